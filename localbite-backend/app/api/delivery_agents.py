@@ -1,15 +1,43 @@
-from datetime import datetime, timezone
+import time
+from datetime import datetime, timedelta, timezone
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import FileResponse
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+from app.crud import agent_ledger as agent_ledger_crud
+from app.crud import agent_stats as agent_stats_crud
 from app.crud import delivery_agent as delivery_agent_crud
+from app.crud import order as order_crud
+from app.crud import order_line_item as line_item_crud
 from app.database import get_db
+from app.models.delivery_agent import DeliveryAgent
 from app.models.order import Order
+from app.dispatch.agent_locations import AGENT_LOCATION_PINGS, AgentLocation, get_agent_location_store
 from app.dispatch.engine import get_dispatch_state
+from app.services.object_store import ObjectTooLarge, get_object_store
+from app.services.order_status import DELIVERED, can_transition
+from app.services.proof_photos import (
+    PROOF_MAX_BYTES,
+    PROOF_UPLOAD_BYTES,
+    PROOF_UPLOAD_SECONDS,
+    SNIFF_BYTES,
+    get_thumbnail_worker,
+    sniff_image_type,
+)
+from app.services.route_planner import RouteStop, plan_route
 from app.schemas.delivery_agent import (
     AgentActiveOrderItem,
     AgentActiveOrdersResponse,
+    AgentEarningsResponse,
+    AgentLocationBatchRequest,
+    AgentLocationBatchResponse,
+    AgentLocationPing,
+    AgentLocationResponse,
+    AgentRouteResponse,
+    AgentRouteStop,
+    AgentStatsResponse,
     DeliveryAgentCreate,
     DeliveryAgentOut,
     DeliveryAgentUpdate,
@@ -19,6 +47,27 @@ from app.schemas.delivery_agent import (
 
 router = APIRouter(prefix="/delivery-agents", tags=["delivery_agents"])
 
+ACTIVE_ORDER_STATUSES = ("assigned", "ready", "on_the_way")
+
+
+def _active_orders(db: Session, agent_id: str) -> list[Order]:
+    return (
+        db.query(Order)
+        .filter(Order.assigned_partner_id == agent_id)
+        .filter(Order.order_status.in_(ACTIVE_ORDER_STATUSES))
+        .order_by(Order.created_at.desc(), Order.order_id.desc())
+        .all()
+    )
+
+
+def _ping_time(recorded_at: datetime | None, now: datetime) -> datetime:
+    if recorded_at is None:
+        return now
+    if recorded_at.tzinfo is None:
+        recorded_at = recorded_at.replace(tzinfo=timezone.utc)
+    # A fix from the future (clock skew) would shadow every later ping.
+    return min(recorded_at, now)
+
 
 @router.post("/", response_model=DeliveryAgentOut, status_code=status.HTTP_201_CREATED)
 def create_delivery_agent(
@@ -57,14 +106,7 @@ async def get_agent_active_orders(agent_id: str, db: Session = Depends(get_db)):
     if not agent:
         raise HTTPException(status_code=404, detail="Delivery agent not found")
 
-    active_statuses = {"assigned", "ready", "on_the_way"}
-    orders = (
-        db.query(Order)
-        .filter(Order.assigned_partner_id == agent_id)
-        .filter(Order.order_status.in_(active_statuses))
-        .order_by(Order.created_at.desc(), Order.order_id.desc())
-        .all()
-    )
+    orders = _active_orders(db, agent_id)
 
     items: list[AgentActiveOrderItem] = []
     for order in orders:
@@ -76,7 +118,7 @@ async def get_agent_active_orders(agent_id: str, db: Session = Depends(get_db)):
                 restaurant_name=order.restaurant.name if getattr(order, "restaurant", None) else None,
                 delivery_address=dispatch_state.get("delivery_address") if dispatch_state else None,
                 order_status=order.order_status,
-                items_count=len(order.order_items) if isinstance(order.order_items, list) else 0,
+                items_count=line_item_crud.item_count(order),
                 delivery_fee=round(float(order.delivery_fee or 0), 2),
                 created_at=order.created_at,
                 assigned_at=dispatch_state.get("updated_at") if dispatch_state else None,
@@ -91,16 +133,135 @@ async def get_agent_active_orders(agent_id: str, db: Session = Depends(get_db)):
     )
 
 
-@router.post(
-    "/{agent_id}/orders/{order_id}/fulfill",
-    response_model=FulfillDeliveryResponse,
-)
-async def fulfill_agent_order(
+@router.get("/{agent_id}/route", response_model=AgentRouteResponse)
+async def get_agent_route(
     agent_id: str,
-    order_id: int,
-    payload: FulfillDeliveryRequest,
+    latitude: float | None = Query(default=None, ge=-90, le=90),
+    longitude: float | None = Query(default=None, ge=-180, le=180),
     db: Session = Depends(get_db),
 ):
+    """
+    Stop sequence (pickups before their drop-offs) with ETAs for the agent's active
+    orders, starting from the given position or the agent's last reported one.
+    """
+    agent = delivery_agent_crud.get_by_id(db, agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Delivery agent not found")
+    if latitude is None or longitude is None:
+        live = await get_agent_location_store().get(agent_id)
+        if live is not None:
+            latitude, longitude = live.latitude, live.longitude
+        else:
+            latitude, longitude = agent.current_lat, agent.current_lng
+    if latitude is None or longitude is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Agent location unknown; pass latitude and longitude",
+        )
+
+    stops: list[RouteStop] = []
+    addresses: dict[tuple[int, str], str | None] = {}
+    unrouted: list[int] = []
+    for order in _active_orders(db, agent_id):
+        restaurant = order.restaurant
+        picked_up = order.order_status == "on_the_way"
+        has_dropoff = order.delivery_lat is not None and order.delivery_lng is not None
+        has_pickup = (
+            restaurant is not None
+            and restaurant.latitude is not None
+            and restaurant.longitude is not None
+        )
+        if not has_dropoff or (not picked_up and not has_pickup):
+            unrouted.append(order.order_id)
+            continue
+        if not picked_up:
+            stops.append(
+                RouteStop(
+                    order_id=order.order_id,
+                    kind="pickup",
+                    latitude=restaurant.latitude,
+                    longitude=restaurant.longitude,
+                )
+            )
+            addresses[(order.order_id, "pickup")] = restaurant.address
+        stops.append(
+            RouteStop(
+                order_id=order.order_id,
+                kind="dropoff",
+                latitude=order.delivery_lat,
+                longitude=order.delivery_lng,
+            )
+        )
+        dispatch_state = await get_dispatch_state(order.order_id)
+        addresses[(order.order_id, "dropoff")] = (
+            dispatch_state.get("delivery_address") if dispatch_state else None
+        )
+
+    plan = plan_route(latitude, longitude, stops)
+    return AgentRouteResponse(
+        agent_id=agent.agent_id,
+        start_latitude=plan.start_latitude,
+        start_longitude=plan.start_longitude,
+        speed_kmph=plan.speed_kmph,
+        total_distance_km=plan.total_distance_km,
+        total_minutes=plan.total_minutes,
+        stops=[
+            AgentRouteStop(
+                **stop.model_dump(),
+                address=addresses.get((stop.order_id, stop.kind)),
+            )
+            for stop in plan.stops
+        ],
+        unrouted_order_ids=unrouted,
+    )
+
+
+@router.post("/locations", response_model=AgentLocationBatchResponse, status_code=status.HTTP_202_ACCEPTED)
+async def record_agent_locations(payload: AgentLocationBatchRequest):
+    """
+    GPS pings for many agents at once (e.g. a gateway relaying device updates). Pings are
+    not checked against delivery_agents; unknown agent ids are dropped when flushed.
+    """
+    now = datetime.now(timezone.utc)
+    locations = [
+        AgentLocation(
+            agent_id=ping.agent_id,
+            latitude=ping.latitude,
+            longitude=ping.longitude,
+            recorded_at=_ping_time(ping.recorded_at, now),
+        )
+        for ping in payload.pings
+    ]
+    accepted = len(await get_agent_location_store().record(locations))
+    stale = len(locations) - accepted
+    AGENT_LOCATION_PINGS.inc(accepted, result="accepted")
+    if stale:
+        AGENT_LOCATION_PINGS.inc(stale, result="stale")
+    return AgentLocationBatchResponse(accepted=accepted, stale=stale)
+
+
+@router.post(
+    "/{agent_id}/location",
+    response_model=AgentLocationResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def record_agent_location(agent_id: str, payload: AgentLocationPing):
+    """
+    Latest GPS fix for the agent. Written to the location store only; delivery_agents
+    picks it up on the next flush.
+    """
+    location = AgentLocation(
+        agent_id=agent_id,
+        latitude=payload.latitude,
+        longitude=payload.longitude,
+        recorded_at=_ping_time(payload.recorded_at, datetime.now(timezone.utc)),
+    )
+    accepted = bool(await get_agent_location_store().record([location]))
+    AGENT_LOCATION_PINGS.inc(result="accepted" if accepted else "stale")
+    return AgentLocationResponse(**location.model_dump(), accepted=accepted)
+
+
+def _load_for_fulfillment(db: Session, agent_id: str, order_id: int) -> tuple[DeliveryAgent, Order]:
     agent = delivery_agent_crud.get_by_id(db, agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Delivery agent not found")
@@ -112,54 +273,203 @@ async def fulfill_agent_order(
         raise HTTPException(status_code=404, detail="Order not found")
     if order.assigned_partner_id != agent_id:
         raise HTTPException(status_code=403, detail="Order is not assigned to this agent")
+    return agent, order
 
+
+@router.post(
+    "/{agent_id}/orders/{order_id}/fulfill",
+    response_model=FulfillDeliveryResponse,
+)
+async def fulfill_agent_order(
+    agent_id: str,
+    order_id: int,
+    payload: FulfillDeliveryRequest,
+    db: Session = Depends(get_db),
+):
+    agent, order = _load_for_fulfillment(db, agent_id, order_id)
     if order.order_status == "delivered" and (order.agent_payout_status == "paid"):
-        return FulfillDeliveryResponse(
-            agent_id=agent.agent_id,
-            order_id=order.order_id,
-            order_status=order.order_status,
-            payout_amount=round(float(order.agent_payout_amount or order.delivery_fee or 0), 2),
-            payout_status=str(order.agent_payout_status or "paid"),
-            total_earnings=round(float(getattr(agent, "total_earnings", 0.0) or 0.0), 2),
-            total_deliveries=int(agent.total_deliveries or 0),
-            delivered_at=order.delivered_at or datetime.now(timezone.utc),
-            proof_photo_ref=order.delivery_proof_ref or payload.proof_photo_ref,
-        )
+        return _fulfilled_response(agent, order, payload)
+    if not can_transition(order.order_status, DELIVERED):
+        raise HTTPException(status_code=409, detail=f"Cannot fulfill an order that is '{order.order_status}'")
 
     payout_amount = round(float(order.delivery_fee or 0), 2)
     now = datetime.now(timezone.utc)
 
-    already_paid = str(order.agent_payout_status or "").lower() == "paid"
-    if not already_paid:
-        agent.total_earnings = round(float(getattr(agent, "total_earnings", 0.0) or 0.0) + payout_amount, 2)
-        agent.total_deliveries = int(agent.total_deliveries or 0) + 1
-        order.agent_payout_amount = payout_amount
-        order.agent_payout_status = "paid"
-
-    order.order_status = "delivered"
+    order.order_status = DELIVERED
     order.delivery_proof_ref = payload.proof_photo_ref
     order.delivery_proof_filename = payload.proof_photo_filename
     order.delivered_at = now
-
-    db.add(agent)
     db.add(order)
-    db.commit()
+
+    already_paid = str(order.agent_payout_status or "").lower() == "paid"
+    try:
+        if not already_paid:
+            order.agent_payout_amount = payout_amount
+            order.agent_payout_status = "paid"
+            agent_stats_crud.record_delivery(db, agent_id, order, payout_amount, now)
+            # Last statement before commit: the agent row is locked only from here.
+            agent_ledger_crud.record_delivery_payout(db, agent_id, order.order_id, payout_amount)
+        db.commit()
+    except (IntegrityError, StaleDataError):
+        # A concurrent request booked this payout (or changed the order) first.
+        order_crud.discard_stale(db, order_id)
     db.refresh(agent)
     db.refresh(order)
+    if order.order_status != DELIVERED:
+        raise HTTPException(status_code=409, detail=f"Order is now '{order.order_status}'")
+    return _fulfilled_response(agent, order, payload)
+
 
+@router.post(
+    "/{agent_id}/orders/{order_id}/proof",
+    response_model=FulfillDeliveryResponse,
+)
+async def upload_proof_and_fulfill(
+    agent_id: str,
+    order_id: int,
+    request: Request,
+    filename: str | None = Query(default=None, max_length=255),
+    db: Session = Depends(get_db),
+):
+    """
+    Fulfill with the proof photo in the same request: the raw request body (image/jpeg,
+    image/png or image/webp) is streamed into the object store and its ref becomes the
+    order's delivery_proof_ref. The thumbnail is rendered in the background.
+    """
+    _load_for_fulfillment(db, agent_id, order_id)
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > PROOF_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Proof photo exceeds {PROOF_MAX_BYTES} bytes")
+
+    started = time.perf_counter()
+    stream = request.stream()
+    head = b""
+    async for chunk in stream:
+        head += chunk
+        if len(head) >= SNIFF_BYTES:
+            break
+    if sniff_image_type(head) is None:
+        raise HTTPException(status_code=415, detail="Proof photo must be a JPEG, PNG or WebP image")
+    try:
+        stored = await get_object_store().put_stream(stream, max_bytes=PROOF_MAX_BYTES, first_chunk=head)
+    except ObjectTooLarge:
+        raise HTTPException(status_code=413, detail=f"Proof photo exceeds {PROOF_MAX_BYTES} bytes")
+    PROOF_UPLOAD_BYTES.observe(stored.size)
+    PROOF_UPLOAD_SECONDS.observe(time.perf_counter() - started)
+
+    response = await fulfill_agent_order(
+        agent_id,
+        order_id,
+        FulfillDeliveryRequest(proof_photo_ref=stored.ref, proof_photo_filename=filename),
+        db,
+    )
+    # A retry of an already fulfilled order keeps its original proof.
+    if response.proof_photo_ref == stored.ref:
+        get_thumbnail_worker().submit(order_id, stored.ref)
+    return response
+
+
+@router.get("/{agent_id}/orders/{order_id}/proof")
+def get_proof_photo(
+    agent_id: str,
+    order_id: int,
+    thumbnail: bool = Query(default=False),
+    db: Session = Depends(get_db),
+):
+    order = db.query(Order).filter(Order.order_id == order_id).first()
+    if not order or order.assigned_partner_id != agent_id:
+        raise HTTPException(status_code=404, detail="Order not found for this agent")
+    ref = order.delivery_proof_thumbnail_ref if thumbnail else order.delivery_proof_ref
+    store = get_object_store()
+    if not ref or not store.exists(ref):
+        raise HTTPException(status_code=404, detail="No stored proof photo for this order")
+    path = store.path_for(ref)
+    with open(path, "rb") as handle:
+        media_type = sniff_image_type(handle.read(SNIFF_BYTES)) or "application/octet-stream"
+    return FileResponse(path, media_type=media_type, headers={"Cache-Control": "private, max-age=86400, immutable"})
+
+
+def _fulfilled_response(agent: DeliveryAgent, order: Order, payload: FulfillDeliveryRequest) -> FulfillDeliveryResponse:
     return FulfillDeliveryResponse(
         agent_id=agent.agent_id,
         order_id=order.order_id,
         order_status=order.order_status,
-        payout_amount=round(float(order.agent_payout_amount or payout_amount), 2),
+        payout_amount=round(float(order.agent_payout_amount or order.delivery_fee or 0), 2),
         payout_status=str(order.agent_payout_status or "paid"),
         total_earnings=round(float(getattr(agent, "total_earnings", 0.0) or 0.0), 2),
         total_deliveries=int(agent.total_deliveries or 0),
-        delivered_at=order.delivered_at or now,
+        delivered_at=order.delivered_at or datetime.now(timezone.utc),
         proof_photo_ref=order.delivery_proof_ref or payload.proof_photo_ref,
     )
 
 
+@router.get("/{agent_id}/earnings", response_model=AgentEarningsResponse)
+def get_agent_earnings(
+    agent_id: str,
+    limit: int = Query(default=20, ge=1, le=200),
+    since: datetime | None = Query(default=None),
+    db: Session = Depends(get_db),
+):
+    """
+    Lifetime totals (the aggregates kept on the agent row) plus recent ledger entries
+    and, with `since`, the earnings booked in that window.
+    """
+    agent = delivery_agent_crud.get_by_id(db, agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Delivery agent not found")
+    period_earnings = period_deliveries = None
+    if since is not None:
+        period_earnings, period_deliveries = agent_ledger_crud.sum_since(db, agent_id, since)
+    return AgentEarningsResponse(
+        agent_id=agent.agent_id,
+        total_earnings=round(float(agent.total_earnings or 0.0), 2),
+        total_deliveries=int(agent.total_deliveries or 0),
+        since=since,
+        period_earnings=period_earnings,
+        period_deliveries=period_deliveries,
+        entries=agent_ledger_crud.list_entries(db, agent_id, limit=limit),
+    )
+
+
+@router.get("/{agent_id}/stats", response_model=AgentStatsResponse)
+def get_agent_stats(
+    agent_id: str,
+    days: int = Query(default=30, ge=1, le=366),
+    db: Session = Depends(get_db),
+):
+    """Performance over the last `days` UTC days, summed from the daily rollups."""
+    agent = delivery_agent_crud.get_by_id(db, agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Delivery agent not found")
+    to_date = datetime.now(timezone.utc).date()
+    from_date = to_date - timedelta(days=days - 1)
+    rows = agent_stats_crud.list_days(db, agent_id, from_date, to_date)
+    totals = agent_stats_crud.AgentStatsTotals.from_rows(rows)
+
+    def _rate(value: float | None) -> float | None:
+        return round(value, 4) if value is not None else None
+
+    return AgentStatsResponse(
+        agent_id=agent.agent_id,
+        from_date=from_date,
+        to_date=to_date,
+        bids_placed=totals.bids_placed,
+        bids_won=totals.bids_won,
+        bids_lost=totals.bids_lost,
+        acceptance_rate=_rate(totals.acceptance_rate),
+        win_rate=_rate(totals.win_rate),
+        avg_bid_to_base_fare=_rate(totals.avg_bid_to_base_fare),
+        deliveries=totals.deliveries,
+        on_time_rate=_rate(totals.on_time_rate),
+        earnings=round(totals.earnings, 2),
+        active_hours=round(totals.active_seconds / 3600.0, 2),
+        earnings_per_hour=(
+            round(totals.earnings_per_hour, 2) if totals.earnings_per_hour is not None else None
+        ),
+        daily=rows,
+    )
+
+
 @router.put("/{agent_id}", response_model=DeliveryAgentOut)
 def update_delivery_agent(
     agent_id: str, payload: DeliveryAgentUpdate, db: Session = Depends(get_db)
@@ -1,16 +1,26 @@
 import logging
 from datetime import datetime, timezone
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
 
+from app.crud import agent_stats as agent_stats_crud
 from app.crud import delivery_bid as delivery_bid_crud
 from app.crud import delivery_agent as delivery_agent_crud
+from app.crud import dispatch_bundle as bundle_crud
 from app.crud import order as order_crud
 from app.database import get_db
-from app.dispatch.engine import mark_order_assigned
+from app.dispatch.engine import dissolve_bundle, mark_order_assigned, record_bid
 from app.models.delivery_agent import AgentType
-from app.schemas.delivery_bid import DeliveryBidCreate, DeliveryBidOut
+from app.schemas.delivery_bid import (
+    AgentBidHistoryResponse,
+    AgentBidSummary,
+    BidStatus,
+    DeliveryBidCreate,
+    DeliveryBidOut,
+)
 from app.services.base_fare import get_bid_window
+from app.services.order_status import ASSIGNED, can_transition
 
 router = APIRouter(prefix="/delivery-bids", tags=["delivery_bids"])
 logger = logging.getLogger("api.delivery_bids")
@@ -41,6 +51,8 @@ async def _accept_bid_and_assign(bid_id: int, db: Session) -> DeliveryBidOut:
         raise HTTPException(
             status_code=409, detail=f"Cannot accept bid with status '{bid.bid_status}'"
         )
+    if not can_transition(order.order_status, ASSIGNED):
+        raise HTTPException(status_code=409, detail=f"Cannot assign an order that is '{order.order_status}'")
 
     agent = delivery_agent_crud.get_by_id(db, bid.agent_id)
     if not agent:
@@ -49,36 +61,57 @@ async def _accept_bid_and_assign(bid_id: int, db: Session) -> DeliveryBidOut:
         raise HTTPException(status_code=403, detail="Inactive delivery agent cannot be assigned")
 
     competing_bids = delivery_bid_crud.list_by_order(db, bid.order_id)
+    now = datetime.now(timezone.utc)
 
     bid.bid_status = "accepted"
-    order.assigned_partner_id = bid.agent_id
-    order.delivery_fee = bid.bid_amount
-    order.order_status = "assigned"
-
-    for other in competing_bids:
-        if other.bid_id == bid.bid_id:
-            continue
-        if other.bid_status == "placed":
-            other.bid_status = "rejected"
+    assigned_order_ids = [order.order_id]
+    bundle = bundle_crud.get_by_id(db, order.bundle_id) if order.bundle_id else None
+    if bundle is not None and bundle.status == "open" and bundle.lead_order_id == order.order_id:
+        try:
+            members = bundle_crud.assign(db, bundle, bid.agent_id, bid.bid_amount)
+        except bundle_crud.BundleConflictError as exc:
+            bundle_id = bundle.bundle_id
+            db.rollback()
+            await dissolve_bundle(bundle_id)
+            raise HTTPException(status_code=409, detail=str(exc))
+        assigned_order_ids = [member.order_id for member in members]
+    else:
+        order.assigned_partner_id = bid.agent_id
+        order.delivery_fee = bid.bid_amount
+        order.order_status = ASSIGNED
+        order.assigned_at = now
+
+    losing_bids = [
+        other for other in competing_bids if other.bid_id != bid.bid_id and other.bid_status == "placed"
+    ]
+    for other in losing_bids:
+        other.bid_status = "rejected"
+    agent_stats_crud.record_award(db, bid, losing_bids, now)
 
     db.add(order)
     db.add(bid)
-    db.commit()
+    try:
+        db.commit()
+    except StaleDataError:
+        # Someone else updated the order (or a member order) since we read it.
+        order_crud.discard_stale(db, *assigned_order_ids)
+        raise HTTPException(status_code=409, detail="Order changed while accepting the bid; retry")
     db.refresh(bid)
 
-    try:
-        await mark_order_assigned(order.order_id, bid.agent_id)
-    except Exception:
-        logger.exception(
-            "Failed to update dispatch assignment state in Redis for order %s",
-            order.order_id,
-        )
+    for assigned_order_id in assigned_order_ids:
+        try:
+            await mark_order_assigned(assigned_order_id, bid.agent_id)
+        except Exception:
+            logger.exception(
+                "Failed to update dispatch assignment state for order %s",
+                assigned_order_id,
+            )
 
     return bid
 
 
 @router.post("/", response_model=DeliveryBidOut, status_code=status.HTTP_201_CREATED)
-def place_delivery_bid(payload: DeliveryBidCreate, db: Session = Depends(get_db)):
+async def place_delivery_bid(payload: DeliveryBidCreate, db: Session = Depends(get_db)):
     order = order_crud.get_by_id(db, payload.order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -97,7 +130,16 @@ def place_delivery_bid(payload: DeliveryBidCreate, db: Session = Depends(get_db)
             detail="Only student delivery agents can bid during student_pool phase",
         )
 
-    min_allowed_fare, max_allowed_fare = get_bid_window(order.base_fare)
+    if order.bundle_id is not None:
+        bundle = bundle_crud.get_by_id(db, order.bundle_id)
+        if bundle is not None and bundle.status == "open" and bundle.lead_order_id != order.order_id:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Order is part of bundle {bundle.bundle_id}; bid on order {bundle.lead_order_id}",
+            )
+
+    base_fare = bundle_crud.effective_base_fare(db, order)
+    min_allowed_fare, max_allowed_fare = get_bid_window(base_fare)
     bid_amount = round(payload.bid_amount, 2)
 
     if bid_amount < min_allowed_fare or bid_amount > max_allowed_fare:
@@ -111,7 +153,9 @@ def place_delivery_bid(payload: DeliveryBidCreate, db: Session = Depends(get_db)
             },
         )
 
-    return delivery_bid_crud.create(
+    # Committed together with the bid.
+    agent_stats_crud.record_bid(db, payload.agent_id, bid_amount, base_fare, datetime.now(timezone.utc))
+    bid = delivery_bid_crud.create(
         db,
         order_id=payload.order_id,
         agent_id=payload.agent_id,
@@ -121,6 +165,14 @@ def place_delivery_bid(payload: DeliveryBidCreate, db: Session = Depends(get_db)
         pool_phase=payload.pool_phase,
     )
 
+    try:
+        await record_bid(bid.order_id, bid.bid_id, bid.bid_amount)
+    except Exception:
+        # The dispatch loop re-reads delivery_bids when a phase closes, so the bid is not lost.
+        logger.exception("Failed to record bid %s in the dispatch bid book", bid.bid_id)
+
+    return bid
+
 
 @router.get("/orders/{order_id}", response_model=list[DeliveryBidOut])
 def list_order_bids(order_id: int, db: Session = Depends(get_db)):
@@ -130,12 +182,37 @@ def list_order_bids(order_id: int, db: Session = Depends(get_db)):
     return delivery_bid_crud.list_by_order(db, order_id)
 
 
-@router.get("/agents/{agent_id}", response_model=list[DeliveryBidOut])
-def list_agent_bids(agent_id: str, db: Session = Depends(get_db)):
+@router.get("/agents/{agent_id}", response_model=AgentBidHistoryResponse)
+def list_agent_bids(
+    agent_id: str,
+    limit: int = Query(default=50, ge=1, le=200),
+    cursor: str | None = Query(default=None),
+    bid_status: BidStatus | None = Query(default=None, alias="status"),
+    since: datetime | None = Query(default=None),
+    until: datetime | None = Query(default=None),
+    db: Session = Depends(get_db),
+):
+    """
+    The agent's bids newest first, one page at a time: pass back `next_cursor` to get
+    the next page. The summary covers the whole since/until range.
+    """
     agent = delivery_agent_crud.get_by_id(db, agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Delivery agent not found")
-    return delivery_bid_crud.list_by_agent(db, agent_id)
+    try:
+        after = delivery_bid_crud.decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    bids, next_key = delivery_bid_crud.list_by_agent(
+        db, agent_id, limit=limit, cursor=after, status=bid_status, since=since, until=until
+    )
+    counts, won_amount = delivery_bid_crud.summarize_by_agent(db, agent_id, since=since, until=until)
+    return AgentBidHistoryResponse(
+        items=bids,
+        next_cursor=delivery_bid_crud.encode_cursor(next_key) if next_key else None,
+        summary=AgentBidSummary(total=sum(counts.values()), by_status=counts, won_amount=won_amount),
+    )
 
 
 @router.post("/{bid_id}/accept", response_model=DeliveryBidOut)
@@ -1,29 +1,65 @@
+import asyncio
 from datetime import datetime, timezone
+from typing import NamedTuple
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
 from app.crud import delivery_agent as delivery_agent_crud
 from app.crud import delivery_bid as delivery_bid_crud
+from app.crud import dispatch_bundle as bundle_crud
 from app.crud import order as order_crud
+from app.crud import order_line_item as line_item_crud
+from app.crud import restaurant as restaurant_crud
+from app.core.singleflight import SingleFlight
 from app.database import get_db
+from app.dispatch.sharding import shard_for
+from app.dispatch.worker import ShardedDispatch, sharded_dispatch_enabled, submit_dispatch
 from app.dispatch.engine import (
+    AdmissionRejected,
+    DeferredDispatch,
+    bundle_orders,
+    cancel_dispatch,
+    dissolve_bundle,
+    get_dispatch_clock,
     get_dispatch_state,
+    dispatch_queue_depth,
+    dispatch_queue_position,
+    is_dispatch_queued,
     is_dispatch_running,
+    schedule_dispatch,
     start_dispatch_background,
 )
 from app.schemas.dispatch import (
     AgentAvailableDispatchResponse,
     AgentAvailableDispatchItem,
+    DispatchCancelRequest,
+    DispatchCancelResponse,
     DispatchStartRequest,
     DispatchStartResponse,
     DispatchStatusResponse,
 )
+from app.models.dispatch_bundle import DispatchBundle
 from app.services.base_fare import get_bid_window
+from app.services.batching import can_batch_from, find_batch, quote_bundle
+from app.services.prep_time import estimate_prep_time, plan_deferred_dispatch
 from app.models.delivery_agent import AgentType
 
 router = APIRouter(prefix="/dispatch", tags=["dispatch"])
 
+_ACTIVE_DISPATCH_STATUSES = {
+    "starting",
+    "broadcasted",
+    "waiting_for_bids",
+    "escalating",
+    "scheduled",
+    "bundled",
+    "queued",
+    "submitted",
+}
+# Seconds a client is asked to wait when the dispatch queue is full.
+_ADMISSION_RETRY_AFTER_SECONDS = 30
+
 
 def _parse_iso_dt(value: str | None) -> datetime | None:
     if not value:
@@ -59,7 +95,7 @@ def _seconds_remaining(state: dict[str, str]) -> int:
     if updated_at.tzinfo is None:
         updated_at = updated_at.replace(tzinfo=timezone.utc)
 
-    elapsed = int((datetime.now(timezone.utc) - updated_at).total_seconds())
+    elapsed = int((get_dispatch_clock().now() - updated_at).total_seconds())
     return max(total_seconds - max(elapsed, 0), 0)
 
 
@@ -75,6 +111,39 @@ def _is_visible_to_agent(state: dict[str, str], agent_type: AgentType) -> bool:
     return False
 
 
+class _BidSummary(NamedTuple):
+    placed: int
+    leading_amount: float | None
+    leading_created_at: datetime | None
+
+
+_bid_summaries: SingleFlight[_BidSummary] = SingleFlight("order_bids")
+
+
+def _leading_bid_key(bid):
+    return (
+        round(float(bid.bid_amount), 2),
+        bid.created_at or datetime.max.replace(tzinfo=timezone.utc),
+        bid.bid_id,
+    )
+
+
+def _load_bid_summary(db: Session, order_id: int) -> _BidSummary:
+    placed_bids = [bid for bid in delivery_bid_crud.list_by_order(db, order_id) if bid.bid_status == "placed"]
+    if not placed_bids:
+        return _BidSummary(0, None, None)
+    leading_bid = min(placed_bids, key=_leading_bid_key)
+    return _BidSummary(len(placed_bids), round(float(leading_bid.bid_amount), 2), leading_bid.created_at)
+
+
+async def _bid_summary(db: Session, order_id: int) -> _BidSummary:
+    # Agents refreshing the feed together ask for the same orders: the first request reads
+    # the bids (off the event loop) and the others share its summary.
+    return await _bid_summaries.do(
+        (db.get_bind(), order_id), lambda: asyncio.to_thread(_load_bid_summary, db, order_id)
+    )
+
+
 @router.get(
     "/agents/{agent_id}/available",
     response_model=AgentAvailableDispatchResponse,
@@ -90,7 +159,7 @@ async def list_available_dispatch_requests_for_agent(
     if not agent.is_active:
         raise HTTPException(status_code=403, detail="Inactive delivery agent cannot receive dispatch feed")
 
-    orders = order_crud.list_all(db, skip=0, limit=limit)
+    orders = order_crud.list_awaiting_dispatch(db, limit=limit)
     items: list[AgentAvailableDispatchItem] = []
 
     for order in orders:
@@ -109,32 +178,19 @@ async def list_available_dispatch_requests_for_agent(
         if phase not in {"student_pool", "all_agents"}:
             continue
 
-        min_allowed_fare, max_allowed_fare = get_bid_window(order.base_fare)
-        competing_bids = delivery_bid_crud.list_by_order(db, order.order_id)
-        placed_bids = [bid for bid in competing_bids if bid.bid_status == "placed"]
-        placed_bids_sorted = sorted(
-            placed_bids,
-            key=lambda bid: (
-                round(float(bid.bid_amount), 2),
-                bid.created_at or datetime.max.replace(tzinfo=timezone.utc),
-                bid.bid_id,
-            ),
-        )
-        leading_bid = placed_bids_sorted[0] if placed_bids_sorted else None
-
-        order_items_count = (
-            len(order.order_items)
-            if isinstance(order.order_items, list)
-            else 0
-        )
+        min_allowed_fare, max_allowed_fare = get_bid_window(bundle_crud.effective_base_fare(db, order))
+        bundle = bundle_crud.get_by_id(db, order.bundle_id) if order.bundle_id else None
+        bundle_order_ids = list(bundle.order_ids) if bundle is not None and bundle.status == "open" else []
+        bids = await _bid_summary(db, order.order_id)
+        restaurant = restaurant_crud.get_by_id(db, order.restaurant_id)
 
         items.append(
             AgentAvailableDispatchItem(
                 order_id=order.order_id,
                 restaurant_id=order.restaurant_id,
-                restaurant_name=order.restaurant.name if getattr(order, "restaurant", None) else None,
+                restaurant_name=restaurant.name if restaurant is not None else None,
                 delivery_address=state.get("delivery_address"),
-                order_items_count=order_items_count,
+                order_items_count=line_item_crud.item_count(order),
                 base_fare=round(order.base_fare, 2),
                 min_allowed_fare=min_allowed_fare,
                 max_allowed_fare=max_allowed_fare,
@@ -143,10 +199,12 @@ async def list_available_dispatch_requests_for_agent(
                 student_only=(phase == "student_pool"),
                 bidding_time_left_seconds=_seconds_remaining(state),
                 dispatch_updated_at=state.get("updated_at"),
-                leading_bid_amount=(round(float(leading_bid.bid_amount), 2) if leading_bid else None),
-                leading_bid_created_at=(leading_bid.created_at if leading_bid else None),
-                total_placed_bids=len(placed_bids),
+                leading_bid_amount=bids.leading_amount,
+                leading_bid_created_at=bids.leading_created_at,
+                total_placed_bids=bids.placed,
                 order_created_at=order.created_at,
+                bundle_id=order.bundle_id if bundle_order_ids else None,
+                bundle_order_ids=bundle_order_ids,
             )
         )
 
@@ -165,6 +223,82 @@ async def list_available_dispatch_requests_for_agent(
     )
 
 
+async def _form_bundle(db: Session, order) -> DispatchBundle | None:
+    """Bundle `order` with batchable orders of the same restaurant that are not dispatching yet."""
+    restaurant = order.restaurant
+    if not can_batch_from(restaurant):
+        return None
+    candidates = []
+    for candidate in order_crud.list_batch_candidates(db, order.restaurant_id):
+        if candidate.order_id == order.order_id:
+            continue
+        if is_dispatch_running(candidate.order_id) or is_dispatch_queued(candidate.order_id):
+            continue
+        state = await get_dispatch_state(candidate.order_id)
+        if state.get("status") in _ACTIVE_DISPATCH_STATUSES - {"scheduled"}:
+            continue
+        candidates.append(candidate)
+    members = find_batch(order, candidates, prep_minutes=estimate_prep_time(db, order.restaurant_id).expected_minutes)
+    if len(members) < 2:
+        return None
+    quote = quote_bundle(restaurant, members)
+    bundle = bundle_crud.create(
+        db,
+        restaurant_id=quote.restaurant_id,
+        lead_order_id=quote.lead_order_id,
+        order_ids=quote.order_ids,
+        route_distance_km=quote.route_distance_km,
+        base_fare=quote.base_fare,
+    )
+    await bundle_orders(bundle.bundle_id, bundle.lead_order_id, bundle.order_ids)
+    return bundle
+
+
+async def _submit_to_shard(
+    order, payload: DispatchStartRequest, shard: str, order_value: float, bundle_fields: dict
+) -> DispatchStartResponse:
+    """Sharded mode: the dispatch worker owning the restaurant's shard runs the dispatch."""
+    state = await get_dispatch_state(order.order_id)
+    common = {
+        "order_id": order.order_id,
+        "phase1_wait_seconds_min": payload.phase1_wait_seconds_min,
+        "phase1_wait_seconds_max": payload.phase1_wait_seconds_max,
+        "phase2_wait_seconds": payload.phase2_wait_seconds,
+        "poll_interval_seconds": payload.poll_interval_seconds,
+        **bundle_fields,
+    }
+    if state.get("status") in _ACTIVE_DISPATCH_STATUSES - {"bundled", "scheduled"}:
+        return DispatchStartResponse(
+            **common,
+            dispatch_started=False,
+            status="already_running",
+            phase="existing",
+            message=f"Dispatch already {state['status']} for this order",
+        )
+    await submit_dispatch(
+        ShardedDispatch(
+            order_id=order.order_id,
+            restaurant_id=order.restaurant_id,
+            delivery_address=payload.delivery_address,
+            shard=shard,
+            phase1_wait_seconds_min=payload.phase1_wait_seconds_min,
+            phase1_wait_seconds_max=payload.phase1_wait_seconds_max,
+            phase2_wait_seconds=payload.phase2_wait_seconds,
+            poll_interval_seconds=payload.poll_interval_seconds,
+            ordered_at=order.created_at,
+            order_value=order_value,
+        )
+    )
+    return DispatchStartResponse(
+        **common,
+        dispatch_started=True,
+        status="submitted",
+        phase="routing",
+        message=f"Dispatch handed to the worker for shard {shard}",
+        shard=shard,
+    )
+
+
 @router.post(
     "/orders/{order_id}/start",
     response_model=DispatchStartResponse,
@@ -181,27 +315,131 @@ async def start_order_dispatch(
     if order.assigned_partner_id:
         raise HTTPException(status_code=409, detail="Order is already assigned")
 
-    started = await start_dispatch_background(
-        order_id=order.order_id,
-        restaurant_id=order.restaurant_id,
-        delivery_address=payload.delivery_address,
-        phase1_wait_seconds_min=payload.phase1_wait_seconds_min,
-        phase1_wait_seconds_max=payload.phase1_wait_seconds_max,
-        phase2_wait_seconds=payload.phase2_wait_seconds,
-        poll_interval_seconds=payload.poll_interval_seconds,
+    bundle = None
+    if order.bundle_id is not None:
+        bundle = bundle_crud.get_by_id(db, order.bundle_id)
+        if bundle is not None and bundle.status == "open" and bundle.lead_order_id != order_id:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Order is dispatched with order {bundle.lead_order_id} in bundle {bundle.bundle_id}",
+            )
+    elif payload.batch and not is_dispatch_running(order_id) and not is_dispatch_queued(order_id):
+        bundle = await _form_bundle(db, order)
+    bundle_fields = (
+        {
+            "bundle_id": bundle.bundle_id,
+            "bundle_order_ids": list(bundle.order_ids),
+            "bundle_base_fare": bundle.base_fare,
+        }
+        if bundle is not None and bundle.status == "open"
+        else {}
+    )
+
+    # Admission priority weighs the fare on offer; a bundle lead carries the bundle's fare.
+    order_value = bundle_crud.effective_base_fare(db, order)
+    restaurant = order.restaurant
+    # Sharded mode: the worker owning the restaurant's zone runs the dispatch.
+    shard = (
+        shard_for(getattr(restaurant, "latitude", None), getattr(restaurant, "longitude", None))
+        if sharded_dispatch_enabled()
+        else None
     )
 
+    already_started = is_dispatch_running(order_id) or is_dispatch_queued(order_id)
+    if payload.defer_until_ready and not already_started and order.ready_at is None:
+        plan = plan_deferred_dispatch(
+            ordered_at=order.created_at or get_dispatch_clock().now(),
+            estimate=estimate_prep_time(db, order.restaurant_id),
+            phase1_wait_seconds=payload.phase1_wait_seconds_max,
+            now=get_dispatch_clock().now(),
+        )
+        if plan.deferred:
+            await schedule_dispatch(
+                DeferredDispatch(
+                    order_id=order.order_id,
+                    restaurant_id=order.restaurant_id,
+                    delivery_address=payload.delivery_address,
+                    run_at=plan.dispatch_at,
+                    expected_ready_at=plan.expected_ready_at,
+                    phase1_wait_seconds_min=payload.phase1_wait_seconds_min,
+                    phase1_wait_seconds_max=payload.phase1_wait_seconds_max,
+                    phase2_wait_seconds=payload.phase2_wait_seconds,
+                    poll_interval_seconds=payload.poll_interval_seconds,
+                    ordered_at=order.created_at,
+                    order_value=order_value,
+                    shard=shard,
+                )
+            )
+            return DispatchStartResponse(
+                order_id=order_id,
+                dispatch_started=False,
+                status="scheduled",
+                phase="deferred",
+                phase1_wait_seconds_min=payload.phase1_wait_seconds_min,
+                phase1_wait_seconds_max=payload.phase1_wait_seconds_max,
+                phase2_wait_seconds=payload.phase2_wait_seconds,
+                poll_interval_seconds=payload.poll_interval_seconds,
+                message="Dispatch scheduled to open before the food is ready",
+                scheduled_for=plan.dispatch_at,
+                expected_ready_at=plan.expected_ready_at,
+                **bundle_fields,
+            )
+
+    if shard is not None:
+        return await _submit_to_shard(order, payload, shard, order_value, bundle_fields)
+
+    try:
+        started = await start_dispatch_background(
+            order_id=order.order_id,
+            restaurant_id=order.restaurant_id,
+            delivery_address=payload.delivery_address,
+            phase1_wait_seconds_min=payload.phase1_wait_seconds_min,
+            phase1_wait_seconds_max=payload.phase1_wait_seconds_max,
+            phase2_wait_seconds=payload.phase2_wait_seconds,
+            poll_interval_seconds=payload.poll_interval_seconds,
+            ordered_at=order.created_at,
+            order_value=order_value,
+        )
+    except AdmissionRejected as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Dispatch capacity exhausted: {exc}",
+            headers={"Retry-After": str(_ADMISSION_RETRY_AFTER_SECONDS)},
+        )
+
     if not started:
         return DispatchStartResponse(
             order_id=order_id,
             dispatch_started=False,
-            status="already_running",
+            status="already_queued" if is_dispatch_queued(order_id) else "already_running",
             phase="existing",
             phase1_wait_seconds_min=payload.phase1_wait_seconds_min,
             phase1_wait_seconds_max=payload.phase1_wait_seconds_max,
             phase2_wait_seconds=payload.phase2_wait_seconds,
             poll_interval_seconds=payload.poll_interval_seconds,
-            message="Dispatch already running for this order",
+            message=(
+                "Dispatch already queued for this order"
+                if is_dispatch_queued(order_id)
+                else "Dispatch already running for this order"
+            ),
+            queue_position=dispatch_queue_position(order_id),
+            **bundle_fields,
+        )
+
+    if is_dispatch_queued(order_id):
+        position = dispatch_queue_position(order_id)
+        return DispatchStartResponse(
+            order_id=order_id,
+            dispatch_started=False,
+            status="queued",
+            phase="admission",
+            phase1_wait_seconds_min=payload.phase1_wait_seconds_min,
+            phase1_wait_seconds_max=payload.phase1_wait_seconds_max,
+            phase2_wait_seconds=payload.phase2_wait_seconds,
+            poll_interval_seconds=payload.poll_interval_seconds,
+            message=f"Dispatch capacity is full; queued at position {position}",
+            queue_position=position,
+            **bundle_fields,
         )
 
     return DispatchStartResponse(
@@ -213,7 +451,36 @@ async def start_order_dispatch(
         phase1_wait_seconds_max=payload.phase1_wait_seconds_max,
         phase2_wait_seconds=payload.phase2_wait_seconds,
         poll_interval_seconds=payload.poll_interval_seconds,
-        message="Two-phase dispatch started",
+        message=(
+            f"Two-phase dispatch started for a bundle of {len(bundle_fields['bundle_order_ids'])} orders"
+            if bundle_fields
+            else "Two-phase dispatch started"
+        ),
+        **bundle_fields,
+    )
+
+
+@router.post("/orders/{order_id}/cancel", response_model=DispatchCancelResponse)
+async def cancel_order_dispatch(
+    order_id: int,
+    payload: DispatchCancelRequest | None = None,
+    db: Session = Depends(get_db),
+):
+    order = order_crud.get_by_id(db, order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if order.assigned_partner_id:
+        raise HTTPException(status_code=409, detail="Order is already assigned")
+
+    was_running = await cancel_dispatch(order_id, reason=payload.reason if payload else None)
+    if order.bundle_id is not None:
+        # The rest of the bundle is dispatched again, one order at a time.
+        await dissolve_bundle(order.bundle_id, drop_order_id=order_id)
+    return DispatchCancelResponse(
+        order_id=order_id,
+        was_running=was_running,
+        status="cancelled",
+        message="Dispatch cancelled" if was_running else "Dispatch marked cancelled",
     )
 
 
@@ -228,12 +495,16 @@ async def get_order_dispatch_status(order_id: int):
             is_running=running,
             status="not_started",
             phase="none",
+            queue_depth=dispatch_queue_depth(),
         )
 
     def _to_int(name: str) -> int | None:
         value = state.get(name)
         return int(value) if value is not None and value != "" else None
 
+    # Queue position is only known to the worker holding the queued dispatch.
+    queue_position = dispatch_queue_position(order_id)
+
     return DispatchStatusResponse(
         order_id=order_id,
         is_running=running,
@@ -245,4 +516,8 @@ async def get_order_dispatch_status(order_id: int):
         phase2_wait_seconds=_to_int("phase2_wait_seconds"),
         note=state.get("note"),
         updated_at=state.get("updated_at"),
+        scheduled_for=state.get("scheduled_for") or None,
+        queue_position=queue_position,
+        queue_depth=dispatch_queue_depth(),
+        shard=state.get("shard") or None,
     )
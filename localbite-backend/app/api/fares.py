@@ -1,6 +1,12 @@
 from fastapi import APIRouter, HTTPException
-from app.schemas.fare import FareRecommendationRequest, FareRecommendationResponse
+from app.schemas.fare import (
+    ActivePricingResponse,
+    FareRecommendationRequest,
+    FareRecommendationResponse,
+)
 from app.services.base_fare import get_fare_recommendation
+from app.services.eta_calibration import get_eta_calibration, reload_eta_calibration
+from app.services.pricing import get_pricing_table, reload_pricing_table
 
 router = APIRouter(prefix="/fares", tags=["fares"])
 
@@ -11,3 +17,23 @@ def fare_recommendation(payload: FareRecommendationRequest):
         return get_fare_recommendation(payload)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
+
+
+@router.get("/pricing", response_model=ActivePricingResponse)
+def get_active_pricing():
+    calibration = get_eta_calibration()
+    return ActivePricingResponse(
+        pricing_version=get_pricing_table().version,
+        eta_calibration_version=calibration.version if calibration else None,
+    )
+
+
+@router.post("/pricing/reload", response_model=ActivePricingResponse)
+def reload_active_pricing():
+    """Pick up new pricing/calibration files now instead of at the next periodic check."""
+    pricing = reload_pricing_table()
+    calibration = reload_eta_calibration()
+    return ActivePricingResponse(
+        pricing_version=pricing.version,
+        eta_calibration_version=calibration.version if calibration else None,
+    )
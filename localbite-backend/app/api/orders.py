@@ -5,7 +5,9 @@ from typing import List
 from app.database import get_db
 from app.schemas.order import OrderCreate, OrderOut, OrderUpdate
 from app.crud import order as crud_order
+from app.dispatch.engine import cancel_dispatch, dissolve_bundle
 from app.models.order import Order
+from app.services.order_status import IllegalOrderTransition
 
 router = APIRouter(prefix="/orders", tags=["Orders"])
 
@@ -35,11 +37,21 @@ def list_orders_by_user(
     return crud_order.list_by_user(db, user_id=user_id, skip=skip, limit=limit)
 
 @router.put("/{order_id}", response_model=OrderOut)
-def update_order(order_id: int, payload: OrderUpdate, db: Session = Depends(get_db)):
+async def update_order(order_id: int, payload: OrderUpdate, db: Session = Depends(get_db)):
     db_obj = crud_order.get_by_id(db, order_id=order_id)
     if not db_obj:
         raise HTTPException(status_code=404, detail="Order not found")
-    return crud_order.update(db=db, db_obj=db_obj, payload=payload)
+    try:
+        order = crud_order.update(db=db, db_obj=db_obj, payload=payload)
+    except (IllegalOrderTransition, crud_order.VersionConflict) as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    if payload.order_status == "cancelled":
+        # Stop looking for a driver; its bids could never be awarded.
+        await cancel_dispatch(order_id, reason="order cancelled")
+        if order.bundle_id is not None:
+            # The rest of its bundle is dispatched again without it.
+            await dissolve_bundle(order.bundle_id, drop_order_id=order_id)
+    return order
 
 @router.delete("/{order_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_order(order_id: int, db: Session = Depends(get_db)):
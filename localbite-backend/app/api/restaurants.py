@@ -1,9 +1,14 @@
+from datetime import datetime
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from app.crud import order_line_item as line_item_crud
 from app.crud import restaurant as restaurant_crud
 from app.database import get_db
 from app.schemas.restaurant import (
+    MenuItemSales,
     RestaurantCreate,
     RestaurantOut,
     RestaurantUpdate,
@@ -38,6 +43,28 @@ def get_restaurant(restaurant_id: int, db: Session = Depends(get_db)):
     return db_obj
 
 
+@router.get("/{restaurant_id}/item-sales", response_model=list[MenuItemSales])
+def get_restaurant_item_sales(
+    restaurant_id: int,
+    since: Optional[datetime] = Query(default=None),
+    limit: int = Query(default=20, ge=1, le=200),
+    db: Session = Depends(get_db),
+):
+    if not restaurant_crud.get_by_id(db, restaurant_id):
+        raise HTTPException(status_code=404, detail="Restaurant not found")
+    rows = line_item_crud.item_sales(db, restaurant_id, since=since, limit=limit)
+    return [
+        MenuItemSales(
+            menu_id=row.menu_id,
+            item_name=row.item_name,
+            quantity=int(row.quantity or 0),
+            revenue=round(float(row.revenue or 0.0), 2),
+            orders=int(row.orders or 0),
+        )
+        for row in rows
+    ]
+
+
 @router.put("/{restaurant_id}", response_model=RestaurantOut)
 def update_restaurant(
     restaurant_id: int, payload: RestaurantUpdate, db: Session = Depends(get_db)
@@ -0,0 +1,193 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Counters and histograms are sharded per thread: every thread updates its own dict, so the
+hot path takes no lock (asyncio code on one thread never interleaves inside a plain
+function call). Shards are only summed when /metrics is scraped. Gauges either hold a
+single value or are computed by a callback at scrape time.
+
+    ORDERS = Counter("orders_total", "Orders seen.", labelnames=("status",))
+    ORDERS.inc(status="pending")
+    LATENCY = Histogram("fetch_seconds", "Fetch latency.", buckets=(0.1, 0.5, 1, 5))
+    LATENCY.observe(0.27)
+    render_prometheus()  # -> text/plain; version=0.0.4
+"""
+from __future__ import annotations
+
+import math
+from bisect import bisect_left
+from threading import get_ident
+from typing import Callable, Iterable
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_REGISTRY: dict[str, "_Metric"] = {}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, *, labelnames: tuple[str, ...] = ()) -> None:
+        if name in _REGISTRY:
+            raise ValueError(f"Metric {name!r} is already registered")
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._shards: dict[int, dict] = {}
+        _REGISTRY[name] = self
+
+    def _label_key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _shard(self) -> dict:
+        ident = get_ident()
+        shard = self._shards.get(ident)
+        if shard is None:
+            shard = self._shards.setdefault(ident, {})
+        return shard
+
+    def _header(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._label_key(labels)
+        shard = self._shard()
+        shard[key] = shard.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        key = self._label_key(labels)
+        return sum(dict(shard).get(key, 0.0) for shard in list(self._shards.values()))
+
+    def _totals(self) -> dict[tuple[str, ...], float]:
+        totals: dict[tuple[str, ...], float] = {}
+        for shard in list(self._shards.values()):
+            for key, value in dict(shard).items():
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for key, value in sorted(self._totals().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        *,
+        buckets: Iterable[float],
+        labelnames: tuple[str, ...] = (),
+    ) -> None:
+        super().__init__(name, documentation, labelnames=labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._label_key(labels)
+        shard = self._shard()
+        # [per-bucket counts..., +Inf count, sum]
+        series = shard.get(key)
+        if series is None:
+            series = shard[key] = [0.0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def snapshot(self, **labels: str) -> tuple[float, float]:
+        """(count, sum) for one label set; handy in tests."""
+        series = self._totals().get(self._label_key(labels))
+        if series is None:
+            return (0.0, 0.0)
+        return (sum(series[:-1]), series[-1])
+
+    def _totals(self) -> dict[tuple[str, ...], list[float]]:
+        totals: dict[tuple[str, ...], list[float]] = {}
+        for shard in list(self._shards.values()):
+            for key, series in dict(shard).items():
+                series = list(series)
+                merged = totals.get(key)
+                if merged is None:
+                    totals[key] = series
+                else:
+                    for i, value in enumerate(series):
+                        merged[i] += value
+        return totals
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        bounds = [_format_value(b) for b in self.buckets] + ["+Inf"]
+        for key, series in sorted(self._totals().items()):
+            cumulative = 0.0
+            for bound, count in zip(bounds, series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(cumulative)}")
+        return lines
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, *, function: Callable[[], float] | None = None) -> None:
+        super().__init__(name, documentation)
+        self._value = 0.0
+        self._function = function
+
+    def set(self, value: float) -> None:
+        self._value = float(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    def value(self) -> float:
+        return float(self._function()) if self._function is not None else self._value
+
+    def render(self) -> list[str]:
+        return self._header() + [f"{self.name} {_format_value(self.value())}"]
+
+
+def render_prometheus() -> str:
+    lines: list[str] = []
+    for metric in _REGISTRY.values():
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+__all__ = ["Counter", "Gauge", "Histogram", "PROMETHEUS_CONTENT_TYPE", "render_prometheus"]
@@ -0,0 +1,118 @@
+"""
+Request coalescing ("single-flight") for hot keys.
+
+When many callers in one process ask for the same key at the same time, only the first
+(the leader) runs the load; the rest wait for it and get the same result, or the same
+exception. Nothing is kept once the load finishes: the next call after that loads again.
+
+    STATE = SingleFlight("dispatch_state")
+    state = await STATE.do(order_id, lambda: store.get_state(order_id))
+
+SingleFlight is for coroutines on one event loop. SyncSingleFlight does the same for
+blocking loads called from several threads (sync endpoints in the threadpool).
+
+Results are shared, so callers must not mutate them; return plain data (copies, tuples,
+serialized rows), never objects tied to the leader's session or connection.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+from app.core.metrics import Counter
+
+T = TypeVar("T")
+
+SINGLEFLIGHT_CALLS = Counter(
+    "localbite_singleflight_calls_total",
+    "Coalesced loads by flight name; role is leader (ran the load) or shared (waited on one).",
+    labelnames=("flight", "role"),
+)
+
+
+class SingleFlight(Generic[T]):
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, load: Callable[[], Awaitable[T]]) -> T:
+        loop = asyncio.get_running_loop()
+        while True:
+            shared = self._inflight.get(key)
+            if shared is None or shared.get_loop() is not loop:
+                break
+            SINGLEFLIGHT_CALLS.inc(flight=self.name, role="shared")
+            try:
+                # Shielded: a waiter that is cancelled must not cancel the result for the rest.
+                return await asyncio.shield(shared)
+            except asyncio.CancelledError:
+                if not shared.cancelled():
+                    raise
+                # The leader was cancelled, not us: load again.
+
+        # The leader runs the load itself, so an uncontended call costs no extra task.
+        SINGLEFLIGHT_CALLS.inc(flight=self.name, role="leader")
+        result = loop.create_future()
+        self._inflight[key] = result
+        try:
+            value = await load()
+        except asyncio.CancelledError:
+            result.cancel()
+            raise
+        except BaseException as exc:
+            result.set_exception(exc)
+            # Marked as retrieved so an error nobody else waited for is not logged twice.
+            result.exception()
+            raise
+        else:
+            result.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is result:
+                del self._inflight[key]
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+class _Call(Generic[T]):
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: T | None = None
+        self.error: BaseException | None = None
+
+
+class SyncSingleFlight(Generic[T]):
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self._inflight: dict[Hashable, _Call[T]] = {}
+
+    def do(self, key: Hashable, load: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+        if not leader:
+            SINGLEFLIGHT_CALLS.inc(flight=self.name, role="shared")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        SINGLEFLIGHT_CALLS.inc(flight=self.name, role="leader")
+        try:
+            call.result = load()
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+
+
+__all__ = ["SingleFlight", "SyncSingleFlight"]
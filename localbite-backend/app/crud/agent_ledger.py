@@ -0,0 +1,179 @@
+"""
+Agent earnings ledger.
+
+Every payout is one INSERT into agent_ledger; the agent's totals move with a single
+atomic `UPDATE ... SET total_earnings = total_earnings + :amount` in the same
+transaction, so concurrent deliveries never overwrite each other and the agent row is
+only locked for that statement until commit. The ledger is the source of truth:
+`reconcile_totals` recomputes the aggregates from it (app.jobs.reconcile_agent_earnings).
+"""
+from datetime import datetime
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.crud import entity_cache
+from app.models.agent_ledger import AgentLedgerEntry
+from app.models.delivery_agent import DeliveryAgent
+from app.models.order import Order
+
+DELIVERY_PAYOUT = "delivery_payout"
+ADJUSTMENT = "adjustment"
+
+
+def append(
+    db: Session,
+    *,
+    agent_id: str,
+    entry_type: str,
+    amount: float,
+    order_id: int | None = None,
+    deliveries: int = 0,
+    note: str | None = None,
+    created_at: datetime | None = None,
+) -> AgentLedgerEntry:
+    """
+    Insert the entry and bump the agent's totals. Does not commit; a duplicate payout
+    for the same order raises IntegrityError at flush.
+    """
+    entry = AgentLedgerEntry(
+        agent_id=agent_id,
+        order_id=order_id,
+        entry_type=entry_type,
+        amount=round(amount, 2),
+        deliveries=deliveries,
+        note=note,
+    )
+    if created_at is not None:
+        entry.created_at = created_at
+    db.add(entry)
+    db.flush()
+    db.execute(
+        update(DeliveryAgent)
+        .where(DeliveryAgent.agent_id == agent_id)
+        .values(
+            total_earnings=func.coalesce(DeliveryAgent.total_earnings, 0) + entry.amount,
+            total_deliveries=func.coalesce(DeliveryAgent.total_deliveries, 0) + deliveries,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    entity_cache.invalidate(DeliveryAgent, agent_id, db=db)
+    return entry
+
+
+def record_delivery_payout(db: Session, agent_id: str, order_id: int, amount: float) -> AgentLedgerEntry:
+    return append(
+        db,
+        agent_id=agent_id,
+        order_id=order_id,
+        entry_type=DELIVERY_PAYOUT,
+        amount=amount,
+        deliveries=1,
+    )
+
+
+def list_entries(
+    db: Session, agent_id: str, *, limit: int = 20, since: datetime | None = None
+) -> list[AgentLedgerEntry]:
+    query = db.query(AgentLedgerEntry).filter(AgentLedgerEntry.agent_id == agent_id)
+    if since is not None:
+        query = query.filter(AgentLedgerEntry.created_at >= since)
+    return (
+        query.order_by(AgentLedgerEntry.created_at.desc(), AgentLedgerEntry.entry_id.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def sum_since(db: Session, agent_id: str, since: datetime) -> tuple[float, int]:
+    """(earnings, deliveries) booked since `since`, e.g. for "this week"."""
+    amount, deliveries = (
+        db.query(
+            func.coalesce(func.sum(AgentLedgerEntry.amount), 0.0),
+            func.coalesce(func.sum(AgentLedgerEntry.deliveries), 0),
+        )
+        .filter(AgentLedgerEntry.agent_id == agent_id, AgentLedgerEntry.created_at >= since)
+        .one()
+    )
+    return round(float(amount), 2), int(deliveries)
+
+
+def backfill_paid_orders(db: Session) -> int:
+    """
+    Ledger entries for orders paid out before the ledger existed (payout status "paid",
+    no delivery_payout entry). Inserted without touching the totals, which already
+    include them. Does not commit.
+    """
+    booked = db.query(AgentLedgerEntry.order_id).filter(
+        AgentLedgerEntry.entry_type == DELIVERY_PAYOUT, AgentLedgerEntry.order_id.isnot(None)
+    )
+    missing = (
+        db.query(Order)
+        .filter(Order.agent_payout_status == "paid")
+        .filter(Order.assigned_partner_id.isnot(None))
+        .filter(Order.order_id.notin_(booked))
+        .all()
+    )
+    for order in missing:
+        entry = AgentLedgerEntry(
+            agent_id=order.assigned_partner_id,
+            order_id=order.order_id,
+            entry_type=DELIVERY_PAYOUT,
+            amount=round(float(order.agent_payout_amount or order.delivery_fee or 0), 2),
+            deliveries=1,
+            note="backfilled",
+        )
+        if order.delivered_at is not None:
+            entry.created_at = order.delivered_at
+        db.add(entry)
+    db.flush()
+    return len(missing)
+
+
+def ledger_totals(db: Session) -> dict[str, tuple[float, int]]:
+    rows = db.query(
+        AgentLedgerEntry.agent_id,
+        func.sum(AgentLedgerEntry.amount),
+        func.sum(AgentLedgerEntry.deliveries),
+    ).group_by(AgentLedgerEntry.agent_id)
+    return {agent_id: (round(float(amount or 0), 2), int(deliveries or 0)) for agent_id, amount, deliveries in rows}
+
+
+def reconcile_totals(db: Session, *, apply: bool = False) -> list[tuple[str, float, float, int, int]]:
+    """
+    Compare each agent's aggregates with the ledger. Returns drifted agents as
+    (agent_id, stored earnings, ledger earnings, stored deliveries, ledger deliveries);
+    with `apply` the aggregates are reset to the ledger sums (not committed).
+
+    The reset locks the drifted agents' rows first, then recomputes the sums in the UPDATE
+    itself: a payout committed after the comparison is in both the row and the ledger by
+    then, and one still in flight adds its amount on top once the lock is released.
+    """
+    totals = ledger_totals(db)
+    drifted = []
+    for agent in db.query(DeliveryAgent).populate_existing().all():
+        earnings, deliveries = totals.get(agent.agent_id, (0.0, 0))
+        stored_earnings = round(float(agent.total_earnings or 0), 2)
+        stored_deliveries = int(agent.total_deliveries or 0)
+        if stored_earnings == earnings and stored_deliveries == deliveries:
+            continue
+        drifted.append((agent.agent_id, stored_earnings, earnings, stored_deliveries, deliveries))
+    if apply and drifted:
+        agent_ids = [row[0] for row in drifted]
+        db.query(DeliveryAgent.agent_id).filter(DeliveryAgent.agent_id.in_(agent_ids)).with_for_update().all()
+        ledger = select(AgentLedgerEntry).where(AgentLedgerEntry.agent_id == DeliveryAgent.agent_id)
+        db.execute(
+            update(DeliveryAgent)
+            .where(DeliveryAgent.agent_id.in_(agent_ids))
+            .values(
+                total_earnings=ledger.with_only_columns(
+                    func.coalesce(func.sum(AgentLedgerEntry.amount), 0.0)
+                ).scalar_subquery(),
+                total_deliveries=ledger.with_only_columns(
+                    func.coalesce(func.sum(AgentLedgerEntry.deliveries), 0)
+                ).scalar_subquery(),
+            )
+            .execution_options(synchronize_session="fetch")
+        )
+        entity_cache.invalidate(DeliveryAgent, *agent_ids, db=db)
+    return drifted
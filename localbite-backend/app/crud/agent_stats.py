@@ -0,0 +1,206 @@
+"""
+Per-agent daily performance rollups.
+
+Each event bumps counters on the agent's agent_daily_stats row for that UTC day with an
+upsert (`INSERT ... ON CONFLICT DO UPDATE SET x = x + excluded.x`), in the caller's
+transaction:
+
+  - record_bid       bid placed: bids_placed, bid amount and the base fare it bid against
+  - record_award     auction decided: bids_won for the winner, bids_lost for the others
+  - record_delivery  order fulfilled: deliveries, on-time deliveries, earnings, active time
+
+A delivery is on time when it lands within AGENT_ON_TIME_MINUTES of the food being ready
+(ready_at, or created_at + DEFAULT_PREP_MINUTES when the kitchen never marked it).
+Active time runs from assignment to delivery, starting no earlier than the agent's
+previous delivery that day, so a multi-order trip is not counted twice.
+"""
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.models.agent_daily_stats import AgentDailyStats
+from app.models.delivery_bid import DeliveryBid
+from app.models.order import Order
+from app.services.prep_time import DEFAULT_PREP_MINUTES
+
+AGENT_ON_TIME_MINUTES = float(os.getenv("AGENT_ON_TIME_MINUTES", "25"))
+
+_COUNTERS = (
+    "bids_placed",
+    "bid_amount_sum",
+    "base_fare_sum",
+    "bids_won",
+    "bids_lost",
+    "deliveries",
+    "on_time_deliveries",
+    "earnings",
+    "active_seconds",
+)
+
+
+def _utc(at: datetime) -> datetime:
+    return at.replace(tzinfo=timezone.utc) if at.tzinfo is None else at.astimezone(timezone.utc)
+
+
+def _bump(
+    db: Session,
+    agent_id: str,
+    day: date,
+    *,
+    last_delivered_at: datetime | None = None,
+    **deltas: float,
+) -> None:
+    """Add `deltas` to the agent's counters for `day`, creating the row if needed."""
+    unknown = set(deltas) - set(_COUNTERS)
+    if unknown:
+        raise ValueError(f"Unknown agent stats counters {sorted(unknown)}")
+    values = {name: deltas.get(name, 0) for name in _COUNTERS}
+    if last_delivered_at is not None:
+        values["last_delivered_at"] = last_delivered_at
+
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = pg_insert if dialect == "postgresql" else sqlite_insert
+        stmt = insert(AgentDailyStats).values(agent_id=agent_id, day=day, **values)
+        table = AgentDailyStats.__table__
+        updates = {
+            name: table.c[name] + stmt.excluded[name] for name in _COUNTERS if deltas.get(name)
+        }
+        if last_delivered_at is not None:
+            latest = func.greatest if dialect == "postgresql" else func.max
+            updates["last_delivered_at"] = func.coalesce(
+                latest(table.c.last_delivered_at, stmt.excluded.last_delivered_at),
+                stmt.excluded.last_delivered_at,
+            )
+        if not updates:
+            return
+        updates["updated_at"] = func.now()
+        db.execute(stmt.on_conflict_do_update(index_elements=["agent_id", "day"], set_=updates))
+        return
+
+    row = db.get(AgentDailyStats, (agent_id, day))
+    if row is None:
+        row = AgentDailyStats(agent_id=agent_id, day=day, **{name: 0 for name in _COUNTERS})
+        db.add(row)
+    for name, delta in deltas.items():
+        setattr(row, name, (getattr(row, name) or 0) + delta)
+    if last_delivered_at is not None and (
+        row.last_delivered_at is None or _utc(row.last_delivered_at) < last_delivered_at
+    ):
+        row.last_delivered_at = last_delivered_at
+    db.flush()
+
+
+def record_bid(db: Session, agent_id: str, bid_amount: float, base_fare: float, at: datetime) -> None:
+    _bump(
+        db,
+        agent_id,
+        _utc(at).date(),
+        bids_placed=1,
+        bid_amount_sum=bid_amount,
+        base_fare_sum=base_fare,
+    )
+
+
+def record_award(db: Session, winner: DeliveryBid, bids: list[DeliveryBid], at: datetime) -> None:
+    """`bids` are the order's other bids that were still open when `winner` was accepted."""
+    day = _utc(at).date()
+    _bump(db, winner.agent_id, day, bids_won=1)
+    lost: dict[str, int] = {}
+    for bid in bids:
+        if bid.bid_id != winner.bid_id:
+            lost[bid.agent_id] = lost.get(bid.agent_id, 0) + 1
+    for agent_id, count in lost.items():
+        _bump(db, agent_id, day, bids_lost=count)
+
+
+def delivery_deadline(order: Order) -> datetime | None:
+    if order.ready_at is not None:
+        ready = _utc(order.ready_at)
+    elif order.created_at is not None:
+        ready = _utc(order.created_at) + timedelta(minutes=DEFAULT_PREP_MINUTES)
+    else:
+        return None
+    return ready + timedelta(minutes=AGENT_ON_TIME_MINUTES)
+
+
+def record_delivery(db: Session, agent_id: str, order: Order, payout: float, delivered_at: datetime) -> None:
+    delivered_at = _utc(delivered_at)
+    day = delivered_at.date()
+    deadline = delivery_deadline(order)
+    active_seconds = 0.0
+    if order.assigned_at is not None:
+        started = _utc(order.assigned_at)
+        row = db.get(AgentDailyStats, (agent_id, day))
+        if row is not None and row.last_delivered_at is not None:
+            started = max(started, _utc(row.last_delivered_at))
+        active_seconds = max((delivered_at - started).total_seconds(), 0.0)
+    _bump(
+        db,
+        agent_id,
+        day,
+        last_delivered_at=delivered_at,
+        deliveries=1,
+        on_time_deliveries=1 if deadline is not None and delivered_at <= deadline else 0,
+        earnings=payout,
+        active_seconds=active_seconds,
+    )
+
+
+def list_days(db: Session, agent_id: str, start: date, end: date) -> list[AgentDailyStats]:
+    return (
+        db.query(AgentDailyStats)
+        .filter(AgentDailyStats.agent_id == agent_id)
+        .filter(AgentDailyStats.day >= start, AgentDailyStats.day <= end)
+        .order_by(AgentDailyStats.day)
+        .all()
+    )
+
+
+@dataclass
+class AgentStatsTotals:
+    bids_placed: int = 0
+    bid_amount_sum: float = 0.0
+    base_fare_sum: float = 0.0
+    bids_won: int = 0
+    bids_lost: int = 0
+    deliveries: int = 0
+    on_time_deliveries: int = 0
+    earnings: float = 0.0
+    active_seconds: float = 0.0
+
+    @classmethod
+    def from_rows(cls, rows: list[AgentDailyStats]) -> "AgentStatsTotals":
+        totals = cls()
+        for row in rows:
+            for name in _COUNTERS:
+                setattr(totals, name, getattr(totals, name) + (getattr(row, name) or 0))
+        return totals
+
+    @property
+    def acceptance_rate(self) -> float | None:
+        """Share of placed bids that were accepted."""
+        return self.bids_won / self.bids_placed if self.bids_placed else None
+
+    @property
+    def win_rate(self) -> float | None:
+        """Share of decided auctions the agent won (bids still open are left out)."""
+        decided = self.bids_won + self.bids_lost
+        return self.bids_won / decided if decided else None
+
+    @property
+    def avg_bid_to_base_fare(self) -> float | None:
+        return self.bid_amount_sum / self.base_fare_sum if self.base_fare_sum else None
+
+    @property
+    def on_time_rate(self) -> float | None:
+        return self.on_time_deliveries / self.deliveries if self.deliveries else None
+
+    @property
+    def earnings_per_hour(self) -> float | None:
+        return self.earnings / (self.active_seconds / 3600.0) if self.active_seconds > 0 else None
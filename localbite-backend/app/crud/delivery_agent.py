@@ -1,4 +1,6 @@
 from sqlalchemy.orm import Session
+from app.crud import agent_ledger as agent_ledger_crud
+from app.crud import entity_cache
 from app.models.delivery_agent import DeliveryAgent
 from app.schemas.delivery_agent import DeliveryAgentCreate, DeliveryAgentUpdate
 
@@ -22,20 +24,32 @@ def create(db: Session, payload: DeliveryAgentCreate) -> DeliveryAgent:
         is_active=payload.is_active,
         is_verified=payload.is_verified,
         rating=payload.rating,
-        total_deliveries=payload.total_deliveries,
+        # Totals only move through the ledger; a starting count becomes an adjustment.
+        total_deliveries=0,
+        total_earnings=0.0,
         current_lat=payload.current_lat,
         current_lng=payload.current_lng,
         base_payout_per_delivery=payload.base_payout_per_delivery,
         bonus_multiplier=payload.bonus_multiplier,
     )
     db.add(db_obj)
+    if payload.total_deliveries:
+        db.flush()
+        agent_ledger_crud.append(
+            db,
+            agent_id=db_obj.agent_id,
+            entry_type=agent_ledger_crud.ADJUSTMENT,
+            amount=0.0,
+            deliveries=payload.total_deliveries,
+            note="opening balance",
+        )
     db.commit()
     db.refresh(db_obj)
     return db_obj
 
 
 def get_by_id(db: Session, agent_id: str) -> DeliveryAgent | None:
-    return db.query(DeliveryAgent).filter(DeliveryAgent.agent_id == agent_id).first()
+    return entity_cache.get(db, DeliveryAgent, agent_id)
 
 
 def list_all(db: Session, skip: int = 0, limit: int = 100) -> list[DeliveryAgent]:
@@ -46,9 +60,23 @@ def update(
     db: Session, db_obj: DeliveryAgent, payload: DeliveryAgentUpdate
 ) -> DeliveryAgent:
     updates = payload.model_dump(exclude_unset=True)
+    # Setting a total books the difference as a ledger adjustment.
+    earnings = updates.pop("total_earnings", None)
+    deliveries = updates.pop("total_deliveries", None)
     for field, value in updates.items():
         setattr(db_obj, field, value)
     db.add(db_obj)
+    earnings_delta = 0.0 if earnings is None else round(earnings - float(db_obj.total_earnings or 0), 2)
+    deliveries_delta = 0 if deliveries is None else deliveries - int(db_obj.total_deliveries or 0)
+    if earnings_delta or deliveries_delta:
+        agent_ledger_crud.append(
+            db,
+            agent_id=db_obj.agent_id,
+            entry_type=agent_ledger_crud.ADJUSTMENT,
+            amount=earnings_delta,
+            deliveries=deliveries_delta,
+            note="manual adjustment",
+        )
     db.commit()
     db.refresh(db_obj)
     return db_obj
@@ -1,6 +1,12 @@
+import base64
+from datetime import datetime
+
+from sqlalchemy import case, func, tuple_
 from sqlalchemy.orm import Session
 from app.models.delivery_bid import DeliveryBid
 
+BID_STATUSES = ("placed", "accepted", "rejected", "expired", "withdrawn")
+
 
 def create(
     db: Session,
@@ -40,10 +46,88 @@ def list_by_order(db: Session, order_id: int) -> list[DeliveryBid]:
     )
 
 
-def list_by_agent(db: Session, agent_id: str) -> list[DeliveryBid]:
-    return (
-        db.query(DeliveryBid)
-        .filter(DeliveryBid.agent_id == agent_id)
-        .order_by(DeliveryBid.created_at.desc(), DeliveryBid.bid_id.desc())
+def encode_cursor(key: tuple[datetime, int]) -> str:
+    """Opaque form of a (created_at, bid_id) keyset returned by list_by_agent."""
+    created_at, bid_id = key
+    raw = f"{created_at.isoformat()}|{bid_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Raises ValueError for a cursor this module did not produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, bid_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(bid_id)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise ValueError(f"Invalid cursor {cursor!r}") from exc
+
+
+def _agent_bids(
+    db: Session,
+    agent_id: str,
+    *,
+    since: datetime | None = None,
+    until: datetime | None = None,
+):
+    query = db.query(DeliveryBid).filter(DeliveryBid.agent_id == agent_id)
+    if since is not None:
+        query = query.filter(DeliveryBid.created_at >= since)
+    if until is not None:
+        query = query.filter(DeliveryBid.created_at < until)
+    return query
+
+
+def list_by_agent(
+    db: Session,
+    agent_id: str,
+    *,
+    limit: int = 50,
+    cursor: tuple[datetime, int] | None = None,
+    status: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> tuple[list[DeliveryBid], tuple[datetime, int] | None]:
+    """
+    One page of the agent's bids, newest first, and the keyset to pass as `cursor` for
+    the next page (None on the last one). Served from ix_delivery_bids_agent_created.
+    """
+    query = _agent_bids(db, agent_id, since=since, until=until)
+    if status is not None:
+        query = query.filter(DeliveryBid.bid_status == status)
+    if cursor is not None:
+        query = query.filter(tuple_(DeliveryBid.created_at, DeliveryBid.bid_id) < tuple_(*cursor))
+    rows = (
+        query.order_by(DeliveryBid.created_at.desc(), DeliveryBid.bid_id.desc())
+        .limit(limit + 1)
         .all()
     )
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1].created_at, rows[-1].bid_id)
+
+
+def summarize_by_agent(
+    db: Session,
+    agent_id: str,
+    *,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> tuple[dict[str, int], float]:
+    """(bid count per status, total amount of accepted bids) in a single aggregate query."""
+    columns = [
+        func.coalesce(func.sum(case((DeliveryBid.bid_status == status, 1), else_=0)), 0)
+        for status in BID_STATUSES
+    ]
+    won_amount = func.coalesce(
+        func.sum(case((DeliveryBid.bid_status == "accepted", DeliveryBid.bid_amount), else_=0.0)), 0.0
+    )
+    row = (
+        _agent_bids(db, agent_id, since=since, until=until)
+        .with_entities(*columns, won_amount)
+        .order_by(None)
+        .one()
+    )
+    counts = {status: int(count) for status, count in zip(BID_STATUSES, row[:-1])}
+    return counts, round(float(row[-1]), 2)
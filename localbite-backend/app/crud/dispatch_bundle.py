@@ -0,0 +1,113 @@
+from datetime import datetime, timezone
+
+from sqlalchemy.orm import Session
+from app.crud import entity_cache
+from app.models.delivery_bid import DeliveryBid
+from app.models.dispatch_bundle import DispatchBundle
+from app.models.order import Order
+from app.services.order_status import ASSIGNED, can_transition
+
+
+class BundleConflictError(Exception):
+    """A member order was assigned on its own before the bundle could be awarded."""
+
+
+def create(
+    db: Session,
+    *,
+    restaurant_id: int,
+    lead_order_id: int,
+    order_ids: list[int],
+    route_distance_km: float,
+    base_fare: float,
+) -> DispatchBundle:
+    db_obj = DispatchBundle(
+        restaurant_id=restaurant_id,
+        lead_order_id=lead_order_id,
+        order_ids=list(order_ids),
+        route_distance_km=route_distance_km,
+        base_fare=base_fare,
+        status="open",
+    )
+    db.add(db_obj)
+    db.flush()
+    (
+        db.query(Order)
+        .filter(Order.order_id.in_(order_ids))
+        .update({Order.bundle_id: db_obj.bundle_id}, synchronize_session="fetch")
+    )
+    entity_cache.invalidate(Order, *order_ids, db=db)
+    db.commit()
+    db.refresh(db_obj)
+    return db_obj
+
+
+def get_by_id(db: Session, bundle_id: int) -> DispatchBundle | None:
+    return db.get(DispatchBundle, bundle_id)
+
+
+def list_members(db: Session, bundle: DispatchBundle) -> list[Order]:
+    orders = {order.order_id: order for order in db.query(Order).filter(Order.order_id.in_(bundle.order_ids))}
+    return [orders[order_id] for order_id in bundle.order_ids if order_id in orders]
+
+
+def effective_base_fare(db: Session, order: Order) -> float:
+    """Base fare agents bid against: the bundle's for a bundled lead order, else the order's."""
+    if order.bundle_id is None:
+        return order.base_fare
+    bundle = db.get(DispatchBundle, order.bundle_id)
+    if bundle is None or bundle.status != "open" or bundle.lead_order_id != order.order_id:
+        return order.base_fare
+    return bundle.base_fare
+
+
+def assign(db: Session, bundle: DispatchBundle, agent_id: str, fee: float) -> list[Order]:
+    """
+    Assign every member order to `agent_id`, splitting `fee` across them. Nothing is
+    committed: the caller commits together with the winning bid, so the award is atomic.
+    """
+    members = list_members(db, bundle)
+    for order in members:
+        if order.assigned_partner_id and order.assigned_partner_id != agent_id:
+            raise BundleConflictError(f"Order {order.order_id} is already assigned to another agent")
+        if not can_transition(order.order_status, ASSIGNED):
+            raise BundleConflictError(f"Order {order.order_id} is '{order.order_status}'")
+    share = round(fee / len(members), 2)
+    now = datetime.now(timezone.utc)
+    for order in members:
+        order.assigned_partner_id = agent_id
+        order.order_status = ASSIGNED
+        order.assigned_at = now
+        # The lead order absorbs the rounding remainder.
+        order.delivery_fee = (
+            round(fee - share * (len(members) - 1), 2) if order.order_id == bundle.lead_order_id else share
+        )
+        db.add(order)
+    bundle.status = "assigned"
+    bundle.assigned_partner_id = agent_id
+    db.add(bundle)
+    return members
+
+
+def dissolve(db: Session, bundle: DispatchBundle) -> list[int]:
+    """
+    Break up an open bundle and reject the lead's placed bids, which were priced against
+    the bundle's fare. Returns the member order ids; restarting their dispatch is up to the
+    caller (see app.dispatch.engine.dissolve_bundle).
+    """
+    order_ids = list(bundle.order_ids)
+    (
+        db.query(Order)
+        .filter(Order.bundle_id == bundle.bundle_id)
+        .update({Order.bundle_id: None}, synchronize_session="fetch")
+    )
+    (
+        db.query(DeliveryBid)
+        .filter(DeliveryBid.order_id == bundle.lead_order_id, DeliveryBid.bid_status == "placed")
+        .update({DeliveryBid.bid_status: "rejected"}, synchronize_session="fetch")
+    )
+    entity_cache.invalidate(Order, *order_ids, db=db)
+    bundle.status = "dissolved"
+    db.add(bundle)
+    db.commit()
+    return order_ids
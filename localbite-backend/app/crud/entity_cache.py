@@ -0,0 +1,330 @@
+"""
+Read-through cache for primary-key lookups of hot rows (agents, orders, restaurants).
+
+    agent = entity_cache.get(db, DeliveryAgent, agent_id)
+
+Two tiers sit in front of `db.get`:
+
+  - local  per-process LRU of ENTITY_CACHE_SIZE rows, kept ENTITY_CACHE_TTL_SECONDS
+  - redis  optional, shared by all processes when ENTITY_CACHE_REDIS_URL is set; rows
+           expire after ENTITY_CACHE_REDIS_TTL_SECONDS
+
+A hit is attached to the caller's session with `merge(load=False)`, so callers get an
+ordinary persistent instance: lazy relationships load, and changes flush as UPDATEs.
+Rows the session already holds are returned from its identity map as before.
+
+Invalidation:
+  - any ORM flush that updates or deletes a cached row drops it, and drops it again
+    after commit (a reader may have re-cached the old row in between)
+  - bulk UPDATE statements call `invalidate` themselves (ledger totals, GPS flush, ...)
+  - a session never fills the cache with a row it has pending changes for
+
+Concurrent misses for the same row in one process are coalesced: one thread reads the
+database and the others attach its result.
+
+Other processes may serve their local copy for up to ENTITY_CACHE_TTL_SECONDS after a
+change, so keep that short. ENTITY_CACHE_TTL_SECONDS=0 turns the cache off.
+"""
+from __future__ import annotations
+
+import enum
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from datetime import date, datetime
+
+import redis
+from redis.exceptions import RedisError
+from sqlalchemy import Date, DateTime, Enum, event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.core.metrics import Counter, Gauge
+from app.core.singleflight import SyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+ENTITY_CACHE_TTL_SECONDS = float(os.getenv("ENTITY_CACHE_TTL_SECONDS", "2"))
+ENTITY_CACHE_SIZE = int(os.getenv("ENTITY_CACHE_SIZE", "10000"))
+ENTITY_CACHE_REDIS_URL = os.getenv("ENTITY_CACHE_REDIS_URL", "")
+ENTITY_CACHE_REDIS_TTL_SECONDS = int(os.getenv("ENTITY_CACHE_REDIS_TTL_SECONDS", "10"))
+
+_PENDING_KEY = "entity_cache_pending"
+
+ENTITY_CACHE_LOOKUPS = Counter(
+    "localbite_entity_cache_lookups_total",
+    "Primary-key lookups through the entity cache by table and where they were served from.",
+    labelnames=("entity", "result"),
+)
+ENTITY_CACHE_HIT_RATIO = Gauge(
+    "localbite_entity_cache_hit_ratio",
+    "Share of entity cache lookups in this process served without a database read.",
+)
+
+
+def _encode(model, obj) -> str:
+    row = {}
+    for attr in inspect(model).column_attrs:
+        value = getattr(obj, attr.key)
+        if isinstance(value, enum.Enum):
+            value = value.name
+        elif isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        row[attr.key] = value
+    return json.dumps(row)
+
+
+def _decode(model, payload: str) -> dict:
+    row = json.loads(payload)
+    for attr in inspect(model).column_attrs:
+        value = row.get(attr.key)
+        if value is None:
+            continue
+        column_type = attr.columns[0].type
+        if isinstance(column_type, DateTime):
+            row[attr.key] = datetime.fromisoformat(value)
+        elif isinstance(column_type, Date):
+            row[attr.key] = date.fromisoformat(value)
+        elif isinstance(column_type, Enum) and column_type.enum_class is not None:
+            row[attr.key] = column_type.enum_class[value]
+    return row
+
+
+class EntityCache:
+    def __init__(
+        self,
+        *,
+        ttl_seconds: float = ENTITY_CACHE_TTL_SECONDS,
+        max_entries: int = ENTITY_CACHE_SIZE,
+        redis_client: redis.Redis | None = None,
+        redis_ttl_seconds: int = ENTITY_CACHE_REDIS_TTL_SECONDS,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.redis = redis_client
+        self.redis_ttl_seconds = redis_ttl_seconds
+        self._lock = threading.Lock()
+        # One LRU per engine, so separate databases (tests, simulations) never share rows.
+        self._local: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self.tables: set[str] = set()
+        self._lookups: dict[str, dict[str, int]] = {}
+        self._loads: SyncSingleFlight[str | None] = SyncSingleFlight("entity_cache")
+
+    def register(self, model) -> None:
+        """Watch flushes of `model` for invalidation (done on first `get` as well)."""
+        self.tables.add(model.__tablename__)
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    @staticmethod
+    def _redis_key(table: str, pk) -> str:
+        return f"entity:{table}:{pk}"
+
+    def _count(self, table: str, result: str) -> None:
+        ENTITY_CACHE_LOOKUPS.inc(entity=table, result=result)
+        with self._lock:
+            counts = self._lookups.setdefault(table, {"local": 0, "redis": 0, "miss": 0})
+            counts[result] += 1
+
+    def _local_get(self, bind, key: tuple[str, str]) -> str | None:
+        with self._lock:
+            entries = self._local.get(bind)
+            if entries is None or key not in entries:
+                return None
+            expires_at, payload = entries[key]
+            if expires_at <= time.monotonic():
+                del entries[key]
+                return None
+            entries.move_to_end(key)
+            return payload
+
+    def _local_put(self, bind, key: tuple[str, str], payload: str) -> None:
+        with self._lock:
+            entries = self._local.setdefault(bind, OrderedDict())
+            entries[key] = (time.monotonic() + self.ttl_seconds, payload)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def _redis_get(self, table: str, pk) -> str | None:
+        if self.redis is None:
+            return None
+        try:
+            payload = self.redis.get(self._redis_key(table, pk))
+        except RedisError:
+            logger.debug("Entity cache read from Redis failed", exc_info=True)
+            return None
+        return payload.decode() if isinstance(payload, bytes) else payload
+
+    def _redis_put(self, table: str, pk, payload: str) -> None:
+        if self.redis is None:
+            return
+        try:
+            self.redis.set(self._redis_key(table, pk), payload, ex=self.redis_ttl_seconds)
+        except RedisError:
+            logger.debug("Entity cache write to Redis failed", exc_info=True)
+
+    def get(self, db: Session, model, pk):
+        """`db.get(model, pk)`, served from the cache when possible."""
+        if not self.enabled or pk is None:
+            return db.get(model, pk)
+        table = model.__tablename__
+        self.tables.add(table)
+        key = (table, str(pk))
+        if db.identity_map.get(db.identity_key(model, pk)) is not None or key in db.info.get(_PENDING_KEY, ()):
+            return db.get(model, pk)
+
+        bind = db.get_bind()
+        payload = self._local_get(bind, key)
+        if payload is not None:
+            self._count(table, "local")
+        else:
+            payload = self._redis_get(table, pk)
+            if payload is not None:
+                self._count(table, "redis")
+                self._local_put(bind, key, payload)
+        if payload is not None:
+            return self._attach(db, model, payload)
+
+        self._count(table, "miss")
+        loaded = []
+
+        def _load() -> str | None:
+            obj = db.get(model, pk)
+            loaded.append(obj)
+            if obj is None:
+                return None
+            payload = _encode(model, obj)
+            self._local_put(bind, key, payload)
+            self._redis_put(table, pk, payload)
+            return payload
+
+        payload = self._loads.do((bind, key), _load)
+        if loaded:
+            return loaded[0]
+        # Another thread loaded the row while this one waited.
+        return self._attach(db, model, payload) if payload is not None else None
+
+    @staticmethod
+    def _attach(db: Session, model, payload: str):
+        obj = model(**_decode(model, payload))
+        make_transient_to_detached(obj)
+        return db.merge(obj, load=False)
+
+    def invalidate(self, model, *pks, db: Session | None = None) -> None:
+        """
+        Drop rows from both tiers. With `db`, they are dropped again when that session
+        commits or rolls back, and the session will not re-cache them before then.
+        """
+        if not pks:
+            return
+        table = model.__tablename__ if not isinstance(model, str) else model
+        keys = [(table, str(pk)) for pk in pks]
+        with self._lock:
+            for entries in self._local.values():
+                for key in keys:
+                    entries.pop(key, None)
+        if self.redis is not None:
+            try:
+                self.redis.delete(*(self._redis_key(table, pk) for pk in pks))
+            except RedisError:
+                logger.warning("Entity cache invalidation in Redis failed", exc_info=True)
+        if db is not None:
+            db.info.setdefault(_PENDING_KEY, set()).update(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._local.clear()
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Lookups per table by outcome, with the hit ratio over both tiers."""
+        with self._lock:
+            lookups = {table: dict(counts) for table, counts in self._lookups.items()}
+        for counts in lookups.values():
+            total = counts["local"] + counts["redis"] + counts["miss"]
+            counts["hit_ratio"] = (counts["local"] + counts["redis"]) / total if total else 0.0
+        return lookups
+
+    def hit_ratio(self) -> float:
+        with self._lock:
+            hits = sum(counts["local"] + counts["redis"] for counts in self._lookups.values())
+            total = hits + sum(counts["miss"] for counts in self._lookups.values())
+        return hits / total if total else 0.0
+
+
+_cache: EntityCache | None = None
+
+
+def get_entity_cache() -> EntityCache:
+    global _cache
+    if _cache is None:
+        client = (
+            redis.Redis.from_url(ENTITY_CACHE_REDIS_URL, socket_timeout=0.2, socket_connect_timeout=0.2)
+            if ENTITY_CACHE_REDIS_URL
+            else None
+        )
+        _cache = EntityCache(redis_client=client)
+    return _cache
+
+
+def set_entity_cache(cache: EntityCache | None) -> EntityCache | None:
+    global _cache
+    previous, _cache = _cache, cache
+    return previous
+
+
+def get(db: Session, model, pk):
+    return get_entity_cache().get(db, model, pk)
+
+
+def invalidate(model, *pks, db: Session | None = None) -> None:
+    get_entity_cache().invalidate(model, *pks, db=db)
+
+
+def register(model) -> None:
+    get_entity_cache().register(model)
+
+
+ENTITY_CACHE_HIT_RATIO.set_function(lambda: get_entity_cache().hit_ratio())
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_flushed(session: Session, flush_context) -> None:
+    tables = get_entity_cache().tables
+    for obj in list(session.dirty) + list(session.deleted):
+        mapper = inspect(obj).mapper
+        if getattr(mapper.class_, "__tablename__", None) not in tables:
+            continue
+        pk = mapper.primary_key_from_instance(obj)
+        if len(pk) == 1 and pk[0] is not None:
+            invalidate(mapper.class_, pk[0], db=session)
+
+
+def _release_pending(session: Session, *args) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    by_table: dict[str, list[str]] = {}
+    for table, pk in pending:
+        by_table.setdefault(table, []).append(pk)
+    for table, pks in by_table.items():
+        invalidate(table, *pks)
+
+
+event.listen(Session, "after_commit", _release_pending)
+event.listen(Session, "after_soft_rollback", _release_pending)
+
+
+__all__ = [
+    "EntityCache",
+    "get",
+    "get_entity_cache",
+    "invalidate",
+    "register",
+    "set_entity_cache",
+]
@@ -1,7 +1,33 @@
-from sqlalchemy.orm import Session
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.orm import Session, undefer
+from sqlalchemy.orm.exc import StaleDataError
+from app.crud import entity_cache
+from app.crud import order_line_item as line_item_crud
+from app.crud import restaurant_prep_stats as prep_stats_crud
 from app.models.order import Order
+from app.services.order_status import check_transition
 from app.schemas.order import OrderCreate, OrderBase
 
+MAX_PREP_MINUTES = 120.0
+# Orders still undispatched this long after creation are abandoned; the dispatch queries
+# below skip them, which keeps them on the recent end of the created_at index. 0 = no limit.
+DISPATCH_LOOKBACK_HOURS = float(os.getenv("DISPATCH_LOOKBACK_HOURS", "24"))
+
+
+def dispatch_window_start() -> datetime | None:
+    """Oldest created_at the dispatch queries consider, or None when unbounded."""
+    if DISPATCH_LOOKBACK_HOURS <= 0:
+        return None
+    return datetime.now(timezone.utc) - timedelta(hours=DISPATCH_LOOKBACK_HOURS)
+
+
+def _recent(query):
+    since = dispatch_window_start()
+    return query if since is None else query.filter(Order.created_at >= since)
+
+
 def create(db: Session, payload: OrderCreate) -> Order:
     db_obj = Order(
         user_id=payload.user_id,
@@ -11,26 +37,77 @@ def create(db: Session, payload: OrderCreate) -> Order:
         base_fare=payload.base_fare,
         delivery_fee=payload.delivery_fee,
         commission_amount=payload.commission_amount,
-        order_status=payload.order_status
+        order_status=payload.order_status,
+        delivery_lat=payload.delivery_lat,
+        delivery_lng=payload.delivery_lng,
     )
     db.add(db_obj)
+    db.flush()
+    line_item_crud.write_lines(db, {db_obj.order_id: payload.order_items})
     db.commit()
     db.refresh(db_obj)
     return db_obj
 
 def get_by_id(db: Session, order_id: int) -> Order | None:
-    return db.query(Order).filter(Order.order_id == order_id).first()
+    return entity_cache.get(db, Order, order_id)
 
 def get_by_user_id(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> list[Order]:
-    return db.query(Order).filter(Order.user_id == user_id).offset(skip).limit(limit).all()
+    return (
+        db.query(Order)
+        .options(undefer(Order.order_items))
+        .filter(Order.user_id == user_id)
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+
+def list_all(db: Session, skip: int = 0, limit: int = 100, *, with_items: bool = True) -> list[Order]:
+    """With with_items=False the order_items JSON is left unloaded (use item_count)."""
+    query = db.query(Order)
+    if with_items:
+        query = query.options(undefer(Order.order_items))
+    return query.offset(skip).limit(limit).all()
+
+
+def list_awaiting_dispatch(db: Session, limit: int = 1000) -> list[Order]:
+    """
+    Unassigned, unfinished orders created within DISPATCH_LOOKBACK_HOURS; a dispatch for
+    them may still be pending.
+    """
+    return (
+        _recent(db.query(Order))
+        .filter(
+            Order.assigned_partner_id.is_(None),
+            Order.order_status.notin_(("delivered", "cancelled", "assigned")),
+        )
+        .order_by(Order.order_id)
+        .limit(limit)
+        .all()
+    )
+
 
-def list_all(db: Session, skip: int = 0, limit: int = 100) -> list[Order]:
-    return db.query(Order).offset(skip).limit(limit).all()
+def list_batch_candidates(db: Session, restaurant_id: int, limit: int = 50) -> list[Order]:
+    """Open, unassigned, unbundled, recent orders of one restaurant that have a drop-off point."""
+    return (
+        _recent(db.query(Order))
+        .filter(
+            Order.restaurant_id == restaurant_id,
+            Order.assigned_partner_id.is_(None),
+            Order.bundle_id.is_(None),
+            Order.order_status.in_(("pending", "preparing", "ready")),
+            Order.delivery_lat.is_not(None),
+            Order.delivery_lng.is_not(None),
+        )
+        .order_by(Order.created_at, Order.order_id)
+        .limit(limit)
+        .all()
+    )
 
 
 def list_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> list[Order]:
     return (
         db.query(Order)
+        .options(undefer(Order.order_items))
         .filter(Order.user_id == user_id)
         .order_by(Order.created_at.desc(), Order.order_id.desc())
         .offset(skip)
@@ -38,15 +115,59 @@ def list_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100) ->
         .all()
     )
 
+def _mark_ready(db: Session, db_obj: Order) -> None:
+    """Stamp ready_at and feed the kitchen prep time into the restaurant's stats."""
+    db_obj.ready_at = datetime.now(timezone.utc)
+    created_at = db_obj.created_at
+    if created_at is None:
+        return
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    minutes = (db_obj.ready_at - created_at).total_seconds() / 60.0
+    # Orders marked ready hours later (forgotten in the dashboard) would skew the stats.
+    if 0 < minutes <= MAX_PREP_MINUTES:
+        prep_stats_crud.record_prep_time(db, db_obj.restaurant_id, minutes)
+
+
+class VersionConflict(Exception):
+    """The order changed since the caller read it."""
+
+
 def update(db: Session, db_obj: Order, payload: OrderBase) -> Order:
+    """
+    Apply `payload`. Raises IllegalOrderTransition for a status change the state machine
+    forbids, and VersionConflict if `payload.version` is stale or another writer
+    updates the row first (the UPDATE is a compare-and-set on version).
+    """
     updates = payload.model_dump(exclude_unset=True)
+    expected_version = updates.pop("version", None)
+    if expected_version is not None and expected_version != db_obj.version:
+        raise VersionConflict(f"Order {db_obj.order_id} is at version {db_obj.version}, not {expected_version}")
+    if "order_status" in updates:
+        check_transition(db_obj.order_status, updates["order_status"])
+    becomes_ready = updates.get("order_status") == "ready" and db_obj.ready_at is None
     for field, value in updates.items():
         setattr(db_obj, field, value)
+    if becomes_ready:
+        _mark_ready(db, db_obj)
     db.add(db_obj)
-    db.commit()
+    order_id = db_obj.order_id
+    try:
+        db.commit()
+    except StaleDataError as exc:
+        discard_stale(db, order_id)
+        raise VersionConflict(f"Order {order_id} was changed by another request") from exc
     db.refresh(db_obj)
     return db_obj
 
+
+def discard_stale(db: Session, *order_ids: int) -> None:
+    """Roll back after losing a compare-and-set, and drop the cached rows that lost it."""
+    db.rollback()
+    entity_cache.invalidate(Order, *order_ids)
+
+
 def delete(db: Session, db_obj: Order) -> None:
+    line_item_crud.delete_by_order(db, db_obj.order_id)
     db.delete(db_obj)
     db.commit()
@@ -0,0 +1,146 @@
+"""
+Normalized order lines (order_line_items), derived from the orders.order_items JSON.
+
+Orders are written with their lines and item_count in one transaction (see
+app.crud.order.create). Orders created before the table existed have item_count NULL
+until app.jobs.backfill_order_line_items converts them.
+"""
+from datetime import datetime
+
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.crud import entity_cache
+from app.models.menu import MenuItem
+from app.models.order import Order
+from app.models.order_line_item import OrderLineItem
+
+
+def parse_lines(order_items) -> list[tuple[int | None, int]]:
+    """(menu_id, quantity) per entry of an order_items blob; malformed entries are skipped."""
+    if not isinstance(order_items, list):
+        return []
+    lines = []
+    for item in order_items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            menu_id = int(item["item_id"]) if item.get("item_id") is not None else None
+        except (TypeError, ValueError):
+            menu_id = None
+        try:
+            quantity = int(item.get("quantity", 1))
+        except (TypeError, ValueError):
+            quantity = 1
+        lines.append((menu_id, max(quantity, 1)))
+    return lines
+
+
+def item_count(order: Order) -> int:
+    """Stored item count, falling back to the JSON for orders not backfilled yet."""
+    if order.item_count is not None:
+        return order.item_count
+    return len(order.order_items) if isinstance(order.order_items, list) else 0
+
+
+def menu_prices(db: Session, menu_ids) -> dict[int, float]:
+    ids = {menu_id for menu_id in menu_ids if menu_id is not None}
+    if not ids:
+        return {}
+    return dict(db.execute(select(MenuItem.menu_id, MenuItem.price).where(MenuItem.menu_id.in_(ids))).all())
+
+
+def write_lines(db: Session, items_by_order: dict[int, list]) -> int:
+    """
+    Insert the lines of several orders with one price lookup and one executemany.
+    Does not commit. Returns the number of lines written.
+    """
+    parsed = {order_id: parse_lines(items) for order_id, items in items_by_order.items()}
+    prices = menu_prices(db, (menu_id for lines in parsed.values() for menu_id, _ in lines))
+    rows = [
+        {"order_id": order_id, "menu_id": menu_id, "quantity": quantity, "unit_price": prices.get(menu_id)}
+        for order_id, lines in parsed.items()
+        for menu_id, quantity in lines
+    ]
+    if rows:
+        db.execute(insert(OrderLineItem), rows)
+    return len(rows)
+
+
+def list_by_order(db: Session, order_id: int) -> list[OrderLineItem]:
+    return (
+        db.query(OrderLineItem)
+        .filter(OrderLineItem.order_id == order_id)
+        .order_by(OrderLineItem.line_id)
+        .all()
+    )
+
+
+def delete_by_order(db: Session, order_id: int) -> None:
+    db.execute(delete(OrderLineItem).where(OrderLineItem.order_id == order_id))
+
+
+def backfill_batch(db: Session, batch_size: int = 500) -> tuple[int, int]:
+    """
+    Convert the next `batch_size` orders that have no item_count yet. Unit prices are the
+    current menu prices, the closest snapshot available for old orders. Does not commit;
+    returns (orders converted, lines written).
+    """
+    orders = db.execute(
+        select(Order.order_id, Order.order_items)
+        .where(Order.item_count.is_(None))
+        .order_by(Order.order_id)
+        .limit(batch_size)
+    ).all()
+    if not orders:
+        return 0, 0
+    order_ids = [order_id for order_id, _ in orders]
+    # A line written for these orders by an earlier, interrupted run would be duplicated.
+    db.execute(delete(OrderLineItem).where(OrderLineItem.order_id.in_(order_ids)))
+    written = write_lines(db, dict(orders))
+    # Core UPDATE: filling in a derived column must not bump the order's version.
+    orders_table = Order.__table__
+    db.execute(
+        update(orders_table)
+        .where(orders_table.c.order_id == bindparam("b_order_id"))
+        .values(item_count=bindparam("b_item_count")),
+        [
+            {"b_order_id": order_id, "b_item_count": len(items) if isinstance(items, list) else 0}
+            for order_id, items in orders
+        ],
+    )
+    entity_cache.invalidate(Order, *order_ids, db=db)
+    return len(orders), written
+
+
+def item_sales(
+    db: Session,
+    restaurant_id: int,
+    *,
+    since: datetime | None = None,
+    limit: int = 20,
+):
+    """
+    Best-selling items of a restaurant: (menu_id, item_name, quantity, revenue, orders)
+    rows, most units first. Cancelled orders are left out; revenue uses the snapshotted
+    unit prices.
+    """
+    quantity = func.sum(OrderLineItem.quantity).label("quantity")
+    query = (
+        select(
+            OrderLineItem.menu_id,
+            MenuItem.item_name,
+            quantity,
+            func.coalesce(func.sum(OrderLineItem.quantity * OrderLineItem.unit_price), 0.0).label("revenue"),
+            func.count(func.distinct(OrderLineItem.order_id)).label("orders"),
+        )
+        .join(Order, Order.order_id == OrderLineItem.order_id)
+        .outerjoin(MenuItem, MenuItem.menu_id == OrderLineItem.menu_id)
+        .where(Order.restaurant_id == restaurant_id, Order.order_status != "cancelled")
+        .group_by(OrderLineItem.menu_id, MenuItem.item_name)
+        .order_by(quantity.desc(), OrderLineItem.menu_id)
+        .limit(limit)
+    )
+    if since is not None:
+        query = query.where(Order.created_at >= since)
+    return db.execute(query).all()
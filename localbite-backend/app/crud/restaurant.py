@@ -1,4 +1,5 @@
 from sqlalchemy.orm import Session
+from app.crud import entity_cache
 from app.models.restaurant import Restaurant
 from app.schemas.restaurant import RestaurantCreate, RestaurantUpdate
 
@@ -29,7 +30,7 @@ def create(db: Session, payload: RestaurantCreate) -> Restaurant:
 
 
 def get_by_id(db: Session, restaurant_id: int) -> Restaurant | None:
-    return db.query(Restaurant).filter(Restaurant.id == restaurant_id).first()
+    return entity_cache.get(db, Restaurant, restaurant_id)
 
 
 def list_all(db: Session, skip: int = 0, limit: int = 100) -> list[Restaurant]:
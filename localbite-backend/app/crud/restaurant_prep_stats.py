@@ -0,0 +1,64 @@
+from sqlalchemy import case
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from app.models.restaurant_prep_stats import RestaurantPrepStats
+
+# Weight of the newest sample in the recency-weighted mean.
+PREP_EWMA_ALPHA = 0.2
+
+
+def get_by_restaurant(db: Session, restaurant_id: int) -> RestaurantPrepStats | None:
+    return db.get(RestaurantPrepStats, restaurant_id)
+
+
+def record_prep_time(db: Session, restaurant_id: int, minutes: float) -> None:
+    """
+    Fold one prep-time sample into the restaurant's running stats. The caller commits.
+
+    On Postgres and SQLite this is one upsert computed from the stored row, so two orders
+    marked ready at once both count and a restaurant's first sample cannot collide.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = pg_insert if dialect == "postgresql" else sqlite_insert
+        stmt = insert(RestaurantPrepStats).values(
+            restaurant_id=restaurant_id, samples=1, mean_minutes=minutes, m2=0.0, ewma_minutes=minutes
+        )
+        table = RestaurantPrepStats.__table__
+        # Every SET expression reads the row as it was before this update.
+        delta = minutes - table.c.mean_minutes
+        mean = table.c.mean_minutes + delta / (table.c.samples + 1)
+        updates = {
+            "samples": table.c.samples + 1,
+            "mean_minutes": mean,
+            "m2": table.c.m2 + delta * (minutes - mean),
+            "ewma_minutes": case(
+                (table.c.samples == 0, minutes),
+                else_=PREP_EWMA_ALPHA * minutes + (1 - PREP_EWMA_ALPHA) * table.c.ewma_minutes,
+            ),
+            "updated_at": func.now(),
+        }
+        db.execute(stmt.on_conflict_do_update(index_elements=["restaurant_id"], set_=updates))
+        # The session may hold the row from an earlier read; it is stale now.
+        stats = db.identity_map.get(db.identity_key(RestaurantPrepStats, restaurant_id))
+        if stats is not None:
+            db.expire(stats)
+        return
+
+    stats = db.get(RestaurantPrepStats, restaurant_id)
+    if stats is None:
+        stats = RestaurantPrepStats(
+            restaurant_id=restaurant_id, samples=0, mean_minutes=0.0, m2=0.0, ewma_minutes=minutes
+        )
+        db.add(stats)
+    samples = stats.samples + 1
+    delta = minutes - stats.mean_minutes
+    mean = stats.mean_minutes + delta / samples
+    stats.m2 = stats.m2 + delta * (minutes - mean)
+    stats.mean_minutes = mean
+    stats.samples = samples
+    stats.ewma_minutes = (
+        minutes if samples == 1 else PREP_EWMA_ALPHA * minutes + (1 - PREP_EWMA_ALPHA) * stats.ewma_minutes
+    )
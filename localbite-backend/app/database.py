@@ -88,6 +88,11 @@ def ensure_delivery_agent_columns():
                 "ALTER TABLE IF EXISTS public.delivery_agents ADD COLUMN IF NOT EXISTS total_earnings DOUBLE PRECISION DEFAULT 0;"
             )
         )
+        conn.execute(
+            text(
+                "ALTER TABLE IF EXISTS public.delivery_agents ADD COLUMN IF NOT EXISTS location_updated_at TIMESTAMPTZ;"
+            )
+        )
 
 
 def ensure_order_delivery_columns():
@@ -105,6 +110,11 @@ def ensure_order_delivery_columns():
                 "ALTER TABLE IF EXISTS public.orders ADD COLUMN IF NOT EXISTS delivery_proof_filename VARCHAR;"
             )
         )
+        conn.execute(
+            text(
+                "ALTER TABLE IF EXISTS public.orders ADD COLUMN IF NOT EXISTS delivery_proof_thumbnail_ref VARCHAR;"
+            )
+        )
         conn.execute(
             text(
                 "ALTER TABLE IF EXISTS public.orders ADD COLUMN IF NOT EXISTS agent_payout_amount DOUBLE PRECISION;"
@@ -120,3 +130,56 @@ def ensure_order_delivery_columns():
                 "ALTER TABLE IF EXISTS public.orders ADD COLUMN IF NOT EXISTS delivered_at TIMESTAMPTZ;"
             )
         )
+        conn.execute(
+            text(
+                "ALTER TABLE IF EXISTS public.orders ADD COLUMN IF NOT EXISTS assigned_at TIMESTAMPTZ;"
+            )
+        )
+        conn.execute(
+            text(
+                "ALTER TABLE IF EXISTS public.orders ADD COLUMN IF NOT EXISTS ready_at TIMESTAMPTZ;"
+            )
+        )
+        conn.execute(
+            text(
+                "ALTER TABLE IF EXISTS public.orders ADD COLUMN IF NOT EXISTS bundle_id INTEGER;"
+            )
+        )
+        conn.execute(
+            text(
+                "ALTER TABLE IF EXISTS public.orders ADD COLUMN IF NOT EXISTS delivery_lat DOUBLE PRECISION;"
+            )
+        )
+        conn.execute(
+            text(
+                "ALTER TABLE IF EXISTS public.orders ADD COLUMN IF NOT EXISTS delivery_lng DOUBLE PRECISION;"
+            )
+        )
+        conn.execute(
+            text(
+                "ALTER TABLE IF EXISTS public.orders ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0;"
+            )
+        )
+        conn.execute(
+            text(
+                "ALTER TABLE IF EXISTS public.orders ADD COLUMN IF NOT EXISTS item_count INTEGER;"
+            )
+        )
+
+
+def ensure_table_indexes():
+    """
+    Create indexes added to existing tables after they were first created (create_all
+    only builds indexes for new tables).
+    """
+    statements = (
+        "CREATE INDEX IF NOT EXISTS ix_delivery_bids_agent_created "
+        "ON public.delivery_bids (agent_id, created_at DESC, bid_id DESC);",
+        # Hot dispatch queries and the archive job select orders, bids and payments by age.
+        "CREATE INDEX IF NOT EXISTS ix_orders_created_at ON public.orders (created_at);",
+        "CREATE INDEX IF NOT EXISTS ix_delivery_bids_created_at ON public.delivery_bids (created_at);",
+        "CREATE INDEX IF NOT EXISTS ix_payments_created_at ON public.payments (created_at);",
+    )
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
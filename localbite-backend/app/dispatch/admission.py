@@ -0,0 +1,204 @@
+"""
+Admission control for dispatch lifecycles.
+
+Each running dispatch holds a broadcast in the agent queues and polls the state store every
+few seconds, so a burst of orders (game day, exam week) would otherwise start as many
+concurrent auctions as there are orders. The controller caps how many dispatches auction
+at once, globally and per restaurant; orders over the cap wait in a priority queue and are
+admitted as running dispatches finish.
+
+Priority is by order age, boosted by order value: an order worth $N more is treated as if
+it had been placed N * DISPATCH_PRIORITY_SECONDS_PER_DOLLAR seconds earlier. An order
+whose restaurant is at its cap does not block the orders behind it. Once
+DISPATCH_MAX_WAITING orders are waiting, new ones are refused outright.
+
+Caps are enforced per dispatch worker process. A limit of 0 disables that cap.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Generic, Iterable, TypeVar
+
+DISPATCH_MAX_ACTIVE = int(os.getenv("DISPATCH_MAX_ACTIVE", "200"))
+DISPATCH_MAX_ACTIVE_PER_RESTAURANT = int(os.getenv("DISPATCH_MAX_ACTIVE_PER_RESTAURANT", "15"))
+DISPATCH_MAX_WAITING = int(os.getenv("DISPATCH_MAX_WAITING", "2000"))
+DISPATCH_PRIORITY_SECONDS_PER_DOLLAR = float(os.getenv("DISPATCH_PRIORITY_SECONDS_PER_DOLLAR", "30"))
+
+T = TypeVar("T")
+
+
+class AdmissionRejected(Exception):
+    """The waiting queue is full; the caller should retry later."""
+
+
+@dataclass(frozen=True)
+class AdmissionLimits:
+    max_active: int = DISPATCH_MAX_ACTIVE
+    max_active_per_restaurant: int = DISPATCH_MAX_ACTIVE_PER_RESTAURANT
+    max_waiting: int = DISPATCH_MAX_WAITING
+
+
+def admission_priority(
+    ordered_at: datetime,
+    order_value: float = 0.0,
+    *,
+    seconds_per_dollar: float = DISPATCH_PRIORITY_SECONDS_PER_DOLLAR,
+) -> float:
+    """Lower is admitted first."""
+    return ordered_at.timestamp() - max(order_value, 0.0) * seconds_per_dollar
+
+
+class AdmissionController(Generic[T]):
+    """
+    Tracks admitted order ids and a priority queue of waiting ones. Each waiting entry
+    carries an opaque payload (whatever the caller needs to start the dispatch later).
+    Not thread-safe; it lives on the event loop.
+    """
+
+    def __init__(self, limits: AdmissionLimits | None = None) -> None:
+        self.limits = limits or AdmissionLimits()
+        self._active: dict[int, int] = {}
+        self._active_by_restaurant: Counter[int] = Counter()
+        self._heap: list[tuple[float, int, int]] = []
+        self._waiting: dict[int, tuple[float, int, T]] = {}
+        self._sequence = itertools.count()
+
+    # -- capacity ---------------------------------------------------------
+
+    def _has_capacity(self, restaurant_id: int) -> bool:
+        limits = self.limits
+        if limits.max_active and len(self._active) >= limits.max_active:
+            return False
+        if (
+            limits.max_active_per_restaurant
+            and self._active_by_restaurant[restaurant_id] >= limits.max_active_per_restaurant
+        ):
+            return False
+        return True
+
+    def _mark_active(self, order_id: int, restaurant_id: int) -> None:
+        self._active[order_id] = restaurant_id
+        self._active_by_restaurant[restaurant_id] += 1
+
+    # -- public API -------------------------------------------------------
+
+    def try_admit(self, order_id: int, restaurant_id: int, priority: float) -> bool:
+        """
+        Admit the order now if there is capacity and no waiting order of the same or a
+        better priority could use it instead. Already admitted orders return True.
+        """
+        if order_id in self._active:
+            return True
+        if not self._has_capacity(restaurant_id):
+            return False
+        if any(
+            entry_priority <= priority and self._has_capacity(entry_restaurant)
+            for entry_priority, entry_restaurant, _ in self._waiting.values()
+        ):
+            return False
+        self._mark_active(order_id, restaurant_id)
+        return True
+
+    def enqueue(self, order_id: int, restaurant_id: int, priority: float, payload: T) -> int:
+        """Add the order to the waiting queue; returns its 1-based position."""
+        if order_id not in self._waiting:
+            if self.limits.max_waiting and len(self._waiting) >= self.limits.max_waiting:
+                raise AdmissionRejected(
+                    f"{len(self._waiting)} dispatches are already waiting for capacity"
+                )
+            sequence = next(self._sequence)
+            self._waiting[order_id] = (priority, restaurant_id, payload)
+            heapq.heappush(self._heap, (priority, sequence, order_id))
+        return self.position(order_id) or 0
+
+    def release(self, order_id: int) -> bool:
+        restaurant_id = self._active.pop(order_id, None)
+        if restaurant_id is None:
+            return False
+        self._active_by_restaurant[restaurant_id] -= 1
+        if self._active_by_restaurant[restaurant_id] <= 0:
+            del self._active_by_restaurant[restaurant_id]
+        return True
+
+    def remove(self, order_id: int) -> T | None:
+        """Drop a waiting order (its heap entry is discarded lazily)."""
+        entry = self._waiting.pop(order_id, None)
+        return entry[2] if entry is not None else None
+
+    def pop_admissible(self) -> list[tuple[int, T]]:
+        """
+        Admit waiting orders, best priority first, while there is capacity. Orders whose
+        restaurant is at its cap stay queued in place.
+        """
+        admitted: list[tuple[int, T]] = []
+        skipped: list[tuple[float, int, int]] = []
+        while self._heap:
+            if self.limits.max_active and len(self._active) >= self.limits.max_active:
+                break
+            item = heapq.heappop(self._heap)
+            order_id = item[2]
+            entry = self._waiting.get(order_id)
+            if entry is None or entry[0] != item[0]:
+                continue
+            _, restaurant_id, payload = entry
+            if not self._has_capacity(restaurant_id):
+                skipped.append(item)
+                continue
+            del self._waiting[order_id]
+            self._mark_active(order_id, restaurant_id)
+            admitted.append((order_id, payload))
+        for item in skipped:
+            heapq.heappush(self._heap, item)
+        return admitted
+
+    def drain_waiting(self, order_ids: Iterable[int] | None = None) -> list[tuple[int, T]]:
+        """Take waiting orders out of the queue (all of them by default), in priority order."""
+        if order_ids is None:
+            entries = sorted(self._waiting.items(), key=lambda item: item[1][0])
+            self._waiting.clear()
+            self._heap.clear()
+        else:
+            wanted = set(order_ids)
+            entries = sorted(
+                ((order_id, entry) for order_id, entry in self._waiting.items() if order_id in wanted),
+                key=lambda item: item[1][0],
+            )
+            for order_id, _ in entries:
+                del self._waiting[order_id]
+        return [(order_id, entry[2]) for order_id, entry in entries]
+
+    def is_active(self, order_id: int) -> bool:
+        return order_id in self._active
+
+    def is_waiting(self, order_id: int) -> bool:
+        return order_id in self._waiting
+
+    def position(self, order_id: int) -> int | None:
+        entry = self._waiting.get(order_id)
+        if entry is None:
+            return None
+        return 1 + sum(1 for other in self._waiting.values() if other[0] < entry[0])
+
+    @property
+    def active_count(self) -> int:
+        return len(self._active)
+
+    @property
+    def waiting_count(self) -> int:
+        return len(self._waiting)
+
+    def active_for_restaurant(self, restaurant_id: int) -> int:
+        return self._active_by_restaurant[restaurant_id]
+
+
+__all__ = [
+    "AdmissionController",
+    "AdmissionLimits",
+    "AdmissionRejected",
+    "admission_priority",
+]
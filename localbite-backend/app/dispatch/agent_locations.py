@@ -0,0 +1,504 @@
+"""
+Live delivery agent positions.
+
+Agents report GPS pings every few seconds, far too often to load, update and refresh the
+delivery_agents row each time. Pings go to a location store instead:
+
+    agents:geo               GEO set, member = agent id
+    agents:seen              zset, score = epoch seconds of the agent's latest ping
+    agents:location:dirty    set of agents whose position changed since the last flush
+
+A ping older than the agent's latest one (a retried or reordered request) is dropped; on
+Redis the compare and the writes run in one Lua script, so concurrent pings for the same
+agent cannot interleave. A
+background flusher pops the dirty agents every AGENT_LOCATION_FLUSH_SECONDS and writes
+their latest positions to delivery_agents.current_lat / current_lng /
+location_updated_at in one bulk UPDATE; if the write fails the agents are marked dirty
+again so the next flush retries them.
+
+The store lives on the dispatch state store's Redis. With the memory or postgres state
+backends positions are buffered in-process, so other API processes only see them once
+they are flushed.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Callable, Iterable
+
+import redis.asyncio as aioredis
+from pydantic import BaseModel
+from sqlalchemy import bindparam, or_, text, update
+from sqlalchemy.orm import Session
+
+from app.core.metrics import Counter
+from app.crud import entity_cache
+from app.database import SessionLocal
+from app.dispatch.state_store import FailoverStateStore, RedisStateStore, get_state_store
+from app.models.delivery_agent import DeliveryAgent
+from app.services.distance import _haversine_km
+
+logger = logging.getLogger(__name__)
+
+AGENT_LOCATION_FLUSH_SECONDS = float(os.getenv("AGENT_LOCATION_FLUSH_SECONDS", "5"))
+AGENT_LOCATION_FLUSH_BATCH = int(os.getenv("AGENT_LOCATION_FLUSH_BATCH", "1000"))
+
+GEO_KEY = "agents:geo"
+SEEN_KEY = "agents:seen"
+DIRTY_KEY = "agents:location:dirty"
+
+AGENT_LOCATION_PINGS = Counter(
+    "localbite_agent_location_pings_total",
+    "Agent GPS pings received, by result (accepted, stale).",
+    labelnames=("result",),
+)
+AGENT_LOCATIONS_FLUSHED = Counter(
+    "localbite_agent_locations_flushed_total",
+    "Agent positions written to delivery_agents by the location flusher.",
+)
+AGENT_LOCATION_FLUSH_FAILURES = Counter(
+    "localbite_agent_location_flush_failures_total",
+    "Agent location flush attempts that failed and were left dirty for retry.",
+)
+
+# KEYS: seen, geo, dirty. ARGV: agent_id, timestamp, longitude, latitude per ping.
+# Returns the agent ids whose ping was newer than the one stored.
+_RECORD_SCRIPT = """
+local accepted = {}
+for i = 1, #ARGV, 4 do
+    local agent_id = ARGV[i]
+    local seen = redis.call('ZSCORE', KEYS[1], agent_id)
+    if not seen or tonumber(ARGV[i + 1]) > tonumber(seen) then
+        redis.call('GEOADD', KEYS[2], ARGV[i + 2], ARGV[i + 3], agent_id)
+        redis.call('ZADD', KEYS[1], ARGV[i + 1], agent_id)
+        redis.call('SADD', KEYS[3], agent_id)
+        accepted[#accepted + 1] = agent_id
+    end
+end
+return accepted
+"""
+
+
+class AgentLocation(BaseModel):
+    agent_id: str
+    latitude: float
+    longitude: float
+    recorded_at: datetime
+
+
+class NearbyAgent(AgentLocation):
+    distance_km: float
+
+
+def _timestamp(at: datetime) -> float:
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return at.timestamp()
+
+
+def _from_timestamp(value: float) -> datetime:
+    return datetime.fromtimestamp(value, tz=timezone.utc)
+
+
+def latest_per_agent(locations: Iterable[AgentLocation]) -> dict[str, AgentLocation]:
+    """Collapse a batch to each agent's newest ping."""
+    latest: dict[str, AgentLocation] = {}
+    for location in locations:
+        current = latest.get(location.agent_id)
+        if current is None or _timestamp(location.recorded_at) > _timestamp(current.recorded_at):
+            latest[location.agent_id] = location
+    return latest
+
+
+class AgentLocationStore(ABC):
+    @abstractmethod
+    async def record(self, locations: list[AgentLocation]) -> list[AgentLocation]:
+        """Store pings, skipping any older than the agent's latest. Returns the accepted ones."""
+
+    @abstractmethod
+    async def get(self, agent_id: str) -> AgentLocation | None:
+        ...
+
+    @abstractmethod
+    async def nearby(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        *,
+        max_age_seconds: float | None = None,
+        limit: int = 50,
+    ) -> list[NearbyAgent]:
+        """Agents within `radius_km`, nearest first, optionally only recently seen ones."""
+
+    @abstractmethod
+    async def take_dirty(self, count: int) -> list[AgentLocation]:
+        """Pop up to `count` agents changed since the last flush, with their latest position."""
+
+    @abstractmethod
+    async def mark_dirty(self, agent_ids: Iterable[str]) -> None:
+        ...
+
+
+class RedisAgentLocationStore(AgentLocationStore):
+    def __init__(self, client: aioredis.Redis) -> None:
+        self.client = client
+        self._record_script = client.register_script(_RECORD_SCRIPT)
+
+    async def record(self, locations: list[AgentLocation]) -> list[AgentLocation]:
+        latest = latest_per_agent(locations)
+        if not latest:
+            return []
+        args: list = []
+        for location in latest.values():
+            args.extend(
+                (location.agent_id, repr(_timestamp(location.recorded_at)), location.longitude, location.latitude)
+            )
+        accepted = await self._record_script(keys=[SEEN_KEY, GEO_KEY, DIRTY_KEY], args=args)
+        return [
+            latest[agent_id.decode() if isinstance(agent_id, bytes) else agent_id] for agent_id in accepted
+        ]
+
+    async def _load(self, agent_ids: list[str]) -> list[AgentLocation]:
+        if not agent_ids:
+            return []
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.geopos(GEO_KEY, *agent_ids)
+            pipe.zmscore(SEEN_KEY, agent_ids)
+            positions, seen = await pipe.execute()
+        return [
+            AgentLocation(
+                agent_id=agent_id,
+                latitude=float(position[1]),
+                longitude=float(position[0]),
+                recorded_at=_from_timestamp(score),
+            )
+            for agent_id, position, score in zip(agent_ids, positions, seen)
+            if position is not None and score is not None
+        ]
+
+    async def get(self, agent_id: str) -> AgentLocation | None:
+        found = await self._load([agent_id])
+        return found[0] if found else None
+
+    async def nearby(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        *,
+        max_age_seconds: float | None = None,
+        limit: int = 50,
+    ) -> list[NearbyAgent]:
+        # Over-fetch when filtering by age, since stale agents are still in the GEO set.
+        fetch = limit * 4 if max_age_seconds is not None else limit
+        matches = await self.client.geosearch(
+            GEO_KEY,
+            longitude=longitude,
+            latitude=latitude,
+            radius=radius_km,
+            unit="km",
+            sort="ASC",
+            count=fetch,
+            withdist=True,
+        )
+        if not matches:
+            return []
+        distances = {agent_id: float(distance) for agent_id, distance in matches}
+        cutoff = (
+            datetime.now(timezone.utc).timestamp() - max_age_seconds
+            if max_age_seconds is not None
+            else None
+        )
+        found = []
+        for location in await self._load(list(distances)):
+            if cutoff is not None and _timestamp(location.recorded_at) < cutoff:
+                continue
+            found.append(NearbyAgent(**location.model_dump(), distance_km=distances[location.agent_id]))
+        return found[:limit]
+
+    async def take_dirty(self, count: int) -> list[AgentLocation]:
+        agent_ids = await self.client.spop(DIRTY_KEY, count) or []
+        return await self._load(list(agent_ids))
+
+    async def mark_dirty(self, agent_ids: Iterable[str]) -> None:
+        agent_ids = list(agent_ids)
+        if agent_ids:
+            await self.client.sadd(DIRTY_KEY, *agent_ids)
+
+
+class InMemoryAgentLocationStore(AgentLocationStore):
+    """Positions buffered in this process (memory/postgres state backends, tests)."""
+
+    def __init__(self) -> None:
+        self.locations: dict[str, AgentLocation] = {}
+        self.dirty: set[str] = set()
+
+    async def record(self, locations: list[AgentLocation]) -> list[AgentLocation]:
+        accepted = []
+        for agent_id, location in latest_per_agent(locations).items():
+            current = self.locations.get(agent_id)
+            if current is not None and _timestamp(location.recorded_at) <= _timestamp(current.recorded_at):
+                continue
+            self.locations[agent_id] = location
+            self.dirty.add(agent_id)
+            accepted.append(location)
+        return accepted
+
+    async def get(self, agent_id: str) -> AgentLocation | None:
+        return self.locations.get(agent_id)
+
+    async def nearby(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        *,
+        max_age_seconds: float | None = None,
+        limit: int = 50,
+    ) -> list[NearbyAgent]:
+        cutoff = (
+            datetime.now(timezone.utc).timestamp() - max_age_seconds
+            if max_age_seconds is not None
+            else None
+        )
+        found = []
+        for location in self.locations.values():
+            if cutoff is not None and _timestamp(location.recorded_at) < cutoff:
+                continue
+            distance = _haversine_km(latitude, longitude, location.latitude, location.longitude)
+            if distance <= radius_km:
+                found.append(NearbyAgent(**location.model_dump(), distance_km=distance))
+        found.sort(key=lambda agent: agent.distance_km)
+        return found[:limit]
+
+    async def take_dirty(self, count: int) -> list[AgentLocation]:
+        taken = []
+        while self.dirty and len(taken) < count:
+            agent_id = self.dirty.pop()
+            if agent_id in self.locations:
+                taken.append(self.locations[agent_id])
+        return taken
+
+    async def mark_dirty(self, agent_ids: Iterable[str]) -> None:
+        self.dirty.update(agent_id for agent_id in agent_ids if agent_id in self.locations)
+
+
+_location_store: AgentLocationStore | None = None
+
+
+def get_agent_location_store() -> AgentLocationStore:
+    global _location_store
+    if _location_store is None:
+        store = get_state_store()
+        if isinstance(store, FailoverStateStore):
+            store = store.primary
+        if isinstance(store, RedisStateStore):
+            _location_store = RedisAgentLocationStore(store.client)
+        else:
+            _location_store = InMemoryAgentLocationStore()
+    return _location_store
+
+
+def set_agent_location_store(store: AgentLocationStore | None) -> AgentLocationStore | None:
+    global _location_store
+    previous, _location_store = _location_store, store
+    return previous
+
+
+# ---------------------------------------------------------------------------
+# Flushing positions into delivery_agents
+# ---------------------------------------------------------------------------
+
+_PG_BULK_UPDATE = """
+UPDATE delivery_agents AS a
+SET current_lat = v.lat, current_lng = v.lng, location_updated_at = v.seen
+FROM (SELECT unnest(CAST(:agent_ids AS varchar[])) AS agent_id,
+             unnest(CAST(:lats AS double precision[])) AS lat,
+             unnest(CAST(:lngs AS double precision[])) AS lng,
+             unnest(CAST(:seen AS timestamptz[])) AS seen) AS v
+WHERE a.agent_id = v.agent_id
+  AND (a.location_updated_at IS NULL OR a.location_updated_at < v.seen)
+"""
+
+
+def write_agent_locations(db: Session, locations: list[AgentLocation]) -> None:
+    """
+    Write the positions in one statement (array unnest on Postgres, executemany
+    elsewhere). A position older than the stored one is skipped, so concurrent flushers
+    cannot move an agent backwards.
+    """
+    if not locations:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(
+            text(_PG_BULK_UPDATE),
+            {
+                "agent_ids": [location.agent_id for location in locations],
+                "lats": [location.latitude for location in locations],
+                "lngs": [location.longitude for location in locations],
+                "seen": [location.recorded_at for location in locations],
+            },
+        )
+    else:
+        stmt = (
+            update(DeliveryAgent)
+            .where(DeliveryAgent.agent_id == bindparam("b_agent_id"))
+            .where(
+                or_(
+                    DeliveryAgent.location_updated_at.is_(None),
+                    DeliveryAgent.location_updated_at < bindparam("b_seen"),
+                )
+            )
+            .values(
+                current_lat=bindparam("b_lat"),
+                current_lng=bindparam("b_lng"),
+                location_updated_at=bindparam("b_seen"),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.connection().execute(
+            stmt,
+            [
+                {
+                    "b_agent_id": location.agent_id,
+                    "b_lat": location.latitude,
+                    "b_lng": location.longitude,
+                    "b_seen": location.recorded_at,
+                }
+                for location in locations
+            ],
+        )
+    entity_cache.invalidate(DeliveryAgent, *(location.agent_id for location in locations), db=db)
+    db.commit()
+
+
+async def flush_locations_once(
+    store: AgentLocationStore | None = None,
+    *,
+    batch_size: int = AGENT_LOCATION_FLUSH_BATCH,
+    session_factory: Callable[[], Session] = SessionLocal,
+) -> int:
+    """Persist one batch of changed positions. Returns the number written."""
+    store = store or get_agent_location_store()
+    locations = await store.take_dirty(batch_size)
+    if not locations:
+        return 0
+
+    def _write() -> None:
+        db = session_factory()
+        try:
+            write_agent_locations(db, locations)
+        finally:
+            db.close()
+
+    try:
+        await asyncio.to_thread(_write)
+    except Exception:
+        await store.mark_dirty(location.agent_id for location in locations)
+        raise
+    AGENT_LOCATIONS_FLUSHED.inc(len(locations))
+    return len(locations)
+
+
+async def drain_locations(
+    store: AgentLocationStore | None = None,
+    *,
+    batch_size: int = AGENT_LOCATION_FLUSH_BATCH,
+    session_factory: Callable[[], Session] = SessionLocal,
+) -> int:
+    total = 0
+    while True:
+        flushed = await flush_locations_once(store, batch_size=batch_size, session_factory=session_factory)
+        total += flushed
+        if flushed < batch_size:
+            return total
+
+
+class AgentLocationFlusher:
+    """Background task that persists changed positions every `interval_seconds`."""
+
+    def __init__(
+        self,
+        *,
+        interval_seconds: float = AGENT_LOCATION_FLUSH_SECONDS,
+        batch_size: int = AGENT_LOCATION_FLUSH_BATCH,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ) -> None:
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+        self._task: asyncio.Task | None = None
+
+    async def _drain(self) -> None:
+        await drain_locations(batch_size=self.batch_size, session_factory=self.session_factory)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._drain()
+            except Exception:
+                AGENT_LOCATION_FLUSH_FAILURES.inc()
+                logger.exception("Agent location flush failed; positions stay dirty for retry")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the loop and persist whatever is still dirty."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self._drain()
+        except Exception:
+            logger.exception("Final agent location flush failed")
+
+
+_flusher: AgentLocationFlusher | None = None
+
+
+def start_location_flusher() -> AgentLocationFlusher:
+    global _flusher
+    if _flusher is None:
+        _flusher = AgentLocationFlusher()
+    _flusher.start()
+    return _flusher
+
+
+async def stop_location_flusher() -> None:
+    global _flusher
+    if _flusher is not None:
+        await _flusher.stop()
+        _flusher = None
+
+
+__all__ = [
+    "AGENT_LOCATION_FLUSH_FAILURES",
+    "AGENT_LOCATION_FLUSH_SECONDS",
+    "AGENT_LOCATION_PINGS",
+    "AGENT_LOCATIONS_FLUSHED",
+    "AgentLocation",
+    "AgentLocationFlusher",
+    "AgentLocationStore",
+    "InMemoryAgentLocationStore",
+    "NearbyAgent",
+    "RedisAgentLocationStore",
+    "drain_locations",
+    "flush_locations_once",
+    "get_agent_location_store",
+    "latest_per_agent",
+    "set_agent_location_store",
+    "start_location_flusher",
+    "stop_location_flusher",
+    "write_agent_locations",
+]
@@ -0,0 +1,155 @@
+"""
+Clocks for the dispatch engine.
+
+The engine never calls asyncio.sleep / loop.time / datetime.now directly; it goes through
+a DispatchClock so the same dispatch logic can run in real time (SystemClock) or in
+simulated time (VirtualClock), where thousands of multi-minute dispatch lifecycles finish
+in seconds.
+
+VirtualClock is a discrete-event scheduler. Tasks it knows about ("tracked" tasks) are
+either busy or parked in clock.sleep(). run_until_complete() lets busy tasks run, and once
+every tracked task is parked it jumps virtual time straight to the earliest wake-up.
+Other awaits (Redis, fakeredis, to_thread DB calls) just keep a task busy; virtual time
+does not move while any tracked task is busy, so timing is deterministic for a given seed.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Protocol, TypeVar
+
+T = TypeVar("T")
+
+
+class DispatchClock(Protocol):
+    def monotonic(self) -> float:
+        """Seconds on a monotonic scale, for measuring elapsed time and deadlines."""
+
+    def now(self) -> datetime:
+        """Current wall-clock time (timezone-aware UTC)."""
+
+    async def sleep(self, seconds: float) -> None:
+        ...
+
+    def track(self, task: asyncio.Task) -> None:
+        """Register a dispatch task the clock should account for."""
+
+
+class SystemClock:
+    """Real time, backed by the running event loop."""
+
+    def monotonic(self) -> float:
+        try:
+            return asyncio.get_running_loop().time()
+        except RuntimeError:
+            return time.monotonic()
+
+    def now(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    async def sleep(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+
+    def track(self, task: asyncio.Task) -> None:
+        return None
+
+
+class VirtualClock:
+    """Simulated time that advances only when every tracked task is sleeping."""
+
+    def __init__(self, start: datetime | None = None) -> None:
+        self._epoch = start or datetime(2026, 1, 1, tzinfo=timezone.utc)
+        self._elapsed = 0.0
+        self._sleepers: list[tuple[float, int, asyncio.Future, asyncio.Task | None]] = []
+        self._seq = itertools.count()
+        self._live: set[asyncio.Task] = set()
+        self._parked: set[asyncio.Task] = set()
+
+    def monotonic(self) -> float:
+        return self._elapsed
+
+    def now(self) -> datetime:
+        return self._epoch + timedelta(seconds=self._elapsed)
+
+    def track(self, task: asyncio.Task) -> None:
+        # Plain futures (e.g. from gather) run no code of their own, so they are never busy.
+        if not isinstance(task, asyncio.Task) or task in self._live or task.done():
+            return
+        self._live.add(task)
+        task.add_done_callback(self._forget)
+
+    def _forget(self, task: asyncio.Task) -> None:
+        self._live.discard(task)
+        self._parked.discard(task)
+
+    async def sleep(self, seconds: float) -> None:
+        task = asyncio.current_task()
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+        if task is not None:
+            self.track(task)
+            self._parked.add(task)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self._elapsed + seconds, next(self._seq), future, task))
+        try:
+            await future
+        finally:
+            if task is not None:
+                self._parked.discard(task)
+
+    def busy_tasks(self) -> int:
+        return len(self._live) - len(self._parked)
+
+    def advance(self, seconds: float) -> None:
+        """Move time forward by `seconds`, waking every sleeper that becomes due."""
+        self._wake_until(self._elapsed + seconds)
+
+    def _wake_until(self, target: float) -> None:
+        self._elapsed = max(self._elapsed, target)
+        while self._sleepers and self._sleepers[0][0] <= self._elapsed:
+            _, _, future, task = heapq.heappop(self._sleepers)
+            if task is not None:
+                # Busy from now on, even before the loop actually resumes it.
+                self._parked.discard(task)
+            if not future.done():
+                future.set_result(None)
+
+    async def run_until_complete(self, awaitable: Awaitable[T], *, max_seconds: float | None = None) -> T:
+        """
+        Drive virtual time until `awaitable` finishes.
+
+        A coroutine is wrapped in a tracked task, so while it is not in clock.sleep() it
+        counts as busy. To wait for other tracked tasks, pass asyncio.gather(*tasks) here
+        rather than awaiting them from inside a tracked coroutine.
+
+        Raises TimeoutError if it would need more than `max_seconds` of virtual time.
+        """
+        target = asyncio.ensure_future(awaitable)
+        self.track(target)
+        limit = None if max_seconds is None else self._elapsed + max_seconds
+        # The driver itself is never "busy", even if it happens to be a tracked task.
+        driver = asyncio.current_task()
+        own = 1 if driver in self._live and driver not in self._parked else 0
+        spins = 0
+
+        while not target.done():
+            if self.busy_tasks() > own or not self._sleepers:
+                # Someone is doing real work (or waiting on a real resource): let it run.
+                spins += 1
+                await asyncio.sleep(0 if spins < 1000 else 0.001)
+                continue
+            spins = 0
+            next_wake = self._sleepers[0][0]
+            if limit is not None and next_wake > limit:
+                target.cancel()
+                raise TimeoutError(f"virtual time limit of {max_seconds}s exceeded")
+            self._wake_until(next_wake)
+
+        return target.result()
+
+
+__all__ = ["DispatchClock", "SystemClock", "VirtualClock"]
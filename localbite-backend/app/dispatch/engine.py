@@ -1,7 +1,8 @@
 """
 Async Delivery Dispatch Engine
 
-This module provides a simple two-phase dispatch system using Redis as a queue.
+This module provides a simple two-phase dispatch system on top of a dispatch state store
+(Redis by default; see app.dispatch.state_store).
 
 Phase 1: Pushes the order to the queue restricted to "student" delivery agents and
          waits 3-4 minutes while polling to see if the order was accepted.
@@ -13,9 +14,22 @@ Functions exposed:
  - dispatch_order(order_id, restaurant_id, delivery_address)
 
 Notes:
- - This implementation uses Redis (redis.asyncio) for queueing and lightweight state checks.
- - In a production system, assignment checks should consult the primary DB or service
-   that holds order/assignment state rather than Redis keys used here for demo/mock purposes.
+ - Time and randomness go through an injectable clock and RNG (see dispatch_runtime), so a
+   simulation can drive the exact same logic on a VirtualClock in accelerated time.
+ - Queueing, state and assignment checks go through the state store, so the same engine runs
+   on Redis, in-process memory or Postgres, and survives Redis outages via failover.
+ - New bids are noticed through the store's bid book; delivery_bids is only read to seed
+   the book and when a phase closes, and auto-award always decides from the database.
+ - Every state change, bid and award is also appended to the dispatch event log (see
+   app.dispatch.event_log), the audit trail state can be rebuilt from.
+ - On shutdown, running dispatches are checkpointed (phase and deadline) into their state
+   as status "interrupted" and resumed by the next worker to start; cancel_dispatch stops a
+   dispatch on any worker, since the loops also watch for a "cancelled" status.
+ - Deferred dispatches (schedule_dispatch) wait in the store's schedule, not in sleeping
+   tasks; one scheduler loop per worker starts them when due (run_due_dispatches).
+ - start_dispatch_background goes through admission control (app.dispatch.admission):
+   over the global or per-restaurant cap, an order waits as "queued" and starts when a
+   running dispatch finishes.
 """
 from __future__ import annotations
 
@@ -24,16 +38,33 @@ import json
 import logging
 import os
 import random
-from datetime import datetime, timezone
-from typing import Literal
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Iterable, Iterator, Literal, NamedTuple
 
-import redis.asyncio as aioredis
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
 
+from app.core.singleflight import SingleFlight
 from app.database import SessionLocal
+from app.dispatch.admission import (
+    AdmissionController,
+    AdmissionRejected,
+    admission_priority,
+)
+from app.crud import agent_stats as agent_stats_crud
 from app.crud import delivery_bid as delivery_bid_crud
+from app.crud import entity_cache
+from app.crud import dispatch_bundle as bundle_crud
 from app.crud import order as order_crud
+from app.services.order_status import ASSIGNED, FINAL_STATUSES, can_transition
+from app.dispatch import metrics as dispatch_metrics
+from app.dispatch.clock import DispatchClock, SystemClock
+from app.dispatch.event_log import EventKind, encode_event
+from app.dispatch.state_store import DispatchStateStore, get_state_store, set_state_store
+from app.models.order import Order
 
 # Logger for the module
 logger = logging.getLogger("dispatch.engine")
@@ -50,31 +81,148 @@ class DispatchMessage(BaseModel):
     candidate_agent_type: Literal["student", "all"] = "student"
 
 
-# Redis connection helper. Read REDIS_URL from env or use localhost default.
-REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-_redis: aioredis.Redis | None = None
 _dispatch_tasks: dict[int, asyncio.Task] = {}
 ROLLING_BID_CLOSE_SECONDS = 60
+_clock: DispatchClock = SystemClock()
+_rng: random.Random = random.Random()
+_session_factory: Callable[[], Session] = SessionLocal
+
+
+class _DispatchTrace:
+    """Per-lifecycle bookkeeping for metrics; lives in a contextvar for the dispatch task."""
+
+    __slots__ = (
+        "started_at",
+        "phase1_ended_at",
+        "ended_at",
+        "first_bid_at",
+        "outcome",
+        "phase",
+        "bids",
+        "store_calls",
+        "db_sessions",
+    )
+
+    def __init__(self, started_at: float) -> None:
+        self.started_at = started_at
+        self.phase1_ended_at: float | None = None
+        self.ended_at: float | None = None
+        self.first_bid_at: float | None = None
+        self.outcome = "failed"
+        self.phase = "error"
+        self.bids = 0
+        self.store_calls = 0
+        self.db_sessions = 0
+
+    def finish(self, outcome: str, phase: str, at: float) -> None:
+        self.outcome = outcome
+        self.phase = phase
+        self.ended_at = at
+
+
+_active_trace: ContextVar[_DispatchTrace | None] = ContextVar("dispatch_trace", default=None)
+# By order id, so bids placed through the API in this process can report time-to-first-bid.
+_active_traces: dict[int, _DispatchTrace] = {}
+
+
+def _store() -> DispatchStateStore:
+    """The state store, counted against the running dispatch lifecycle (if any)."""
+    trace = _active_trace.get()
+    if trace is not None:
+        trace.store_calls += 1
+    return get_state_store()
+
 
+def _open_session() -> Session:
+    trace = _active_trace.get()
+    if trace is not None:
+        trace.db_sessions += 1
+    return _session_factory()
 
-def get_redis() -> aioredis.Redis:
-    """Return a singleton Redis client for async operations."""
-    global _redis
-    if _redis is None:
-        # Create a redis.asyncio client
-        _redis = aioredis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
-    return _redis
+
+def _observe_dispatch(trace: _DispatchTrace, now: float) -> None:
+    ended_at = trace.ended_at if trace.ended_at is not None else now
+    phase1_end = trace.phase1_ended_at if trace.phase1_ended_at is not None else ended_at
+    dispatch_metrics.PHASE_DURATION.observe(phase1_end - trace.started_at, phase="student_pool")
+    if trace.phase1_ended_at is not None and trace.phase != "student_pool":
+        dispatch_metrics.PHASE_DURATION.observe(ended_at - trace.phase1_ended_at, phase="all_agents")
+    dispatch_metrics.DISPATCH_OUTCOMES.inc(outcome=trace.outcome, phase=trace.phase)
+    if trace.outcome in ("assigned", "awarded"):
+        dispatch_metrics.TIME_TO_AWARD.observe(ended_at - trace.started_at, phase=trace.phase)
+    dispatch_metrics.BIDS_PER_ORDER.observe(trace.bids)
+    dispatch_metrics.STORE_CALLS_PER_DISPATCH.observe(trace.store_calls)
+    dispatch_metrics.DB_CALLS_PER_DISPATCH.observe(trace.db_sessions)
+
+
+def get_dispatch_clock() -> DispatchClock:
+    return _clock
+
+
+class DispatchRuntime(NamedTuple):
+    clock: DispatchClock
+    rng: random.Random
+    session_factory: Callable[[], Session]
+    state_store: DispatchStateStore | None
+
+
+def set_dispatch_runtime(
+    *,
+    clock: DispatchClock | None = None,
+    rng: random.Random | None = None,
+    session_factory: Callable[[], Session] | None = None,
+    state_store: DispatchStateStore | None = None,
+) -> DispatchRuntime:
+    """Swap any of the engine clock, RNG, DB session factory and state store. Returns the previous set."""
+    global _clock, _rng, _session_factory
+    previous = DispatchRuntime(_clock, _rng, _session_factory, None)
+    if clock is not None:
+        _clock = clock
+    if rng is not None:
+        _rng = rng
+    if session_factory is not None:
+        _session_factory = session_factory
+    if state_store is not None:
+        previous = previous._replace(state_store=set_state_store(state_store))
+    return previous
+
+
+@contextmanager
+def dispatch_runtime(
+    *,
+    clock: DispatchClock | None = None,
+    rng: random.Random | None = None,
+    session_factory: Callable[[], Session] | None = None,
+    state_store: DispatchStateStore | None = None,
+) -> Iterator[DispatchClock]:
+    """
+    Run dispatch with the given clock, RNG, session factory and/or state store, restoring
+    the previous ones on exit.
+
+        clock = VirtualClock()
+        with dispatch_runtime(clock=clock, rng=random.Random(7), state_store=InMemoryStateStore()):
+            await clock.run_until_complete(dispatch_order(...))
+    """
+    previous = set_dispatch_runtime(
+        clock=clock, rng=rng, session_factory=session_factory, state_store=state_store
+    )
+    try:
+        yield _clock
+    finally:
+        set_dispatch_runtime(
+            clock=previous.clock, rng=previous.rng, session_factory=previous.session_factory
+        )
+        if state_store is not None:
+            set_state_store(previous.state_store)
 
 
 async def push_to_queue(dispatch_message: DispatchMessage) -> None:
     """
-    Push a serialized DispatchMessage onto the Redis queue.
+    Push a serialized DispatchMessage onto the dispatch queue.
 
-    We use a Redis list as a simple FIFO queue. Consumers (agents) can BLPOP or BRPOP
+    On Redis the queue is a list used as a FIFO; consumers (agents) can BLPOP or BRPOP
     to receive messages. The key used is 'dispatch:queue:{candidate_agent_type}' so
     we can separate student-only broadcasts from all-agents broadcasts if needed.
     """
-    redis = get_redis()
 
     # Choose queue key based on candidate_agent_type so consumers can subscribe selectively.
     queue_key = f"dispatch:queue:{dispatch_message.candidate_agent_type}"
@@ -83,21 +231,20 @@ async def push_to_queue(dispatch_message: DispatchMessage) -> None:
     payload = dispatch_message.model_dump()
     payload_json = json.dumps(payload)
 
-    # Use RPUSH to append and keep FIFO behavior with BLPOP on consumers.
-    await redis.rpush(queue_key, payload_json)
+    await _store().push(queue_key, payload_json)
     logger.info("Pushed dispatch message to %s: %s", queue_key, payload)
 
 
-def _dispatch_state_key(order_id: int) -> str:
-    return f"dispatch:order:{order_id}:state"
-
-
-def _assignment_key(order_id: int) -> str:
-    return f"order:{order_id}:assigned"
+def _now_iso() -> str:
+    return _clock.now().isoformat()
 
 
-def _now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
+async def _log_event(kind: EventKind, order_id: int, payload: dict) -> None:
+    """Append to the event log. The log is an audit trail, so failures never stop dispatch."""
+    try:
+        await _store().append_event(encode_event(kind, order_id, _clock.now(), payload))
+    except Exception:
+        logger.exception("Failed to append %s event for order %s", kind, order_id)
 
 
 async def set_dispatch_state(
@@ -110,9 +257,8 @@ async def set_dispatch_state(
     phase1_wait_seconds: int | None = None,
     phase2_wait_seconds: int | None = None,
     note: str | None = None,
+    extra: dict[str, str] | None = None,
 ) -> None:
-    redis = get_redis()
-    key = _dispatch_state_key(order_id)
     payload = {
         "order_id": str(order_id),
         "status": status,
@@ -129,20 +275,31 @@ async def set_dispatch_state(
         payload["phase2_wait_seconds"] = str(phase2_wait_seconds)
     if note:
         payload["note"] = note
-    await redis.hset(key, mapping=payload)
+    if extra:
+        payload.update(extra)
+    await _store().set_state(order_id, payload)
+    await _log_event(
+        "state", order_id, {k: v for k, v in payload.items() if k not in ("order_id", "updated_at")}
+    )
+
+
+_state_reads: SingleFlight[dict[str, str]] = SingleFlight("dispatch_state")
+_bid_marker_reads: SingleFlight[tuple[int, int]] = SingleFlight("bid_marker")
 
 
 async def get_dispatch_state(order_id: int) -> dict[str, str]:
-    redis = get_redis()
-    key = _dispatch_state_key(order_id)
-    data = await redis.hgetall(key)
-    return data or {}
+    # Feed refreshes ask for the same orders at once; one store read serves them all.
+    store = _store()
+    state = await _state_reads.do((store, order_id), lambda: store.get_state(order_id))
+    return dict(state)
 
 
 async def mark_order_assigned(order_id: int, agent_id: str | None = None) -> None:
-    redis = get_redis()
-    assigned_key = _assignment_key(order_id)
-    await redis.set(assigned_key, "1")
+    # The award was committed by the caller; make sure no process keeps the unassigned row.
+    entity_cache.invalidate(Order, order_id)
+    await _store().set_assigned(order_id)
+    await _store().clear_bids(order_id)
+    await _log_event("award", order_id, {"agent_id": agent_id})
     await set_dispatch_state(
         order_id,
         status="assigned",
@@ -152,29 +309,27 @@ async def mark_order_assigned(order_id: int, agent_id: str | None = None) -> Non
 
 
 async def clear_order_assignment(order_id: int) -> None:
-    redis = get_redis()
-    await redis.delete(_assignment_key(order_id))
+    await _store().clear_assigned(order_id)
+    await _log_event("unassign", order_id, {})
 
 
 async def is_order_assigned(order_id: int) -> bool:
     """
     Check if an order has been accepted/assigned.
 
-    For this example we use a Redis key 'order:{order_id}:assigned' which would be set
-    by the consumer/assignment service when an agent accepts the order. In a real system
-    this should check the primary orders database or a dedicated assignment service.
+    The flag is set by mark_order_assigned whenever a bid is accepted or auto-awarded.
     """
-    redis = get_redis()
-    assigned_key = _assignment_key(order_id)
+    return await _store().is_assigned(order_id)
 
-    # Key value expected to be '1' or 'true' when assigned. Existence alone is considered assigned.
-    val = await redis.get(assigned_key)
-    if val is None:
-        return False
-    try:
-        return str(val).lower() not in ("0", "false")
-    except Exception:
-        return True
+
+async def record_bid(order_id: int, bid_id: int, bid_amount: float) -> None:
+    """Add a newly placed bid to the order's bid book so the dispatch loop sees it."""
+    await _store().add_bid(order_id, bid_id, bid_amount)
+    await _log_event("bid", order_id, {"bid_id": bid_id, "amount": bid_amount})
+    trace = _active_traces.get(order_id)
+    if trace is not None and trace.first_bid_at is None:
+        trace.first_bid_at = _clock.monotonic()
+        dispatch_metrics.TIME_TO_FIRST_BID.observe(trace.first_bid_at - trace.started_at)
 
 
 def _to_utc(dt: datetime | None) -> datetime | None:
@@ -192,7 +347,7 @@ def _bid_sort_key(bid) -> tuple[float, float, int]:
 
 
 def _get_placed_bids(order_id: int):
-    db: Session = SessionLocal()
+    db: Session = _open_session()
     try:
         bids = delivery_bid_crud.list_by_order(db, order_id)
         return [bid for bid in bids if getattr(bid, "bid_status", None) == "placed"]
@@ -200,25 +355,35 @@ def _get_placed_bids(order_id: int):
         db.close()
 
 
-def _get_latest_bid_marker(order_id: int) -> tuple[int, int]:
-    placed_bids = _get_placed_bids(order_id)
-    if not placed_bids:
-        return (0, 0)
-    return (len(placed_bids), max(int(bid.bid_id) for bid in placed_bids))
+async def _sync_bid_book(order_id: int) -> tuple[int, int]:
+    """Reload the order's bid book from delivery_bids and return its (count, max bid_id) marker."""
+    bids = {int(bid.bid_id): float(bid.bid_amount) for bid in _get_placed_bids(order_id)}
+    await _store().replace_bids(order_id, bids)
+    await _log_event("book", order_id, {"bids": bids})
+    return (len(bids), max(bids)) if bids else (0, 0)
+
+
+async def _get_latest_bid_marker(order_id: int) -> tuple[int, int]:
+    store = _store()
+    return await _bid_marker_reads.do((store, order_id), lambda: store.bid_marker(order_id))
 
 
 async def auto_award_best_bid(order_id: int) -> tuple[bool, str | None]:
     """
     Select the winning bid by lowest bid_amount, then earliest created_at, then lowest bid_id.
+    For the lead order of an open bundle, the winner gets every member order at once.
     Returns (awarded, agent_id).
     """
-    db: Session = SessionLocal()
+    assigned_order_ids = [order_id]
+    db: Session = _open_session()
     try:
         order = order_crud.get_by_id(db, order_id)
         if not order:
             return False, None
         if order.assigned_partner_id:
             return True, str(order.assigned_partner_id)
+        if not can_transition(order.order_status, ASSIGNED):
+            return False, None
 
         bids = delivery_bid_crud.list_by_order(db, order_id)
         placed_bids = [bid for bid in bids if getattr(bid, "bid_status", None) == "placed"]
@@ -226,21 +391,41 @@ async def auto_award_best_bid(order_id: int) -> tuple[bool, str | None]:
             return False, None
 
         winner = min(placed_bids, key=_bid_sort_key)
+        now = _clock.now()
 
         winner.bid_status = "accepted"
-        order.assigned_partner_id = winner.agent_id
-        order.delivery_fee = winner.bid_amount
-        order.order_status = "assigned"
-
-        for other in bids:
-            if other.bid_id == winner.bid_id:
-                continue
-            if other.bid_status == "placed":
-                other.bid_status = "rejected"
+        bundle = bundle_crud.get_by_id(db, order.bundle_id) if order.bundle_id else None
+        if bundle is not None and bundle.status == "open" and bundle.lead_order_id == order_id:
+            try:
+                members = bundle_crud.assign(db, bundle, winner.agent_id, winner.bid_amount)
+            except bundle_crud.BundleConflictError:
+                logger.warning("Bundle %s could not be awarded: a member order is taken", bundle.bundle_id)
+                bundle_id = bundle.bundle_id
+                db.rollback()
+                # Its remaining orders would otherwise wait on this lead forever.
+                await dissolve_bundle(bundle_id)
+                return False, None
+            assigned_order_ids = [member.order_id for member in members]
+        else:
+            order.assigned_partner_id = winner.agent_id
+            order.delivery_fee = winner.bid_amount
+            order.order_status = ASSIGNED
+            order.assigned_at = now
+
+        losing_bids = [bid for bid in placed_bids if bid.bid_id != winner.bid_id]
+        for other in losing_bids:
+            other.bid_status = "rejected"
+        agent_stats_crud.record_award(db, winner, losing_bids, now)
 
         db.add(order)
         db.add(winner)
-        db.commit()
+        try:
+            db.commit()
+        except StaleDataError:
+            # Changed under us (awarded by an accept, cancelled, ...); the next poll re-reads it.
+            logger.info("Order %s changed during auto-award; skipping this round", order_id)
+            order_crud.discard_stale(db, *assigned_order_ids)
+            return False, None
         db.refresh(winner)
         winner_agent_id = str(winner.agent_id)
     except Exception:
@@ -249,10 +434,113 @@ async def auto_award_best_bid(order_id: int) -> tuple[bool, str | None]:
     finally:
         db.close()
 
-    await mark_order_assigned(order_id, winner_agent_id)
+    for assigned_order_id in assigned_order_ids:
+        await mark_order_assigned(assigned_order_id, winner_agent_id)
     return True, winner_agent_id
 
 
+def _open_bundle_led_by(order_id: int) -> int | None:
+    db: Session = _open_session()
+    try:
+        order = order_crud.get_by_id(db, order_id)
+        if order is None or order.bundle_id is None:
+            return None
+        bundle = bundle_crud.get_by_id(db, order.bundle_id)
+        if bundle is None or bundle.status != "open" or bundle.lead_order_id != order_id:
+            return None
+        return bundle.bundle_id
+    finally:
+        db.close()
+
+
+async def dissolve_bundle(bundle_id: int, *, drop_order_id: int | None = None) -> list[int]:
+    """
+    Break up an open bundle and dispatch its orders one by one again. The lead's dispatch
+    is stopped and restarted on its own fare, since its bids were checked against the
+    bundle's; called from the lead's own dispatch, that dispatch carries on alone instead.
+    `drop_order_id` (an order being cancelled) is not restarted, nor is any member that is
+    no longer open for assignment. Returns the restarted order ids.
+    """
+    db: Session = _open_session()
+    try:
+        bundle = bundle_crud.get_by_id(db, bundle_id)
+        if bundle is None or bundle.status != "open":
+            return []
+        lead_order_id = bundle.lead_order_id
+        restart = [
+            (
+                order.order_id,
+                order.restaurant_id,
+                order.created_at,
+                order.base_fare,
+                order.delivery_lat,
+                order.delivery_lng,
+            )
+            for order in bundle_crud.list_members(db, bundle)
+            if order.order_id != drop_order_id
+            and not order.assigned_partner_id
+            and can_transition(order.order_status, ASSIGNED)
+        ]
+        bundle_crud.dissolve(db, bundle)
+    finally:
+        db.close()
+
+    lead_task = _dispatch_tasks.get(lead_order_id)
+    from_lead = lead_task is not None and lead_task is asyncio.current_task()
+    if lead_order_id != drop_order_id and not from_lead:
+        await _stop_task(lead_order_id, "cancelled")
+
+    restarted: list[int] = []
+    for order_id, restaurant_id, ordered_at, base_fare, lat, lng in restart:
+        if order_id == lead_order_id:
+            if from_lead:
+                await _store().clear_bids(order_id)
+                continue
+            await _release_dispatch(order_id, f"bundle {bundle_id} dissolved; restarting alone")
+        state = await _store().get_state(order_id)
+        # Parked members never had a dispatch of their own; broadcast the drop-off point.
+        address = state.get("delivery_address") or (
+            f"{lat:.5f},{lng:.5f}" if lat is not None and lng is not None else None
+        )
+        if address is None:
+            await set_dispatch_state(
+                order_id, status="unbundled", phase="none", note=f"bundle {bundle_id} dissolved"
+            )
+            continue
+        try:
+            started = await start_dispatch_background(
+                order_id, restaurant_id, address, ordered_at=ordered_at, order_value=base_fare
+            )
+        except AdmissionRejected:
+            logger.warning("Dispatch queue full; order %s of bundle %s left unbundled", order_id, bundle_id)
+            await set_dispatch_state(
+                order_id,
+                status="unbundled",
+                phase="none",
+                note=f"bundle {bundle_id} dissolved; dispatch queue full",
+            )
+            continue
+        if started:
+            restarted.append(order_id)
+    logger.info("Dissolved bundle %s; dispatching %s again", bundle_id, restarted)
+    return restarted
+
+
+async def bundle_orders(bundle_id: int, lead_order_id: int, order_ids: list[int]) -> None:
+    """Park the non-lead members of a bundle; they are dispatched through the lead order."""
+    for order_id in order_ids:
+        if order_id == lead_order_id:
+            continue
+        await _store().unschedule(order_id)
+        await set_dispatch_state(
+            order_id,
+            status="bundled",
+            phase="bundled",
+            note=f"dispatched with order {lead_order_id} in bundle {bundle_id}",
+            extra={"bundle_id": str(bundle_id)},
+        )
+
+
 async def dispatch_order(
     order_id: int,
     restaurant_id: int,
@@ -262,6 +550,8 @@ async def dispatch_order(
     phase1_wait_seconds_max: int = 240,
     phase2_wait_seconds: int = 180,
     poll_interval_seconds: int = 5,
+    rolling_bid_close_seconds: int = ROLLING_BID_CLOSE_SECONDS,
+    resume: DispatchCheckpoint | None = None,
 ) -> None:
     """
     Perform a two-phase dispatch for a given order.
@@ -272,13 +562,140 @@ async def dispatch_order(
 
     This function is asynchronous and returns when the Phase 2 broadcast is complete or
     when the order has been assigned during Phase 1.
+
+    All waiting goes through the engine clock and the phase 1 window is drawn from the
+    engine RNG, so the lifecycle is deterministic under a VirtualClock and a seeded RNG.
+
+    With `resume`, the dispatch continues from a checkpoint taken at shutdown instead of
+    starting over; the phase windows keep their original deadlines.
     """
+    trace = _DispatchTrace(_clock.monotonic())
+    token = _active_trace.set(trace)
+    _active_traces[order_id] = trace
+    dispatch_metrics.DISPATCH_STARTED.inc()
+    try:
+        await _run_dispatch(
+            order_id,
+            restaurant_id,
+            delivery_address,
+            trace,
+            phase1_wait_seconds_min=phase1_wait_seconds_min,
+            phase1_wait_seconds_max=phase1_wait_seconds_max,
+            phase2_wait_seconds=phase2_wait_seconds,
+            poll_interval_seconds=poll_interval_seconds,
+            rolling_bid_close_seconds=rolling_bid_close_seconds,
+            resume=resume,
+        )
+    except asyncio.CancelledError:
+        if _stop_reasons.pop(order_id, None) == "shutdown":
+            trace.outcome = "interrupted"
+            await _write_checkpoint(order_id)
+        else:
+            trace.outcome = "cancelled"
+        raise
+    finally:
+        _active_trace.reset(token)
+        _active_traces.pop(order_id, None)
+        _dispatch_checkpoints.pop(order_id, None)
+        _observe_dispatch(trace, _clock.monotonic())
+
+
+async def _write_checkpoint(order_id: int) -> None:
+    checkpoint = _dispatch_checkpoints.get(order_id)
+    state = await _store().get_state(order_id)
+    await set_dispatch_state(
+        order_id,
+        status="interrupted",
+        phase=checkpoint.phase if checkpoint else state.get("phase", "student_pool"),
+        note="dispatch interrupted by shutdown; waiting to resume",
+        extra={"checkpoint": checkpoint.model_dump_json() if checkpoint else ""},
+    )
+
+
+class DispatchCheckpoint(BaseModel):
+    """Where a running dispatch is, so it can be resumed after a restart."""
+
+    order_id: int
+    restaurant_id: int
+    delivery_address: str
+    phase: Literal["student_pool", "all_agents"]
+    # Engine-clock wall time at which the current phase window ends.
+    phase_deadline: datetime
+    phase1_wait_seconds: int
+    phase2_wait_seconds: int
+    poll_interval_seconds: int
+    rolling_bid_close_seconds: int
+    rolling_close_deadline: datetime | None = None
+
+
+# Latest checkpoint of every dispatch running in this process, by order id.
+_dispatch_checkpoints: dict[int, DispatchCheckpoint] = {}
+# Why a dispatch task is being cancelled ("shutdown" or "cancelled"), by order id.
+_stop_reasons: dict[int, str] = {}
+
+
+def _checkpoint(checkpoint: DispatchCheckpoint, **update) -> DispatchCheckpoint:
+    checkpoint = checkpoint.model_copy(update=update)
+    _dispatch_checkpoints[checkpoint.order_id] = checkpoint
+    return checkpoint
+
+
+def _seconds_until(deadline: datetime) -> float:
+    return max((deadline - _clock.now()).total_seconds(), 0.0)
+
+
+async def _stop_reason(order_id: int) -> str | None:
+    """"assigned" or "cancelled" when the dispatch loop should stop, else None."""
+    if await is_order_assigned(order_id):
+        return "assigned"
+    # Cancellation may come through another worker, so it is read from the shared state.
+    if (await _store().get_state(order_id)).get("status") == "cancelled":
+        return "cancelled"
+    return None
+
+
+def _final_order_status(order_id: int) -> str | None:
+    """The order's status if it is delivered or cancelled, so that no bid can be awarded."""
+    db: Session = _open_session()
+    try:
+        order = order_crud.get_by_id(db, order_id)
+        if order is None or order.assigned_partner_id or order.order_status not in FINAL_STATUSES:
+            return None
+        return order.order_status
+    finally:
+        db.close()
+
+
+async def _run_dispatch(
+    order_id: int,
+    restaurant_id: int,
+    delivery_address: str,
+    trace: _DispatchTrace,
+    *,
+    phase1_wait_seconds_min: int,
+    phase1_wait_seconds_max: int,
+    phase2_wait_seconds: int,
+    poll_interval_seconds: int,
+    rolling_bid_close_seconds: int,
+    resume: DispatchCheckpoint | None = None,
+) -> None:
+    if resume is not None:
+        await _sync_bid_book(order_id)
+        if resume.phase == "all_agents":
+            trace.phase1_ended_at = trace.started_at
+            await _run_all_agents(resume, trace, resumed=True)
+        elif await _run_student_pool(resume, trace, resumed=True):
+            await _escalate(resume, trace)
+        return
+
     phase1_wait_seconds_min = max(1, phase1_wait_seconds_min)
     phase1_wait_seconds_max = max(phase1_wait_seconds_min, phase1_wait_seconds_max)
     phase2_wait_seconds = max(1, phase2_wait_seconds)
     poll_interval_seconds = max(1, poll_interval_seconds)
+    rolling_bid_close_seconds = max(1, rolling_bid_close_seconds)
 
     await clear_order_assignment(order_id)
+    await _sync_bid_book(order_id)
     await set_dispatch_state(
         order_id,
         status="starting",
@@ -311,9 +728,34 @@ async def dispatch_order(
 
     # Wait duration between 3 and 4 minutes (in seconds). We'll poll frequently during this window
     # so we can stop early if the order is accepted.
-    wait_seconds = int(random.uniform(phase1_wait_seconds_min, phase1_wait_seconds_max))
-    poll_interval = poll_interval_seconds
-    elapsed = 0.0
+    wait_seconds = int(_rng.uniform(phase1_wait_seconds_min, phase1_wait_seconds_max))
+    checkpoint = _checkpoint(
+        DispatchCheckpoint(
+            order_id=order_id,
+            restaurant_id=restaurant_id,
+            delivery_address=delivery_address,
+            phase="student_pool",
+            phase_deadline=_clock.now() + timedelta(seconds=wait_seconds),
+            phase1_wait_seconds=wait_seconds,
+            phase2_wait_seconds=phase2_wait_seconds,
+            poll_interval_seconds=poll_interval_seconds,
+            rolling_bid_close_seconds=rolling_bid_close_seconds,
+        )
+    )
+    if await _run_student_pool(checkpoint, trace):
+        await _escalate(checkpoint, trace)
+
+
+async def _run_student_pool(checkpoint: DispatchCheckpoint, trace: _DispatchTrace, *, resumed: bool = False) -> bool:
+    """Phase 1. Returns True when the order is still unclaimed and should escalate."""
+    order_id = checkpoint.order_id
+    restaurant_id = checkpoint.restaurant_id
+    delivery_address = checkpoint.delivery_address
+    wait_seconds = checkpoint.phase1_wait_seconds
+    phase2_wait_seconds = checkpoint.phase2_wait_seconds
+    poll_interval = checkpoint.poll_interval_seconds
+    clock = _clock
+    elapsed = max(wait_seconds - _seconds_until(checkpoint.phase_deadline), 0.0)
     await set_dispatch_state(
         order_id,
         status="waiting_for_bids",
@@ -322,16 +764,20 @@ async def dispatch_order(
         delivery_address=delivery_address,
         phase1_wait_seconds=wait_seconds,
         phase2_wait_seconds=phase2_wait_seconds,
-        note="student pool timer active",
+        note="student pool timer resumed after restart" if resumed else "student pool timer active",
     )
 
     # Poll loop: check every poll_interval seconds up to wait_seconds
     while elapsed < wait_seconds:
         # Short sleep then check assignment state to allow responsive cancellation by acceptance.
-        await asyncio.sleep(poll_interval)
+        await clock.sleep(poll_interval)
         elapsed += poll_interval
 
-        if await is_order_assigned(order_id):
+        stop_reason = await _stop_reason(order_id)
+        if stop_reason == "cancelled":
+            trace.finish("cancelled", "student_pool", clock.monotonic())
+            return False
+        if stop_reason == "assigned":
             logger.info("Order %s assigned during Phase 1 after %.1f seconds", order_id, elapsed)
             await set_dispatch_state(
                 order_id,
@@ -343,41 +789,74 @@ async def dispatch_order(
                 phase2_wait_seconds=phase2_wait_seconds,
                 note=f"assigned during student_pool after {int(elapsed)}s",
             )
-            return
+            trace.finish("assigned", "student_pool", clock.monotonic())
+            return False
 
     # Student pool ended. If any student bids exist, award the best bid instead of escalating.
-    if _get_placed_bids(order_id):
+    trace.phase1_ended_at = clock.monotonic()
+    student_bid_marker = await _sync_bid_book(order_id)
+    trace.bids = student_bid_marker[0]
+    if student_bid_marker != (0, 0):
         awarded, agent_id = await auto_award_best_bid(order_id)
         if awarded:
+            trace.finish("awarded", "student_pool", clock.monotonic())
             logger.info(
                 "Order %s auto-awarded from student pool after %.1f seconds to agent %s",
                 order_id,
                 elapsed,
                 agent_id,
             )
-            return
+            return False
+        # The order was closed (e.g. cancelled) under the dispatch: do not escalate it.
+        final_status = _final_order_status(order_id)
+        if final_status is not None:
+            await _release_dispatch(order_id, f"order {final_status}; dispatch stopped")
+            trace.finish("cancelled", "student_pool", clock.monotonic())
+            return False
 
     # If we reach here, the order is still unassigned after Phase 1
     logger.info("Order %s unclaimed after Phase 1 (%.1f seconds); entering Phase 2 (broadcast to all agents)", order_id, elapsed)
+    return True
+
+
+async def _escalate(checkpoint: DispatchCheckpoint, trace: _DispatchTrace) -> None:
+    order_id = checkpoint.order_id
     await set_dispatch_state(
         order_id,
         status="escalating",
         phase="all_agents",
-        restaurant_id=restaurant_id,
-        delivery_address=delivery_address,
-        phase1_wait_seconds=wait_seconds,
-        phase2_wait_seconds=phase2_wait_seconds,
+        restaurant_id=checkpoint.restaurant_id,
+        delivery_address=checkpoint.delivery_address,
+        phase1_wait_seconds=checkpoint.phase1_wait_seconds,
+        phase2_wait_seconds=checkpoint.phase2_wait_seconds,
         note="moving from student pool to all agents",
     )
 
     # Phase 2: Broadcast to all agents
     all_message = DispatchMessage(
         order_id=order_id,
-        restaurant_id=restaurant_id,
-        delivery_address=delivery_address,
+        restaurant_id=checkpoint.restaurant_id,
+        delivery_address=checkpoint.delivery_address,
         candidate_agent_type="all",
     )
     await push_to_queue(all_message)
+    checkpoint = _checkpoint(
+        checkpoint,
+        phase="all_agents",
+        phase_deadline=_clock.now() + timedelta(seconds=checkpoint.phase2_wait_seconds),
+    )
+    await _run_all_agents(checkpoint, trace)
+
+
+async def _run_all_agents(checkpoint: DispatchCheckpoint, trace: _DispatchTrace, *, resumed: bool = False) -> None:
+    order_id = checkpoint.order_id
+    restaurant_id = checkpoint.restaurant_id
+    delivery_address = checkpoint.delivery_address
+    wait_seconds = checkpoint.phase1_wait_seconds
+    phase2_wait_seconds = checkpoint.phase2_wait_seconds
+    rolling_bid_close_seconds = checkpoint.rolling_bid_close_seconds
+    poll_interval = checkpoint.poll_interval_seconds
+    clock = _clock
     await set_dispatch_state(
         order_id,
         status="waiting_for_bids",
@@ -386,21 +865,26 @@ async def dispatch_order(
         delivery_address=delivery_address,
         phase1_wait_seconds=wait_seconds,
         phase2_wait_seconds=phase2_wait_seconds,
-        note="all agents broadcast sent",
+        note="all agents timer resumed after restart" if resumed else "all agents broadcast sent",
     )
 
     # Phase 2: wait for bids/assignment. If bids arrive, run a rolling 60s close window
     # that resets whenever a new bid is placed; then auto-award the best bid.
-    elapsed_phase2 = 0.0
+    elapsed_phase2 = max(phase2_wait_seconds - _seconds_until(checkpoint.phase_deadline), 0.0)
     rolling_close_deadline: float | None = None
-    last_seen_bid_marker = _get_latest_bid_marker(order_id)
-    loop = asyncio.get_running_loop()
+    if checkpoint.rolling_close_deadline is not None:
+        rolling_close_deadline = clock.monotonic() + _seconds_until(checkpoint.rolling_close_deadline)
+    last_seen_bid_marker = await _get_latest_bid_marker(order_id)
 
     while True:
-        await asyncio.sleep(poll_interval)
+        await clock.sleep(poll_interval)
         elapsed_phase2 += poll_interval
 
-        if await is_order_assigned(order_id):
+        stop_reason = await _stop_reason(order_id)
+        if stop_reason == "cancelled":
+            trace.finish("cancelled", "all_agents", clock.monotonic())
+            return
+        if stop_reason == "assigned":
             logger.info(
                 "Order %s assigned during Phase 2 after %.1f seconds",
                 order_id,
@@ -416,15 +900,21 @@ async def dispatch_order(
                 phase2_wait_seconds=phase2_wait_seconds,
                 note=f"assigned during all_agents after {int(elapsed_phase2)}s",
             )
+            trace.finish("assigned", "all_agents", clock.monotonic())
             return
-        current_bid_marker = _get_latest_bid_marker(order_id)
-        now_mono = loop.time()
+        current_bid_marker = await _get_latest_bid_marker(order_id)
+        now_mono = clock.monotonic()
+        trace.bids = max(trace.bids, current_bid_marker[0])
 
         if current_bid_marker != (0, 0):
-            # Start/reset 60s rolling close when a new bid arrives.
+            # Start/reset the rolling close when a new bid arrives.
             if current_bid_marker != last_seen_bid_marker or rolling_close_deadline is None:
                 last_seen_bid_marker = current_bid_marker
-                rolling_close_deadline = now_mono + ROLLING_BID_CLOSE_SECONDS
+                rolling_close_deadline = now_mono + rolling_bid_close_seconds
+                checkpoint = _checkpoint(
+                    checkpoint,
+                    rolling_close_deadline=clock.now() + timedelta(seconds=rolling_bid_close_seconds),
+                )
                 await set_dispatch_state(
                     order_id,
                     status="waiting_for_bids",
@@ -432,22 +922,31 @@ async def dispatch_order(
                     restaurant_id=restaurant_id,
                     delivery_address=delivery_address,
                     phase1_wait_seconds=wait_seconds,
-                    phase2_wait_seconds=ROLLING_BID_CLOSE_SECONDS,
-                    note="bids received; rolling 60s close window reset",
+                    phase2_wait_seconds=rolling_bid_close_seconds,
+                    note=f"bids received; rolling {rolling_bid_close_seconds}s close window reset",
                 )
 
             if rolling_close_deadline is not None and now_mono >= rolling_close_deadline:
                 awarded, agent_id = await auto_award_best_bid(order_id)
                 if awarded:
+                    trace.finish("awarded", "all_agents", clock.monotonic())
                     logger.info(
                         "Order %s auto-awarded during all_agents phase to %s after rolling close",
                         order_id,
                         agent_id,
                     )
                     return
+                # An order closed under the dispatch keeps its placed bids, so the rolling
+                # close would re-arm forever.
+                final_status = _final_order_status(order_id)
+                if final_status is not None:
+                    await _release_dispatch(order_id, f"order {final_status}; dispatch stopped")
+                    trace.finish("cancelled", "all_agents", clock.monotonic())
+                    return
                 # If bids disappeared (e.g., race), continue and fall back to phase2 timeout.
                 rolling_close_deadline = None
-                last_seen_bid_marker = _get_latest_bid_marker(order_id)
+                checkpoint = _checkpoint(checkpoint, rolling_close_deadline=None)
+                last_seen_bid_marker = await _sync_bid_book(order_id)
                 await set_dispatch_state(
                     order_id,
                     status="waiting_for_bids",
@@ -462,6 +961,9 @@ async def dispatch_order(
 
         # No bids yet in all-agents phase: keep waiting until phase2 window ends.
         if elapsed_phase2 >= phase2_wait_seconds and current_bid_marker == (0, 0):
+            # Check delivery_bids before giving up, in case a bid never reached the book.
+            if await _sync_bid_book(order_id) != (0, 0):
+                continue
             await set_dispatch_state(
                 order_id,
                 status="needs_fee_increase",
@@ -472,38 +974,82 @@ async def dispatch_order(
                 phase2_wait_seconds=phase2_wait_seconds,
                 note="no assignment after all_agents phase; prompt user to increase fee",
             )
+            trace.finish("needs_fee_increase", "all_agents", clock.monotonic())
+            # The fee prompt is for this order alone; the rest of its bundle goes back out.
+            bundle_id = _open_bundle_led_by(order_id)
+            if bundle_id is not None:
+                await dissolve_bundle(bundle_id)
             logger.info("Completed Phase 2 window for order %s; needs fee increase prompt", order_id)
             return
 
 
+def _live_dispatch_tasks() -> int:
+    return sum(1 for task in list(_dispatch_tasks.values()) if not task.done())
+
+
+dispatch_metrics.LIVE_TASKS.set_function(_live_dispatch_tasks)
+
+
+class QueuedDispatch(BaseModel):
+    """Everything needed to start a dispatch once admission control lets it through."""
+
+    order_id: int
+    restaurant_id: int
+    delivery_address: str
+    phase1_wait_seconds_min: int = 180
+    phase1_wait_seconds_max: int = 240
+    phase2_wait_seconds: int = 180
+    poll_interval_seconds: int = 5
+    rolling_bid_close_seconds: int = ROLLING_BID_CLOSE_SECONDS
+    resume: DispatchCheckpoint | None = None
+    priority: float
+    queued_at: datetime
+
+
+_admission: AdmissionController[QueuedDispatch] = AdmissionController()
+dispatch_metrics.ADMISSION_WAITING.set_function(lambda: _admission.waiting_count)
+
+
+def set_admission_controller(controller: AdmissionController) -> AdmissionController:
+    """Swap the admission controller (e.g. with different limits). Returns the previous one."""
+    global _admission
+    previous, _admission = _admission, controller
+    return previous
+
+
 def is_dispatch_running(order_id: int) -> bool:
     task = _dispatch_tasks.get(order_id)
     return task is not None and not task.done()
 
 
-async def start_dispatch_background(
-    order_id: int,
-    restaurant_id: int,
-    delivery_address: str,
-    *,
-    phase1_wait_seconds_min: int = 180,
-    phase1_wait_seconds_max: int = 240,
-    phase2_wait_seconds: int = 180,
-    poll_interval_seconds: int = 5,
-) -> bool:
-    if is_dispatch_running(order_id):
-        return False
+def is_dispatch_queued(order_id: int) -> bool:
+    return _admission.is_waiting(order_id)
+
+
+def dispatch_queue_position(order_id: int) -> int | None:
+    """1-based position among dispatches waiting for capacity in this process."""
+    return _admission.position(order_id)
+
+
+def dispatch_queue_depth() -> int:
+    return _admission.waiting_count
+
+
+def _launch_dispatch(request: QueuedDispatch) -> None:
+    order_id = request.order_id
 
     async def _runner() -> None:
         try:
             await dispatch_order(
                 order_id=order_id,
-                restaurant_id=restaurant_id,
-                delivery_address=delivery_address,
-                phase1_wait_seconds_min=phase1_wait_seconds_min,
-                phase1_wait_seconds_max=phase1_wait_seconds_max,
-                phase2_wait_seconds=phase2_wait_seconds,
-                poll_interval_seconds=poll_interval_seconds,
+                restaurant_id=request.restaurant_id,
+                delivery_address=request.delivery_address,
+                phase1_wait_seconds_min=request.phase1_wait_seconds_min,
+                phase1_wait_seconds_max=request.phase1_wait_seconds_max,
+                phase2_wait_seconds=request.phase2_wait_seconds,
+                poll_interval_seconds=request.poll_interval_seconds,
+                rolling_bid_close_seconds=request.rolling_bid_close_seconds,
+                resume=request.resume,
             )
         except Exception:
             logger.exception("Dispatch task failed for order %s", order_id)
@@ -512,28 +1058,390 @@ async def start_dispatch_background(
                     order_id,
                     status="failed",
                     phase="error",
-                    restaurant_id=restaurant_id,
-                    delivery_address=delivery_address,
+                    restaurant_id=request.restaurant_id,
+                    delivery_address=request.delivery_address,
                     note="dispatch task exception",
                 )
             except Exception:
                 logger.exception("Failed to persist dispatch error state for order %s", order_id)
         finally:
             _dispatch_tasks.pop(order_id, None)
+            _admission.release(order_id)
+            _admit_waiting()
 
     task = asyncio.create_task(_runner())
+    _clock.track(task)
     _dispatch_tasks[order_id] = task
+
+
+def _admit_waiting() -> None:
+    for order_id, request in _admission.pop_admissible():
+        waited = (_clock.now() - request.queued_at).total_seconds()
+        dispatch_metrics.ADMISSION_WAIT.observe(max(waited, 0.0))
+        logger.info("Admitted queued dispatch for order %s after %.1fs", order_id, waited)
+        _launch_dispatch(request)
+
+
+async def start_dispatch_background(
+    order_id: int,
+    restaurant_id: int,
+    delivery_address: str,
+    *,
+    phase1_wait_seconds_min: int = 180,
+    phase1_wait_seconds_max: int = 240,
+    phase2_wait_seconds: int = 180,
+    poll_interval_seconds: int = 5,
+    rolling_bid_close_seconds: int = ROLLING_BID_CLOSE_SECONDS,
+    resume: DispatchCheckpoint | None = None,
+    ordered_at: datetime | None = None,
+    order_value: float = 0.0,
+) -> bool:
+    """
+    Start a dispatch task, or queue it when the dispatch caps are reached (status "queued";
+    it starts as soon as capacity frees up). Returns False if the order is already running
+    or queued here; raises AdmissionRejected when the waiting queue is full.
+    """
+    if is_dispatch_running(order_id) or _admission.is_waiting(order_id):
+        return False
+
+    now = _clock.now()
+    request = QueuedDispatch(
+        order_id=order_id,
+        restaurant_id=restaurant_id,
+        delivery_address=delivery_address,
+        phase1_wait_seconds_min=phase1_wait_seconds_min,
+        phase1_wait_seconds_max=phase1_wait_seconds_max,
+        phase2_wait_seconds=phase2_wait_seconds,
+        poll_interval_seconds=poll_interval_seconds,
+        rolling_bid_close_seconds=rolling_bid_close_seconds,
+        resume=resume,
+        priority=admission_priority(_to_utc(ordered_at) or now, order_value),
+        queued_at=now,
+    )
+    if _admission.try_admit(order_id, restaurant_id, request.priority):
+        _launch_dispatch(request)
+        return True
+
+    limits = _admission.limits
+    if limits.max_waiting and _admission.waiting_count >= limits.max_waiting:
+        dispatch_metrics.ADMISSION_REJECTED.inc()
+        raise AdmissionRejected(f"{_admission.waiting_count} dispatches are already waiting for capacity")
+    await set_dispatch_state(
+        order_id,
+        status="queued",
+        phase="admission",
+        restaurant_id=restaurant_id,
+        delivery_address=delivery_address,
+        note="waiting for dispatch capacity",
+        extra={"queued_at": now.isoformat()},
+    )
+    try:
+        position = _admission.enqueue(order_id, restaurant_id, request.priority, request)
+    except AdmissionRejected:
+        # The queue filled up while the state was written.
+        dispatch_metrics.ADMISSION_REJECTED.inc()
+        await set_dispatch_state(
+            order_id, status="rejected", phase="admission", note="dispatch queue full"
+        )
+        raise
+    dispatch_metrics.ADMISSION_QUEUED.inc()
+    logger.info(
+        "Queued dispatch for order %s at position %s (%s active)",
+        order_id,
+        position,
+        _admission.active_count,
+    )
+    # Capacity may have freed up while the state was written.
+    _admit_waiting()
+    return True
+
+
+async def _stop_task(order_id: int, reason: str, timeout_seconds: float | None = None) -> bool:
+    task = _dispatch_tasks.get(order_id)
+    if task is None or task.done():
+        return False
+    _stop_reasons[order_id] = reason
+    task.cancel()
+    await asyncio.wait([task], timeout=timeout_seconds)
     return True
 
 
+async def cancel_dispatch(order_id: int, *, reason: str | None = None) -> bool:
+    """
+    Stop dispatching an order: cancel its task (if it runs in this process), withdraw its
+    broadcasts from the agent queues, drop its bid book and mark the state "cancelled".
+    Returns whether a task was running here.
+    """
+    was_running = await _stop_task(order_id, "cancelled")
+    await _release_dispatch(order_id, reason or "dispatch cancelled")
+    logger.info("Cancelled dispatch for order %s (task running here: %s)", order_id, was_running)
+    return was_running
+
+
+async def _release_dispatch(order_id: int, note: str) -> None:
+    """Everything cancel_dispatch does besides stopping the task; the task itself may call it."""
+    _admission.remove(order_id)
+    await _store().unschedule(order_id)
+    state = await _store().get_state(order_id)
+    if state.get("restaurant_id") and state.get("delivery_address"):
+        for agent_type in ("student", "all"):
+            message = DispatchMessage(
+                order_id=order_id,
+                restaurant_id=int(state["restaurant_id"]),
+                delivery_address=state["delivery_address"],
+                candidate_agent_type=agent_type,
+            )
+            await _store().remove(f"dispatch:queue:{agent_type}", json.dumps(message.model_dump()))
+    await _store().clear_bids(order_id)
+    await set_dispatch_state(
+        order_id,
+        status="cancelled",
+        phase="cancelled",
+        note=note,
+        extra={"checkpoint": ""},
+    )
+
+
+async def drain_dispatch_tasks(
+    timeout_seconds: float = 10.0, *, order_ids: Iterable[int] | None = None
+) -> int:
+    """
+    Stop every dispatch task in this process for shutdown (or only those of `order_ids`,
+    when a worker hands a shard over). Each task checkpoints its phase and deadline into
+    the dispatch state (status "interrupted") on its way out, so
+    resume_interrupted_dispatches can pick it up after the restart. Returns the task count.
+    """
+    selected = set(order_ids) if order_ids is not None else None
+    # Queued dispatches go first, so tasks stopping below do not admit them.
+    waiting = _admission.drain_waiting(selected)
+    for order_id, request in waiting:
+        await set_dispatch_state(
+            order_id,
+            status="interrupted",
+            phase=request.resume.phase if request.resume else "admission",
+            restaurant_id=request.restaurant_id,
+            delivery_address=request.delivery_address,
+            note="queued dispatch interrupted by shutdown; waiting to resume",
+            extra={"checkpoint": request.resume.model_dump_json() if request.resume else ""},
+        )
+    if waiting:
+        logger.info("Released %s queued dispatches for shutdown", len(waiting))
+    running = [
+        order_id
+        for order_id, task in list(_dispatch_tasks.items())
+        if not task.done() and (selected is None or order_id in selected)
+    ]
+    if not running:
+        return 0
+    tasks = []
+    for order_id in running:
+        _stop_reasons[order_id] = "shutdown"
+        task = _dispatch_tasks[order_id]
+        task.cancel()
+        tasks.append(task)
+    _, pending = await asyncio.wait(tasks, timeout=timeout_seconds)
+    if pending:
+        logger.warning("%s dispatch tasks did not checkpoint within %.1fs", len(pending), timeout_seconds)
+    logger.info("Drained %s dispatch tasks for shutdown", len(running))
+    return len(running)
+
+
+async def resume_interrupted_dispatches(
+    *, limit: int = 1000, shards: Iterable[str] | None = None
+) -> list[int]:
+    """
+    Restart dispatches checkpointed by a previous shutdown, optionally only those of the
+    given dispatch shards (see app.dispatch.worker). Returns the resumed order ids.
+    """
+    shard_filter = set(shards) if shards is not None else None
+    db = _open_session()
+    try:
+        order_ids = [order.order_id for order in order_crud.list_awaiting_dispatch(db, limit=limit)]
+    finally:
+        db.close()
+
+    resumed: list[int] = []
+    for order_id in order_ids:
+        state = await _store().get_state(order_id)
+        if state.get("status") != "interrupted" or is_dispatch_running(order_id):
+            continue
+        if shard_filter is not None and state.get("shard", "") not in shard_filter:
+            continue
+        raw_checkpoint = state.get("checkpoint")
+        try:
+            if raw_checkpoint:
+                checkpoint = DispatchCheckpoint.model_validate_json(raw_checkpoint)
+                started = await start_dispatch_background(
+                    order_id,
+                    checkpoint.restaurant_id,
+                    checkpoint.delivery_address,
+                    phase2_wait_seconds=checkpoint.phase2_wait_seconds,
+                    poll_interval_seconds=checkpoint.poll_interval_seconds,
+                    rolling_bid_close_seconds=checkpoint.rolling_bid_close_seconds,
+                    resume=checkpoint,
+                )
+            elif state.get("restaurant_id") and state.get("delivery_address"):
+                # Interrupted before the phase 1 timer started: run the dispatch from the top.
+                started = await start_dispatch_background(
+                    order_id, int(state["restaurant_id"]), state["delivery_address"]
+                )
+            else:
+                continue
+        except AdmissionRejected:
+            # Left "interrupted"; the next start (or sharded worker rescan) retries it.
+            logger.warning("Dispatch queue full; leaving the remaining interrupted dispatches")
+            break
+        if started:
+            resumed.append(order_id)
+    if resumed:
+        logger.info("Resumed %s interrupted dispatches: %s", len(resumed), resumed)
+    return resumed
+
+
+class DeferredDispatch(BaseModel):
+    """A dispatch waiting in the schedule until `run_at` (engine clock)."""
+
+    order_id: int
+    restaurant_id: int
+    delivery_address: str
+    run_at: datetime
+    expected_ready_at: datetime | None = None
+    phase1_wait_seconds_min: int = 180
+    phase1_wait_seconds_max: int = 240
+    phase2_wait_seconds: int = 180
+    poll_interval_seconds: int = 5
+    rolling_bid_close_seconds: int = ROLLING_BID_CLOSE_SECONDS
+    # Admission priority once the dispatch is due.
+    ordered_at: datetime | None = None
+    order_value: float = 0.0
+    # Dispatch shard of the restaurant when workers are sharded (app.dispatch.worker).
+    shard: str | None = None
+
+
+DISPATCH_SCHEDULER_TICK_SECONDS = float(os.getenv("DISPATCH_SCHEDULER_TICK_SECONDS", "5"))
+_scheduler_task: asyncio.Task | None = None
+
+
+async def schedule_dispatch(deferred: DeferredDispatch) -> None:
+    """Queue a dispatch to start at `deferred.run_at`; the order shows as "scheduled" until then."""
+    await _store().schedule(deferred.order_id, deferred.run_at.timestamp(), deferred.model_dump_json())
+    await set_dispatch_state(
+        deferred.order_id,
+        status="scheduled",
+        phase="deferred",
+        restaurant_id=deferred.restaurant_id,
+        delivery_address=deferred.delivery_address,
+        note=f"student pool opens at {deferred.run_at.isoformat()}",
+        extra={
+            "scheduled_for": deferred.run_at.isoformat(),
+            "expected_ready_at": deferred.expected_ready_at.isoformat() if deferred.expected_ready_at else "",
+            **({"shard": deferred.shard} if deferred.shard else {}),
+        },
+    )
+    logger.info("Scheduled dispatch for order %s at %s", deferred.order_id, deferred.run_at.isoformat())
+
+
+async def start_deferred_dispatch(deferred: DeferredDispatch) -> bool:
+    """Start a due deferred dispatch in this process (through admission control)."""
+    return await start_dispatch_background(
+        deferred.order_id,
+        deferred.restaurant_id,
+        deferred.delivery_address,
+        phase1_wait_seconds_min=deferred.phase1_wait_seconds_min,
+        phase1_wait_seconds_max=deferred.phase1_wait_seconds_max,
+        phase2_wait_seconds=deferred.phase2_wait_seconds,
+        poll_interval_seconds=deferred.poll_interval_seconds,
+        rolling_bid_close_seconds=deferred.rolling_bid_close_seconds,
+        ordered_at=deferred.ordered_at,
+        order_value=deferred.order_value,
+    )
+
+
+async def run_due_dispatches(
+    limit: int = 100,
+    *,
+    start: Callable[[DeferredDispatch], Awaitable[bool]] | None = None,
+) -> list[int]:
+    """
+    Start every scheduled dispatch whose time has come. Returns the started order ids.
+    `start` replaces starting it in this process (a sharded worker forwards dispatches of
+    shards it does not own).
+    """
+    start = start or start_deferred_dispatch
+    started: list[int] = []
+    for payload in await _store().pop_due(_clock.now().timestamp(), limit):
+        deferred = DeferredDispatch.model_validate_json(payload)
+        # Started by hand or cancelled while it waited.
+        if (await _store().get_state(deferred.order_id)).get("status") != "scheduled":
+            continue
+        try:
+            accepted = await start(deferred)
+        except AdmissionRejected:
+            # Try again on a later tick.
+            retry_at = _clock.now() + timedelta(seconds=DISPATCH_SCHEDULER_TICK_SECONDS)
+            await _store().schedule(deferred.order_id, retry_at.timestamp(), payload)
+            continue
+        if accepted:
+            started.append(deferred.order_id)
+    return started
+
+
+async def _run_scheduler(tick_seconds: float) -> None:
+    while True:
+        try:
+            await run_due_dispatches()
+        except Exception:
+            logger.exception("Dispatch scheduler tick failed")
+        await _clock.sleep(tick_seconds)
+
+
+def start_dispatch_scheduler(tick_seconds: float = DISPATCH_SCHEDULER_TICK_SECONDS) -> None:
+    global _scheduler_task
+    if _scheduler_task is None or _scheduler_task.done():
+        _scheduler_task = asyncio.create_task(_run_scheduler(tick_seconds))
+
+
+async def stop_dispatch_scheduler() -> None:
+    global _scheduler_task
+    if _scheduler_task is not None:
+        _scheduler_task.cancel()
+        try:
+            await _scheduler_task
+        except asyncio.CancelledError:
+            pass
+        _scheduler_task = None
+
+
 __all__ = [
     "DispatchMessage",
     "push_to_queue",
     "is_order_assigned",
     "dispatch_order",
     "start_dispatch_background",
+    "AdmissionRejected",
+    "QueuedDispatch",
+    "set_admission_controller",
+    "is_dispatch_queued",
+    "dispatch_queue_position",
+    "dispatch_queue_depth",
+    "cancel_dispatch",
+    "drain_dispatch_tasks",
+    "resume_interrupted_dispatches",
+    "DeferredDispatch",
+    "bundle_orders",
+    "dissolve_bundle",
+    "schedule_dispatch",
+    "run_due_dispatches",
+    "start_deferred_dispatch",
+    "start_dispatch_scheduler",
+    "stop_dispatch_scheduler",
+    "DispatchCheckpoint",
     "is_dispatch_running",
     "get_dispatch_state",
     "set_dispatch_state",
     "mark_order_assigned",
+    "record_bid",
+    "dispatch_runtime",
+    "get_dispatch_clock",
+    "set_dispatch_runtime",
 ]
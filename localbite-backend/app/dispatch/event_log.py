@@ -0,0 +1,355 @@
+"""
+Dispatch event log.
+
+Every state transition, bid and award the engine makes is appended to the state store's
+event log as a compact entry:
+
+    {"o": "<order_id>", "k": "<kind>", "t": "<iso time>", "d": "<json payload>"}
+
+On Redis that is the `dispatch:events` stream, capped with an approximate MAXLEN so an
+append stays O(1). A background flusher drains the stream through a consumer group into
+the dispatch_events table in batches (COPY on Postgres), acknowledging entries only once
+they are committed; entries left pending by a crashed flusher are re-claimed after a minute.
+The Postgres state store writes events straight to the table instead.
+
+The table is the audit trail: rebuild_states() folds events back into the per-order
+dispatch state, assignment flag and bid book (see app.jobs.replay_dispatch_events).
+
+Event kinds:
+  - state     fields merged into the dispatch state hash
+  - bid       {"bid_id", "amount"} added to the bid book
+  - book      {"bids": {bid_id: amount}} bid book reloaded from delivery_bids
+  - award     {"agent_id"} order assigned, bid book cleared
+  - unassign  assignment flag cleared for a fresh dispatch
+"""
+from __future__ import annotations
+
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import socket
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, Literal
+
+from pydantic import BaseModel, Field
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.dispatch import metrics as dispatch_metrics
+from app.dispatch.state_store import DispatchStateStore, event_row, get_state_store
+from app.models.dispatch_state import DispatchEventRecord
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_EVENT_FLUSH_SECONDS = float(os.getenv("DISPATCH_EVENT_FLUSH_SECONDS", "2"))
+DISPATCH_EVENT_FLUSH_BATCH = int(os.getenv("DISPATCH_EVENT_FLUSH_BATCH", "500"))
+
+EventKind = Literal["state", "bid", "book", "award", "unassign"]
+
+
+def encode_event(kind: EventKind, order_id: int, at: datetime, payload: dict[str, Any]) -> dict[str, str]:
+    return {
+        "o": str(order_id),
+        "k": kind,
+        "t": at.isoformat(),
+        "d": json.dumps(payload, separators=(",", ":")),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Flushing the stream into dispatch_events
+# ---------------------------------------------------------------------------
+
+_COPY_SQL = (
+    "COPY dispatch_events (stream_id, order_id, kind, payload, occurred_at) "
+    "FROM STDIN WITH (FORMAT csv)"
+)
+
+
+def _copy_rows(db: Session, rows: list[dict]) -> None:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # An unquoted empty field is NULL in COPY's csv format.
+        writer.writerow([
+            row["stream_id"] or "",
+            row["order_id"],
+            row["kind"],
+            json.dumps(row["payload"]),
+            row["occurred_at"].isoformat(),
+        ])
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(_COPY_SQL, buffer)
+    finally:
+        cursor.close()
+
+
+def _insert_ignoring_duplicates(db: Session, rows: list[dict]) -> None:
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = pg_insert(DispatchEventRecord).on_conflict_do_nothing(index_elements=["stream_id"])
+    elif dialect == "sqlite":
+        stmt = insert(DispatchEventRecord).prefix_with("OR IGNORE")
+    else:
+        stmt = insert(DispatchEventRecord)
+    db.execute(stmt, rows)
+
+
+def write_event_rows(db: Session, rows: list[dict]) -> None:
+    """
+    Persist a batch of decoded events. Re-delivered entries (same stream id) are skipped,
+    so a batch that was written but not acknowledged can safely be flushed again.
+    """
+    if not rows:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        try:
+            _copy_rows(db, rows)
+            db.commit()
+            return
+        except Exception:
+            # Typically a unique violation from a re-delivered batch; COPY is all or nothing.
+            db.rollback()
+    _insert_ignoring_duplicates(db, rows)
+    db.commit()
+
+
+async def flush_events_once(
+    store: DispatchStateStore | None = None,
+    *,
+    consumer: str,
+    batch_size: int = DISPATCH_EVENT_FLUSH_BATCH,
+    session_factory: Callable[[], Session] = SessionLocal,
+) -> int:
+    """Move one batch of stream entries into dispatch_events. Returns the number flushed."""
+    store = store or get_state_store()
+    entries = await store.read_event_batch(consumer, batch_size)
+    if not entries:
+        return 0
+    rows = [event_row(fields, stream_id=entry_id) for entry_id, fields in entries]
+
+    def _write() -> None:
+        db = session_factory()
+        try:
+            write_event_rows(db, rows)
+        finally:
+            db.close()
+
+    await asyncio.to_thread(_write)
+    await store.ack_events([entry_id for entry_id, _ in entries])
+    dispatch_metrics.EVENTS_FLUSHED.inc(len(rows))
+    return len(rows)
+
+
+async def drain_events(
+    store: DispatchStateStore | None = None,
+    *,
+    consumer: str,
+    batch_size: int = DISPATCH_EVENT_FLUSH_BATCH,
+    session_factory: Callable[[], Session] = SessionLocal,
+) -> int:
+    """Flush until the stream has nothing left for `consumer`."""
+    total = 0
+    while True:
+        flushed = await flush_events_once(
+            store, consumer=consumer, batch_size=batch_size, session_factory=session_factory
+        )
+        total += flushed
+        if flushed < batch_size:
+            return total
+
+
+def default_consumer_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class EventLogFlusher:
+    """Background task that drains the event stream every `interval_seconds`."""
+
+    def __init__(
+        self,
+        *,
+        interval_seconds: float = DISPATCH_EVENT_FLUSH_SECONDS,
+        batch_size: int = DISPATCH_EVENT_FLUSH_BATCH,
+        consumer: str | None = None,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ) -> None:
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.consumer = consumer or default_consumer_name()
+        self.session_factory = session_factory
+        self._task: asyncio.Task | None = None
+
+    async def _drain(self) -> None:
+        await drain_events(
+            consumer=self.consumer, batch_size=self.batch_size, session_factory=self.session_factory
+        )
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._drain()
+            except Exception:
+                dispatch_metrics.EVENT_FLUSH_FAILURES.inc()
+                logger.exception("Dispatch event flush failed; entries stay pending for retry")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the loop and flush whatever is still in the stream."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self._drain()
+        except Exception:
+            logger.exception("Final dispatch event flush failed")
+
+
+# ---------------------------------------------------------------------------
+# Rebuilding state from events
+# ---------------------------------------------------------------------------
+
+class DispatchEvent(BaseModel):
+    order_id: int
+    kind: str
+    occurred_at: datetime
+    payload: dict[str, Any] = Field(default_factory=dict)
+
+
+class RebuiltOrderState(BaseModel):
+    order_id: int
+    state: dict[str, str] = Field(default_factory=dict)
+    assigned: bool = False
+    bids: dict[int, float] = Field(default_factory=dict)
+    events: int = 0
+    last_event_at: datetime | None = None
+
+
+def apply_event(states: dict[int, RebuiltOrderState], event: DispatchEvent) -> RebuiltOrderState:
+    current = states.get(event.order_id)
+    if current is None:
+        current = states[event.order_id] = RebuiltOrderState(order_id=event.order_id)
+    payload = event.payload
+    if event.kind == "state":
+        current.state.update({key: str(value) for key, value in payload.items()})
+        current.state["order_id"] = str(event.order_id)
+        current.state["updated_at"] = event.occurred_at.isoformat()
+    elif event.kind == "bid":
+        current.bids[int(payload["bid_id"])] = float(payload["amount"])
+    elif event.kind == "book":
+        current.bids = {int(bid_id): float(amount) for bid_id, amount in payload.get("bids", {}).items()}
+    elif event.kind == "award":
+        current.assigned = True
+        current.bids = {}
+    elif event.kind == "unassign":
+        current.assigned = False
+    else:
+        logger.warning("Skipping unknown dispatch event kind %r", event.kind)
+    current.events += 1
+    current.last_event_at = event.occurred_at
+    return current
+
+
+def rebuild_states(events: Iterable[DispatchEvent]) -> dict[int, RebuiltOrderState]:
+    """Fold events (in occurrence order) into per-order dispatch state."""
+    states: dict[int, RebuiltOrderState] = {}
+    for event in events:
+        apply_event(states, event)
+    return states
+
+
+def load_events(
+    db: Session,
+    *,
+    order_id: int | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> list[DispatchEvent]:
+    query = db.query(DispatchEventRecord)
+    if order_id is not None:
+        query = query.filter(DispatchEventRecord.order_id == order_id)
+    if since is not None:
+        query = query.filter(DispatchEventRecord.occurred_at >= since)
+    if until is not None:
+        query = query.filter(DispatchEventRecord.occurred_at <= until)
+    records = query.order_by(DispatchEventRecord.occurred_at, DispatchEventRecord.id).all()
+    return [
+        DispatchEvent(
+            order_id=record.order_id,
+            kind=record.kind,
+            # SQLite hands timestamps back naive; they were written in UTC.
+            occurred_at=(
+                record.occurred_at.replace(tzinfo=timezone.utc)
+                if record.occurred_at.tzinfo is None
+                else record.occurred_at
+            ),
+            payload=record.payload or {},
+        )
+        for record in records
+    ]
+
+
+async def restore_states(store: DispatchStateStore, states: Iterable[RebuiltOrderState]) -> int:
+    """Write rebuilt state back into a state store (e.g. an empty Redis after data loss)."""
+    restored = 0
+    for rebuilt in states:
+        if rebuilt.state:
+            await store.set_state(rebuilt.order_id, rebuilt.state)
+        if rebuilt.assigned:
+            await store.set_assigned(rebuilt.order_id)
+        else:
+            await store.clear_assigned(rebuilt.order_id)
+        await store.replace_bids(rebuilt.order_id, rebuilt.bids)
+        restored += 1
+    return restored
+
+
+_flusher: EventLogFlusher | None = None
+
+
+def start_event_flusher() -> EventLogFlusher:
+    global _flusher
+    if _flusher is None:
+        _flusher = EventLogFlusher()
+    _flusher.start()
+    return _flusher
+
+
+async def stop_event_flusher() -> None:
+    global _flusher
+    if _flusher is not None:
+        await _flusher.stop()
+        _flusher = None
+
+
+__all__ = [
+    "DispatchEvent",
+    "EventLogFlusher",
+    "RebuiltOrderState",
+    "apply_event",
+    "default_consumer_name",
+    "drain_events",
+    "encode_event",
+    "flush_events_once",
+    "load_events",
+    "rebuild_states",
+    "restore_states",
+    "start_event_flusher",
+    "stop_event_flusher",
+    "write_event_rows",
+]
@@ -0,0 +1,81 @@
+"""
+Dispatch lifecycle metrics, exported at /metrics.
+
+Durations are measured on the engine clock, so simulated runs report simulated seconds.
+"""
+from app.core.metrics import Counter, Gauge, Histogram
+
+_PHASE_BUCKETS = (5, 15, 30, 60, 120, 180, 240, 300, 420, 600, 900)
+_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+_CALL_BUCKETS = (5, 10, 25, 50, 100, 200, 400, 800)
+
+DISPATCH_STARTED = Counter(
+    "localbite_dispatch_started_total",
+    "Dispatch lifecycles started.",
+)
+DISPATCH_OUTCOMES = Counter(
+    "localbite_dispatch_outcomes_total",
+    "Finished dispatch lifecycles by outcome (assigned, awarded, needs_fee_increase, failed, cancelled, interrupted) and final phase.",
+    labelnames=("outcome", "phase"),
+)
+PHASE_DURATION = Histogram(
+    "localbite_dispatch_phase_duration_seconds",
+    "Time an order spent in each dispatch phase.",
+    buckets=_PHASE_BUCKETS,
+    labelnames=("phase",),
+)
+TIME_TO_FIRST_BID = Histogram(
+    "localbite_dispatch_time_to_first_bid_seconds",
+    "Time from dispatch start to the first bid recorded for the order.",
+    buckets=_PHASE_BUCKETS,
+)
+TIME_TO_AWARD = Histogram(
+    "localbite_dispatch_time_to_award_seconds",
+    "Time from dispatch start until the order was assigned, by the phase it was assigned in.",
+    buckets=_PHASE_BUCKETS,
+    labelnames=("phase",),
+)
+BIDS_PER_ORDER = Histogram(
+    "localbite_dispatch_bids_per_order",
+    "Placed bids seen by the dispatch loop when the lifecycle ended.",
+    buckets=_COUNT_BUCKETS,
+)
+STORE_CALLS_PER_DISPATCH = Histogram(
+    "localbite_dispatch_state_store_calls",
+    "Dispatch state store (Redis) calls made by one dispatch lifecycle.",
+    buckets=_CALL_BUCKETS,
+)
+DB_CALLS_PER_DISPATCH = Histogram(
+    "localbite_dispatch_db_sessions",
+    "Database sessions opened by one dispatch lifecycle.",
+    buckets=_CALL_BUCKETS,
+)
+LIVE_TASKS = Gauge(
+    "localbite_dispatch_live_tasks",
+    "Dispatch tasks currently running in this process.",
+)
+ADMISSION_WAITING = Gauge(
+    "localbite_dispatch_admission_waiting",
+    "Dispatches in this process waiting for admission (over the active caps).",
+)
+ADMISSION_QUEUED = Counter(
+    "localbite_dispatch_admission_queued_total",
+    "Dispatches that had to wait for admission instead of starting right away.",
+)
+ADMISSION_REJECTED = Counter(
+    "localbite_dispatch_admission_rejected_total",
+    "Dispatches refused because the admission queue was full.",
+)
+ADMISSION_WAIT = Histogram(
+    "localbite_dispatch_admission_wait_seconds",
+    "Time a queued dispatch waited before it was admitted.",
+    buckets=_PHASE_BUCKETS,
+)
+EVENTS_FLUSHED = Counter(
+    "localbite_dispatch_events_flushed_total",
+    "Dispatch event log entries moved from the stream into dispatch_events.",
+)
+EVENT_FLUSH_FAILURES = Counter(
+    "localbite_dispatch_event_flush_failures_total",
+    "Event log flush attempts that failed and were left pending for retry.",
+)
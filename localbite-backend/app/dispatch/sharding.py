@@ -0,0 +1,301 @@
+"""
+Geographic shards for dispatch workers.
+
+A shard is the geohash prefix (DISPATCH_SHARD_PRECISION characters, ~5 km cells by
+default) of the restaurant an order is picked up from; orders of restaurants without
+coordinates fall into the catch-all shard "_". Each shard is owned by at most one dispatch
+worker at a time through a lease:
+
+    dispatch:shard:{shard}:lease   SET NX PX, value = worker id, renewed every tick
+    dispatch:workers               zset of live workers, score = heartbeat expiry
+    dispatch:shards                set of shards that have ever received work
+
+On every tick a worker heartbeats, renews the leases it holds, and rebalances toward an
+even split: with S known shards and W live workers it keeps at most ceil(S / W) shards,
+releasing the surplus and picking up unowned shards while it is below that share. A
+crashed worker's leases expire after DISPATCH_SHARD_LEASE_SECONDS and are picked up by
+the others.
+
+Leases need one store every worker can see: Redis in production, InMemoryShardLeases for
+a single process and tests. They deliberately do not fail over to Postgres, where two
+workers could each believe they own a shard.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable
+
+import redis.asyncio as aioredis
+from redis.exceptions import WatchError
+
+from app.services.distance import geohash_encode
+
+logger = logging.getLogger("dispatch.sharding")
+
+DISPATCH_SHARD_PRECISION = int(os.getenv("DISPATCH_SHARD_PRECISION", "5"))
+DISPATCH_SHARD_LEASE_SECONDS = float(os.getenv("DISPATCH_SHARD_LEASE_SECONDS", "15"))
+UNLOCATED_SHARD = "_"
+
+WORKERS_KEY = "dispatch:workers"
+SHARDS_KEY = "dispatch:shards"
+
+
+def shard_for(
+    latitude: float | None,
+    longitude: float | None,
+    precision: int = DISPATCH_SHARD_PRECISION,
+) -> str:
+    if latitude is None or longitude is None:
+        return UNLOCATED_SHARD
+    return geohash_encode(latitude, longitude, precision)
+
+
+def inbox_key(shard: str) -> str:
+    """State store queue holding dispatch start requests for one shard."""
+    return f"dispatch:inbox:{shard}"
+
+
+def _lease_key(shard: str) -> str:
+    return f"dispatch:shard:{shard}:lease"
+
+
+class ShardLeases(ABC):
+    @abstractmethod
+    async def acquire(self, shard: str, owner: str, ttl_seconds: float) -> bool:
+        """Take the lease if it is free, or extend it if `owner` already holds it."""
+
+    @abstractmethod
+    async def release(self, shard: str, owner: str) -> None:
+        """Drop the lease, but only if `owner` holds it."""
+
+    @abstractmethod
+    async def owner(self, shard: str) -> str | None:
+        ...
+
+    @abstractmethod
+    async def heartbeat(self, worker: str, ttl_seconds: float) -> None:
+        ...
+
+    @abstractmethod
+    async def leave(self, worker: str) -> None:
+        ...
+
+    @abstractmethod
+    async def live_workers(self) -> list[str]:
+        ...
+
+    @abstractmethod
+    async def add_shard(self, shard: str) -> None:
+        ...
+
+    @abstractmethod
+    async def known_shards(self) -> set[str]:
+        ...
+
+
+class RedisShardLeases(ShardLeases):
+    def __init__(self, client: aioredis.Redis, *, now: Callable[[], float] = time.time) -> None:
+        self.client = client
+        self._now = now
+
+    async def acquire(self, shard: str, owner: str, ttl_seconds: float) -> bool:
+        key = _lease_key(shard)
+        ttl_ms = int(ttl_seconds * 1000)
+        if await self.client.set(key, owner, nx=True, px=ttl_ms):
+            return True
+        async with self.client.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                if await pipe.get(key) != owner:
+                    return False
+                pipe.multi()
+                pipe.pexpire(key, ttl_ms)
+                await pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    async def release(self, shard: str, owner: str) -> None:
+        key = _lease_key(shard)
+        async with self.client.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                if await pipe.get(key) != owner:
+                    return
+                pipe.multi()
+                pipe.delete(key)
+                await pipe.execute()
+            except WatchError:
+                pass
+
+    async def owner(self, shard: str) -> str | None:
+        return await self.client.get(_lease_key(shard))
+
+    async def heartbeat(self, worker: str, ttl_seconds: float) -> None:
+        now = self._now()
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zadd(WORKERS_KEY, {worker: now + ttl_seconds})
+            pipe.zremrangebyscore(WORKERS_KEY, "-inf", now)
+            await pipe.execute()
+
+    async def leave(self, worker: str) -> None:
+        await self.client.zrem(WORKERS_KEY, worker)
+
+    async def live_workers(self) -> list[str]:
+        return sorted(await self.client.zrangebyscore(WORKERS_KEY, self._now(), "+inf"))
+
+    async def add_shard(self, shard: str) -> None:
+        await self.client.sadd(SHARDS_KEY, shard)
+
+    async def known_shards(self) -> set[str]:
+        return set(await self.client.smembers(SHARDS_KEY))
+
+
+class InMemoryShardLeases(ShardLeases):
+    """Leases for workers sharing one process (tests, single-node installs)."""
+
+    def __init__(self, *, now: Callable[[], float] = time.monotonic) -> None:
+        self._now = now
+        self.leases: dict[str, tuple[str, float]] = {}
+        self.workers: dict[str, float] = {}
+        self.shards: set[str] = set()
+
+    def _holder(self, shard: str) -> str | None:
+        lease = self.leases.get(shard)
+        if lease is None or lease[1] <= self._now():
+            return None
+        return lease[0]
+
+    async def acquire(self, shard: str, owner: str, ttl_seconds: float) -> bool:
+        holder = self._holder(shard)
+        if holder not in (None, owner):
+            return False
+        self.leases[shard] = (owner, self._now() + ttl_seconds)
+        return True
+
+    async def release(self, shard: str, owner: str) -> None:
+        if self._holder(shard) == owner:
+            del self.leases[shard]
+
+    async def owner(self, shard: str) -> str | None:
+        return self._holder(shard)
+
+    async def heartbeat(self, worker: str, ttl_seconds: float) -> None:
+        self.workers[worker] = self._now() + ttl_seconds
+
+    async def leave(self, worker: str) -> None:
+        self.workers.pop(worker, None)
+
+    async def live_workers(self) -> list[str]:
+        now = self._now()
+        return sorted(worker for worker, expires in self.workers.items() if expires > now)
+
+    async def add_shard(self, shard: str) -> None:
+        self.shards.add(shard)
+
+    async def known_shards(self) -> set[str]:
+        return set(self.shards)
+
+
+@dataclass
+class Rebalance:
+    owned: set[str]
+    gained: set[str] = field(default_factory=set)
+    lost: set[str] = field(default_factory=set)
+
+
+class ShardCoordinator:
+    """
+    Keeps one worker's share of the shard leases. With `pinned` shards the worker only
+    ever competes for those (and holds all it can get); otherwise it takes a fair share
+    of every known shard.
+    """
+
+    def __init__(
+        self,
+        leases: ShardLeases,
+        worker_id: str,
+        *,
+        lease_seconds: float = DISPATCH_SHARD_LEASE_SECONDS,
+        pinned: Iterable[str] | None = None,
+    ) -> None:
+        self.leases = leases
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.pinned = set(pinned) if pinned else None
+        self.owned: set[str] = set()
+
+    async def rebalance(
+        self, *, before_release: Callable[[set[str]], Awaitable[None]] | None = None
+    ) -> Rebalance:
+        """
+        Renew, shed and acquire leases. `before_release` is awaited with the shards about to
+        be shed while this worker still holds them, so it can checkpoint their dispatches
+        before another worker may pick them up.
+        """
+        await self.leases.heartbeat(self.worker_id, self.lease_seconds)
+        previous = set(self.owned)
+
+        owned: set[str] = set()
+        for shard in sorted(previous):
+            if await self.leases.acquire(shard, self.worker_id, self.lease_seconds):
+                owned.add(shard)
+
+        if self.pinned is not None:
+            candidates = self.pinned
+            share = len(candidates)
+        else:
+            candidates = await self.leases.known_shards()
+            workers = await self.leases.live_workers()
+            share = math.ceil(len(candidates) / max(len(workers), 1))
+
+        # Shed the surplus so a newly joined worker can pick it up.
+        surplus = set(sorted(owned, reverse=True)[: max(len(owned) - share, 0)])
+        if surplus and before_release is not None:
+            await before_release(surplus)
+        for shard in sorted(surplus):
+            await self.leases.release(shard, self.worker_id)
+            owned.discard(shard)
+
+        for shard in sorted(candidates - owned):
+            if len(owned) >= share:
+                break
+            if await self.leases.acquire(shard, self.worker_id, self.lease_seconds):
+                owned.add(shard)
+
+        self.owned = owned
+        result = Rebalance(owned=set(owned), gained=owned - previous, lost=previous - owned)
+        if result.gained or result.lost:
+            logger.info(
+                "Worker %s shards: +%s -%s (now %s)",
+                self.worker_id,
+                sorted(result.gained),
+                sorted(result.lost),
+                len(owned),
+            )
+        return result
+
+    async def release_all(self) -> None:
+        for shard in sorted(self.owned):
+            await self.leases.release(shard, self.worker_id)
+        self.owned = set()
+        await self.leases.leave(self.worker_id)
+
+
+__all__ = [
+    "DISPATCH_SHARD_LEASE_SECONDS",
+    "DISPATCH_SHARD_PRECISION",
+    "InMemoryShardLeases",
+    "Rebalance",
+    "RedisShardLeases",
+    "ShardCoordinator",
+    "ShardLeases",
+    "UNLOCATED_SHARD",
+    "inbox_key",
+    "shard_for",
+]
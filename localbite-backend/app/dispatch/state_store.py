@@ -0,0 +1,854 @@
+"""
+Dispatch state stores
+
+Everything the dispatch engine keeps outside the orders table lives behind one small
+interface:
+
+  - state hash    per-order dispatch status fields (status, phase, timers, note, ...)
+  - assigned flag set once an order is awarded, polled by the dispatch loop
+  - queue         broadcast messages for the student / all-agents pools, and per-shard
+                  inboxes of dispatch start requests (see app.dispatch.worker)
+  - bid book      placed bid ids and amounts per order, so the dispatch loop can notice
+                  new bids without querying delivery_bids on every poll
+  - schedule      deferred dispatches by start time (epoch seconds on the engine clock);
+                  pop_due claims an entry for exactly one worker
+  - event log     append-only transitions, bids and awards (see app.dispatch.event_log);
+                  a Redis Stream capped by MAXLEN and drained through a consumer group
+
+Backends:
+  RedisStateStore     the production store (same keys the engine always used)
+  InMemoryStateStore  single-process installs, tests and simulations; no Redis needed
+  PostgresStateStore  durable tables in the application database via SQLAlchemy
+  FailoverStateStore  Redis first; a circuit breaker sends calls to Postgres while Redis
+                      is unreachable instead of letting dispatch tasks die
+
+The backend is picked by DISPATCH_STATE_BACKEND = redis (default) | memory | postgres.
+With "redis", DISPATCH_STATE_FAILOVER=postgres (default) wraps it in the failover store;
+set it to "none" to use Redis alone.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from itertools import islice
+from datetime import datetime, timezone
+from typing import Callable, TypeVar
+
+import redis.asyncio as aioredis
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import ResponseError as RedisResponseError
+from redis.exceptions import TimeoutError as RedisTimeoutError
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.dispatch_state import (
+    DispatchBidBookEntry,
+    DispatchEventRecord,
+    DispatchQueueMessage,
+    DispatchScheduleEntry,
+    DispatchStateRecord,
+)
+
+logger = logging.getLogger("dispatch.state_store")
+
+T = TypeVar("T")
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_SOCKET_TIMEOUT_SECONDS = float(os.getenv("REDIS_SOCKET_TIMEOUT_SECONDS", "2.0"))
+DISPATCH_STATE_BACKEND = os.getenv("DISPATCH_STATE_BACKEND", "redis").lower()
+DISPATCH_STATE_FAILOVER = os.getenv("DISPATCH_STATE_FAILOVER", "postgres").lower()
+DISPATCH_EVENT_STREAM_MAXLEN = int(os.getenv("DISPATCH_EVENT_STREAM_MAXLEN", "100000"))
+EVENT_STREAM_KEY = "dispatch:events"
+EVENT_CONSUMER_GROUP = "dispatch-events-flush"
+SCHEDULE_KEY = "dispatch:scheduled"
+SCHEDULE_PAYLOAD_KEY = "dispatch:scheduled:payload"
+
+EventEntry = tuple[str, dict[str, str]]
+
+
+def event_row(fields: dict[str, str], stream_id: str | None = None) -> dict:
+    """Decode a compact event entry ({o, k, t, d}) into dispatch_events column values."""
+    return {
+        "stream_id": stream_id,
+        "order_id": int(fields["o"]),
+        "kind": fields["k"],
+        "payload": json.loads(fields.get("d") or "{}"),
+        "occurred_at": datetime.fromisoformat(fields["t"]),
+    }
+
+
+class DispatchStateStore(ABC):
+    name = "abstract"
+
+    @abstractmethod
+    async def set_state(self, order_id: int, fields: dict[str, str]) -> None:
+        """Merge `fields` into the order's state hash."""
+
+    @abstractmethod
+    async def get_state(self, order_id: int) -> dict[str, str]:
+        ...
+
+    @abstractmethod
+    async def set_assigned(self, order_id: int) -> None:
+        ...
+
+    @abstractmethod
+    async def clear_assigned(self, order_id: int) -> None:
+        ...
+
+    @abstractmethod
+    async def is_assigned(self, order_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    async def push(self, queue: str, payload: str) -> None:
+        ...
+
+    @abstractmethod
+    async def remove(self, queue: str, payload: str) -> None:
+        """Withdraw every queued copy of `payload` (e.g. when a dispatch is cancelled)."""
+
+    @abstractmethod
+    async def pop(self, queue: str, count: int) -> list[str]:
+        """Take up to `count` messages from the head of the queue; each goes to one caller."""
+
+    @abstractmethod
+    async def add_bid(self, order_id: int, bid_id: int, bid_amount: float) -> None:
+        ...
+
+    @abstractmethod
+    async def replace_bids(self, order_id: int, bids: dict[int, float]) -> None:
+        ...
+
+    @abstractmethod
+    async def get_bids(self, order_id: int) -> dict[int, float]:
+        ...
+
+    @abstractmethod
+    async def clear_bids(self, order_id: int) -> None:
+        ...
+
+    @abstractmethod
+    async def schedule(self, order_id: int, run_at: float, payload: str) -> None:
+        """Schedule (or reschedule) a deferred dispatch for epoch time `run_at`."""
+
+    @abstractmethod
+    async def unschedule(self, order_id: int) -> None:
+        ...
+
+    @abstractmethod
+    async def pop_due(self, now: float, limit: int) -> list[str]:
+        """Remove and return payloads scheduled at or before `now`; each goes to one caller."""
+
+    @abstractmethod
+    async def append_event(self, fields: dict[str, str]) -> None:
+        """Append one compact event entry to the dispatch event log."""
+
+    async def read_event_batch(self, consumer: str, count: int) -> list[EventEntry]:
+        """Unflushed events for `consumer`. Stores that write events durably return none."""
+        return []
+
+    async def ack_events(self, entry_ids: list[str]) -> None:
+        return None
+
+    async def bid_marker(self, order_id: int) -> tuple[int, int]:
+        """(number of placed bids, highest bid id); changes whenever a bid is added."""
+        bids = await self.get_bids(order_id)
+        if not bids:
+            return (0, 0)
+        return (len(bids), max(bids))
+
+    async def close(self) -> None:
+        return None
+
+
+class RedisStateStore(DispatchStateStore):
+    name = "redis"
+
+    def __init__(
+        self,
+        client: aioredis.Redis | None = None,
+        *,
+        url: str = REDIS_URL,
+        event_maxlen: int = DISPATCH_EVENT_STREAM_MAXLEN,
+        claim_idle_ms: int = 60_000,
+    ) -> None:
+        self._client = client
+        self._url = url
+        self.event_maxlen = event_maxlen
+        self.claim_idle_ms = claim_idle_ms
+        self._group_ready = False
+
+    @property
+    def client(self) -> aioredis.Redis:
+        if self._client is None:
+            self._client = aioredis.from_url(
+                self._url,
+                encoding="utf-8",
+                decode_responses=True,
+                socket_connect_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+                socket_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+            )
+        return self._client
+
+    @staticmethod
+    def _state_key(order_id: int) -> str:
+        return f"dispatch:order:{order_id}:state"
+
+    @staticmethod
+    def _assignment_key(order_id: int) -> str:
+        return f"order:{order_id}:assigned"
+
+    @staticmethod
+    def _bids_key(order_id: int) -> str:
+        return f"dispatch:order:{order_id}:bids"
+
+    async def set_state(self, order_id: int, fields: dict[str, str]) -> None:
+        await self.client.hset(self._state_key(order_id), mapping=fields)
+
+    async def get_state(self, order_id: int) -> dict[str, str]:
+        return await self.client.hgetall(self._state_key(order_id)) or {}
+
+    async def set_assigned(self, order_id: int) -> None:
+        await self.client.set(self._assignment_key(order_id), "1")
+
+    async def clear_assigned(self, order_id: int) -> None:
+        await self.client.delete(self._assignment_key(order_id))
+
+    async def is_assigned(self, order_id: int) -> bool:
+        # Existence alone counts as assigned unless the value is explicitly falsy.
+        val = await self.client.get(self._assignment_key(order_id))
+        if val is None:
+            return False
+        return str(val).lower() not in ("0", "false")
+
+    async def push(self, queue: str, payload: str) -> None:
+        await self.client.rpush(queue, payload)
+
+    async def remove(self, queue: str, payload: str) -> None:
+        await self.client.lrem(queue, 0, payload)
+
+    async def pop(self, queue: str, count: int) -> list[str]:
+        return await self.client.lpop(queue, count) or []
+
+    async def add_bid(self, order_id: int, bid_id: int, bid_amount: float) -> None:
+        await self.client.hset(self._bids_key(order_id), str(bid_id), str(bid_amount))
+
+    async def replace_bids(self, order_id: int, bids: dict[int, float]) -> None:
+        key = self._bids_key(order_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            if bids:
+                pipe.hset(key, mapping={str(bid_id): str(amount) for bid_id, amount in bids.items()})
+            await pipe.execute()
+
+    async def get_bids(self, order_id: int) -> dict[int, float]:
+        raw = await self.client.hgetall(self._bids_key(order_id))
+        return {int(bid_id): float(amount) for bid_id, amount in (raw or {}).items()}
+
+    async def clear_bids(self, order_id: int) -> None:
+        await self.client.delete(self._bids_key(order_id))
+
+    async def schedule(self, order_id: int, run_at: float, payload: str) -> None:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(SCHEDULE_PAYLOAD_KEY, str(order_id), payload)
+            pipe.zadd(SCHEDULE_KEY, {str(order_id): run_at})
+            await pipe.execute()
+
+    async def unschedule(self, order_id: int) -> None:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zrem(SCHEDULE_KEY, str(order_id))
+            pipe.hdel(SCHEDULE_PAYLOAD_KEY, str(order_id))
+            await pipe.execute()
+
+    async def pop_due(self, now: float, limit: int) -> list[str]:
+        due = await self.client.zrangebyscore(SCHEDULE_KEY, "-inf", now, start=0, num=limit)
+        payloads: list[str] = []
+        for member in due:
+            # ZREM succeeds for exactly one worker, which then owns the entry.
+            if not await self.client.zrem(SCHEDULE_KEY, member):
+                continue
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.hget(SCHEDULE_PAYLOAD_KEY, member)
+                pipe.hdel(SCHEDULE_PAYLOAD_KEY, member)
+                payload, _ = await pipe.execute()
+            if payload:
+                payloads.append(payload)
+        return payloads
+
+    async def append_event(self, fields: dict[str, str]) -> None:
+        await self.client.xadd(EVENT_STREAM_KEY, fields, maxlen=self.event_maxlen, approximate=True)
+
+    async def _ensure_event_group(self) -> None:
+        if self._group_ready:
+            return
+        try:
+            await self.client.xgroup_create(EVENT_STREAM_KEY, EVENT_CONSUMER_GROUP, id="0", mkstream=True)
+        except RedisResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+        self._group_ready = True
+
+    async def read_event_batch(self, consumer: str, count: int) -> list[EventEntry]:
+        await self._ensure_event_group()
+        # Entries a crashed (or failed) flush left pending are re-claimed first.
+        claimed = await self.client.xautoclaim(
+            EVENT_STREAM_KEY,
+            EVENT_CONSUMER_GROUP,
+            consumer,
+            min_idle_time=self.claim_idle_ms,
+            start_id="0-0",
+            count=count,
+        )
+        trimmed = claimed[2] if len(claimed) > 2 else []
+        if trimmed:
+            await self.client.xack(EVENT_STREAM_KEY, EVENT_CONSUMER_GROUP, *trimmed)
+        entries = [(entry_id, fields) for entry_id, fields in claimed[1] if fields]
+        if entries:
+            return entries
+        response = await self.client.xreadgroup(
+            EVENT_CONSUMER_GROUP, consumer, {EVENT_STREAM_KEY: ">"}, count=count
+        )
+        return [entry for _, stream_entries in response or [] for entry in stream_entries]
+
+    async def ack_events(self, entry_ids: list[str]) -> None:
+        if entry_ids:
+            await self.client.xack(EVENT_STREAM_KEY, EVENT_CONSUMER_GROUP, *entry_ids)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class InMemoryStateStore(DispatchStateStore):
+    """Process-local store. Only correct with a single API worker."""
+
+    name = "memory"
+
+    def __init__(self) -> None:
+        self.states: dict[int, dict[str, str]] = {}
+        self.assigned: set[int] = set()
+        self.queues: dict[str, deque[str]] = defaultdict(deque)
+        self.bids: dict[int, dict[int, float]] = {}
+        self.scheduled: dict[int, tuple[float, str]] = {}
+        self.events: deque[EventEntry] = deque(maxlen=DISPATCH_EVENT_STREAM_MAXLEN)
+        self._event_seq = 0
+
+    async def set_state(self, order_id: int, fields: dict[str, str]) -> None:
+        self.states.setdefault(order_id, {}).update(fields)
+
+    async def get_state(self, order_id: int) -> dict[str, str]:
+        return dict(self.states.get(order_id, {}))
+
+    async def set_assigned(self, order_id: int) -> None:
+        self.assigned.add(order_id)
+
+    async def clear_assigned(self, order_id: int) -> None:
+        self.assigned.discard(order_id)
+
+    async def is_assigned(self, order_id: int) -> bool:
+        return order_id in self.assigned
+
+    async def push(self, queue: str, payload: str) -> None:
+        self.queues[queue].append(payload)
+
+    async def remove(self, queue: str, payload: str) -> None:
+        if queue in self.queues:
+            self.queues[queue] = deque(item for item in self.queues[queue] if item != payload)
+
+    async def pop(self, queue: str, count: int) -> list[str]:
+        pending = self.queues.get(queue)
+        if not pending:
+            return []
+        return [pending.popleft() for _ in range(min(count, len(pending)))]
+
+    async def add_bid(self, order_id: int, bid_id: int, bid_amount: float) -> None:
+        self.bids.setdefault(order_id, {})[bid_id] = bid_amount
+
+    async def replace_bids(self, order_id: int, bids: dict[int, float]) -> None:
+        if bids:
+            self.bids[order_id] = dict(bids)
+        else:
+            self.bids.pop(order_id, None)
+
+    async def get_bids(self, order_id: int) -> dict[int, float]:
+        return dict(self.bids.get(order_id, {}))
+
+    async def clear_bids(self, order_id: int) -> None:
+        self.bids.pop(order_id, None)
+
+    async def schedule(self, order_id: int, run_at: float, payload: str) -> None:
+        self.scheduled[order_id] = (run_at, payload)
+
+    async def unschedule(self, order_id: int) -> None:
+        self.scheduled.pop(order_id, None)
+
+    async def pop_due(self, now: float, limit: int) -> list[str]:
+        due = sorted((run_at, order_id) for order_id, (run_at, _) in self.scheduled.items() if run_at <= now)
+        return [self.scheduled.pop(order_id)[1] for _, order_id in due[:limit]]
+
+    async def append_event(self, fields: dict[str, str]) -> None:
+        self._event_seq += 1
+        self.events.append((f"{self._event_seq}-0", dict(fields)))
+
+    async def read_event_batch(self, consumer: str, count: int) -> list[EventEntry]:
+        return list(islice(self.events, count))
+
+    async def ack_events(self, entry_ids: list[str]) -> None:
+        acked = set(entry_ids)
+        self.events = deque((e for e in self.events if e[0] not in acked), maxlen=self.events.maxlen)
+
+
+class PostgresStateStore(DispatchStateStore):
+    """
+    Durable store in the application database.
+
+    Calls run the synchronous SQLAlchemy session in a worker thread so they never block
+    the event loop. Any SQLAlchemy database works; Postgres is the intended target.
+    """
+
+    name = "postgres"
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal) -> None:
+        self._session_factory = session_factory
+
+    async def _run(self, fn: Callable[[Session], T]) -> T:
+        def _call() -> T:
+            db = self._session_factory()
+            try:
+                return fn(db)
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+        return await asyncio.to_thread(_call)
+
+    @staticmethod
+    def _upsert_state(db: Session, order_id: int, apply: Callable[[DispatchStateRecord], None]) -> None:
+        for attempt in range(2):
+            row = db.get(DispatchStateRecord, order_id, with_for_update=True)
+            if row is None:
+                row = DispatchStateRecord(order_id=order_id, fields={}, assigned=False)
+                db.add(row)
+            apply(row)
+            row.updated_at = datetime.now(timezone.utc)
+            try:
+                db.commit()
+                return
+            except IntegrityError:
+                # Another writer created the row first; merge into theirs.
+                db.rollback()
+                if attempt:
+                    raise
+
+    async def set_state(self, order_id: int, fields: dict[str, str]) -> None:
+        def _apply(row: DispatchStateRecord) -> None:
+            row.fields = {**(row.fields or {}), **fields}
+
+        await self._run(lambda db: self._upsert_state(db, order_id, _apply))
+
+    async def get_state(self, order_id: int) -> dict[str, str]:
+        def _get(db: Session) -> dict[str, str]:
+            row = db.get(DispatchStateRecord, order_id)
+            return dict(row.fields or {}) if row else {}
+
+        return await self._run(_get)
+
+    async def set_assigned(self, order_id: int) -> None:
+        def _apply(row: DispatchStateRecord) -> None:
+            row.assigned = True
+
+        await self._run(lambda db: self._upsert_state(db, order_id, _apply))
+
+    async def clear_assigned(self, order_id: int) -> None:
+        def _clear(db: Session) -> None:
+            row = db.get(DispatchStateRecord, order_id)
+            if row is not None and row.assigned:
+                row.assigned = False
+                db.commit()
+
+        await self._run(_clear)
+
+    async def is_assigned(self, order_id: int) -> bool:
+        def _get(db: Session) -> bool:
+            return bool(
+                db.execute(
+                    select(DispatchStateRecord.assigned).where(DispatchStateRecord.order_id == order_id)
+                ).scalar()
+            )
+
+        return await self._run(_get)
+
+    async def push(self, queue: str, payload: str) -> None:
+        def _push(db: Session) -> None:
+            db.add(DispatchQueueMessage(queue=queue, payload=payload))
+            db.commit()
+
+        await self._run(_push)
+
+    async def remove(self, queue: str, payload: str) -> None:
+        def _remove(db: Session) -> None:
+            db.execute(
+                delete(DispatchQueueMessage).where(
+                    DispatchQueueMessage.queue == queue, DispatchQueueMessage.payload == payload
+                )
+            )
+            db.commit()
+
+        await self._run(_remove)
+
+    async def pop(self, queue: str, count: int) -> list[str]:
+        def _pop(db: Session) -> list[str]:
+            rows = db.execute(
+                select(DispatchQueueMessage.id, DispatchQueueMessage.payload)
+                .where(DispatchQueueMessage.queue == queue)
+                .order_by(DispatchQueueMessage.id)
+                .limit(count)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not rows:
+                return []
+            db.execute(delete(DispatchQueueMessage).where(DispatchQueueMessage.id.in_([row.id for row in rows])))
+            db.commit()
+            return [row.payload for row in rows]
+
+        return await self._run(_pop)
+
+    async def add_bid(self, order_id: int, bid_id: int, bid_amount: float) -> None:
+        def _add(db: Session) -> None:
+            db.merge(DispatchBidBookEntry(order_id=order_id, bid_id=bid_id, bid_amount=bid_amount))
+            db.commit()
+
+        await self._run(_add)
+
+    async def replace_bids(self, order_id: int, bids: dict[int, float]) -> None:
+        def _replace(db: Session) -> None:
+            db.execute(delete(DispatchBidBookEntry).where(DispatchBidBookEntry.order_id == order_id))
+            db.add_all(
+                DispatchBidBookEntry(order_id=order_id, bid_id=bid_id, bid_amount=amount)
+                for bid_id, amount in bids.items()
+            )
+            db.commit()
+
+        await self._run(_replace)
+
+    async def get_bids(self, order_id: int) -> dict[int, float]:
+        def _get(db: Session) -> dict[int, float]:
+            rows = db.execute(
+                select(DispatchBidBookEntry.bid_id, DispatchBidBookEntry.bid_amount).where(
+                    DispatchBidBookEntry.order_id == order_id
+                )
+            )
+            return {int(bid_id): float(amount) for bid_id, amount in rows}
+
+        return await self._run(_get)
+
+    async def bid_marker(self, order_id: int) -> tuple[int, int]:
+        def _marker(db: Session) -> tuple[int, int]:
+            count, max_id = db.execute(
+                select(func.count(), func.max(DispatchBidBookEntry.bid_id)).where(
+                    DispatchBidBookEntry.order_id == order_id
+                )
+            ).one()
+            return (int(count or 0), int(max_id or 0))
+
+        return await self._run(_marker)
+
+    async def clear_bids(self, order_id: int) -> None:
+        def _clear(db: Session) -> None:
+            db.execute(delete(DispatchBidBookEntry).where(DispatchBidBookEntry.order_id == order_id))
+            db.commit()
+
+        await self._run(_clear)
+
+    async def schedule(self, order_id: int, run_at: float, payload: str) -> None:
+        def _schedule(db: Session) -> None:
+            db.merge(DispatchScheduleEntry(order_id=order_id, run_at=run_at, payload=payload))
+            db.commit()
+
+        await self._run(_schedule)
+
+    async def unschedule(self, order_id: int) -> None:
+        def _unschedule(db: Session) -> None:
+            db.execute(delete(DispatchScheduleEntry).where(DispatchScheduleEntry.order_id == order_id))
+            db.commit()
+
+        await self._run(_unschedule)
+
+    async def pop_due(self, now: float, limit: int) -> list[str]:
+        def _pop(db: Session) -> list[str]:
+            due = db.execute(
+                select(DispatchScheduleEntry.order_id, DispatchScheduleEntry.run_at, DispatchScheduleEntry.payload)
+                .where(DispatchScheduleEntry.run_at <= now)
+                .order_by(DispatchScheduleEntry.run_at)
+                .limit(limit)
+            ).all()
+            payloads = []
+            for order_id, run_at, payload in due:
+                # Only the worker whose DELETE hits the row owns the entry.
+                claimed = db.execute(
+                    delete(DispatchScheduleEntry).where(
+                        DispatchScheduleEntry.order_id == order_id, DispatchScheduleEntry.run_at == run_at
+                    )
+                ).rowcount
+                db.commit()
+                if claimed:
+                    payloads.append(payload)
+            return payloads
+
+        return await self._run(_pop)
+
+    async def append_event(self, fields: dict[str, str]) -> None:
+        # Already durable: written straight to dispatch_events, nothing left to flush.
+        def _append(db: Session) -> None:
+            db.add(DispatchEventRecord(**event_row(fields)))
+            db.commit()
+
+        await self._run(_append)
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures. While open, calls are
+    refused for `reset_timeout_seconds`; after that one trial call is let through
+    (half-open) and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, *, failure_threshold: int = 3, reset_timeout_seconds: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("Dispatch state primary recovered; circuit closed")
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("Dispatch state primary unreachable; circuit opened")
+            self.opened_at = time.monotonic()
+
+
+_UNREACHABLE_ERRORS = (RedisConnectionError, RedisTimeoutError, ConnectionError, TimeoutError, OSError)
+
+
+class FailoverStateStore(DispatchStateStore):
+    """
+    Use `primary` (Redis) while it is reachable, and `fallback` (Postgres) while the
+    circuit is open.
+
+    Writes made during an outage only exist in the fallback, so for a while after the
+    fallback was last used (longer than any dispatch lifecycle), reads also consult it:
+    the newer of the two state hashes wins and bid books are merged.
+    """
+
+    name = "failover"
+
+    def __init__(
+        self,
+        primary: DispatchStateStore,
+        fallback: DispatchStateStore,
+        *,
+        breaker: CircuitBreaker | None = None,
+        fallback_read_window_seconds: float = 3600.0,
+    ) -> None:
+        self.primary = primary
+        self.fallback = fallback
+        self.breaker = breaker or CircuitBreaker()
+        self.fallback_read_window_seconds = fallback_read_window_seconds
+        self._fallback_last_used: float | None = None
+
+    @property
+    def fallback_used(self) -> bool:
+        return (
+            self._fallback_last_used is not None
+            and time.monotonic() - self._fallback_last_used < self.fallback_read_window_seconds
+        )
+
+    @property
+    def _reconcile_reads(self) -> bool:
+        return self.breaker.state == "closed" and self.fallback_used
+
+    async def _call(self, method: str, *args) -> T:
+        if self.breaker.allow():
+            try:
+                result = await getattr(self.primary, method)(*args)
+            except _UNREACHABLE_ERRORS as exc:
+                self.breaker.record_failure()
+                logger.warning("Dispatch state %s failed on %s (%s); using %s", method, self.primary.name, exc, self.fallback.name)
+            else:
+                self.breaker.record_success()
+                return result
+        self._fallback_last_used = time.monotonic()
+        return await getattr(self.fallback, method)(*args)
+
+    async def _also_fallback(self, method: str, *args) -> None:
+        # Keep the fallback from resurrecting stale data after the primary recovers.
+        if self.fallback_used:
+            await getattr(self.fallback, method)(*args)
+
+    async def set_state(self, order_id: int, fields: dict[str, str]) -> None:
+        await self._call("set_state", order_id, fields)
+
+    async def get_state(self, order_id: int) -> dict[str, str]:
+        state = await self._call("get_state", order_id)
+        if self._reconcile_reads:
+            other = await self.fallback.get_state(order_id)
+            if other.get("updated_at", "") > state.get("updated_at", ""):
+                return other
+        return state
+
+    async def set_assigned(self, order_id: int) -> None:
+        await self._call("set_assigned", order_id)
+
+    async def clear_assigned(self, order_id: int) -> None:
+        await self._call("clear_assigned", order_id)
+        await self._also_fallback("clear_assigned", order_id)
+
+    async def is_assigned(self, order_id: int) -> bool:
+        if await self._call("is_assigned", order_id):
+            return True
+        if self._reconcile_reads:
+            return await self.fallback.is_assigned(order_id)
+        return False
+
+    async def push(self, queue: str, payload: str) -> None:
+        await self._call("push", queue, payload)
+
+    async def remove(self, queue: str, payload: str) -> None:
+        await self._call("remove", queue, payload)
+        await self._also_fallback("remove", queue, payload)
+
+    async def pop(self, queue: str, count: int) -> list[str]:
+        messages = await self._call("pop", queue, count)
+        if self._reconcile_reads and len(messages) < count:
+            # Messages pushed during an outage only exist in the fallback.
+            messages = messages + await self.fallback.pop(queue, count - len(messages))
+        return messages
+
+    async def add_bid(self, order_id: int, bid_id: int, bid_amount: float) -> None:
+        await self._call("add_bid", order_id, bid_id, bid_amount)
+
+    async def replace_bids(self, order_id: int, bids: dict[int, float]) -> None:
+        await self._call("replace_bids", order_id, bids)
+        await self._also_fallback("clear_bids", order_id)
+
+    async def get_bids(self, order_id: int) -> dict[int, float]:
+        bids = await self._call("get_bids", order_id)
+        if self._reconcile_reads:
+            bids = {**await self.fallback.get_bids(order_id), **bids}
+        return bids
+
+    async def clear_bids(self, order_id: int) -> None:
+        await self._call("clear_bids", order_id)
+        await self._also_fallback("clear_bids", order_id)
+
+    async def schedule(self, order_id: int, run_at: float, payload: str) -> None:
+        await self._call("schedule", order_id, run_at, payload)
+
+    async def unschedule(self, order_id: int) -> None:
+        await self._call("unschedule", order_id)
+        await self._also_fallback("unschedule", order_id)
+
+    async def pop_due(self, now: float, limit: int) -> list[str]:
+        due = await self._call("pop_due", now, limit)
+        if self._reconcile_reads:
+            # Entries scheduled during an outage only exist in the fallback.
+            due = due + await self.fallback.pop_due(now, limit)
+        return due
+
+    async def append_event(self, fields: dict[str, str]) -> None:
+        await self._call("append_event", fields)
+
+    async def read_event_batch(self, consumer: str, count: int) -> list[EventEntry]:
+        return await self._call("read_event_batch", consumer, count)
+
+    async def ack_events(self, entry_ids: list[str]) -> None:
+        await self._call("ack_events", entry_ids)
+
+    async def close(self) -> None:
+        await self.primary.close()
+        await self.fallback.close()
+
+
+def build_state_store(backend: str = DISPATCH_STATE_BACKEND, failover: str = DISPATCH_STATE_FAILOVER) -> DispatchStateStore:
+    if backend == "memory":
+        return InMemoryStateStore()
+    if backend == "postgres":
+        return PostgresStateStore()
+    if backend == "redis":
+        store = RedisStateStore()
+        if failover == "postgres":
+            return FailoverStateStore(store, PostgresStateStore())
+        if failover in ("", "none"):
+            return store
+        raise ValueError(f"Unknown DISPATCH_STATE_FAILOVER {failover!r}; expected 'postgres' or 'none'")
+    raise ValueError(f"Unknown DISPATCH_STATE_BACKEND {backend!r}; expected 'redis', 'memory' or 'postgres'")
+
+
+_store: DispatchStateStore | None = None
+
+
+def get_state_store() -> DispatchStateStore:
+    """Return the process-wide dispatch state store, building it from env on first use."""
+    global _store
+    if _store is None:
+        _store = build_state_store()
+    return _store
+
+
+def set_state_store(store: DispatchStateStore | None) -> DispatchStateStore | None:
+    """Install `store` (None resets to the env default on next use). Returns the previous one."""
+    global _store
+    previous = _store
+    _store = store
+    return previous
+
+
+__all__ = [
+    "CircuitBreaker",
+    "DispatchStateStore",
+    "FailoverStateStore",
+    "InMemoryStateStore",
+    "PostgresStateStore",
+    "RedisStateStore",
+    "build_state_store",
+    "event_row",
+    "get_state_store",
+    "set_state_store",
+]
@@ -0,0 +1,301 @@
+"""
+Dispatch worker: runs dispatch for the geographic shards it holds a lease on.
+
+With DISPATCH_MODE=sharded the API no longer runs dispatch itself. POST
+/dispatch/orders/{id}/start records the order as "submitted" and pushes the start request
+onto the inbox of the restaurant's shard (see app.dispatch.sharding); the worker holding
+that shard's lease pops it and starts the dispatch locally. Each worker therefore only
+polls the orders, bid books and agent queues of its own zones.
+
+Every tick (DISPATCH_WORKER_TICK_SECONDS) a worker:
+  1. renews its leases and rebalances shards with the other live workers;
+  2. checkpoints the running dispatches of shards it sheds (status "interrupted") before
+     releasing their leases, and resumes interrupted dispatches of shards it picked up, so a
+     dispatch moves between workers with its phase deadlines intact. Every
+     DISPATCH_RESUME_SCAN_TICKS ticks it also rescans all its shards, which picks up
+     dispatches checkpointed after the shard changed hands (a lease that expired) or left
+     interrupted because admission was full;
+  3. starts the requests waiting in its shards' inboxes;
+  4. starts deferred dispatches that came due, forwarding those of other shards to their
+     inbox.
+
+Run one or more workers next to the API:
+
+    python -m app.dispatch.worker                      # fair share of all shards
+    python -m app.dispatch.worker --shards 9qce8,9qce9 # only these shards
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+from datetime import datetime
+
+from pydantic import BaseModel
+
+from app.dispatch import engine as dispatch_engine
+from app.dispatch.admission import AdmissionRejected
+from app.dispatch.event_log import (
+    DISPATCH_EVENT_FLUSH_SECONDS,
+    default_consumer_name,
+    start_event_flusher,
+    stop_event_flusher,
+)
+from app.dispatch.sharding import (
+    InMemoryShardLeases,
+    RedisShardLeases,
+    ShardCoordinator,
+    ShardLeases,
+    inbox_key,
+)
+from app.dispatch.state_store import (
+    FailoverStateStore,
+    InMemoryStateStore,
+    RedisStateStore,
+    get_state_store,
+)
+
+logger = logging.getLogger("dispatch.worker")
+
+DISPATCH_MODE = os.getenv("DISPATCH_MODE", "inline").lower()
+DISPATCH_WORKER_TICK_SECONDS = float(os.getenv("DISPATCH_WORKER_TICK_SECONDS", "2"))
+DISPATCH_INBOX_BATCH = int(os.getenv("DISPATCH_INBOX_BATCH", "50"))
+DISPATCH_RESUME_SCAN_TICKS = max(int(os.getenv("DISPATCH_RESUME_SCAN_TICKS", "5")), 1)
+
+
+def sharded_dispatch_enabled() -> bool:
+    return DISPATCH_MODE == "sharded"
+
+
+class ShardedDispatch(BaseModel):
+    """A dispatch start request travelling through a shard inbox."""
+
+    order_id: int
+    restaurant_id: int
+    delivery_address: str
+    shard: str
+    phase1_wait_seconds_min: int = 180
+    phase1_wait_seconds_max: int = 240
+    phase2_wait_seconds: int = 180
+    poll_interval_seconds: int = 5
+    ordered_at: datetime | None = None
+    order_value: float = 0.0
+
+
+_leases: ShardLeases | None = None
+
+
+def get_shard_leases() -> ShardLeases:
+    """Leases on the same Redis as the dispatch state (or in-process for the memory store)."""
+    global _leases
+    if _leases is None:
+        store = get_state_store()
+        if isinstance(store, FailoverStateStore):
+            store = store.primary
+        if isinstance(store, RedisStateStore):
+            _leases = RedisShardLeases(store.client)
+        elif isinstance(store, InMemoryStateStore):
+            _leases = InMemoryShardLeases()
+        else:
+            raise RuntimeError(
+                "Sharded dispatch needs the redis (or, in a single process, memory) state backend"
+            )
+    return _leases
+
+
+def set_shard_leases(leases: ShardLeases | None) -> ShardLeases | None:
+    global _leases
+    previous, _leases = _leases, leases
+    return previous
+
+
+async def submit_dispatch(request: ShardedDispatch) -> None:
+    """API side: hand the start request to whichever worker owns the shard."""
+    await get_shard_leases().add_shard(request.shard)
+    await dispatch_engine.set_dispatch_state(
+        request.order_id,
+        status="submitted",
+        phase="routing",
+        restaurant_id=request.restaurant_id,
+        delivery_address=request.delivery_address,
+        note=f"waiting for the dispatch worker of shard {request.shard}",
+        extra={"shard": request.shard},
+    )
+    await get_state_store().push(inbox_key(request.shard), request.model_dump_json())
+
+
+class DispatchWorker:
+    def __init__(
+        self,
+        coordinator: ShardCoordinator,
+        *,
+        tick_seconds: float = DISPATCH_WORKER_TICK_SECONDS,
+        inbox_batch: int = DISPATCH_INBOX_BATCH,
+        resume_scan_ticks: int = DISPATCH_RESUME_SCAN_TICKS,
+    ) -> None:
+        self.coordinator = coordinator
+        self.tick_seconds = tick_seconds
+        self.inbox_batch = inbox_batch
+        self.resume_scan_ticks = resume_scan_ticks
+        self._ticks = 0
+        # Shard of every dispatch this worker started, for handing shards over.
+        self._order_shards: dict[int, str] = {}
+
+    @property
+    def owned_shards(self) -> set[str]:
+        return set(self.coordinator.owned)
+
+    def _forget_finished(self) -> None:
+        for order_id in list(self._order_shards):
+            if not (
+                dispatch_engine.is_dispatch_running(order_id)
+                or dispatch_engine.is_dispatch_queued(order_id)
+            ):
+                del self._order_shards[order_id]
+
+    async def _hand_off(self, shards: set[str]) -> None:
+        order_ids = [order_id for order_id, shard in self._order_shards.items() if shard in shards]
+        if order_ids:
+            await dispatch_engine.drain_dispatch_tasks(order_ids=order_ids)
+            logger.info("Handed off %s dispatches of shards %s", len(order_ids), sorted(shards))
+        for order_id in order_ids:
+            self._order_shards.pop(order_id, None)
+
+    async def _resume(self, shards: set[str]) -> None:
+        for order_id in await dispatch_engine.resume_interrupted_dispatches(shards=shards):
+            state = await dispatch_engine.get_dispatch_state(order_id)
+            self._order_shards[order_id] = state.get("shard", "")
+
+    async def _start(self, request: ShardedDispatch) -> bool:
+        # Cancelled (or started by hand) while it sat in the inbox.
+        state = await dispatch_engine.get_dispatch_state(request.order_id)
+        if state.get("status") != "submitted":
+            return False
+        try:
+            accepted = await dispatch_engine.start_dispatch_background(
+                request.order_id,
+                request.restaurant_id,
+                request.delivery_address,
+                phase1_wait_seconds_min=request.phase1_wait_seconds_min,
+                phase1_wait_seconds_max=request.phase1_wait_seconds_max,
+                phase2_wait_seconds=request.phase2_wait_seconds,
+                poll_interval_seconds=request.poll_interval_seconds,
+                ordered_at=request.ordered_at,
+                order_value=request.order_value,
+            )
+        except AdmissionRejected:
+            # Back of the inbox; admission frees up as dispatches finish.
+            await get_state_store().push(inbox_key(request.shard), request.model_dump_json())
+            return False
+        if accepted:
+            self._order_shards[request.order_id] = request.shard
+        return accepted
+
+    async def _drain_inbox(self, shard: str) -> int:
+        started = 0
+        for payload in await get_state_store().pop(inbox_key(shard), self.inbox_batch):
+            if await self._start(ShardedDispatch.model_validate_json(payload)):
+                started += 1
+        return started
+
+    async def _start_due(self, deferred: dispatch_engine.DeferredDispatch) -> bool:
+        if deferred.shard is None or deferred.shard in self.coordinator.owned:
+            started = await dispatch_engine.start_deferred_dispatch(deferred)
+            if started and deferred.shard is not None:
+                self._order_shards[deferred.order_id] = deferred.shard
+            return started
+        await submit_dispatch(
+            ShardedDispatch(
+                order_id=deferred.order_id,
+                restaurant_id=deferred.restaurant_id,
+                delivery_address=deferred.delivery_address,
+                shard=deferred.shard,
+                phase1_wait_seconds_min=deferred.phase1_wait_seconds_min,
+                phase1_wait_seconds_max=deferred.phase1_wait_seconds_max,
+                phase2_wait_seconds=deferred.phase2_wait_seconds,
+                poll_interval_seconds=deferred.poll_interval_seconds,
+                ordered_at=deferred.ordered_at,
+                order_value=deferred.order_value,
+            )
+        )
+        return False
+
+    async def tick(self) -> int:
+        """One rebalance + inbox pass. Returns how many dispatches were started."""
+        self._forget_finished()
+        self._ticks += 1
+        rebalance = await self.coordinator.rebalance(before_release=self._hand_off)
+        if rebalance.lost:
+            # Shards whose lease expired are already someone else's; the new owner's
+            # rescan resumes what gets checkpointed here.
+            await self._hand_off(rebalance.lost)
+        if rebalance.owned and self._ticks % self.resume_scan_ticks == 0:
+            await self._resume(rebalance.owned)
+        elif rebalance.gained:
+            await self._resume(rebalance.gained)
+        started = 0
+        for shard in sorted(rebalance.owned):
+            started += await self._drain_inbox(shard)
+        started += len(await dispatch_engine.run_due_dispatches(start=self._start_due))
+        return started
+
+    async def run(self, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            try:
+                await self.tick()
+            except Exception:
+                logger.exception("Dispatch worker tick failed")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.tick_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def shutdown(self) -> None:
+        """Checkpoint every dispatch and give up the leases so other workers resume them."""
+        await dispatch_engine.drain_dispatch_tasks()
+        self._order_shards.clear()
+        await self.coordinator.release_all()
+
+
+async def run_worker(worker_id: str, shards: list[str] | None, tick_seconds: float) -> None:
+    coordinator = ShardCoordinator(get_shard_leases(), worker_id, pinned=shards)
+    worker = DispatchWorker(coordinator, tick_seconds=tick_seconds)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    if DISPATCH_EVENT_FLUSH_SECONDS > 0:
+        start_event_flusher()
+    logger.info("Dispatch worker %s started (shards: %s)", worker_id, shards or "rebalanced")
+    try:
+        await worker.run(stop)
+    finally:
+        await worker.shutdown()
+        await stop_event_flusher()
+        await get_state_store().close()
+        logger.info("Dispatch worker %s stopped", worker_id)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run dispatch for a set of geographic shards.")
+    parser.add_argument(
+        "--shards",
+        help="Comma-separated geohash shards to own; default is a fair share of all shards",
+    )
+    parser.add_argument("--worker-id", default=None, help="Defaults to <hostname>-<pid>")
+    parser.add_argument("--tick", type=float, default=DISPATCH_WORKER_TICK_SECONDS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    shards = [shard.strip() for shard in args.shards.split(",") if shard.strip()] if args.shards else None
+    asyncio.run(run_worker(args.worker_id or default_consumer_name(), shards, args.tick))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Order archival job
+
+Moves delivered/cancelled orders (with their bids and line items), settled bids and
+final payments older than --days out of Postgres into monthly gzip JSON Lines files
+under --dir (see app.services.archive). Batches of --batch-size rows are written and
+deleted one transaction at a time, so the job can be stopped and rerun. Without --apply
+it only reports how many rows would move.
+
+Usage:
+    python -m app.jobs.archive_orders [--days 180] [--batch-size 500] [--dir archive] [--apply]
+"""
+from __future__ import annotations
+
+import argparse
+
+from app.database import SessionLocal
+from app.services import archive
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Archive old orders, bids and payments to local files.")
+    parser.add_argument("--days", type=int, default=archive.ARCHIVE_AFTER_DAYS, help="Archive rows older than this")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per transaction")
+    parser.add_argument("--dir", default=archive.ARCHIVE_DIR, help="Archive root directory")
+    parser.add_argument("--apply", action="store_true", help="Move the rows")
+    args = parser.parse_args(argv)
+
+    cutoff = archive.archive_cutoff(args.days)
+    db = SessionLocal()
+    try:
+        counts = archive.count_archivable(db, cutoff)
+        print(f"Rows created before {cutoff:%Y-%m-%d %H:%M} UTC that can be archived:")
+        for table, count in counts.items():
+            print(f"  {table}: {count}")
+        if not args.apply:
+            return
+        result = archive.ArchiveResult()
+        options = dict(cutoff=cutoff, root=args.dir, batch_size=args.batch_size, result=result)
+        archive.archive_orders(db, **options)
+        archive.archive_bids(db, **options)
+        archive.archive_payments(db, **options)
+        print(
+            f"Archived {result.orders} orders, {result.bids} bids, {result.line_items} line items "
+            f"and {result.payments} payments into {len(result.files)} files under {args.dir}."
+        )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
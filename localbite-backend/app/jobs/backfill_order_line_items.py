@@ -0,0 +1,51 @@
+"""
+Order line items backfill job
+
+Orders created before order_line_items existed only have their items in the
+orders.order_items JSON, and item_count NULL. This job converts them in batches of
+--batch-size orders, committing each batch, so it can be stopped and rerun at any time;
+orders that already have an item_count are never touched. Unit prices come from the
+current menu. Without --apply it only reports how many orders are left.
+
+Usage:
+    python -m app.jobs.backfill_order_line_items [--batch-size 500] [--apply]
+"""
+from __future__ import annotations
+
+import argparse
+
+from sqlalchemy import func, select
+
+from app.crud import order_line_item as line_item_crud
+from app.database import SessionLocal
+from app.models.order import Order
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Convert orders.order_items JSON into order_line_items.")
+    parser.add_argument("--batch-size", type=int, default=500, help="Orders per transaction")
+    parser.add_argument("--apply", action="store_true", help="Write the line items")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        remaining = db.scalar(select(func.count()).select_from(Order).where(Order.item_count.is_(None)))
+        print(f"{remaining} orders without line items.")
+        if not args.apply:
+            return
+        total_orders = total_lines = 0
+        while True:
+            orders, lines = line_item_crud.backfill_batch(db, batch_size=args.batch_size)
+            if not orders:
+                break
+            db.commit()
+            total_orders += orders
+            total_lines += lines
+            print(f"  {total_orders}/{remaining} orders, {total_lines} lines")
+        print(f"Backfilled {total_orders} orders.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
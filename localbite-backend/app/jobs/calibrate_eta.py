@@ -0,0 +1,279 @@
+"""
+ETA calibration job
+
+Streams delivered orders and fits, per zone and local hour, the linear model
+
+    delivery_minutes = buffer_minutes + distance_km * (60 / speed_kmph)
+
+where delivery_minutes is `delivered_at - created_at` and distance_km is the haversine
+distance from the restaurant to the drop-off point. Zones are geohash prefixes of the
+restaurant location.
+
+Orders are read in batches and reduced into per-(zone, hour) sufficient statistics
+(n, Σx, Σy, Σx², Σxy) with np.bincount, so memory stays flat no matter how much history
+is scanned. The least-squares solution for every group is then computed in one vectorized
+pass. Groups with too few samples fall back to the zone-wide fit, then the global per-hour
+fit, then the global fit, then the service defaults.
+
+The table is written atomically (temp file + rename) so the fare service's hot loader
+never sees a partial file.
+
+Usage:
+    python -m app.jobs.calibrate_eta [--output PATH] [--since-days 90] [--min-samples 20]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.models.order import Order
+from app.models.restaurant import Restaurant
+from app.services.distance import geohash_encode
+from app.services.eta_calibration import (
+    DEFAULT_DISPATCH_BUFFER_MINUTES,
+    DEFAULT_SPEED_KMPH,
+    ETA_CALIBRATION_PATH,
+    ETA_ZONE_PRECISION,
+    EtaCalibrationTable,
+    EtaHourlyParameters,
+)
+
+logger = logging.getLogger("jobs.calibrate_eta")
+
+BATCH_SIZE = 2000
+HOURS = 24
+MAX_DELIVERY_MINUTES = 180.0
+MIN_SPEED_KMPH = 8.0
+MAX_SPEED_KMPH = 60.0
+MAX_BUFFER_MINUTES = 45.0
+EARTH_RADIUS_KM = 6371.0
+
+# Column order of the sufficient-statistics matrix.
+_N, _SX, _SY, _SXX, _SXY = range(5)
+
+
+def haversine_km_vec(lat1, lon1, lat2, lon2) -> np.ndarray:
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+class GroupAccumulator:
+    """Running per-(zone, hour) sums for a simple linear regression."""
+
+    def __init__(self) -> None:
+        self.zones: dict[str, int] = {}
+        self.stats = np.zeros((0, HOURS, 5), dtype=np.float64)
+
+    def zone_index(self, zone: str) -> int:
+        idx = self.zones.get(zone)
+        if idx is None:
+            idx = len(self.zones)
+            self.zones[zone] = idx
+            self.stats = np.concatenate([self.stats, np.zeros((1, HOURS, 5))])
+        return idx
+
+    def add(self, zone_idx: np.ndarray, hour: np.ndarray, x: np.ndarray, y: np.ndarray) -> None:
+        if x.size == 0:
+            return
+        n_groups = len(self.zones) * HOURS
+        group = zone_idx * HOURS + hour
+        flat = self.stats.reshape(n_groups, 5)
+        flat[:, _N] += np.bincount(group, minlength=n_groups)
+        flat[:, _SX] += np.bincount(group, weights=x, minlength=n_groups)
+        flat[:, _SY] += np.bincount(group, weights=y, minlength=n_groups)
+        flat[:, _SXX] += np.bincount(group, weights=x * x, minlength=n_groups)
+        flat[:, _SXY] += np.bincount(group, weights=x * y, minlength=n_groups)
+
+
+def fit_speed_and_buffer(
+    stats: np.ndarray, min_samples: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Solve the least-squares line for every group in `stats[..., 5]` at once.
+
+    Returns (speed_kmph, buffer_minutes, valid) with the leading shape of `stats`.
+    A group is valid when it has enough samples, some spread in distance, and a
+    physically plausible positive slope.
+    """
+    n = stats[..., _N]
+    sx = stats[..., _SX]
+    sy = stats[..., _SY]
+    sxx = stats[..., _SXX]
+    sxy = stats[..., _SXY]
+
+    denom = n * sxx - sx * sx
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (n * sxy - sx * sy) / denom  # minutes per km
+        intercept = (sy - slope * sx) / n
+        speed = 60.0 / slope
+
+    valid = (
+        (n >= min_samples)
+        & (denom > 1e-9 * np.maximum(n * n, 1.0))
+        & np.isfinite(slope)
+        & (slope > 0)
+    )
+    speed = np.clip(np.where(valid, speed, DEFAULT_SPEED_KMPH), MIN_SPEED_KMPH, MAX_SPEED_KMPH)
+    buffer = np.clip(
+        np.where(valid, intercept, DEFAULT_DISPATCH_BUFFER_MINUTES), 0.0, MAX_BUFFER_MINUTES
+    )
+    return speed, buffer, valid
+
+
+def build_table(
+    accumulator: GroupAccumulator, *, min_samples: int, version: str | None = None
+) -> EtaCalibrationTable:
+    stats = accumulator.stats  # (zones, 24, 5)
+    now = datetime.now(timezone.utc)
+
+    global_hourly = stats.sum(axis=0)  # (24, 5)
+    global_all = global_hourly.sum(axis=0)  # (5,)
+    g_speed, g_buffer, _ = fit_speed_and_buffer(global_all, min_samples)
+    gh_speed, gh_buffer, gh_valid = fit_speed_and_buffer(global_hourly, min_samples)
+    default_speed = np.where(gh_valid, gh_speed, g_speed)
+    default_buffer = np.where(gh_valid, gh_buffer, g_buffer)
+
+    zones: dict[str, EtaHourlyParameters] = {}
+    if stats.shape[0]:
+        z_speed, z_buffer, z_valid = fit_speed_and_buffer(stats, min_samples)
+        za_speed, za_buffer, za_valid = fit_speed_and_buffer(stats.sum(axis=1), min_samples)
+        for zone, idx in accumulator.zones.items():
+            if not z_valid[idx].any() and not za_valid[idx]:
+                continue  # nothing zone-specific to say; the default row covers it
+            fallback_speed = za_speed[idx] if za_valid[idx] else default_speed
+            fallback_buffer = za_buffer[idx] if za_valid[idx] else default_buffer
+            zones[zone] = EtaHourlyParameters(
+                speed_kmph=np.round(np.where(z_valid[idx], z_speed[idx], fallback_speed), 2).tolist(),
+                buffer_minutes=np.round(np.where(z_valid[idx], z_buffer[idx], fallback_buffer), 2).tolist(),
+                samples=stats[idx, :, _N].astype(int).tolist(),
+            )
+
+    return EtaCalibrationTable(
+        version=version or now.strftime("%Y%m%d%H%M%S"),
+        generated_at=now,
+        zone_precision=ETA_ZONE_PRECISION,
+        default=EtaHourlyParameters(
+            speed_kmph=np.round(default_speed, 2).tolist(),
+            buffer_minutes=np.round(default_buffer, 2).tolist(),
+            samples=global_hourly[:, _N].astype(int).tolist(),
+        ),
+        zones=zones,
+    )
+
+
+def _local_hour(dt: datetime) -> int:
+    # Quotes use the server's local clock (see get_fare_recommendation), so bucket the
+    # history the same way.
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone().hour
+
+
+def accumulate_delivered_orders(db, *, since: datetime | None = None) -> GroupAccumulator:
+    accumulator = GroupAccumulator()
+    zone_cache: dict[tuple[float, float], int] = {}
+
+    stmt = (
+        select(
+            Order.created_at,
+            Order.delivered_at,
+            Order.delivery_lat,
+            Order.delivery_lng,
+            Restaurant.latitude,
+            Restaurant.longitude,
+        )
+        .join(Restaurant, Restaurant.id == Order.restaurant_id)
+        .where(Order.order_status == "delivered")
+        .where(Order.delivered_at.is_not(None))
+        .where(Order.delivery_lat.is_not(None), Order.delivery_lng.is_not(None))
+        .where(Restaurant.latitude.is_not(None), Restaurant.longitude.is_not(None))
+        .execution_options(yield_per=BATCH_SIZE)
+    )
+    if since is not None:
+        stmt = stmt.where(Order.created_at >= since)
+
+    total = 0
+    for rows in db.execute(stmt).partitions():
+        size = len(rows)
+        zone_idx = np.empty(size, dtype=np.int64)
+        hour = np.empty(size, dtype=np.int64)
+        minutes = np.empty(size, dtype=np.float64)
+        coords = np.empty((size, 4), dtype=np.float64)
+
+        for i, (created_at, delivered_at, d_lat, d_lng, r_lat, r_lng) in enumerate(rows):
+            key = (r_lat, r_lng)
+            idx = zone_cache.get(key)
+            if idx is None:
+                idx = accumulator.zone_index(geohash_encode(r_lat, r_lng, ETA_ZONE_PRECISION))
+                zone_cache[key] = idx
+            zone_idx[i] = idx
+            hour[i] = _local_hour(created_at)
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            if delivered_at.tzinfo is None:
+                delivered_at = delivered_at.replace(tzinfo=timezone.utc)
+            minutes[i] = (delivered_at - created_at).total_seconds() / 60.0
+            coords[i] = (r_lat, r_lng, d_lat, d_lng)
+
+        distance = haversine_km_vec(coords[:, 0], coords[:, 1], coords[:, 2], coords[:, 3])
+        keep = (minutes > 0) & (minutes <= MAX_DELIVERY_MINUTES) & (distance > 0.05)
+        accumulator.add(zone_idx[keep], hour[keep], distance[keep], minutes[keep])
+        total += int(keep.sum())
+
+    logger.info("Accumulated %s delivered orders across %s zones", total, len(accumulator.zones))
+    return accumulator
+
+
+def write_table(table: EtaCalibrationTable, output: str | Path) -> Path:
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".eta_calibration.", dir=output.parent)
+    try:
+        with os.fdopen(fd, "w") as fh:
+            fh.write(table.model_dump_json())
+        os.replace(tmp_path, output)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    return output
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Fit ETA parameters from delivery history.")
+    parser.add_argument("--output", default=ETA_CALIBRATION_PATH)
+    parser.add_argument("--since-days", type=int, default=90)
+    parser.add_argument("--min-samples", type=int, default=20)
+    parser.add_argument("--version", default=None, help="Override the generated version tag.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    since = datetime.now(timezone.utc) - timedelta(days=args.since_days) if args.since_days else None
+
+    db = SessionLocal()
+    try:
+        accumulator = accumulate_delivered_orders(db, since=since)
+    finally:
+        db.close()
+
+    table = build_table(accumulator, min_samples=args.min_samples, version=args.version)
+    path = write_table(table, args.output)
+    print(
+        f"✅ Wrote ETA calibration {table.version} to {path} "
+        f"({len(table.zones)} zones, {sum(table.default.samples)} samples)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Agent earnings reconciliation job
+
+delivery_agents.total_earnings / total_deliveries are running aggregates of the
+agent_ledger table. This job recomputes them from the ledger and reports any agent whose
+aggregates drifted (e.g. a manual SQL edit). --backfill first books ledger entries for
+orders paid out before the ledger existed; --apply overwrites drifted aggregates with the
+ledger values. Without --apply nothing is written.
+
+Usage:
+    python -m app.jobs.reconcile_agent_earnings [--backfill] [--apply]
+"""
+from __future__ import annotations
+
+import argparse
+
+from app.crud import agent_ledger as agent_ledger_crud
+from app.database import SessionLocal
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Reconcile agent earnings totals with the ledger.")
+    parser.add_argument("--backfill", action="store_true", help="Book paid orders missing from the ledger")
+    parser.add_argument("--apply", action="store_true", help="Write the backfill and corrected totals")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if args.backfill:
+            backfilled = agent_ledger_crud.backfill_paid_orders(db)
+            print(f"Backfilled {backfilled} payout entries.")
+        drifted = agent_ledger_crud.reconcile_totals(db, apply=args.apply)
+        for agent_id, stored_earnings, earnings, stored_deliveries, deliveries in drifted:
+            print(
+                f"  {agent_id}: earnings {stored_earnings:.2f} -> {earnings:.2f}, "
+                f"deliveries {stored_deliveries} -> {deliveries}"
+            )
+        print(f"{len(drifted)} agents drifted from the ledger.")
+        if args.apply:
+            db.commit()
+            print("Applied.")
+        else:
+            db.rollback()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Dispatch event replay job
+
+Reads the dispatch_events audit log and folds it back into per-order dispatch state
+(state hash, assignment flag and bid book). Useful to answer "what happened to order N"
+and to repopulate the state store after Redis loses its data.
+
+With --flush the stream tail that has not reached the table yet is flushed first, so the
+replay also covers the last few seconds of events. --apply writes the rebuilt state into
+the configured state store; without it the job only reports.
+
+Usage:
+    python -m app.jobs.replay_dispatch_events --order-id 42
+    python -m app.jobs.replay_dispatch_events [--since ISO] [--until ISO] [--flush] [--apply]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+from collections import Counter
+from datetime import datetime
+
+from app.database import SessionLocal
+from app.dispatch.event_log import (
+    default_consumer_name,
+    drain_events,
+    load_events,
+    rebuild_states,
+    restore_states,
+)
+from app.dispatch.state_store import get_state_store
+
+logger = logging.getLogger("jobs.replay_dispatch_events")
+
+
+def _parse_time(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f"not an ISO timestamp: {value!r}") from exc
+
+
+def print_timeline(order_id: int, events) -> None:
+    if not events:
+        print(f"No events recorded for order {order_id}.")
+        return
+    print(f"Order {order_id}: {len(events)} events")
+    for event in events:
+        print(f"  {event.occurred_at.isoformat()}  {event.kind:<8} {json.dumps(event.payload, sort_keys=True)}")
+    rebuilt = rebuild_states(events)[order_id]
+    print(f"  -> status={rebuilt.state.get('status')} phase={rebuilt.state.get('phase')} "
+          f"assigned={rebuilt.assigned} open_bids={len(rebuilt.bids)}")
+
+
+async def _run(args: argparse.Namespace) -> None:
+    store = get_state_store()
+    try:
+        if args.flush:
+            flushed = await drain_events(store, consumer=default_consumer_name())
+            logger.info("Flushed %s pending stream entries", flushed)
+
+        db = SessionLocal()
+        try:
+            events = load_events(db, order_id=args.order_id, since=args.since, until=args.until)
+        finally:
+            db.close()
+
+        if args.order_id is not None:
+            print_timeline(args.order_id, events)
+        states = rebuild_states(events)
+        if args.order_id is None:
+            by_status = Counter(state.state.get("status", "unknown") for state in states.values())
+            print(f"Replayed {len(events)} events for {len(states)} orders")
+            for status, count in by_status.most_common():
+                print(f"  {status:<20} {count}")
+        if args.apply:
+            restored = await restore_states(store, states.values())
+            print(f"Restored dispatch state for {restored} orders into the {store.name} store")
+    finally:
+        await store.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Rebuild dispatch state from the dispatch event log.")
+    parser.add_argument("--order-id", type=int, default=None, help="Print the audit timeline of one order.")
+    parser.add_argument("--since", type=_parse_time, default=None)
+    parser.add_argument("--until", type=_parse_time, default=None, help="Rebuild state as of this time.")
+    parser.add_argument("--flush", action="store_true", help="Flush the unflushed stream tail first.")
+    parser.add_argument("--apply", action="store_true", help="Write rebuilt state into the state store.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
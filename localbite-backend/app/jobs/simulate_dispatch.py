@@ -0,0 +1,470 @@
+"""
+Dispatch policy simulator
+
+Replays historical orders and their delivery bids through the real dispatch state machine
+(app.dispatch.engine.dispatch_order) under alternative timing parameters, and reports how
+each policy would have performed:
+
+    time-to-assign p50 / p90 / p99, share of orders awarded in the student pool,
+    average delivery fee, and orders that ended in `needs_fee_increase`.
+
+Every configuration runs in its own worker process against a private in-memory SQLite
+database and an in-memory dispatch state store, on a VirtualClock, so a day of orders replays in seconds and runs
+are deterministic for a given --seed.
+
+Bid timing is taken from the historical rows relative to each order's created_at:
+  - student agents bid at their historical offset, whichever phase that lands in;
+  - third-party agents can only bid once the order escalates, so their offset is measured
+    from the historical escalation point (--historical-phase1-seconds after creation,
+    the midpoint of the default 180-240s window) and replayed from the simulated one.
+Bids that arrive after the simulated order is already assigned or closed are dropped.
+
+Usage:
+    python -m app.jobs.simulate_dispatch --since-days 30 \\
+        --config baseline \\
+        --config "short:p1min=120,p1max=150,p2=150,close=45" \\
+        [--workers 4] [--seed 7] [--json results.json]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from itertools import repeat
+
+import numpy as np
+from pydantic import BaseModel
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base, SessionLocal
+from app.dispatch import engine as dispatch_engine
+from app.dispatch.clock import VirtualClock
+from app.dispatch.state_store import InMemoryStateStore
+from app.models.delivery_agent import AgentType, DeliveryAgent
+from app.models.delivery_bid import DeliveryBid
+from app.models.order import Order
+from app.services.base_fare import get_bid_window
+
+logger = logging.getLogger("jobs.simulate_dispatch")
+
+HISTORICAL_PHASE1_SECONDS = 210
+_CLOSED_STATUSES = {"assigned", "needs_fee_increase", "failed"}
+_CONFIG_KEYS = {
+    "p1min": "phase1_wait_seconds_min",
+    "p1max": "phase1_wait_seconds_max",
+    "p2": "phase2_wait_seconds",
+    "close": "rolling_bid_close_seconds",
+    "poll": "poll_interval_seconds",
+}
+
+
+class SimulationConfig(BaseModel):
+    name: str = "baseline"
+    phase1_wait_seconds_min: int = 180
+    phase1_wait_seconds_max: int = 240
+    phase2_wait_seconds: int = 180
+    rolling_bid_close_seconds: int = dispatch_engine.ROLLING_BID_CLOSE_SECONDS
+    poll_interval_seconds: int = 5
+
+
+class HistoricalBid(BaseModel):
+    agent_id: str
+    bid_amount: float
+    offset_seconds: float
+    # Third-party bids are timed from escalation rather than from order creation.
+    after_escalation: bool = False
+
+
+class HistoricalOrder(BaseModel):
+    order_id: int
+    restaurant_id: int
+    base_fare: float
+    created_at: datetime
+    bids: list[HistoricalBid] = []
+
+
+class OrderOutcome(BaseModel):
+    order_id: int
+    status: str
+    seconds_to_assign: float | None = None
+    delivery_fee: float | None = None
+    awarded_phase: str | None = None
+
+
+class SimulationResult(BaseModel):
+    config: SimulationConfig
+    orders: int
+    assigned: int
+    needs_fee_increase: int
+    student_pool_awards: int
+    student_pool_share: float
+    time_to_assign_p50: float | None
+    time_to_assign_p90: float | None
+    time_to_assign_p99: float | None
+    avg_delivery_fee: float | None
+    wall_seconds: float
+
+
+def parse_config(spec: str) -> SimulationConfig:
+    """Parse `name[:key=value,...]` with keys p1min, p1max, p2, close, poll."""
+    name, _, params = spec.partition(":")
+    values: dict[str, int | str] = {"name": name.strip() or "baseline"}
+    for item in filter(None, (part.strip() for part in params.split(","))):
+        key, sep, raw = item.partition("=")
+        if not sep or key.strip() not in _CONFIG_KEYS:
+            raise ValueError(f"Unknown config parameter {item!r}; expected one of {sorted(_CONFIG_KEYS)}")
+        values[_CONFIG_KEYS[key.strip()]] = int(raw)
+    config = SimulationConfig(**values)
+    if config.phase1_wait_seconds_max < config.phase1_wait_seconds_min:
+        raise ValueError(f"{config.name}: p1max must be >= p1min")
+    return config
+
+
+def _to_utc(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+def load_history(
+    db: Session,
+    *,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    limit: int | None = None,
+    historical_phase1_seconds: float = HISTORICAL_PHASE1_SECONDS,
+) -> list[HistoricalOrder]:
+    order_query = (
+        select(Order.order_id, Order.restaurant_id, Order.base_fare, Order.created_at)
+        .where(Order.created_at.is_not(None), Order.order_status != "cancelled")
+        .order_by(Order.created_at, Order.order_id)
+    )
+    if since is not None:
+        order_query = order_query.where(Order.created_at >= since)
+    if until is not None:
+        order_query = order_query.where(Order.created_at < until)
+    if limit:
+        order_query = order_query.limit(limit)
+
+    orders = {
+        row.order_id: HistoricalOrder(
+            order_id=row.order_id,
+            restaurant_id=row.restaurant_id,
+            base_fare=row.base_fare,
+            created_at=_to_utc(row.created_at),
+        )
+        for row in db.execute(order_query)
+    }
+    if not orders:
+        return []
+
+    selected = order_query.with_only_columns(Order.order_id).subquery()
+    bid_query = (
+        select(
+            DeliveryBid.order_id,
+            DeliveryBid.agent_id,
+            DeliveryBid.bid_amount,
+            DeliveryBid.created_at,
+            DeliveryAgent.agent_type,
+        )
+        .join(selected, selected.c.order_id == DeliveryBid.order_id)
+        .join(DeliveryAgent, DeliveryAgent.agent_id == DeliveryBid.agent_id)
+        .where(DeliveryBid.created_at.is_not(None))
+        .order_by(DeliveryBid.created_at, DeliveryBid.bid_id)
+    )
+    for row in db.execute(bid_query):
+        order = orders[row.order_id]
+        offset = max((_to_utc(row.created_at) - order.created_at).total_seconds(), 0.0)
+        student = row.agent_type == AgentType.STUDENT
+        order.bids.append(
+            HistoricalBid(
+                agent_id=row.agent_id,
+                bid_amount=row.bid_amount,
+                offset_seconds=offset if student else max(offset - historical_phase1_seconds, 0.0),
+                after_escalation=not student,
+            )
+        )
+    return list(orders.values())
+
+
+def _seed_orders(session_factory: sessionmaker, history: list[HistoricalOrder]) -> None:
+    db = session_factory()
+    try:
+        for order in history:
+            db.add(
+                Order(
+                    order_id=order.order_id,
+                    user_id=0,
+                    restaurant_id=order.restaurant_id,
+                    order_items=[],
+                    base_fare=order.base_fare,
+                    delivery_fee=order.base_fare,
+                    commission_amount=0.0,
+                    order_status="pending",
+                    created_at=order.created_at,
+                )
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _replay_bid(
+    clock: VirtualClock,
+    session_factory: sessionmaker,
+    order: HistoricalOrder,
+    bid: HistoricalBid,
+    poll_interval_seconds: float,
+) -> None:
+    if bid.after_escalation:
+        # Escalation only happens on the engine's poll grid, which this loop shares.
+        while True:
+            state = await dispatch_engine.get_dispatch_state(order.order_id)
+            if state.get("phase") == "all_agents":
+                break
+            if state.get("phase") == "completed" or state.get("status") in _CLOSED_STATUSES:
+                return
+            await clock.sleep(poll_interval_seconds)
+
+    await clock.sleep(bid.offset_seconds)
+    state = await dispatch_engine.get_dispatch_state(order.order_id)
+    if state.get("phase") == "completed" or state.get("status") in _CLOSED_STATUSES:
+        return
+    phase = state.get("phase") or "student_pool"
+
+    db = session_factory()
+    try:
+        row = db.get(Order, order.order_id)
+        if row is None or row.assigned_partner_id:
+            return
+        min_allowed_fare, max_allowed_fare = get_bid_window(order.base_fare)
+        placed = DeliveryBid(
+            order_id=order.order_id,
+            agent_id=bid.agent_id,
+            bid_amount=round(bid.bid_amount, 2),
+            min_allowed_fare=min_allowed_fare,
+            max_allowed_fare=max_allowed_fare,
+            pool_phase=phase,
+            bid_status="placed",
+            created_at=clock.now(),
+        )
+        db.add(placed)
+        db.commit()
+        await dispatch_engine.record_bid(order.order_id, placed.bid_id, placed.bid_amount)
+    finally:
+        db.close()
+
+
+async def _replay_order(
+    clock: VirtualClock,
+    session_factory: sessionmaker,
+    config: SimulationConfig,
+    order: HistoricalOrder,
+) -> OrderOutcome:
+    started = clock.monotonic()
+    await dispatch_engine.dispatch_order(
+        order.order_id,
+        order.restaurant_id,
+        "simulated",
+        phase1_wait_seconds_min=config.phase1_wait_seconds_min,
+        phase1_wait_seconds_max=config.phase1_wait_seconds_max,
+        phase2_wait_seconds=config.phase2_wait_seconds,
+        poll_interval_seconds=config.poll_interval_seconds,
+        rolling_bid_close_seconds=config.rolling_bid_close_seconds,
+    )
+    state = await dispatch_engine.get_dispatch_state(order.order_id)
+    outcome = OrderOutcome(order_id=order.order_id, status=state.get("status", "unknown"))
+    if outcome.status != "assigned":
+        return outcome
+
+    db = session_factory()
+    try:
+        row = db.get(Order, order.order_id)
+        accepted = (
+            db.query(DeliveryBid)
+            .filter(DeliveryBid.order_id == order.order_id, DeliveryBid.bid_status == "accepted")
+            .first()
+        )
+        outcome.seconds_to_assign = clock.monotonic() - started
+        outcome.delivery_fee = row.delivery_fee if row else None
+        outcome.awarded_phase = accepted.pool_phase if accepted else None
+    finally:
+        db.close()
+    return outcome
+
+
+async def _launch(
+    clock: VirtualClock,
+    session_factory: sessionmaker,
+    config: SimulationConfig,
+    history: list[HistoricalOrder],
+) -> tuple[list[asyncio.Task], list[asyncio.Task]]:
+    """Start every order's dispatch (and its bidders) at its historical arrival time."""
+    epoch = history[0].created_at
+    order_tasks: list[asyncio.Task] = []
+    bid_tasks: list[asyncio.Task] = []
+    for order in history:
+        delay = (order.created_at - epoch).total_seconds() - clock.monotonic()
+        if delay > 0:
+            await clock.sleep(delay)
+        task = asyncio.create_task(_replay_order(clock, session_factory, config, order))
+        clock.track(task)
+        order_tasks.append(task)
+        for bid in order.bids:
+            bid_task = asyncio.create_task(
+                _replay_bid(clock, session_factory, order, bid, config.poll_interval_seconds)
+            )
+            clock.track(bid_task)
+            bid_tasks.append(bid_task)
+    return order_tasks, bid_tasks
+
+
+async def _simulate(config: SimulationConfig, history: list[HistoricalOrder], seed: int) -> list[OrderOutcome]:
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    _seed_orders(session_factory, history)
+
+    clock = VirtualClock(start=history[0].created_at)
+    try:
+        with dispatch_engine.dispatch_runtime(
+            clock=clock,
+            rng=random.Random(seed),
+            session_factory=session_factory,
+            state_store=InMemoryStateStore(),
+        ):
+            order_tasks, bid_tasks = await clock.run_until_complete(
+                _launch(clock, session_factory, config, history)
+            )
+            outcomes = await clock.run_until_complete(asyncio.gather(*order_tasks))
+            await clock.run_until_complete(asyncio.gather(*bid_tasks))
+            return list(outcomes)
+    finally:
+        engine.dispose()
+
+
+def summarize(config: SimulationConfig, outcomes: list[OrderOutcome], *, wall_seconds: float) -> SimulationResult:
+    assigned = [o for o in outcomes if o.status == "assigned"]
+    times = np.array([o.seconds_to_assign for o in assigned if o.seconds_to_assign is not None])
+    fees = [o.delivery_fee for o in assigned if o.delivery_fee is not None]
+    student_awards = sum(1 for o in assigned if o.awarded_phase == "student_pool")
+    p50, p90, p99 = np.percentile(times, [50, 90, 99]).tolist() if times.size else (None, None, None)
+    return SimulationResult(
+        config=config,
+        orders=len(outcomes),
+        assigned=len(assigned),
+        needs_fee_increase=sum(1 for o in outcomes if o.status == "needs_fee_increase"),
+        student_pool_awards=student_awards,
+        student_pool_share=student_awards / len(assigned) if assigned else 0.0,
+        time_to_assign_p50=p50,
+        time_to_assign_p90=p90,
+        time_to_assign_p99=p99,
+        avg_delivery_fee=round(sum(fees) / len(fees), 2) if fees else None,
+        wall_seconds=round(wall_seconds, 3),
+    )
+
+
+def run_configuration(config: SimulationConfig, history: list[HistoricalOrder], seed: int = 7) -> SimulationResult:
+    """Simulate one configuration end to end. Safe to call in a worker process."""
+    logging.getLogger("dispatch.engine").setLevel(logging.WARNING)
+    started = time.perf_counter()
+    outcomes = asyncio.run(_simulate(config, history, seed)) if history else []
+    return summarize(config, outcomes, wall_seconds=time.perf_counter() - started)
+
+
+def run_configurations(
+    configs: list[SimulationConfig],
+    history: list[HistoricalOrder],
+    *,
+    seed: int = 7,
+    workers: int | None = None,
+) -> list[SimulationResult]:
+    workers = workers or min(len(configs), os.cpu_count() or 1)
+    if workers <= 1 or len(configs) <= 1:
+        return [run_configuration(config, history, seed) for config in configs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_configuration, configs, repeat(history), repeat(seed)))
+
+
+def _fmt_seconds(value: float | None) -> str:
+    return "-" if value is None else f"{value:.0f}s"
+
+
+def print_report(results: list[SimulationResult]) -> None:
+    header = f"{'config':<16}{'orders':>7}{'assigned':>9}{'p50':>7}{'p90':>7}{'p99':>7}{'student%':>10}{'avg fee':>9}{'fee+':>6}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        avg_fee = "-" if r.avg_delivery_fee is None else f"${r.avg_delivery_fee:.2f}"
+        print(
+            f"{r.config.name:<16}{r.orders:>7}{r.assigned:>9}"
+            f"{_fmt_seconds(r.time_to_assign_p50):>7}{_fmt_seconds(r.time_to_assign_p90):>7}"
+            f"{_fmt_seconds(r.time_to_assign_p99):>7}{r.student_pool_share * 100:>9.1f}%"
+            f"{avg_fee:>9}{r.needs_fee_increase:>6}"
+        )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay historical orders under alternative dispatch policies.")
+    parser.add_argument(
+        "--config",
+        action="append",
+        default=None,
+        help="name[:p1min=..,p1max=..,p2=..,close=..,poll=..]; repeat for several configurations.",
+    )
+    parser.add_argument("--since-days", type=int, default=30)
+    parser.add_argument("--limit", type=int, default=None, help="Replay at most this many orders.")
+    parser.add_argument("--historical-phase1-seconds", type=float, default=HISTORICAL_PHASE1_SECONDS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write results as JSON.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        configs = [parse_config(spec) for spec in (args.config or ["baseline"])]
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    since = datetime.now(timezone.utc) - timedelta(days=args.since_days) if args.since_days else None
+    db = SessionLocal()
+    try:
+        history = load_history(
+            db,
+            since=since,
+            limit=args.limit,
+            historical_phase1_seconds=args.historical_phase1_seconds,
+        )
+    finally:
+        db.close()
+
+    if not history:
+        print("No orders found in the selected window; nothing to simulate.")
+        return
+    logger.info(
+        "Replaying %s orders / %s bids under %s configuration(s)",
+        len(history),
+        sum(len(order.bids) for order in history),
+        len(configs),
+    )
+
+    results = run_configurations(configs, history, seed=args.seed, workers=args.workers)
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as fh:
+            json.dump([r.model_dump() for r in results], fh, indent=2)
+        print(f"✅ Wrote results to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,4 +5,16 @@ from .users import User
 from .payments import Payment
 from .menu import MenuItem
 from .order import Order
+from .order_line_item import OrderLineItem
 from .delivery_bid import DeliveryBid
+from .restaurant_prep_stats import RestaurantPrepStats
+from .dispatch_bundle import DispatchBundle
+from .agent_ledger import AgentLedgerEntry
+from .agent_daily_stats import AgentDailyStats
+from .dispatch_state import (
+    DispatchBidBookEntry,
+    DispatchEventRecord,
+    DispatchQueueMessage,
+    DispatchScheduleEntry,
+    DispatchStateRecord,
+)
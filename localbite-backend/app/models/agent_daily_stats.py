@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Date, DateTime, Float, ForeignKey, Integer, String
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class AgentDailyStats(Base):
+    """
+    Per-agent, per-day (UTC) performance counters, bumped in place as bids are placed,
+    auctions are decided and deliveries are fulfilled (see app.crud.agent_stats). Stats
+    over a window are sums of these rows, so reading them costs O(days), not O(bids).
+    """
+
+    __tablename__ = "agent_daily_stats"
+
+    agent_id = Column(String, ForeignKey("delivery_agents.agent_id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+
+    bids_placed = Column(Integer, nullable=False, default=0)
+    bid_amount_sum = Column(Float, nullable=False, default=0.0)
+    # Base fare the bids were placed against, for the average bid / base fare ratio.
+    base_fare_sum = Column(Float, nullable=False, default=0.0)
+    bids_won = Column(Integer, nullable=False, default=0)
+    # Bids rejected because another agent's bid was awarded.
+    bids_lost = Column(Integer, nullable=False, default=0)
+
+    deliveries = Column(Integer, nullable=False, default=0)
+    on_time_deliveries = Column(Integer, nullable=False, default=0)
+    earnings = Column(Float, nullable=False, default=0.0)
+    # Time spent on assigned orders; overlapping multi-order trips are counted once.
+    active_seconds = Column(Float, nullable=False, default=0.0)
+    last_delivered_at = Column(DateTime(timezone=True), nullable=True)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
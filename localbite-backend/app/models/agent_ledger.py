@@ -0,0 +1,29 @@
+from sqlalchemy import BigInteger, Column, DateTime, Float, Index, Integer, String, UniqueConstraint
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class AgentLedgerEntry(Base):
+    """
+    Immutable agent earnings entry. Rows are only ever inserted; corrections are new
+    "adjustment" entries. delivery_agents.total_earnings / total_deliveries are running
+    aggregates of this table (see app.crud.agent_ledger).
+    """
+
+    __tablename__ = "agent_ledger"
+    __table_args__ = (
+        # One payout per delivered order, however often fulfillment is retried.
+        UniqueConstraint("order_id", "entry_type", name="uq_agent_ledger_order_entry"),
+        Index("ix_agent_ledger_agent_created", "agent_id", "created_at"),
+    )
+
+    entry_id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    agent_id = Column(String, nullable=False)
+    order_id = Column(Integer, nullable=True)
+    # "delivery_payout" or "adjustment"
+    entry_type = Column(String, nullable=False)
+    amount = Column(Float, nullable=False)
+    # Deliveries this entry adds to total_deliveries (1 for a payout, usually 0 otherwise).
+    deliveries = Column(Integer, nullable=False, default=0)
+    note = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
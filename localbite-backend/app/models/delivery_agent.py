@@ -60,6 +60,8 @@ class DeliveryAgent(Base):
 
     current_lat = Column(Float, nullable=True)
     current_lng = Column(Float, nullable=True)
+    # Time of the GPS ping current_lat/current_lng came from (see app.dispatch.agent_locations).
+    location_updated_at = Column(DateTime(timezone=True), nullable=True)
 
     base_payout_per_delivery = Column(Float, nullable=False)
     bonus_multiplier = Column(Float, default=1.0)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime, Index
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -23,3 +23,15 @@ class DeliveryBid(Base):
     updated_at = Column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
+
+
+# Keyset pagination of an agent's bid history (newest first) reads this index in order.
+Index(
+    "ix_delivery_bids_agent_created",
+    DeliveryBid.agent_id,
+    DeliveryBid.created_at.desc(),
+    DeliveryBid.bid_id.desc(),
+)
+
+# The archive job selects settled bids by age.
+Index("ix_delivery_bids_created_at", DeliveryBid.created_at)
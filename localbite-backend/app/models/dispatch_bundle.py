@@ -0,0 +1,26 @@
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, JSON, String
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class DispatchBundle(Base):
+    """
+    Several orders from one restaurant offered to agents as a single job.
+
+    The bundle is auctioned through its lead order's dispatch; the winning bid assigns
+    every member order in one transaction.
+    """
+
+    __tablename__ = "dispatch_bundles"
+
+    bundle_id = Column(Integer, primary_key=True, index=True)
+    restaurant_id = Column(Integer, ForeignKey("restaurants.id"), nullable=False, index=True)
+    # The member order whose dispatch runs the auction.
+    lead_order_id = Column(Integer, nullable=False)
+    # Member order ids in drop-off order.
+    order_ids = Column(JSON, nullable=False)
+    route_distance_km = Column(Float, nullable=False)
+    base_fare = Column(Float, nullable=False)
+    status = Column(String, nullable=False, default="open")
+    assigned_partner_id = Column(String, ForeignKey("delivery_agents.agent_id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,58 @@
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Float, Integer, JSON, String
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class DispatchStateRecord(Base):
+    """Durable copy of a dispatch state hash and its assignment flag (Postgres state store)."""
+
+    __tablename__ = "dispatch_state"
+
+    order_id = Column(Integer, primary_key=True)
+    fields = Column(JSON, nullable=False, default=dict)
+    assigned = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+class DispatchQueueMessage(Base):
+    __tablename__ = "dispatch_queue"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    queue = Column(String, nullable=False, index=True)
+    payload = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class DispatchBidBookEntry(Base):
+    __tablename__ = "dispatch_bid_book"
+
+    order_id = Column(Integer, primary_key=True)
+    bid_id = Column(Integer, primary_key=True)
+    bid_amount = Column(Float, nullable=False)
+
+
+class DispatchEventRecord(Base):
+    """Append-only dispatch audit log (state transitions, bids, awards)."""
+
+    __tablename__ = "dispatch_events"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    # Redis Stream entry id; NULL for events written straight to the database.
+    stream_id = Column(String, nullable=True, unique=True)
+    order_id = Column(Integer, nullable=False, index=True)
+    kind = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False, default=dict)
+    occurred_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class DispatchScheduleEntry(Base):
+    """Deferred dispatch waiting for its start time (Postgres state store)."""
+
+    __tablename__ = "dispatch_schedule"
+
+    order_id = Column(Integer, primary_key=True)
+    # Epoch seconds on the dispatch engine clock.
+    run_at = Column(Float, nullable=False, index=True)
+    payload = Column(String, nullable=False)
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, Float, String, JSON, ForeignKey, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, Float, String, JSON, ForeignKey, DateTime, Index
+from sqlalchemy.orm import deferred, relationship, validates
 from sqlalchemy.sql import func
 from app.database import Base
+from app.services.order_status import check_transition
 
 class Order(Base):
     __tablename__ = "orders"
@@ -10,18 +11,46 @@ class Order(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     restaurant_id = Column(Integer, ForeignKey("restaurants.id"), nullable=False)
     assigned_partner_id = Column(String, ForeignKey("delivery_agents.agent_id"), nullable=True)
-    order_items = Column(JSON, nullable=False)  # Store items as JSON
+    # Store items as JSON. Deferred: list views use item_count, and order_line_items holds
+    # the queryable copy, so the blob is only loaded where it is returned.
+    order_items = deferred(Column(JSON, nullable=False))
+    # len(order_items), set whenever order_items is; null for orders from before the column.
+    item_count = Column(Integer, nullable=True)
     base_fare = Column(Float, nullable=False)
     delivery_fee = Column(Float, nullable=False)
     commission_amount = Column(Float, nullable=False)
     order_status = Column(String, default="pending")
+    bundle_id = Column(Integer, ForeignKey("dispatch_bundles.bundle_id"), nullable=True, index=True)
+    delivery_lat = Column(Float, nullable=True)
+    delivery_lng = Column(Float, nullable=True)
     delivery_proof_ref = Column(String, nullable=True)
     delivery_proof_filename = Column(String, nullable=True)
+    delivery_proof_thumbnail_ref = Column(String, nullable=True)
     agent_payout_amount = Column(Float, nullable=True)
     agent_payout_status = Column(String, nullable=True, default="pending")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    ready_at = Column(DateTime(timezone=True), nullable=True)
+    assigned_at = Column(DateTime(timezone=True), nullable=True)
     delivered_at = Column(DateTime(timezone=True), nullable=True)
+    # Compared and bumped by every ORM UPDATE of the row (optimistic concurrency).
+    version = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Relationships
     user = relationship("User", back_populates="orders")
     restaurant = relationship("Restaurant", back_populates="orders")
+
+    __mapper_args__ = {"version_id_col": version}
+
+    @validates("order_status")
+    def _validate_status(self, key, value):
+        check_transition(self.order_status, value)
+        return value
+
+    @validates("order_items")
+    def _count_items(self, key, value):
+        self.item_count = len(value) if isinstance(value, list) else 0
+        return value
+
+
+# Dispatch queries look at recent orders only; the archive job selects old ones.
+Index("ix_orders_created_at", Order.created_at)
@@ -0,0 +1,24 @@
+from sqlalchemy import BigInteger, Column, Float, ForeignKey, Index, Integer
+from app.database import Base
+
+
+class OrderLineItem(Base):
+    """
+    One line of an order, normalized from orders.order_items. Written once when the order
+    is created; unit_price is the menu price at that moment, so later menu edits do not
+    change what the order was worth.
+    """
+
+    __tablename__ = "order_line_items"
+    __table_args__ = (
+        # Item popularity / revenue: GROUP BY menu_id without touching the orders table.
+        Index("ix_order_line_items_menu_order", "menu_id", "order_id"),
+    )
+
+    line_id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    order_id = Column(Integer, ForeignKey("orders.order_id", ondelete="CASCADE"), nullable=False, index=True)
+    # No foreign key: menu items can be deleted, their sales history stays.
+    menu_id = Column(Integer, nullable=True)
+    quantity = Column(Integer, nullable=False, default=1)
+    # Null when the item was not on the menu when the line was written.
+    unit_price = Column(Float, nullable=True)
@@ -1,6 +1,6 @@
 import uuid
 from enum import Enum as PyEnum
-from sqlalchemy import Column, DateTime, Enum, Integer, JSON, String
+from sqlalchemy import Column, DateTime, Enum, Index, Integer, JSON, String
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from app.database import Base
@@ -94,3 +94,6 @@ class Payment(Base):
     authorized_at = Column(DateTime, nullable=True)
     captured_at = Column(DateTime, nullable=True)
     refunded_at = Column(DateTime, nullable=True)
+
+
+Index("ix_payments_created_at", Payment.created_at)
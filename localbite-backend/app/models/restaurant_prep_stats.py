@@ -0,0 +1,21 @@
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class RestaurantPrepStats(Base):
+    """
+    Running kitchen prep-time statistics per restaurant (created_at -> ready_at, minutes).
+
+    Updated in O(1) each time an order is marked ready: Welford's mean / M2 over every
+    sample plus an exponentially weighted mean that follows recent kitchen load.
+    """
+
+    __tablename__ = "restaurant_prep_stats"
+
+    restaurant_id = Column(Integer, ForeignKey("restaurants.id"), primary_key=True)
+    samples = Column(Integer, nullable=False, default=0)
+    mean_minutes = Column(Float, nullable=False, default=0.0)
+    m2 = Column(Float, nullable=False, default=0.0)
+    ewma_minutes = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
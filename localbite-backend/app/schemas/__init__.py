@@ -13,11 +13,14 @@ from .fare import (
     FareRecommendationRequest,
     FareBreakdown,
     FareRecommendationResponse,
+    ActivePricingResponse,
 )
 from .delivery_bid import DeliveryBidCreate, DeliveryBidUpdate, DeliveryBidOut, DeliveryBidListItem
 from .dispatch import (
     DispatchStartRequest,
     DispatchStartResponse,
+    DispatchCancelRequest,
+    DispatchCancelResponse,
     DispatchStatusResponse,
     AgentAvailableDispatchItem,
     AgentAvailableDispatchResponse,
@@ -45,12 +48,15 @@ __all__ = [
     "FareRecommendationRequest",
     "FareBreakdown",
     "FareRecommendationResponse",
+    "ActivePricingResponse",
     "DeliveryBidCreate",
     "DeliveryBidUpdate",
     "DeliveryBidOut",
     "DeliveryBidListItem",
     "DispatchStartRequest",
     "DispatchStartResponse",
+    "DispatchCancelRequest",
+    "DispatchCancelResponse",
     "DispatchStatusResponse",
     "AgentAvailableDispatchItem",
     "AgentAvailableDispatchResponse",
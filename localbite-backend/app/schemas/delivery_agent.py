@@ -1,5 +1,5 @@
-from datetime import datetime
-from typing import Optional
+from datetime import date, datetime
+from typing import Literal, Optional
 from pydantic import BaseModel, ConfigDict, EmailStr, Field, field_validator, model_validator
 from app.models.delivery_agent import AgentType, VehicleType
 
@@ -99,6 +99,118 @@ class AgentActiveOrdersResponse(BaseModel):
     active_orders: list[AgentActiveOrderItem]
 
 
+class AgentRouteStop(BaseModel):
+    sequence: int
+    order_id: int
+    kind: Literal["pickup", "dropoff"]
+    latitude: float
+    longitude: float
+    address: Optional[str] = None
+    leg_distance_km: float
+    cumulative_distance_km: float
+    eta: datetime
+
+
+class AgentRouteResponse(BaseModel):
+    agent_id: str
+    start_latitude: float
+    start_longitude: float
+    speed_kmph: float
+    total_distance_km: float
+    total_minutes: float
+    stops: list[AgentRouteStop]
+    # Active orders left out because the restaurant or drop-off has no coordinates.
+    unrouted_order_ids: list[int] = Field(default_factory=list)
+
+
+# Redis GEO sets only hold latitudes inside the Web Mercator range.
+MAX_GEO_LATITUDE = 85.05112878
+
+
+class AgentLocationPing(BaseModel):
+    latitude: float = Field(..., ge=-MAX_GEO_LATITUDE, le=MAX_GEO_LATITUDE)
+    longitude: float = Field(..., ge=-180, le=180)
+    # When the device took the fix; defaults to when the server received it.
+    recorded_at: Optional[datetime] = None
+
+
+class AgentLocationBatchItem(AgentLocationPing):
+    agent_id: str
+
+
+class AgentLocationBatchRequest(BaseModel):
+    pings: list[AgentLocationBatchItem] = Field(..., min_length=1, max_length=500)
+
+
+class AgentLocationResponse(BaseModel):
+    agent_id: str
+    # False when a newer ping for the agent had already been recorded.
+    accepted: bool
+    latitude: float
+    longitude: float
+    recorded_at: datetime
+
+
+class AgentLocationBatchResponse(BaseModel):
+    accepted: int
+    stale: int
+
+
+class AgentLedgerEntryOut(BaseModel):
+    entry_id: int
+    order_id: Optional[int] = None
+    entry_type: str
+    amount: float
+    deliveries: int
+    note: Optional[str] = None
+    created_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class AgentEarningsResponse(BaseModel):
+    agent_id: str
+    total_earnings: float
+    total_deliveries: int
+    since: Optional[datetime] = None
+    period_earnings: Optional[float] = None
+    period_deliveries: Optional[int] = None
+    # Most recent first.
+    entries: list[AgentLedgerEntryOut]
+
+
+class AgentDailyStatsOut(BaseModel):
+    day: date
+    bids_placed: int
+    bids_won: int
+    bids_lost: int
+    deliveries: int
+    on_time_deliveries: int
+    earnings: float
+    active_seconds: float
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class AgentStatsResponse(BaseModel):
+    agent_id: str
+    from_date: date
+    to_date: date
+    bids_placed: int
+    bids_won: int
+    bids_lost: int
+    # Rates are None when there is nothing to divide by yet.
+    acceptance_rate: Optional[float] = None
+    win_rate: Optional[float] = None
+    avg_bid_to_base_fare: Optional[float] = None
+    deliveries: int
+    on_time_rate: Optional[float] = None
+    earnings: float
+    active_hours: float
+    earnings_per_hour: Optional[float] = None
+    daily: list[AgentDailyStatsOut]
+
+
 class FulfillDeliveryRequest(BaseModel):
     proof_photo_ref: str = Field(..., min_length=1)
     proof_photo_filename: Optional[str] = None
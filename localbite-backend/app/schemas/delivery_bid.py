@@ -35,3 +35,17 @@ class DeliveryBidOut(BaseModel):
 
 class DeliveryBidListItem(DeliveryBidOut):
     pass
+
+
+class AgentBidSummary(BaseModel):
+    """Covers every bid in the requested date range, not just the current page."""
+
+    total: int
+    by_status: dict[BidStatus, int]
+    won_amount: float
+
+
+class AgentBidHistoryResponse(BaseModel):
+    items: list[DeliveryBidOut]
+    next_cursor: Optional[str] = None
+    summary: AgentBidSummary
@@ -9,6 +9,10 @@ class DispatchStartRequest(BaseModel):
     phase1_wait_seconds_max: int = Field(default=240, ge=1, le=1800)
     phase2_wait_seconds: int = Field(default=180, ge=1, le=1800)
     poll_interval_seconds: int = Field(default=5, ge=1, le=60)
+    # Open the student pool shortly before the kitchen is expected to finish, instead of now.
+    defer_until_ready: bool = False
+    # Offer this order together with batchable orders from the same restaurant as one job.
+    batch: bool = False
 
 
 class DispatchStartResponse(BaseModel):
@@ -21,6 +25,26 @@ class DispatchStartResponse(BaseModel):
     phase2_wait_seconds: int
     poll_interval_seconds: int
     message: str
+    scheduled_for: Optional[datetime] = None
+    expected_ready_at: Optional[datetime] = None
+    bundle_id: Optional[int] = None
+    bundle_order_ids: list[int] = Field(default_factory=list)
+    bundle_base_fare: Optional[float] = None
+    # Set while the dispatch waits for capacity (status "queued").
+    queue_position: Optional[int] = None
+    # Geographic shard whose dispatch worker runs the order (sharded mode only).
+    shard: Optional[str] = None
+
+
+class DispatchCancelRequest(BaseModel):
+    reason: Optional[str] = Field(default=None, max_length=200)
+
+
+class DispatchCancelResponse(BaseModel):
+    order_id: int
+    was_running: bool
+    status: str
+    message: str
 
 
 class DispatchStatusResponse(BaseModel):
@@ -34,6 +58,11 @@ class DispatchStatusResponse(BaseModel):
     phase2_wait_seconds: Optional[int] = None
     note: Optional[str] = None
     updated_at: Optional[str] = None
+    scheduled_for: Optional[str] = None
+    queue_position: Optional[int] = None
+    # Dispatches waiting for capacity on the worker that answered.
+    queue_depth: int = 0
+    shard: Optional[str] = None
 
 
 class AgentAvailableDispatchItem(BaseModel):
@@ -54,6 +83,8 @@ class AgentAvailableDispatchItem(BaseModel):
     leading_bid_created_at: Optional[datetime] = None
     total_placed_bids: int = 0
     order_created_at: Optional[datetime] = None
+    bundle_id: Optional[int] = None
+    bundle_order_ids: list[int] = Field(default_factory=list)
 
 
 class AgentAvailableDispatchResponse(BaseModel):
@@ -52,7 +52,10 @@ class FareBreakdown(BaseModel):
     time_multiplier: float
     peak_multiplier: float
     incentive_multiplier: float
-    pricing_version: Literal["v1"]
+    pricing_version: str = Field(
+        ...,
+        description="Pricing rules version, suffixed with the ETA calibration version when one is active.",
+    )
     distance_source: Literal["input_distance", "haversine"]
 
 
@@ -61,3 +64,8 @@ class FareRecommendationResponse(BaseModel):
     max_bid_limit: float = Field(..., description="Maximum allowed bid (1.5x base fare).")
     eta_estimate_minutes: int
     breakdown: FareBreakdown
+
+
+class ActivePricingResponse(BaseModel):
+    pricing_version: str
+    eta_calibration_version: Optional[str] = None
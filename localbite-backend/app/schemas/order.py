@@ -1,7 +1,9 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Dict, Optional
 from datetime import datetime
 
+from app.services.order_status import OrderStatus
+
 class RestaurantInfo(BaseModel):
     id: int
     name: str
@@ -18,15 +20,23 @@ class OrderBase(BaseModel):
     delivery_fee: float
     commission_amount: float
     order_status: Optional[str] = "pending"
+    delivery_lat: Optional[float] = Field(default=None, ge=-90, le=90)
+    delivery_lng: Optional[float] = Field(default=None, ge=-180, le=180)
 
 class OrderCreate(OrderBase):
-    pass  # For POST requests
+    order_status: Optional[OrderStatus] = "pending"
 
 class OrderUpdate(BaseModel):
-    order_status: Optional[str] = None
+    order_status: Optional[OrderStatus] = None
     assigned_partner_id: Optional[str] = None
+    # The version the client last read; the update is rejected if the order moved on.
+    version: Optional[int] = None
 
 class OrderOut(OrderBase):
     order_id: int
     created_at: datetime
+    ready_at: Optional[datetime] = None
+    bundle_id: Optional[int] = None
+    version: int = 0
+    item_count: Optional[int] = None
     restaurant: Optional[RestaurantInfo] = None
@@ -41,3 +41,11 @@ class RestaurantOut(RestaurantBase):
     created_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class MenuItemSales(BaseModel):
+    menu_id: Optional[int] = None
+    item_name: Optional[str] = None
+    quantity: int
+    revenue: float
+    orders: int
@@ -0,0 +1,308 @@
+"""
+Cold storage for finished orders, settled bids and payments.
+
+Rows older than ARCHIVE_AFTER_DAYS move out of the hot tables into gzip-compressed JSON
+Lines files under ARCHIVE_DIR, partitioned by table and month of created_at:
+
+    archive/orders/2026-03/20261019T120000Z-orders-3f9a0c1b2d4e.jsonl.gz
+    archive/delivery_bids/2026-03/...
+    archive/order_line_items/2026-03/...
+    archive/payments/2026-03/...
+
+What moves:
+  - orders that are delivered or cancelled, with all of their bids and line items
+  - bids that expired, lost or were withdrawn, whatever their order's state
+  - payments in a final status (captured, refunded, failed, cancelled); keep
+    ARCHIVE_AFTER_DAYS longer than the window in which payments are still refunded
+
+Each batch is written to temporary files, renamed into place, and only then deleted from
+the database in one transaction. A crash between the two leaves the rows in both places;
+the next run archives them again, so readers should de-duplicate on the primary key.
+"""
+from __future__ import annotations
+
+import enum
+import gzip
+import json
+import os
+import uuid
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Iterator
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.crud import entity_cache
+from app.models.delivery_bid import DeliveryBid
+from app.models.order import Order
+from app.models.order_line_item import OrderLineItem
+from app.models.payments import Payment, PaymentStatus
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+
+ARCHIVED_ORDER_STATUSES = ("delivered", "cancelled")
+ARCHIVED_BID_STATUSES = ("expired", "rejected", "withdrawn")
+ARCHIVED_PAYMENT_STATUSES = (
+    PaymentStatus.CAPTURED,
+    PaymentStatus.REFUNDED,
+    PaymentStatus.FAILED,
+    PaymentStatus.CANCELLED,
+)
+
+
+def archive_cutoff(days: int = ARCHIVE_AFTER_DAYS, now: datetime | None = None) -> datetime:
+    return (now or datetime.now(timezone.utc)) - timedelta(days=days)
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot archive value of type {type(value).__name__}")
+
+
+def _month(row: dict) -> str:
+    created_at = row.get("created_at")
+    return created_at.strftime("%Y-%m") if created_at is not None else "undated"
+
+
+class ArchiveWriter:
+    """
+    Appends rows to one file per (table, month) for the current batch. Nothing is visible
+    under the archive root until `commit`.
+    """
+
+    def __init__(self, root: str | Path, batch_name: str) -> None:
+        self.root = Path(root)
+        self.batch_name = batch_name
+        self._files: dict[tuple[str, str], tuple[Path, gzip.GzipFile]] = {}
+
+    def write(self, table: str, row: dict, month: str | None = None) -> None:
+        key = (table, month or _month(row))
+        entry = self._files.get(key)
+        if entry is None:
+            directory = self.root.joinpath(*key)
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / f"{self.batch_name}.jsonl.gz"
+            tmp = path.with_name(path.name + ".tmp")
+            entry = self._files[key] = (path, gzip.open(tmp, "wb"))
+        line = json.dumps(row, default=_json_value, separators=(",", ":")) + "\n"
+        entry[1].write(line.encode())
+
+    def commit(self) -> list[Path]:
+        """Flush every file to disk and move it into place."""
+        paths = []
+        for path, handle in self._files.values():
+            handle.close()
+            tmp = path.with_name(path.name + ".tmp")
+            with open(tmp, "rb") as written:
+                os.fsync(written.fileno())
+            os.replace(tmp, path)
+            paths.append(path)
+        self._files.clear()
+        return paths
+
+    def abort(self) -> None:
+        for path, handle in self._files.values():
+            handle.close()
+            path.with_name(path.name + ".tmp").unlink(missing_ok=True)
+        self._files.clear()
+
+
+def read_archive(root: str | Path, table: str, month: str | None = None) -> Iterator[dict]:
+    """Rows archived for `table`, optionally only one month ("2026-03"). Values stay JSON."""
+    base = Path(root) / table
+    directories = [base / month] if month is not None else sorted(p for p in base.glob("*") if p.is_dir())
+    for directory in directories:
+        for path in sorted(directory.glob("*.jsonl.gz")):
+            with gzip.open(path, "rt") as handle:
+                for line in handle:
+                    yield json.loads(line)
+
+
+@dataclass
+class ArchiveResult:
+    orders: int = 0
+    bids: int = 0
+    line_items: int = 0
+    payments: int = 0
+    files: list[Path] = field(default_factory=list)
+
+
+def _batch_name(kind: str) -> str:
+    # Unique per batch, so two runs never replace each other's files.
+    return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{kind}-{uuid.uuid4().hex[:12]}"
+
+
+def _rows(db: Session, query) -> list[dict]:
+    return [dict(row) for row in db.execute(query).mappings()]
+
+
+def _move(
+    db: Session,
+    root: Path,
+    batch_name: str,
+    tables: list[tuple[str, list[dict], Callable[[dict], str]]],
+    deletes: list,
+) -> list[Path]:
+    """Archive each table's rows under the month `month_of(row)`, then run `deletes` and commit."""
+    writer = ArchiveWriter(root, batch_name)
+    try:
+        for table, rows, month_of in tables:
+            for row in rows:
+                writer.write(table, row, month_of(row))
+        paths = writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+    for statement in deletes:
+        db.execute(statement)
+    db.commit()
+    return paths
+
+
+def archive_orders(
+    db: Session,
+    *,
+    cutoff: datetime,
+    root: str | Path = ARCHIVE_DIR,
+    batch_size: int = 500,
+    result: ArchiveResult | None = None,
+) -> ArchiveResult:
+    """Move finished orders created before `cutoff`, with their bids and line items."""
+    result = result or ArchiveResult()
+    while True:
+        orders = _rows(
+            db,
+            select(Order.__table__)
+            .where(Order.created_at < cutoff, Order.order_status.in_(ARCHIVED_ORDER_STATUSES))
+            .order_by(Order.order_id)
+            .limit(batch_size),
+        )
+        if not orders:
+            return result
+        order_ids = [row["order_id"] for row in orders]
+        order_months = {row["order_id"]: _month(row) for row in orders}
+        bids = _rows(db, select(DeliveryBid.__table__).where(DeliveryBid.order_id.in_(order_ids)))
+        lines = _rows(db, select(OrderLineItem.__table__).where(OrderLineItem.order_id.in_(order_ids)))
+        result.files += _move(
+            db,
+            Path(root),
+            _batch_name("orders"),
+            [
+                ("orders", orders, _month),
+                ("delivery_bids", bids, _month),
+                # Line items have no timestamp of their own; they go with their order.
+                ("order_line_items", lines, lambda row: order_months[row["order_id"]]),
+            ],
+            [
+                delete(OrderLineItem).where(OrderLineItem.order_id.in_(order_ids)),
+                delete(DeliveryBid).where(DeliveryBid.order_id.in_(order_ids)),
+                delete(Order).where(Order.order_id.in_(order_ids)),
+            ],
+        )
+        entity_cache.invalidate(Order, *order_ids)
+        result.orders += len(orders)
+        result.bids += len(bids)
+        result.line_items += len(lines)
+
+
+def archive_bids(
+    db: Session,
+    *,
+    cutoff: datetime,
+    root: str | Path = ARCHIVE_DIR,
+    batch_size: int = 500,
+    result: ArchiveResult | None = None,
+) -> ArchiveResult:
+    """Move settled bids (expired, rejected, withdrawn) created before `cutoff`."""
+    result = result or ArchiveResult()
+    while True:
+        bids = _rows(
+            db,
+            select(DeliveryBid.__table__)
+            .where(DeliveryBid.created_at < cutoff, DeliveryBid.bid_status.in_(ARCHIVED_BID_STATUSES))
+            .order_by(DeliveryBid.bid_id)
+            .limit(batch_size),
+        )
+        if not bids:
+            return result
+        result.files += _move(
+            db,
+            Path(root),
+            _batch_name("bids"),
+            [("delivery_bids", bids, _month)],
+            [delete(DeliveryBid).where(DeliveryBid.bid_id.in_([row["bid_id"] for row in bids]))],
+        )
+        result.bids += len(bids)
+
+
+def archive_payments(
+    db: Session,
+    *,
+    cutoff: datetime,
+    root: str | Path = ARCHIVE_DIR,
+    batch_size: int = 500,
+    result: ArchiveResult | None = None,
+) -> ArchiveResult:
+    """Move payments in a final status created before `cutoff`."""
+    result = result or ArchiveResult()
+    # payments.created_at is a naive UTC timestamp.
+    naive_cutoff = cutoff.astimezone(timezone.utc).replace(tzinfo=None)
+    while True:
+        payments = _rows(
+            db,
+            select(Payment.__table__)
+            .where(Payment.created_at < naive_cutoff, Payment.status.in_(ARCHIVED_PAYMENT_STATUSES))
+            .order_by(Payment.created_at, Payment.payment_id)
+            .limit(batch_size),
+        )
+        if not payments:
+            return result
+        result.files += _move(
+            db,
+            Path(root),
+            _batch_name("payments"),
+            [("payments", payments, _month)],
+            [delete(Payment).where(Payment.payment_id.in_([row["payment_id"] for row in payments]))],
+        )
+        result.payments += len(payments)
+
+
+def count_archivable(db: Session, cutoff: datetime) -> dict[str, int]:
+    """Rows each archive step would move now (orders' own bids and lines not included)."""
+    naive_cutoff = cutoff.astimezone(timezone.utc).replace(tzinfo=None)
+    return {
+        "orders": db.query(Order)
+        .filter(Order.created_at < cutoff, Order.order_status.in_(ARCHIVED_ORDER_STATUSES))
+        .count(),
+        "delivery_bids": db.query(DeliveryBid)
+        .filter(DeliveryBid.created_at < cutoff, DeliveryBid.bid_status.in_(ARCHIVED_BID_STATUSES))
+        .count(),
+        "payments": db.query(Payment)
+        .filter(Payment.created_at < naive_cutoff, Payment.status.in_(ARCHIVED_PAYMENT_STATUSES))
+        .count(),
+    }
+
+
+__all__ = [
+    "ARCHIVE_AFTER_DAYS",
+    "ARCHIVE_DIR",
+    "ArchiveResult",
+    "ArchiveWriter",
+    "archive_bids",
+    "archive_cutoff",
+    "archive_orders",
+    "archive_payments",
+    "count_archivable",
+    "read_archive",
+]
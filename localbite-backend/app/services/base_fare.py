@@ -2,38 +2,55 @@ import math
 from datetime import datetime
 from app.schemas.fare import FareBreakdown, FareRecommendationRequest, FareRecommendationResponse
 from app.services.distance import resolve_distance_km
-
-# Pricing knobs for bidding minimum.
-BASE_PICKUP_FEE = 2.25
-PER_KM_RATE = 0.95
-MIN_BASE_FARE = 3.25
-MAX_BASE_FARE = 35.00
-MAX_BID_MULTIPLIER = 1.5
+from app.services.eta_calibration import (
+    DEFAULT_DISPATCH_BUFFER_MINUTES,
+    DEFAULT_SPEED_KMPH,
+    get_eta_calibration,
+)
+from app.services.pricing import PricingTable, get_pricing_table
 
 
 def get_fare_recommendation(payload: FareRecommendationRequest) -> FareRecommendationResponse:
+    # Take one reference to the active table: a hot reload mid-quote does not affect
+    # this quote, which is priced and versioned entirely from the table it started with.
+    pricing = get_pricing_table()
     distance_km, distance_source = resolve_distance_km(payload)
     request_time = payload.request_time or datetime.now()
     hour = request_time.hour
 
-    time_multiplier = _time_of_day_multiplier(hour)
-    peak_multiplier = _peak_hour_multiplier(hour)
+    time_multiplier = pricing.time_multiplier(request_time)
+    peak_multiplier = pricing.peak_multiplier(request_time)
     incentive_multiplier = _incentive_multiplier(
         payload.incentive_metrics.demand_index,
         payload.incentive_metrics.supply_index,
         payload.incentive_metrics.weather_severity,
     )
 
-    distance_component = distance_km * PER_KM_RATE
-    raw_fare = (BASE_PICKUP_FEE + distance_component) * time_multiplier
+    distance_component = distance_km * pricing.per_km_rate
+    raw_fare = (pricing.base_pickup_fee + distance_component) * time_multiplier
     raw_fare *= peak_multiplier * incentive_multiplier
 
-    base_fare = round(_clamp(raw_fare, MIN_BASE_FARE, MAX_BASE_FARE), 2)
-    max_bid_limit = get_max_bid_limit(base_fare)
+    base_fare = round(_clamp(raw_fare, pricing.min_base_fare, pricing.max_base_fare), 2)
+    max_bid_limit = get_max_bid_limit(base_fare, pricing)
+
+    # Read the calibration once so the ETA and pricing_version come from the same table
+    # even if a reload lands while this quote is being computed.
+    calibration = get_eta_calibration()
+    calibrated_eta = None
+    pricing_version = pricing.version
+    if calibration is not None:
+        zone = calibration.zone_for(
+            payload.restaurant_location.latitude,
+            payload.restaurant_location.longitude,
+        )
+        calibrated_eta = calibration.lookup(zone, hour)
+        pricing_version = f"{pricing.version}+eta.{calibration.version}"
+
     eta_minutes = _estimate_eta_minutes(
         distance_km=distance_km,
         peak_multiplier=peak_multiplier,
         weather_severity=payload.incentive_metrics.weather_severity,
+        calibrated=calibrated_eta,
     )
 
     return FareRecommendationResponse(
@@ -42,37 +59,17 @@ def get_fare_recommendation(payload: FareRecommendationRequest) -> FareRecommend
         eta_estimate_minutes=eta_minutes,
         breakdown=FareBreakdown(
             distance_km=round(distance_km, 2),
-            base_pickup_fee=BASE_PICKUP_FEE,
+            base_pickup_fee=pricing.base_pickup_fee,
             distance_component=round(distance_component, 2),
             time_multiplier=time_multiplier,
             peak_multiplier=peak_multiplier,
             incentive_multiplier=incentive_multiplier,
-            pricing_version="v1",
+            pricing_version=pricing_version,
             distance_source=distance_source,
         ),
     )
 
 
-def _time_of_day_multiplier(hour: int) -> float:
-    if 0 <= hour < 6:
-        return 1.12
-    if 6 <= hour < 11:
-        return 1.00
-    if 11 <= hour < 14:
-        return 1.08
-    if 14 <= hour < 17:
-        return 0.97
-    if 17 <= hour < 22:
-        return 1.12
-    return 1.05
-
-
-def _peak_hour_multiplier(hour: int) -> float:
-    if 11 <= hour < 14 or 18 <= hour < 22:
-        return 1.12
-    return 1.00
-
-
 def _incentive_multiplier(
     demand_index: float,
     supply_index: float,
@@ -85,21 +82,31 @@ def _incentive_multiplier(
 
 
 def _estimate_eta_minutes(
-    distance_km: float, peak_multiplier: float, weather_severity: float
+    distance_km: float,
+    peak_multiplier: float,
+    weather_severity: float,
+    calibrated: tuple[float, float] | None = None,
 ) -> int:
-    base_speed_kmph = 28.0
-    peak_penalty = 0.90 if peak_multiplier > 1.0 else 1.0
+    if calibrated is not None:
+        # Calibrated (speed, buffer) are fitted per zone and hour, so peak traffic is
+        # already reflected in the speed; only weather is applied on top.
+        base_speed_kmph, dispatch_buffer = calibrated
+        peak_penalty = 1.0
+    else:
+        base_speed_kmph = DEFAULT_SPEED_KMPH
+        dispatch_buffer = DEFAULT_DISPATCH_BUFFER_MINUTES
+        peak_penalty = 0.90 if peak_multiplier > 1.0 else 1.0
     weather_penalty = 1.0 - (0.25 * weather_severity)
     effective_speed_kmph = max(8.0, base_speed_kmph * peak_penalty * weather_penalty)
 
     travel_minutes = (distance_km / effective_speed_kmph) * 60
-    dispatch_buffer = 8
     eta = math.ceil(travel_minutes + dispatch_buffer)
     return max(10, eta)
 
 
-def get_max_bid_limit(base_fare: float) -> float:
-    return round(base_fare * MAX_BID_MULTIPLIER, 2)
+def get_max_bid_limit(base_fare: float, pricing: PricingTable | None = None) -> float:
+    pricing = pricing or get_pricing_table()
+    return round(base_fare * pricing.max_bid_multiplier, 2)
 
 
 def get_bid_window(base_fare: float) -> tuple[float, float]:
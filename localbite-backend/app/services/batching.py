@@ -0,0 +1,147 @@
+"""
+Multi-order batching: one agent, several pickups from the same restaurant.
+
+Orders are batchable when they come from the same restaurant, their expected ready times
+fall within BATCH_READY_WINDOW_MINUTES of each other, and every drop-off is within
+BATCH_RADIUS_KM of every other one. The bundle is priced by the fare service over the
+whole route (restaurant, then drop-offs nearest-first), so one pickup fee covers all stops.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Sequence
+
+from pydantic import BaseModel
+
+from app.models.order import Order
+from app.models.restaurant import Restaurant
+from app.schemas.fare import FareRecommendationRequest, LocationInput
+from app.services.base_fare import get_fare_recommendation
+from app.services.distance import _haversine_km
+
+BATCH_RADIUS_KM = float(os.getenv("BATCH_RADIUS_KM", "1.5"))
+BATCH_READY_WINDOW_MINUTES = float(os.getenv("BATCH_READY_WINDOW_MINUTES", "10"))
+BATCH_MAX_ORDERS = int(os.getenv("BATCH_MAX_ORDERS", "4"))
+
+BATCHABLE_STATUSES = {"pending", "preparing", "ready"}
+
+
+class BundleQuote(BaseModel):
+    restaurant_id: int
+    lead_order_id: int
+    # Drop-off order.
+    order_ids: list[int]
+    route_distance_km: float
+    base_fare: float
+    max_bid_limit: float
+    separate_base_fare_total: float
+
+
+def _utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def expected_ready_at(order: Order, prep_minutes: float) -> datetime:
+    if order.ready_at is not None:
+        return _utc(order.ready_at)
+    created_at = _utc(order.created_at) if order.created_at else datetime.now(timezone.utc)
+    return created_at + timedelta(minutes=prep_minutes)
+
+
+def _is_candidate(order: Order) -> bool:
+    return (
+        order.assigned_partner_id is None
+        and order.bundle_id is None
+        and order.order_status in BATCHABLE_STATUSES
+        and order.delivery_lat is not None
+        and order.delivery_lng is not None
+    )
+
+
+def _drop_distance_km(a: Order, b: Order) -> float:
+    return _haversine_km(a.delivery_lat, a.delivery_lng, b.delivery_lat, b.delivery_lng)
+
+
+def find_batch(
+    lead: Order,
+    candidates: Sequence[Order],
+    *,
+    prep_minutes: float,
+    radius_km: float = BATCH_RADIUS_KM,
+    ready_window_minutes: float = BATCH_READY_WINDOW_MINUTES,
+    max_orders: int = BATCH_MAX_ORDERS,
+) -> list[Order]:
+    """
+    Orders that can ride along with `lead` (lead first). Candidates are taken closest
+    ready time first; each must be within the radius of every order already in the batch.
+    Returns just [lead] when nothing fits.
+    """
+    if not _is_candidate(lead):
+        return [lead]
+    lead_ready = expected_ready_at(lead, prep_minutes)
+    window = timedelta(minutes=ready_window_minutes)
+    pool = [
+        order
+        for order in candidates
+        if order.order_id != lead.order_id
+        and order.restaurant_id == lead.restaurant_id
+        and _is_candidate(order)
+        and abs(expected_ready_at(order, prep_minutes) - lead_ready) <= window
+    ]
+    pool.sort(key=lambda order: (abs(expected_ready_at(order, prep_minutes) - lead_ready), order.order_id))
+
+    batch = [lead]
+    for order in pool:
+        if len(batch) >= max_orders:
+            break
+        if all(_drop_distance_km(order, member) <= radius_km for member in batch):
+            batch.append(order)
+    return batch
+
+
+def plan_route(restaurant: Restaurant, orders: Sequence[Order]) -> tuple[list[Order], float]:
+    """Nearest-neighbour drop-off order from the restaurant, and the route length in km."""
+    remaining = list(orders)
+    route: list[Order] = []
+    lat, lng = restaurant.latitude, restaurant.longitude
+    total = 0.0
+    while remaining:
+        nearest = min(remaining, key=lambda o: (_haversine_km(lat, lng, o.delivery_lat, o.delivery_lng), o.order_id))
+        total += _haversine_km(lat, lng, nearest.delivery_lat, nearest.delivery_lng)
+        lat, lng = nearest.delivery_lat, nearest.delivery_lng
+        route.append(nearest)
+        remaining.remove(nearest)
+    return route, total
+
+
+def quote_bundle(restaurant: Restaurant, orders: Sequence[Order], *, request_time: datetime | None = None) -> BundleQuote:
+    """Price the whole route as one job with the fare service. orders[0] is the lead."""
+    route, distance_km = plan_route(restaurant, orders)
+    last_stop = route[-1]
+    fare = get_fare_recommendation(
+        FareRecommendationRequest(
+            restaurant_location=LocationInput(
+                address=restaurant.address, latitude=restaurant.latitude, longitude=restaurant.longitude
+            ),
+            user_location=LocationInput(
+                address=f"order {last_stop.order_id} drop-off",
+                latitude=last_stop.delivery_lat,
+                longitude=last_stop.delivery_lng,
+            ),
+            # The fare service floors tiny distances at its minimum fare anyway.
+            distance_km=max(distance_km, 0.01),
+            request_time=request_time,
+        )
+    )
+    return BundleQuote(
+        restaurant_id=restaurant.id,
+        lead_order_id=orders[0].order_id,
+        order_ids=[order.order_id for order in route],
+        route_distance_km=round(distance_km, 3),
+        base_fare=fare.base_fare,
+        max_bid_limit=fare.max_bid_limit,
+        separate_base_fare_total=round(sum(order.base_fare for order in orders), 2),
+    )
+
+
+def can_batch_from(restaurant: Restaurant | None) -> bool:
+    return restaurant is not None and restaurant.latitude is not None and restaurant.longitude is not None
@@ -0,0 +1,77 @@
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from app.services.distance import geohash_encode
+from app.services.hot_reload import HotReloadFile
+
+# Fallbacks used when no calibration has been produced yet.
+DEFAULT_SPEED_KMPH = 28.0
+DEFAULT_DISPATCH_BUFFER_MINUTES = 8.0
+ETA_ZONE_PRECISION = 5
+
+ETA_CALIBRATION_PATH = os.getenv(
+    "ETA_CALIBRATION_PATH",
+    str(Path(__file__).resolve().parents[2] / "data" / "eta_calibration.json"),
+)
+
+
+class EtaHourlyParameters(BaseModel):
+    """Per-hour (local time, 0-23) speed and dispatch buffer for one zone."""
+
+    speed_kmph: list[float] = Field(..., min_length=24, max_length=24)
+    buffer_minutes: list[float] = Field(..., min_length=24, max_length=24)
+    samples: list[int] = Field(default_factory=lambda: [0] * 24, min_length=24, max_length=24)
+
+
+class EtaCalibrationTable(BaseModel):
+    """
+    Lookup table written by `app.jobs.calibrate_eta` and hot-loaded by the fare service.
+
+    Zones are geohash prefixes of the restaurant location; `default` covers zones that
+    had too little history to fit on their own.
+    """
+
+    version: str
+    generated_at: datetime
+    zone_precision: int = ETA_ZONE_PRECISION
+    default: EtaHourlyParameters
+    zones: dict[str, EtaHourlyParameters] = Field(default_factory=dict)
+
+    def zone_for(self, latitude: float | None, longitude: float | None) -> str | None:
+        if latitude is None or longitude is None:
+            return None
+        return geohash_encode(latitude, longitude, self.zone_precision)
+
+    def lookup(self, zone: str | None, hour: int) -> tuple[float, float]:
+        params = self.zones.get(zone, self.default) if zone else self.default
+        return params.speed_kmph[hour], params.buffer_minutes[hour]
+
+
+_calibration_file: HotReloadFile[EtaCalibrationTable] = HotReloadFile(
+    ETA_CALIBRATION_PATH,
+    EtaCalibrationTable.model_validate_json,
+)
+
+
+def get_eta_calibration() -> Optional[EtaCalibrationTable]:
+    """Return the active calibration table, or None when no calibration file exists."""
+    return _calibration_file.get()
+
+
+def reload_eta_calibration() -> Optional[EtaCalibrationTable]:
+    return _calibration_file.reload()
+
+
+__all__ = [
+    "DEFAULT_SPEED_KMPH",
+    "DEFAULT_DISPATCH_BUFFER_MINUTES",
+    "ETA_CALIBRATION_PATH",
+    "EtaHourlyParameters",
+    "EtaCalibrationTable",
+    "get_eta_calibration",
+    "reload_eta_calibration",
+]
@@ -0,0 +1,75 @@
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Generic, Optional, TypeVar
+
+logger = logging.getLogger("services.hot_reload")
+
+T = TypeVar("T")
+
+
+class HotReloadFile(Generic[T]):
+    """
+    Keep a parsed snapshot of a file and swap it when the file changes on disk.
+
+    `get()` stats the file at most once per `check_interval_seconds`. A reload builds the
+    new snapshot fully before publishing it with a single reference assignment, so callers
+    that already hold the previous snapshot keep using it unchanged. If the file is missing
+    or fails to parse, the last good snapshot (or None) stays active.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        loader: Callable[[bytes], T],
+        *,
+        check_interval_seconds: float = 5.0,
+    ) -> None:
+        self.path = Path(path)
+        self._loader = loader
+        self._check_interval = check_interval_seconds
+        self._snapshot: Optional[T] = None
+        self._signature: tuple[int, int] | None = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+
+    def get(self) -> Optional[T]:
+        now = time.monotonic()
+        if now >= self._next_check and self._reload_lock.acquire(blocking=False):
+            # Only one thread reloads; concurrent callers read the current snapshot.
+            try:
+                self._next_check = now + self._check_interval
+                self._reload_if_changed()
+            finally:
+                self._reload_lock.release()
+        return self._snapshot
+
+    def reload(self) -> Optional[T]:
+        """Force a stat + reload on the next call regardless of the check interval."""
+        self._next_check = 0.0
+        return self.get()
+
+    def _reload_if_changed(self) -> None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return
+
+        # Remember the signature even on failure so a bad file is not re-parsed every check.
+        self._signature = signature
+        try:
+            snapshot = self._loader(self.path.read_bytes())
+        except Exception:
+            logger.exception("Failed to load %s; keeping previous snapshot", self.path)
+            return
+
+        self._snapshot = snapshot
+        logger.info("Loaded %s", self.path)
+
+
+__all__ = ["HotReloadFile"]
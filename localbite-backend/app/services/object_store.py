@@ -0,0 +1,139 @@
+"""
+Content-addressed object store on the local filesystem.
+
+An object is written once under its SHA-256 and referenced as "sha256:<hex>":
+
+    <root>/ab/cd/abcd...ef
+
+Uploads stream into a temporary file in <root>/tmp while the digest is computed, then are
+renamed into place, so no upload is ever held in memory and a half-written file is never
+visible under a ref. Identical content lands on the same path and is stored once.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator
+
+from pydantic import BaseModel
+
+OBJECT_STORE_DIR = os.getenv("OBJECT_STORE_DIR", "data/objects")
+REF_PREFIX = "sha256:"
+
+
+class ObjectTooLarge(Exception):
+    """The stream went past the caller's byte limit; nothing was stored."""
+
+
+class StoredObject(BaseModel):
+    ref: str
+    size: int
+    path: str
+
+
+def is_object_ref(value: str | None) -> bool:
+    return bool(value) and value.startswith(REF_PREFIX) and len(value) == len(REF_PREFIX) + 64
+
+
+class LocalObjectStore:
+    def __init__(self, root: str | os.PathLike = OBJECT_STORE_DIR) -> None:
+        self.root = Path(root)
+
+    def path_for(self, ref: str) -> Path:
+        if not is_object_ref(ref):
+            raise ValueError(f"Not an object ref: {ref!r}")
+        digest = ref[len(REF_PREFIX):]
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def exists(self, ref: str) -> bool:
+        return is_object_ref(ref) and self.path_for(ref).is_file()
+
+    def _commit(self, tmp_path: Path, digest: str, size: int) -> StoredObject:
+        ref = REF_PREFIX + digest
+        final = self.path_for(ref)
+        if final.exists():
+            tmp_path.unlink(missing_ok=True)
+        else:
+            final.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, final)
+        return StoredObject(ref=ref, size=size, path=str(final))
+
+    def _temp_file(self):
+        tmp_dir = self.root / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False)
+
+    async def put_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        *,
+        max_bytes: int | None = None,
+        first_chunk: bytes = b"",
+    ) -> StoredObject:
+        """
+        Store a byte stream. `first_chunk` is data the caller already pulled off the stream
+        (e.g. to sniff the file type). Raises ObjectTooLarge past `max_bytes`.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        tmp = self._temp_file()
+        tmp_path = Path(tmp.name)
+        try:
+            with tmp:
+                if first_chunk:
+                    digest.update(first_chunk)
+                    tmp.write(first_chunk)
+                    size += len(first_chunk)
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise ObjectTooLarge(f"Upload exceeds {max_bytes} bytes")
+                    digest.update(chunk)
+                    # Page-cache writes of upload-sized chunks; not worth a thread hop each.
+                    tmp.write(chunk)
+            if max_bytes is not None and size > max_bytes:
+                raise ObjectTooLarge(f"Upload exceeds {max_bytes} bytes")
+            return self._commit(tmp_path, digest.hexdigest(), size)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    def put_bytes(self, data: bytes) -> StoredObject:
+        """Store a small blob (thumbnails) synchronously."""
+        tmp = self._temp_file()
+        tmp_path = Path(tmp.name)
+        try:
+            with tmp:
+                tmp.write(data)
+            return self._commit(tmp_path, hashlib.sha256(data).hexdigest(), len(data))
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+
+_store: LocalObjectStore | None = None
+
+
+def get_object_store() -> LocalObjectStore:
+    global _store
+    if _store is None:
+        _store = LocalObjectStore()
+    return _store
+
+
+def set_object_store(store: LocalObjectStore | None) -> LocalObjectStore | None:
+    global _store
+    previous, _store = _store, store
+    return previous
+
+
+__all__ = [
+    "LocalObjectStore",
+    "ObjectTooLarge",
+    "StoredObject",
+    "get_object_store",
+    "is_object_ref",
+    "set_object_store",
+]
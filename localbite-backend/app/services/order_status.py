@@ -0,0 +1,78 @@
+"""
+Order status state machine.
+
+    pending ──> preparing ──> ready ──> on_the_way ──> delivered
+       │            │           │ ▲          ▲
+       └────────────┴──> assigned ┘──────────┘          (any open status) ──> cancelled
+
+The kitchen moves an order through preparing and ready; dispatch can award it at any of
+those points, and the kitchen can still mark an assigned order ready. delivered and
+cancelled are final. Setting the status it already has is always allowed, so retries are
+harmless. Rows with a status outside this table (written before it existed) may move
+anywhere once.
+
+Orders also carry a version that every ORM update compares and bumps (`UPDATE ... WHERE
+version = :v`, see Order.__mapper_args__), so a writer that lost a race gets a
+StaleDataError instead of silently overwriting the winner.
+"""
+from typing import Literal
+
+PENDING = "pending"
+PREPARING = "preparing"
+READY = "ready"
+ASSIGNED = "assigned"
+ON_THE_WAY = "on_the_way"
+DELIVERED = "delivered"
+CANCELLED = "cancelled"
+
+OrderStatus = Literal["pending", "preparing", "ready", "assigned", "on_the_way", "delivered", "cancelled"]
+
+TRANSITIONS: dict[str, frozenset[str]] = {
+    PENDING: frozenset({PREPARING, READY, ASSIGNED, CANCELLED}),
+    PREPARING: frozenset({READY, ASSIGNED, CANCELLED}),
+    READY: frozenset({ASSIGNED, ON_THE_WAY, DELIVERED, CANCELLED}),
+    ASSIGNED: frozenset({READY, ON_THE_WAY, DELIVERED, CANCELLED}),
+    ON_THE_WAY: frozenset({DELIVERED, CANCELLED}),
+    DELIVERED: frozenset(),
+    CANCELLED: frozenset(),
+}
+ORDER_STATUSES = frozenset(TRANSITIONS)
+FINAL_STATUSES = frozenset({DELIVERED, CANCELLED})
+
+
+class IllegalOrderTransition(ValueError):
+    def __init__(self, current: str | None, target: str) -> None:
+        super().__init__(f"Order cannot move from '{current}' to '{target}'")
+        self.current = current
+        self.target = target
+
+
+def can_transition(current: str | None, target: str) -> bool:
+    if target not in ORDER_STATUSES:
+        return False
+    if current is None or current == target or current not in TRANSITIONS:
+        return True
+    return target in TRANSITIONS[current]
+
+
+def check_transition(current: str | None, target: str) -> None:
+    if not can_transition(current, target):
+        raise IllegalOrderTransition(current, target)
+
+
+__all__ = [
+    "ASSIGNED",
+    "CANCELLED",
+    "DELIVERED",
+    "FINAL_STATUSES",
+    "IllegalOrderTransition",
+    "ON_THE_WAY",
+    "ORDER_STATUSES",
+    "OrderStatus",
+    "PENDING",
+    "PREPARING",
+    "READY",
+    "TRANSITIONS",
+    "can_transition",
+    "check_transition",
+]
@@ -0,0 +1,77 @@
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Literal
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from app.crud import restaurant_prep_stats as prep_stats_crud
+
+# Used until a restaurant has MIN_PREP_SAMPLES orders marked ready.
+DEFAULT_PREP_MINUTES = float(os.getenv("DEFAULT_PREP_MINUTES", "15"))
+MIN_PREP_SAMPLES = int(os.getenv("MIN_PREP_SAMPLES", "5"))
+# How long before the food is ready the student-pool auction should have closed, so the
+# winning agent has time to reach the restaurant.
+DISPATCH_PICKUP_LEAD_MINUTES = float(os.getenv("DISPATCH_PICKUP_LEAD_MINUTES", "5"))
+
+
+class PrepTimeEstimate(BaseModel):
+    restaurant_id: int
+    expected_minutes: float
+    stddev_minutes: float | None = None
+    samples: int = 0
+    source: Literal["history", "default"] = "default"
+
+
+class DeferredDispatchPlan(BaseModel):
+    expected_ready_at: datetime
+    dispatch_at: datetime
+    deferred: bool
+    estimate: PrepTimeEstimate
+
+
+def estimate_prep_time(db: Session, restaurant_id: int) -> PrepTimeEstimate:
+    """Recency-weighted prep time for the restaurant, or the default without enough history."""
+    stats = prep_stats_crud.get_by_restaurant(db, restaurant_id)
+    if stats is None or stats.samples < MIN_PREP_SAMPLES:
+        return PrepTimeEstimate(
+            restaurant_id=restaurant_id,
+            expected_minutes=DEFAULT_PREP_MINUTES,
+            samples=stats.samples if stats else 0,
+        )
+    return PrepTimeEstimate(
+        restaurant_id=restaurant_id,
+        expected_minutes=round(stats.ewma_minutes, 2),
+        stddev_minutes=round(math.sqrt(stats.m2 / (stats.samples - 1)), 2),
+        samples=stats.samples,
+        source="history",
+    )
+
+
+def plan_deferred_dispatch(
+    *,
+    ordered_at: datetime,
+    estimate: PrepTimeEstimate,
+    phase1_wait_seconds: int,
+    now: datetime,
+    lead_minutes: float = DISPATCH_PICKUP_LEAD_MINUTES,
+) -> DeferredDispatchPlan:
+    """
+    Open the student pool so that it closes `lead_minutes` before the expected ready time:
+
+        dispatch_at = ordered_at + expected prep - phase 1 window - lead
+
+    If that moment has already passed, dispatch starts right away.
+    """
+    if ordered_at.tzinfo is None:
+        ordered_at = ordered_at.replace(tzinfo=timezone.utc)
+    expected_ready_at = ordered_at + timedelta(minutes=estimate.expected_minutes)
+    dispatch_at = expected_ready_at - timedelta(seconds=phase1_wait_seconds, minutes=lead_minutes)
+    deferred = dispatch_at > now
+    return DeferredDispatchPlan(
+        expected_ready_at=expected_ready_at,
+        dispatch_at=dispatch_at if deferred else now,
+        deferred=deferred,
+        estimate=estimate,
+    )
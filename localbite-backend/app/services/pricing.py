@@ -0,0 +1,173 @@
+"""
+Versioned pricing configuration compiled into flat lookup tables.
+
+A PricingConfig describes the fare knobs and the hour/day multiplier bands. It is compiled
+once into a PricingTable whose time-of-day and peak multipliers are precomputed for every
+(weekday, hour) slot, so a quote does a tuple index instead of walking branches.
+
+The active table is read from PRICING_CONFIG_PATH (JSON) when set and hot-reloaded when the
+file changes; otherwise the built-in "v1" config is used. Reloads publish a new table object
+with one reference assignment, so a quote that already called get_pricing_table() finishes
+on the version it started with.
+"""
+import json
+import os
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel, Field, model_validator
+
+from app.services.hot_reload import HotReloadFile
+
+DAYS_PER_WEEK = 7
+HOURS_PER_DAY = 24
+
+PRICING_CONFIG_PATH = os.getenv("PRICING_CONFIG_PATH")
+
+
+class MultiplierBand(BaseModel):
+    """Multiplier applied from start_hour (inclusive) to end_hour (exclusive).
+
+    Bands may wrap midnight (e.g. 22 -> 6). `days` uses datetime.weekday() numbering
+    (0 = Monday) and names the day a band starts on, so a Friday 22 -> 2 band covers
+    Saturday 00:00-02:00; omit it to apply the band every day. Later bands override
+    earlier ones.
+    """
+
+    start_hour: int = Field(..., ge=0, le=23)
+    end_hour: int = Field(..., ge=1, le=24)
+    multiplier: float = Field(..., gt=0)
+    days: Optional[list[int]] = None
+
+    @model_validator(mode="after")
+    def validate_days(self):
+        if self.days is not None and any(day < 0 or day >= DAYS_PER_WEEK for day in self.days):
+            raise ValueError("days must use weekday numbers 0 (Monday) to 6 (Sunday)")
+        return self
+
+    def hours(self) -> list[tuple[int, int]]:
+        """(day offset, hour) pairs covered; hours after midnight fall on the next day."""
+        if self.start_hour < self.end_hour:
+            return [(0, hour) for hour in range(self.start_hour, self.end_hour)]
+        return [(0, hour) for hour in range(self.start_hour, HOURS_PER_DAY)] + [
+            (1, hour) for hour in range(0, self.end_hour % HOURS_PER_DAY)
+        ]
+
+
+class PricingConfig(BaseModel):
+    version: str = Field(..., min_length=1)
+    base_pickup_fee: float = Field(..., ge=0)
+    per_km_rate: float = Field(..., ge=0)
+    min_base_fare: float = Field(..., ge=0)
+    max_base_fare: float = Field(..., gt=0)
+    max_bid_multiplier: float = Field(..., ge=1.0)
+    default_time_multiplier: float = Field(default=1.0, gt=0)
+    default_peak_multiplier: float = Field(default=1.0, gt=0)
+    time_of_day_bands: list[MultiplierBand] = Field(default_factory=list)
+    peak_bands: list[MultiplierBand] = Field(default_factory=list)
+
+
+class PricingTable:
+    """Immutable, compiled form of a PricingConfig."""
+
+    __slots__ = (
+        "version",
+        "base_pickup_fee",
+        "per_km_rate",
+        "min_base_fare",
+        "max_base_fare",
+        "max_bid_multiplier",
+        "time_multipliers",
+        "peak_multipliers",
+    )
+
+    def __init__(self, config: PricingConfig) -> None:
+        self.version = config.version
+        self.base_pickup_fee = config.base_pickup_fee
+        self.per_km_rate = config.per_km_rate
+        self.min_base_fare = config.min_base_fare
+        self.max_base_fare = config.max_base_fare
+        self.max_bid_multiplier = config.max_bid_multiplier
+        self.time_multipliers = _compile_bands(config.time_of_day_bands, config.default_time_multiplier)
+        self.peak_multipliers = _compile_bands(config.peak_bands, config.default_peak_multiplier)
+
+    @staticmethod
+    def slot(when: datetime) -> int:
+        return when.weekday() * HOURS_PER_DAY + when.hour
+
+    def time_multiplier(self, when: datetime) -> float:
+        return self.time_multipliers[self.slot(when)]
+
+    def peak_multiplier(self, when: datetime) -> float:
+        return self.peak_multipliers[self.slot(when)]
+
+
+def _compile_bands(bands: list[MultiplierBand], default: float) -> tuple[float, ...]:
+    grid = [default] * (DAYS_PER_WEEK * HOURS_PER_DAY)
+    for band in bands:
+        days = band.days if band.days is not None else range(DAYS_PER_WEEK)
+        for day in days:
+            for offset, hour in band.hours():
+                grid[((day + offset) % DAYS_PER_WEEK) * HOURS_PER_DAY + hour] = band.multiplier
+    return tuple(grid)
+
+
+def compile_pricing_config(config: PricingConfig) -> PricingTable:
+    return PricingTable(config)
+
+
+def load_pricing_table(raw: bytes | str) -> PricingTable:
+    return compile_pricing_config(PricingConfig.model_validate(json.loads(raw)))
+
+
+DEFAULT_PRICING_CONFIG = PricingConfig(
+    version="v1",
+    base_pickup_fee=2.25,
+    per_km_rate=0.95,
+    min_base_fare=3.25,
+    max_base_fare=35.00,
+    max_bid_multiplier=1.5,
+    time_of_day_bands=[
+        MultiplierBand(start_hour=0, end_hour=6, multiplier=1.12),
+        MultiplierBand(start_hour=6, end_hour=11, multiplier=1.00),
+        MultiplierBand(start_hour=11, end_hour=14, multiplier=1.08),
+        MultiplierBand(start_hour=14, end_hour=17, multiplier=0.97),
+        MultiplierBand(start_hour=17, end_hour=22, multiplier=1.12),
+        MultiplierBand(start_hour=22, end_hour=24, multiplier=1.05),
+    ],
+    peak_bands=[
+        MultiplierBand(start_hour=11, end_hour=14, multiplier=1.12),
+        MultiplierBand(start_hour=18, end_hour=22, multiplier=1.12),
+    ],
+)
+DEFAULT_PRICING_TABLE = compile_pricing_config(DEFAULT_PRICING_CONFIG)
+
+_pricing_file: Optional[HotReloadFile[PricingTable]] = (
+    HotReloadFile(PRICING_CONFIG_PATH, load_pricing_table) if PRICING_CONFIG_PATH else None
+)
+
+
+def get_pricing_table() -> PricingTable:
+    """Return the active compiled pricing table (falls back to the built-in v1 config)."""
+    if _pricing_file is None:
+        return DEFAULT_PRICING_TABLE
+    return _pricing_file.get() or DEFAULT_PRICING_TABLE
+
+
+def reload_pricing_table() -> PricingTable:
+    if _pricing_file is None:
+        return DEFAULT_PRICING_TABLE
+    return _pricing_file.reload() or DEFAULT_PRICING_TABLE
+
+
+__all__ = [
+    "MultiplierBand",
+    "PricingConfig",
+    "PricingTable",
+    "DEFAULT_PRICING_CONFIG",
+    "DEFAULT_PRICING_TABLE",
+    "compile_pricing_config",
+    "load_pricing_table",
+    "get_pricing_table",
+    "reload_pricing_table",
+]
@@ -0,0 +1,181 @@
+"""
+Proof-of-delivery photos.
+
+The agent app streams the photo as the raw request body (no multipart form, which would
+be spooled whole before the handler runs). The first bytes are sniffed to make sure it is
+a JPEG, PNG or WebP image, and the rest goes straight into the object store.
+
+After the order is marked delivered a thumbnail (longest side PROOF_THUMBNAIL_PX) is
+rendered in a small thread pool, since decoding and resizing a phone photo takes tens of
+milliseconds of CPU, and its ref is saved on the order. Thumbnails need Pillow; without it
+the original photo is kept and no thumbnail is made.
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+from app.core.metrics import Counter, Histogram
+from app.crud import entity_cache
+from app.database import SessionLocal
+from app.models.order import Order
+from app.services.object_store import LocalObjectStore, get_object_store
+
+logger = logging.getLogger(__name__)
+
+PROOF_MAX_BYTES = int(os.getenv("PROOF_MAX_BYTES", str(10 * 1024 * 1024)))
+PROOF_THUMBNAIL_PX = int(os.getenv("PROOF_THUMBNAIL_PX", "320"))
+PROOF_THUMBNAIL_WORKERS = int(os.getenv("PROOF_THUMBNAIL_WORKERS", "2"))
+# Enough of the body to recognise every supported format.
+SNIFF_BYTES = 12
+
+PROOF_UPLOAD_BYTES = Histogram(
+    "localbite_proof_upload_bytes",
+    "Size of proof-of-delivery photos streamed into the object store.",
+    buckets=(64_000, 256_000, 512_000, 1_000_000, 2_000_000, 4_000_000, 8_000_000),
+)
+PROOF_UPLOAD_SECONDS = Histogram(
+    "localbite_proof_upload_seconds",
+    "Time to receive and store a proof-of-delivery photo.",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+PROOF_THUMBNAIL_FAILURES = Counter(
+    "localbite_proof_thumbnail_failures_total",
+    "Proof photo thumbnails that could not be rendered or saved.",
+)
+
+
+def sniff_image_type(head: bytes) -> str | None:
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def render_thumbnail(path: str, max_px: int = PROOF_THUMBNAIL_PX) -> bytes | None:
+    """JPEG thumbnail of the image at `path`, or None when Pillow is not installed."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+    with Image.open(path) as image:
+        # draft() lets the JPEG decoder skip most of the pixels it would throw away.
+        image.draft("RGB", (max_px, max_px))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((max_px, max_px))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=80, optimize=True)
+        return buffer.getvalue()
+
+
+def _save_thumbnail_ref(session_factory: Callable[[], Session], order_id: int, proof_ref: str, thumb_ref: str) -> None:
+    db = session_factory()
+    try:
+        # Only if the order still shows the photo the thumbnail was made from.
+        (
+            db.query(Order)
+            .filter(Order.order_id == order_id, Order.delivery_proof_ref == proof_ref)
+            .update({Order.delivery_proof_thumbnail_ref: thumb_ref}, synchronize_session=False)
+        )
+        entity_cache.invalidate(Order, order_id, db=db)
+        db.commit()
+    finally:
+        db.close()
+
+
+class ThumbnailWorker:
+    """Renders proof thumbnails off the event loop and records them on the order."""
+
+    def __init__(
+        self,
+        *,
+        workers: int = PROOF_THUMBNAIL_WORKERS,
+        store: LocalObjectStore | None = None,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ) -> None:
+        self.workers = workers
+        self.store = store
+        self.session_factory = session_factory
+        self._executor: ThreadPoolExecutor | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="proof-thumb")
+        return self._executor
+
+    async def _run(self, order_id: int, proof_ref: str) -> str | None:
+        store = self.store or get_object_store()
+        loop = asyncio.get_running_loop()
+        try:
+            data = await loop.run_in_executor(self._pool(), render_thumbnail, str(store.path_for(proof_ref)))
+            if data is None:
+                return None
+            thumb = await loop.run_in_executor(self._pool(), store.put_bytes, data)
+            await asyncio.to_thread(_save_thumbnail_ref, self.session_factory, order_id, proof_ref, thumb.ref)
+            return thumb.ref
+        except Exception:
+            PROOF_THUMBNAIL_FAILURES.inc()
+            logger.exception("Thumbnail for order %s proof %s failed", order_id, proof_ref)
+            return None
+
+    def submit(self, order_id: int, proof_ref: str) -> asyncio.Task:
+        task = asyncio.create_task(self._run(order_id, proof_ref))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def drain(self) -> None:
+        """Finish queued thumbnails and stop the pool."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+_worker: ThumbnailWorker | None = None
+
+
+def get_thumbnail_worker() -> ThumbnailWorker:
+    global _worker
+    if _worker is None:
+        _worker = ThumbnailWorker()
+    return _worker
+
+
+def set_thumbnail_worker(worker: ThumbnailWorker | None) -> ThumbnailWorker | None:
+    global _worker
+    previous, _worker = _worker, worker
+    return previous
+
+
+async def stop_thumbnail_worker() -> None:
+    global _worker
+    if _worker is not None:
+        await _worker.drain()
+        _worker = None
+
+
+__all__ = [
+    "PROOF_MAX_BYTES",
+    "PROOF_THUMBNAIL_FAILURES",
+    "PROOF_UPLOAD_BYTES",
+    "PROOF_UPLOAD_SECONDS",
+    "SNIFF_BYTES",
+    "ThumbnailWorker",
+    "get_thumbnail_worker",
+    "render_thumbnail",
+    "set_thumbnail_worker",
+    "sniff_image_type",
+    "stop_thumbnail_worker",
+]
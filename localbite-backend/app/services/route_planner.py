@@ -0,0 +1,272 @@
+"""
+Stop sequencing for an agent carrying several orders.
+
+Every active order contributes a drop-off, and a pickup at its restaurant unless the agent
+already has the food (status "on_the_way"). The sequence is an open path from the agent's
+current position that must visit each pickup before its drop-off (TSP with precedence):
+
+  1. cheapest insertion: repeatedly insert the order whose pickup/drop-off pair adds the
+     least distance at its best feasible positions;
+  2. 2-opt: reverse route segments while that shortens the path and no pickup ends up
+     behind its own drop-off.
+
+Stop-to-stop distances are haversine and cached per set of stops, since an agent's stops
+only change when an order is added or completed; the row from the agent's position is
+recomputed on every plan. ETAs use the calibrated speed of the agent's zone and hour.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Literal, Sequence
+
+from pydantic import BaseModel
+
+from app.services.distance import _haversine_km
+from app.services.eta_calibration import DEFAULT_SPEED_KMPH, get_eta_calibration
+
+ROUTE_PICKUP_SERVICE_MINUTES = float(os.getenv("ROUTE_PICKUP_SERVICE_MINUTES", "3"))
+ROUTE_DROPOFF_SERVICE_MINUTES = float(os.getenv("ROUTE_DROPOFF_SERVICE_MINUTES", "2"))
+ROUTE_MATRIX_CACHE_SIZE = 512
+
+# Coordinates are rounded to ~1 m before they key the matrix cache.
+_COORD_DECIMALS = 5
+_EPSILON = 1e-9
+
+StopKind = Literal["pickup", "dropoff"]
+
+
+class RouteStop(BaseModel):
+    order_id: int
+    kind: StopKind
+    latitude: float
+    longitude: float
+
+
+class PlannedStop(RouteStop):
+    sequence: int
+    leg_distance_km: float
+    cumulative_distance_km: float
+    eta: datetime
+
+
+class RoutePlan(BaseModel):
+    start_latitude: float
+    start_longitude: float
+    speed_kmph: float
+    total_distance_km: float
+    total_minutes: float
+    stops: list[PlannedStop]
+
+
+Point = tuple[float, float]
+
+
+@lru_cache(maxsize=ROUTE_MATRIX_CACHE_SIZE)
+def _stop_matrix(points: tuple[Point, ...]) -> tuple[tuple[float, ...], ...]:
+    size = len(points)
+    rows = [[0.0] * size for _ in range(size)]
+    for i in range(size):
+        lat1, lng1 = points[i]
+        for j in range(i + 1, size):
+            rows[i][j] = rows[j][i] = _haversine_km(lat1, lng1, *points[j])
+    return tuple(tuple(row) for row in rows)
+
+
+def distance_matrix(start: Point, stops: Sequence[RouteStop]) -> list[list[float]]:
+    """Node 0 is the start; node i is stops[i - 1]."""
+    points = tuple(
+        (round(stop.latitude, _COORD_DECIMALS), round(stop.longitude, _COORD_DECIMALS))
+        for stop in stops
+    )
+    cached = _stop_matrix(points)
+    start_row = [0.0] + [_haversine_km(start[0], start[1], *point) for point in points]
+    matrix = [start_row]
+    for i, row in enumerate(cached):
+        matrix.append([start_row[i + 1], *row])
+    return matrix
+
+
+def _path_length(route: list[int], dist: list[list[float]]) -> float:
+    return sum(dist[route[k]][route[k + 1]] for k in range(len(route) - 1))
+
+
+def _best_insertion(
+    route: list[int], pickup: int | None, dropoff: int, dist: list[list[float]]
+) -> tuple[float, int, int]:
+    """Cheapest (added km, pickup slot, drop-off slot); a slot is the index to insert before."""
+    length = len(route)
+
+    def _added(prev: int, node: int, nxt: int | None) -> float:
+        if nxt is None:
+            return dist[prev][node]
+        return dist[prev][node] + dist[node][nxt] - dist[prev][nxt]
+
+    if pickup is None:
+        best = (float("inf"), -1, -1)
+        for j in range(1, length + 1):
+            cost = _added(route[j - 1], dropoff, route[j] if j < length else None)
+            if cost < best[0]:
+                best = (cost, -1, j)
+        return best
+
+    best = (float("inf"), -1, -1)
+    for i in range(1, length + 1):
+        prev = route[i - 1]
+        nxt = route[i] if i < length else None
+        # Drop-off directly after the pickup.
+        cost = dist[prev][pickup] + dist[pickup][dropoff]
+        if nxt is not None:
+            cost += dist[dropoff][nxt] - dist[prev][nxt]
+        if cost < best[0]:
+            best = (cost, i, i)
+        pickup_cost = _added(prev, pickup, nxt)
+        for j in range(i + 1, length + 1):
+            cost = pickup_cost + _added(route[j - 1], dropoff, route[j] if j < length else None)
+            if cost < best[0]:
+                best = (cost, i, j)
+    return best
+
+
+def _cheapest_insertion(
+    requests: list[tuple[int | None, int]], dist: list[list[float]]
+) -> list[int]:
+    route = [0]
+    pending = list(requests)
+    while pending:
+        best_index, best = 0, (float("inf"), -1, -1)
+        for index, (pickup, dropoff) in enumerate(pending):
+            candidate = _best_insertion(route, pickup, dropoff, dist)
+            if candidate[0] < best[0]:
+                best_index, best = index, candidate
+        pickup, dropoff = pending.pop(best_index)
+        _, pickup_slot, dropoff_slot = best
+        if pickup is None:
+            route.insert(dropoff_slot, dropoff)
+        else:
+            route.insert(pickup_slot, pickup)
+            # The drop-off slot was computed on the route without the pickup in it.
+            route.insert(dropoff_slot + 1, dropoff)
+    return route
+
+
+def _two_opt(route: list[int], pickup_of: list[int], dist: list[list[float]]) -> list[int]:
+    """Segment reversals on the open path; a reversal is skipped if it would put a drop-off
+    before its pickup (i.e. the segment contains both)."""
+    length = len(route)
+    improved = True
+    while improved:
+        improved = False
+        position = [0] * length
+        for index, node in enumerate(route):
+            position[node] = index
+        for i in range(1, length - 1):
+            for j in range(i + 1, length):
+                a, b = route[i - 1], route[i]
+                c = route[j]
+                d = route[j + 1] if j + 1 < length else None
+                delta = dist[a][c] - dist[a][b]
+                if d is not None:
+                    delta += dist[b][d] - dist[c][d]
+                if delta >= -_EPSILON:
+                    continue
+                if any(
+                    pickup_of[route[k]] and i <= position[pickup_of[route[k]]] <= j
+                    for k in range(i, j + 1)
+                ):
+                    continue
+                route[i : j + 1] = reversed(route[i : j + 1])
+                improved = True
+                break
+            if improved:
+                break
+    return route
+
+
+def sequence_stops(start: Point, stops: Sequence[RouteStop]) -> list[int]:
+    """
+    Order `stops` (indices into the list) for an agent at `start`. A pickup must be
+    followed, at some point, by the drop-off with the same order_id.
+    """
+    if not stops:
+        return []
+    dist = distance_matrix(start, stops)
+    pickups: dict[int, int] = {}
+    dropoffs: dict[int, int] = {}
+    for node, stop in enumerate(stops, start=1):
+        (pickups if stop.kind == "pickup" else dropoffs)[stop.order_id] = node
+    orphans = set(pickups) - set(dropoffs)
+    if orphans:
+        raise ValueError(f"Pickups without a drop-off for orders {sorted(orphans)}")
+
+    requests = [(pickups.get(order_id), dropoff) for order_id, dropoff in dropoffs.items()]
+    pickup_of = [0] * (len(stops) + 1)
+    for pickup, dropoff in requests:
+        if pickup is not None:
+            pickup_of[dropoff] = pickup
+
+    route = _two_opt(_cheapest_insertion(requests, dist), pickup_of, dist)
+    return [node - 1 for node in route[1:]]
+
+
+def route_speed_kmph(latitude: float, longitude: float, at: datetime) -> float:
+    calibration = get_eta_calibration()
+    if calibration is None:
+        return DEFAULT_SPEED_KMPH
+    speed, _ = calibration.lookup(calibration.zone_for(latitude, longitude), at.hour)
+    return speed if speed > 0 else DEFAULT_SPEED_KMPH
+
+
+def plan_route(
+    start_latitude: float,
+    start_longitude: float,
+    stops: Sequence[RouteStop],
+    *,
+    now: datetime | None = None,
+    speed_kmph: float | None = None,
+) -> RoutePlan:
+    now = now or datetime.now(timezone.utc)
+    speed = speed_kmph or route_speed_kmph(start_latitude, start_longitude, now)
+    order = sequence_stops((start_latitude, start_longitude), stops)
+
+    planned: list[PlannedStop] = []
+    previous = (start_latitude, start_longitude)
+    cumulative_km = 0.0
+    elapsed_minutes = 0.0
+    for sequence, index in enumerate(order, start=1):
+        stop = stops[index]
+        leg_km = _haversine_km(previous[0], previous[1], stop.latitude, stop.longitude)
+        cumulative_km += leg_km
+        elapsed_minutes += leg_km / speed * 60.0
+        planned.append(
+            PlannedStop(
+                **stop.model_dump(),
+                sequence=sequence,
+                leg_distance_km=round(leg_km, 3),
+                cumulative_distance_km=round(cumulative_km, 3),
+                eta=now + timedelta(minutes=elapsed_minutes),
+            )
+        )
+        elapsed_minutes += (
+            ROUTE_PICKUP_SERVICE_MINUTES if stop.kind == "pickup" else ROUTE_DROPOFF_SERVICE_MINUTES
+        )
+        previous = (stop.latitude, stop.longitude)
+
+    return RoutePlan(
+        start_latitude=start_latitude,
+        start_longitude=start_longitude,
+        speed_kmph=round(speed, 2),
+        total_distance_km=round(cumulative_km, 3),
+        total_minutes=round(elapsed_minutes, 2),
+        stops=planned,
+    )
+
+
+__all__ = [
+    "PlannedStop",
+    "RoutePlan",
+    "RouteStop",
+    "distance_matrix",
+    "plan_route",
+    "route_speed_kmph",
+    "sequence_stops",
+]
@@ -0,0 +1 @@
+# Load generators, run as `python -m loadtest.<name>`
@@ -0,0 +1,473 @@
+"""
+Dispatch workflow load generator
+
+Replays the Postman `localbite-dispatch-workflow` happy path with many concurrent actors:
+ - N customers quote a fare, create orders, start dispatch and poll status until assigned
+ - M delivery agents (half students) poll the dispatch feed and bid on visible orders
+ - restaurants move assigned orders to `ready` after a short prep delay
+
+Reports p50/p95/p99 latency per endpoint, request throughput, the time-to-assignment
+distribution and, in --in-process mode, DB statements and Redis commands per order.
+
+Modes:
+    # against a running server (DB/Redis counters are not available)
+    python -m loadtest.dispatch_workflow --base-url http://localhost:8000
+
+    # self-contained: the app runs in this process on a temp SQLite file + fakeredis
+    python -m loadtest.dispatch_workflow --in-process --customers 50 --agents 20
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import httpx
+
+API = "/api/v1"
+TERMINAL_DISPATCH_STATUSES = {"assigned", "needs_fee_increase", "failed"}
+
+RESTAURANT_LAT = 38.5449
+RESTAURANT_LNG = -121.7405
+
+
+@dataclass
+class LoadStats:
+    latencies: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    errors: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    time_to_assignment: list[float] = field(default_factory=list)
+    outcomes: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    orders_created: int = 0
+    bids_placed: int = 0
+
+    def record(self, name: str, seconds: float, ok: bool) -> None:
+        self.latencies[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+
+class OpCounters:
+    def __init__(self) -> None:
+        self.db_statements = 0
+        self.redis_commands = 0
+
+
+class LoadClient:
+    """Thin httpx wrapper that times every call under a stable endpoint name."""
+
+    def __init__(self, client: httpx.AsyncClient, stats: LoadStats) -> None:
+        self._client = client
+        self._stats = stats
+
+    async def call(self, name: str, method: str, url: str, **kwargs) -> httpx.Response | None:
+        started = time.perf_counter()
+        try:
+            response = await self._client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self._stats.record(name, time.perf_counter() - started, ok=False)
+            return None
+        self._stats.record(name, time.perf_counter() - started, ok=response.is_success)
+        return response
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[rank]
+
+
+async def setup_entities(client: LoadClient, run_id: str, customers: int, agents: int):
+    restaurant = await client.call(
+        "register_restaurant",
+        "POST",
+        f"{API}/register/restaurant",
+        json={
+            "name": f"Load Test Kitchen {run_id}",
+            "email": f"kitchen-{run_id}@example.com",
+            "password": "loadtest",
+            "cuisine_type": "Halal / Middle Eastern",
+            "address": "123 Main St, Davis, CA",
+            "latitude": RESTAURANT_LAT,
+            "longitude": RESTAURANT_LNG,
+        },
+    )
+    if restaurant is None or not restaurant.is_success:
+        raise RuntimeError(f"Failed to register restaurant: {restaurant and restaurant.text}")
+    restaurant_id = restaurant.json()["id"]
+
+    user_ids: list[int] = []
+    for i in range(customers):
+        response = await client.call(
+            "register_user",
+            "POST",
+            f"{API}/register/user",
+            json={
+                "email": f"customer-{run_id}-{i}@example.com",
+                "password": "loadtest",
+                "first_name": "Load",
+                "last_name": f"Customer{i}",
+            },
+        )
+        if response is None or not response.is_success:
+            raise RuntimeError(f"Failed to register user: {response and response.text}")
+        user_ids.append(response.json()["id"])
+
+    agent_ids: list[tuple[str, bool]] = []
+    for i in range(agents):
+        is_student = i % 2 == 0
+        agent_id = f"load-{run_id}-{i}"
+        domain = "ucdavis.edu" if is_student else "example.com"
+        response = await client.call(
+            "register_agent",
+            "POST",
+            f"{API}/register/delivery-agent",
+            json={
+                "agent_id": agent_id,
+                "full_name": f"Load Rider {i}",
+                "email": f"rider-{run_id}-{i}@{domain}",
+                "password": "loadtest",
+                "phone_number": f"555-{run_id}-{i:04d}",
+                "vehicle_type": "bike",
+                "base_payout_per_delivery": 3.0,
+            },
+        )
+        if response is None or not response.is_success:
+            raise RuntimeError(f"Failed to register agent: {response and response.text}")
+        agent_ids.append((agent_id, is_student))
+
+    return restaurant_id, user_ids, agent_ids
+
+
+async def customer_loop(
+    client: LoadClient,
+    stats: LoadStats,
+    rng: random.Random,
+    *,
+    user_id: int,
+    restaurant_id: int,
+    orders: int,
+    args: argparse.Namespace,
+    ready_queue: asyncio.Queue,
+) -> None:
+    for _ in range(orders):
+        d_lat = RESTAURANT_LAT + rng.uniform(-0.02, 0.02)
+        d_lng = RESTAURANT_LNG + rng.uniform(-0.02, 0.02)
+        quote = await client.call(
+            "fare_recommendation",
+            "POST",
+            f"{API}/fares/recommendation",
+            json={
+                "user_location": {"address": "Davis, CA", "latitude": d_lat, "longitude": d_lng},
+                "restaurant_location": {
+                    "address": "123 Main St, Davis, CA",
+                    "latitude": RESTAURANT_LAT,
+                    "longitude": RESTAURANT_LNG,
+                },
+            },
+        )
+        base_fare = quote.json()["base_fare"] if quote is not None and quote.is_success else 5.0
+
+        created = await client.call(
+            "create_order",
+            "POST",
+            f"{API}/orders/",
+            json={
+                "user_id": user_id,
+                "restaurant_id": restaurant_id,
+                "order_items": [{"item_id": 1, "quantity": rng.randint(1, 3)}],
+                "base_fare": base_fare,
+                "delivery_fee": base_fare,
+                "commission_amount": round(base_fare * 0.1, 2),
+                "order_status": "pending",
+                "delivery_lat": d_lat,
+                "delivery_lng": d_lng,
+            },
+        )
+        if created is None or not created.is_success:
+            continue
+        order_id = created.json()["order_id"]
+        stats.orders_created += 1
+
+        started = await client.call(
+            "start_dispatch",
+            "POST",
+            f"{API}/dispatch/orders/{order_id}/start",
+            json={
+                "delivery_address": "1 Shields Ave, Davis, CA",
+                "phase1_wait_seconds_min": args.phase1_min,
+                "phase1_wait_seconds_max": args.phase1_max,
+                "phase2_wait_seconds": args.phase2,
+                "poll_interval_seconds": 1,
+            },
+        )
+        if started is None or not started.is_success:
+            continue
+        dispatch_started_at = time.perf_counter()
+
+        deadline = dispatch_started_at + args.order_timeout
+        outcome = "timeout"
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(args.status_poll_interval)
+            status = await client.call(
+                "dispatch_status", "GET", f"{API}/dispatch/orders/{order_id}/status"
+            )
+            if status is None or not status.is_success:
+                continue
+            current = status.json()["status"]
+            if current in TERMINAL_DISPATCH_STATUSES:
+                outcome = current
+                break
+
+        stats.outcomes[outcome] += 1
+        if outcome == "assigned":
+            stats.time_to_assignment.append(time.perf_counter() - dispatch_started_at)
+            await ready_queue.put(order_id)
+
+
+async def agent_loop(
+    client: LoadClient,
+    stats: LoadStats,
+    rng: random.Random,
+    *,
+    agent_id: str,
+    args: argparse.Namespace,
+    stop: asyncio.Event,
+) -> None:
+    bid_on: set[int] = set()
+    while not stop.is_set():
+        await asyncio.sleep(args.feed_poll_interval * rng.uniform(0.5, 1.5))
+        feed = await client.call(
+            "agent_feed", "GET", f"{API}/dispatch/agents/{agent_id}/available"
+        )
+        if feed is None or not feed.is_success:
+            continue
+        for item in feed.json()["items"]:
+            if item["order_id"] in bid_on or rng.random() > args.bid_probability:
+                continue
+            amount = round(rng.uniform(item["min_allowed_fare"], item["max_allowed_fare"]), 2)
+            response = await client.call(
+                "place_bid",
+                "POST",
+                f"{API}/delivery-bids/",
+                json={
+                    "order_id": item["order_id"],
+                    "agent_id": agent_id,
+                    "bid_amount": amount,
+                    "pool_phase": item["pool_phase"],
+                },
+            )
+            bid_on.add(item["order_id"])
+            if response is not None and response.is_success:
+                stats.bids_placed += 1
+
+
+async def restaurant_loop(
+    client: LoadClient,
+    rng: random.Random,
+    *,
+    args: argparse.Namespace,
+    ready_queue: asyncio.Queue,
+) -> None:
+    while True:
+        order_id = await ready_queue.get()
+        await asyncio.sleep(rng.uniform(0, args.prep_seconds))
+        await client.call(
+            "update_order_status",
+            "PUT",
+            f"{API}/orders/{order_id}",
+            json={"order_status": "ready"},
+        )
+        ready_queue.task_done()
+
+
+def _build_in_process_app(counters: OpCounters):
+    """Import the app against a temp SQLite DB and a counting fakeredis client."""
+    import fakeredis
+    from sqlalchemy import create_engine, event
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="localbite-load-"), "load.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+    from app.database import Base, SessionLocal
+    from app.dispatch.state_store import RedisStateStore, set_state_store
+    from main import app
+
+    sqlite_engine = create_engine(
+        f"sqlite:///{db_path}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    Base.metadata.create_all(bind=sqlite_engine)
+    SessionLocal.configure(bind=sqlite_engine)
+
+    @event.listens_for(sqlite_engine, "before_cursor_execute")
+    def _count_statement(*_args, **_kwargs):
+        counters.db_statements += 1
+
+    class CountingFakeRedis(fakeredis.aioredis.FakeRedis):
+        async def execute_command(self, *args, **options):
+            counters.redis_commands += 1
+            return await super().execute_command(*args, **options)
+
+    set_state_store(RedisStateStore(client=CountingFakeRedis(decode_responses=True)))
+    return app
+
+
+def print_report(stats: LoadStats, counters: OpCounters | None, wall_seconds: float) -> dict:
+    total_requests = sum(len(v) for v in stats.latencies.values())
+    report = {
+        "wall_seconds": round(wall_seconds, 2),
+        "requests": total_requests,
+        "throughput_rps": round(total_requests / wall_seconds, 1) if wall_seconds else 0.0,
+        "orders_created": stats.orders_created,
+        "bids_placed": stats.bids_placed,
+        "outcomes": dict(stats.outcomes),
+        "endpoints": {},
+        "time_to_assignment_seconds": {
+            "count": len(stats.time_to_assignment),
+            "p50": round(percentile(stats.time_to_assignment, 50), 2),
+            "p95": round(percentile(stats.time_to_assignment, 95), 2),
+            "p99": round(percentile(stats.time_to_assignment, 99), 2),
+            "max": round(max(stats.time_to_assignment, default=0.0), 2),
+        },
+    }
+    if counters is not None and stats.orders_created:
+        report["db_statements_per_order"] = round(counters.db_statements / stats.orders_created, 1)
+        report["redis_commands_per_order"] = round(counters.redis_commands / stats.orders_created, 1)
+
+    print(f"\n{'endpoint':<24}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name in sorted(stats.latencies):
+        values = stats.latencies[name]
+        row = {
+            "count": len(values),
+            "errors": stats.errors.get(name, 0),
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1),
+        }
+        report["endpoints"][name] = row
+        print(
+            f"{name:<24}{row['count']:>8}{row['errors']:>8}"
+            f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+        )
+
+    tta = report["time_to_assignment_seconds"]
+    print(
+        f"\nthroughput: {report['throughput_rps']} req/s over {report['wall_seconds']}s"
+        f" | orders: {stats.orders_created} | bids: {stats.bids_placed}"
+        f" | outcomes: {report['outcomes']}"
+    )
+    print(
+        f"time to assignment (s): n={tta['count']} p50={tta['p50']} p95={tta['p95']}"
+        f" p99={tta['p99']} max={tta['max']}"
+    )
+    if "db_statements_per_order" in report:
+        print(
+            f"per order: {report['db_statements_per_order']} DB statements, "
+            f"{report['redis_commands_per_order']} Redis commands"
+        )
+    return report
+
+
+async def run(args: argparse.Namespace) -> dict:
+    stats = LoadStats()
+    counters: OpCounters | None = None
+    rng = random.Random(args.seed)
+    run_id = uuid.uuid4().hex[:8]
+
+    if args.in_process:
+        counters = OpCounters()
+        transport = httpx.ASGITransport(app=_build_in_process_app(counters))
+        http = httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60)
+    else:
+        http = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+
+    async with http:
+        client = LoadClient(http, stats)
+        restaurant_id, user_ids, agent_ids = await setup_entities(
+            client, run_id, args.customers, args.agents
+        )
+        # Registration (password hashing) is setup, not part of the measured workload.
+        setup_names = {"register_restaurant", "register_user", "register_agent"}
+        for name in setup_names:
+            stats.latencies.pop(name, None)
+        if counters is not None:
+            counters.db_statements = counters.redis_commands = 0
+
+        stop = asyncio.Event()
+        ready_queue: asyncio.Queue = asyncio.Queue()
+        started = time.perf_counter()
+
+        agents = [
+            asyncio.create_task(
+                agent_loop(client, stats, random.Random(rng.random()), agent_id=agent_id, args=args, stop=stop)
+            )
+            for agent_id, _ in agent_ids
+        ]
+        restaurants = [
+            asyncio.create_task(restaurant_loop(client, random.Random(rng.random()), args=args, ready_queue=ready_queue))
+            for _ in range(args.restaurant_workers)
+        ]
+        await asyncio.gather(
+            *[
+                customer_loop(
+                    client,
+                    stats,
+                    random.Random(rng.random()),
+                    user_id=user_id,
+                    restaurant_id=restaurant_id,
+                    orders=args.orders_per_customer,
+                    args=args,
+                    ready_queue=ready_queue,
+                )
+                for user_id in user_ids
+            ]
+        )
+        stop.set()
+        await ready_queue.join()
+        wall_seconds = time.perf_counter() - started
+
+        for task in agents + restaurants:
+            task.cancel()
+        await asyncio.gather(*agents, *restaurants, return_exceptions=True)
+
+    return print_report(stats, counters, wall_seconds)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Load-test the dispatch + bidding workflow.")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--base-url", default="http://localhost:8000")
+    target.add_argument("--in-process", action="store_true", help="Run the app in-process on SQLite + fakeredis.")
+    parser.add_argument("--customers", type=int, default=20)
+    parser.add_argument("--orders-per-customer", type=int, default=2)
+    parser.add_argument("--agents", type=int, default=10)
+    parser.add_argument("--restaurant-workers", type=int, default=2)
+    parser.add_argument("--bid-probability", type=float, default=0.3)
+    parser.add_argument("--feed-poll-interval", type=float, default=1.0)
+    parser.add_argument("--status-poll-interval", type=float, default=0.5)
+    parser.add_argument("--prep-seconds", type=float, default=2.0)
+    parser.add_argument("--phase1-min", type=int, default=3)
+    parser.add_argument("--phase1-max", type=int, default=4)
+    parser.add_argument("--phase2", type=int, default=5)
+    parser.add_argument("--order-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=29)
+    parser.add_argument("--json-out", default=None, help="Also write the report as JSON.")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    if args.json_out:
+        with open(args.json_out, "w") as fh:
+            json.dump(report, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.exc import OperationalError
 from app.api import api_router
+from app.core.metrics import PROMETHEUS_CONTENT_TYPE, render_prometheus
 from app.database import engine, Base
 from app.models import Restaurant, User, DeliveryAgent, Payment, MenuItem, Order, DeliveryBid
 
@@ -13,11 +14,16 @@ async def lifespan(app: FastAPI):
         Base.metadata.create_all(bind=engine)
         # Ensure any new nullable columns exist (useful during development/hackathons
         # when the DB schema may lag behind model changes). This is idempotent.
-        from app.database import ensure_delivery_agent_columns, ensure_order_delivery_columns
+        from app.database import (
+            ensure_delivery_agent_columns,
+            ensure_order_delivery_columns,
+            ensure_table_indexes,
+        )
 
         try:
             ensure_delivery_agent_columns()
             ensure_order_delivery_columns()
+            ensure_table_indexes()
         except Exception as e:
             # Don't fail startup for this helper, just log the error.
             print(f"Warning: ensure_delivery_agent_columns failed: {e}")
@@ -26,7 +32,42 @@ async def lifespan(app: FastAPI):
         print(f"❌ Database connection failed: {e}")
     except Exception as e:
         print(f"❌ An unexpected error occurred during database startup: {e}")
+    from app.dispatch.engine import (
+        drain_dispatch_tasks,
+        resume_interrupted_dispatches,
+        start_dispatch_scheduler,
+        stop_dispatch_scheduler,
+    )
+    from app.dispatch.event_log import DISPATCH_EVENT_FLUSH_SECONDS, start_event_flusher, stop_event_flusher
+    from app.dispatch.agent_locations import (
+        AGENT_LOCATION_FLUSH_SECONDS,
+        start_location_flusher,
+        stop_location_flusher,
+    )
+    from app.dispatch.state_store import get_state_store
+    from app.services.proof_photos import stop_thumbnail_worker
+
+    from app.dispatch.worker import sharded_dispatch_enabled
+
+    if DISPATCH_EVENT_FLUSH_SECONDS > 0:
+        start_event_flusher()
+    if AGENT_LOCATION_FLUSH_SECONDS > 0:
+        start_location_flusher()
+    # In sharded mode dispatch runs in app.dispatch.worker processes instead.
+    if not sharded_dispatch_enabled():
+        try:
+            await resume_interrupted_dispatches()
+        except Exception as e:
+            print(f"Warning: resuming interrupted dispatches failed: {e}")
+        start_dispatch_scheduler()
     yield
+    await stop_dispatch_scheduler()
+    # Checkpoint running dispatches before the event log and store go away.
+    await drain_dispatch_tasks()
+    await stop_event_flusher()
+    await stop_location_flusher()
+    await stop_thumbnail_worker()
+    await get_state_store().close()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -50,3 +91,8 @@ app.include_router(api_router, prefix="/api/v1")
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(content=render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
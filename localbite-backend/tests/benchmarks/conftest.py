@@ -0,0 +1,152 @@
+"""
+Shared fixtures for the offline benchmark suite.
+
+Everything runs against an in-memory SQLite database and a fakeredis client so the
+benchmarks need neither Postgres nor a Redis server.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("pytest_benchmark")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.dispatch import engine as dispatch_engine
+from app.dispatch.state_store import RedisStateStore, set_state_store
+from app.models.delivery_agent import AgentType, DeliveryAgent, VehicleType
+from app.models.delivery_bid import DeliveryBid
+from app.models.order import Order
+from app.models.restaurant import Restaurant
+from app.models.users import User
+
+FEED_ORDERS = 100
+BIDS_PER_ORDER = 5
+
+
+@pytest.fixture
+def event_loop_runner():
+    """Run coroutines on one private loop for the whole benchmark."""
+    loop = asyncio.new_event_loop()
+    try:
+        yield loop.run_until_complete
+    finally:
+        loop.close()
+
+
+@pytest.fixture
+def fake_redis():
+    """Redis-backed dispatch state store on fakeredis, so benchmarks keep the Redis code path."""
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    previous = set_state_store(RedisStateStore(client=client))
+    yield client
+    set_state_store(previous)
+
+
+@pytest.fixture
+def db_session():
+    """In-memory SQLite shared by every session created from it (StaticPool)."""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def dispatch_feed(db_session, fake_redis, event_loop_runner):
+    """
+    Seed FEED_ORDERS unassigned orders, each with BIDS_PER_ORDER placed bids and a live
+    dispatch state, half in the student pool and half in the all-agents phase.
+    Returns the student agent id that reads the feed and the number of seeded orders.
+    """
+    db = db_session
+    db.add(User(id=1, email="bench@example.com", password_hash="x", first_name="B", last_name="M"))
+    db.add(
+        Restaurant(
+            id=1,
+            email="shahs@example.com",
+            password_hash="x",
+            name="Shah's Halal",
+            cuisine_type="Halal / Middle Eastern",
+            address="123 Main St",
+            latitude=38.5449,
+            longitude=-121.7405,
+        )
+    )
+    for i in range(BIDS_PER_ORDER):
+        db.add(
+            DeliveryAgent(
+                agent_id=f"agent-{i}",
+                full_name=f"Agent {i}",
+                email=f"agent{i}@ucdavis.edu",
+                password_hash="x",
+                phone_number=f"555-01{i:02d}",
+                agent_type=AgentType.STUDENT,
+                vehicle_type=VehicleType.BIKE,
+                base_payout_per_delivery=3.0,
+            )
+        )
+    db.flush()
+
+    # Recent, so the orders fall inside the dispatch feed's lookback window.
+    created = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(hours=1)
+    orders = []
+    for i in range(FEED_ORDERS):
+        order = Order(
+            user_id=1,
+            restaurant_id=1,
+            order_items=[{"item_id": 1, "quantity": 2}, {"item_id": 2, "quantity": 1}],
+            base_fare=6.5,
+            delivery_fee=6.5,
+            commission_amount=0.65,
+            order_status="pending",
+            created_at=created + timedelta(seconds=i),
+        )
+        db.add(order)
+        orders.append(order)
+    db.flush()
+
+    for order in orders:
+        for i in range(BIDS_PER_ORDER):
+            db.add(
+                DeliveryBid(
+                    order_id=order.order_id,
+                    agent_id=f"agent-{i}",
+                    bid_amount=6.5 + 0.25 * ((order.order_id + i) % 7),
+                    min_allowed_fare=6.5,
+                    max_allowed_fare=9.75,
+                    pool_phase="student_pool",
+                    created_at=created + timedelta(seconds=order.order_id * 10 + i),
+                )
+            )
+    db.commit()
+
+    async def _seed_states():
+        for order in orders:
+            await dispatch_engine.set_dispatch_state(
+                order.order_id,
+                status="waiting_for_bids",
+                phase="student_pool" if order.order_id % 2 else "all_agents",
+                restaurant_id=1,
+                delivery_address="1 Shields Ave, Davis, CA",
+                phase1_wait_seconds=210,
+                phase2_wait_seconds=180,
+            )
+
+    event_loop_runner(_seed_states())
+    return SimpleNamespace(agent_id="agent-0", order_count=FEED_ORDERS)
@@ -0,0 +1,80 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+BACKEND_DIR="$(cd "$SCRIPT_DIR/../.." && pwd)"
+RESULTS_DIR="$SCRIPT_DIR/results"
+
+MODE="run"
+BASELINE_NAME="${BASELINE_NAME:-baseline}"
+COMPARE_FAIL="${COMPARE_FAIL:-mean:15%}"
+PYTHON="${PYTHON:-python}"
+
+usage() {
+  cat <<USAGE
+Usage: $(basename "$0") [options] [-- extra pytest args]
+
+Runs the offline fare/dispatch microbenchmarks (SQLite + fakeredis).
+
+Options:
+  --save-baseline      Save this run as the new baseline in results/
+  --compare            Compare against the latest saved run and fail on regressions
+  --fail-on EXPR       Regression threshold for --compare (default: $COMPARE_FAIL)
+  -h, --help           Show help
+
+Environment overrides:
+  BASELINE_NAME, COMPARE_FAIL, PYTHON
+USAGE
+}
+
+EXTRA_ARGS=()
+while [[ $# -gt 0 ]]; do
+  case "$1" in
+    --save-baseline)
+      MODE="save"
+      shift
+      ;;
+    --compare)
+      MODE="compare"
+      shift
+      ;;
+    --fail-on)
+      COMPARE_FAIL="$2"
+      shift 2
+      ;;
+    -h|--help)
+      usage
+      exit 0
+      ;;
+    --)
+      shift
+      EXTRA_ARGS=("$@")
+      break
+      ;;
+    *)
+      echo "Unknown argument: $1" >&2
+      usage
+      exit 1
+      ;;
+  esac
+done
+
+cd "$BACKEND_DIR"
+export DATABASE_URL="${DATABASE_URL:-sqlite://}"
+
+CMD=("$PYTHON" -m pytest tests/benchmarks --benchmark-only)
+CMD+=(--benchmark-storage "file://$RESULTS_DIR" --benchmark-sort mean)
+
+case "$MODE" in
+  save)
+    CMD+=(--benchmark-save "$BASELINE_NAME")
+    ;;
+  compare)
+    CMD+=(--benchmark-compare --benchmark-compare-fail "$COMPARE_FAIL")
+    ;;
+esac
+
+echo "Running benchmarks ($MODE)..."
+echo "Results: $RESULTS_DIR"
+
+"${CMD[@]}" ${EXTRA_ARGS[@]+"${EXTRA_ARGS[@]}"}
@@ -0,0 +1,74 @@
+import random
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from app.api.dispatch import list_available_dispatch_requests_for_agent
+from app.dispatch.engine import _bid_sort_key
+from app.schemas.dispatch import AgentAvailableDispatchItem, AgentAvailableDispatchResponse
+
+
+def _fake_bids(count: int):
+    rng = random.Random(26)
+    base = datetime(2026, 10, 19, 18, 0, tzinfo=timezone.utc)
+    return [
+        SimpleNamespace(
+            bid_id=i,
+            bid_amount=round(rng.uniform(5.0, 9.0), 2),
+            created_at=base + timedelta(milliseconds=rng.randint(0, 240_000)),
+        )
+        for i in range(count)
+    ]
+
+
+@pytest.mark.parametrize("count", [10, 200])
+def test_bench_bid_ranking(benchmark, count):
+    bids = _fake_bids(count)
+    ranked = benchmark(sorted, bids, key=_bid_sort_key)
+    assert ranked[0] is min(bids, key=_bid_sort_key)
+
+
+def test_bench_agent_feed_assembly(benchmark, db_session, dispatch_feed, event_loop_runner):
+    def _assemble():
+        return event_loop_runner(
+            list_available_dispatch_requests_for_agent(
+                dispatch_feed.agent_id, limit=dispatch_feed.order_count, db=db_session
+            )
+        )
+
+    response = benchmark(_assemble)
+    assert len(response.items) == dispatch_feed.order_count
+
+
+@pytest.mark.parametrize("count", [100, 500])
+def test_bench_feed_serialization(benchmark, count):
+    now = datetime(2026, 10, 19, 18, 0, tzinfo=timezone.utc)
+    items = [
+        AgentAvailableDispatchItem(
+            order_id=i,
+            restaurant_id=1,
+            restaurant_name="Shah's Halal",
+            delivery_address="1 Shields Ave, Davis, CA",
+            order_items_count=3,
+            base_fare=6.5,
+            min_allowed_fare=6.5,
+            max_allowed_fare=9.75,
+            dispatch_status="waiting_for_bids",
+            pool_phase="student_pool",
+            student_only=True,
+            bidding_time_left_seconds=120,
+            dispatch_updated_at=now.isoformat(),
+            leading_bid_amount=7.0,
+            leading_bid_created_at=now,
+            total_placed_bids=4,
+            order_created_at=now,
+        )
+        for i in range(count)
+    ]
+    response = AgentAvailableDispatchResponse(agent_id="agent-0", agent_type="student", items=items)
+
+    payload = benchmark(response.model_dump_json)
+    assert payload.startswith('{"agent_id":"agent-0"')
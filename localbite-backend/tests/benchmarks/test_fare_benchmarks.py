@@ -0,0 +1,35 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from app.schemas.fare import FareRecommendationRequest
+from app.services.base_fare import get_fare_recommendation
+from app.services.distance import _haversine_km
+
+
+@pytest.fixture
+def haversine_request():
+    return FareRecommendationRequest(
+        user_location={"address": "1 Shields Ave", "latitude": 38.5382, "longitude": -121.7617},
+        restaurant_location={"address": "123 Main St", "latitude": 38.5449, "longitude": -121.7405},
+        request_time=datetime(2026, 10, 19, 19, 30),
+        incentive_metrics={"demand_index": 1.4, "supply_index": 0.8, "weather_severity": 0.2},
+    )
+
+
+def test_bench_fare_recommendation_haversine(benchmark, haversine_request):
+    result = benchmark(get_fare_recommendation, haversine_request)
+    assert result.breakdown.distance_source == "haversine"
+
+
+def test_bench_fare_recommendation_input_distance(benchmark, haversine_request):
+    payload = haversine_request.model_copy(update={"distance_km": 3.2})
+    result = benchmark(get_fare_recommendation, payload)
+    assert result.breakdown.distance_source == "input_distance"
+
+
+def test_bench_haversine_km(benchmark):
+    distance = benchmark(_haversine_km, 38.5449, -121.7405, 38.5382, -121.7617)
+    assert distance == pytest.approx(1.98, abs=0.05)
@@ -0,0 +1,53 @@
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from app.services.route_planner import RouteStop, _stop_matrix, plan_route
+
+NOW = datetime(2026, 10, 19, 18, 0, tzinfo=timezone.utc)
+
+
+def _stops(orders: int, picked_up: int) -> list[RouteStop]:
+    rng = random.Random(38)
+    stops: list[RouteStop] = []
+    for order_id in range(1, orders + 1):
+        if order_id > picked_up:
+            stops.append(
+                RouteStop(
+                    order_id=order_id,
+                    kind="pickup",
+                    latitude=38.54 + rng.uniform(-0.02, 0.02),
+                    longitude=-121.74 + rng.uniform(-0.02, 0.02),
+                )
+            )
+        stops.append(
+            RouteStop(
+                order_id=order_id,
+                kind="dropoff",
+                latitude=38.54 + rng.uniform(-0.03, 0.03),
+                longitude=-121.74 + rng.uniform(-0.03, 0.03),
+            )
+        )
+    return stops
+
+
+# (6, 0) is the twelve-stop route, the largest an agent carries; it should plan in under 10 ms.
+@pytest.mark.parametrize("orders,picked_up", [(2, 0), (4, 1), (6, 0)])
+def test_bench_plan_route(benchmark, orders, picked_up):
+    stops = _stops(orders, picked_up)
+    plan = benchmark(plan_route, 38.5449, -121.7405, stops, now=NOW, speed_kmph=28.0)
+    assert len(plan.stops) == len(stops)
+
+
+def test_bench_plan_route_cold_matrix(benchmark):
+    stops = _stops(6, 0)
+
+    def _cold():
+        _stop_matrix.cache_clear()
+        return plan_route(38.5449, -121.7405, stops, now=NOW, speed_kmph=28.0)
+
+    plan = benchmark(_cold)
+    assert len(plan.stops) == 12
@@ -0,0 +1,4 @@
+import os
+
+# app.database needs a URL at import time; tests build their own SQLite engines.
+os.environ.setdefault("DATABASE_URL", "sqlite://")
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.delivery_bids import list_agent_bids
+from app.database import Base
+from app.models.delivery_agent import DeliveryAgent, VehicleType
+from app.models.delivery_bid import DeliveryBid
+from app.models.order import Order
+
+T0 = datetime(2026, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _db():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    db.add(
+        DeliveryAgent(
+            agent_id="a1",
+            full_name="a1",
+            password_hash="x",
+            phone_number="a1",
+            vehicle_type=VehicleType.BIKE,
+            base_payout_per_delivery=3.0,
+        )
+    )
+    db.add(
+        Order(
+            order_id=1,
+            user_id=1,
+            restaurant_id=1,
+            order_items=[],
+            base_fare=6.0,
+            delivery_fee=6.0,
+            commission_amount=0.6,
+        )
+    )
+    statuses = ["accepted", "rejected", "placed", "accepted", "expired", "rejected", "accepted"]
+    for bid_id, status in enumerate(statuses, start=1):
+        db.add(
+            DeliveryBid(
+                bid_id=bid_id,
+                order_id=1,
+                agent_id="a1",
+                bid_amount=5.0 + bid_id,
+                min_allowed_fare=5.0,
+                max_allowed_fare=15.0,
+                bid_status=status,
+                # Bids 3 and 4 share a timestamp; bid_id breaks the tie.
+                created_at=T0 + timedelta(minutes=min(bid_id, 3) if bid_id <= 4 else bid_id),
+            )
+        )
+    db.commit()
+    return db
+
+
+def _page(db, **kwargs):
+    params = dict(limit=50, cursor=None, bid_status=None, since=None, until=None)
+    params.update(kwargs)
+    return list_agent_bids("a1", db=db, **params)
+
+
+def test_bid_history_pages_with_a_stable_cursor():
+    db = _db()
+    try:
+        seen = []
+        cursor = None
+        while True:
+            page = _page(db, limit=2, cursor=cursor)
+            seen.extend(bid.bid_id for bid in page.items)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        assert seen == [7, 6, 5, 4, 3, 2, 1]
+
+        summary = page.summary
+        assert summary.total == 7
+        assert summary.by_status == {"placed": 1, "accepted": 3, "rejected": 2, "expired": 1, "withdrawn": 0}
+        assert summary.won_amount == 6.0 + 9.0 + 12.0
+    finally:
+        db.close()
+
+
+def test_bid_history_filters_and_rejects_bad_cursors():
+    db = _db()
+    try:
+        accepted = _page(db, bid_status="accepted")
+        assert [bid.bid_id for bid in accepted.items] == [7, 4, 1]
+        assert accepted.next_cursor is None
+
+        # The summary follows the date range, not the status filter.
+        ranged = _page(db, bid_status="accepted", since=T0 + timedelta(minutes=3), until=T0 + timedelta(minutes=7))
+        assert [bid.bid_id for bid in ranged.items] == [4]
+        assert ranged.summary.total == 4
+        assert ranged.summary.won_amount == 9.0
+
+        with pytest.raises(HTTPException) as excinfo:
+            _page(db, cursor="not-a-cursor")
+        assert excinfo.value.status_code == 400
+
+        with pytest.raises(HTTPException) as excinfo:
+            list_agent_bids("nobody", limit=50, cursor=None, bid_status=None, since=None, until=None, db=db)
+        assert excinfo.value.status_code == 404
+    finally:
+        db.close()
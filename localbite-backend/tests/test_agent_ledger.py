@@ -0,0 +1,161 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.delivery_agents import fulfill_agent_order, get_agent_earnings
+from app.crud import agent_ledger as agent_ledger_crud
+from app.crud import delivery_agent as delivery_agent_crud
+from app.database import Base
+from app.models.agent_ledger import AgentLedgerEntry
+from app.models.delivery_agent import DeliveryAgent, VehicleType
+from app.models.order import Order
+from app.schemas.delivery_agent import DeliveryAgentUpdate, FulfillDeliveryRequest
+
+
+def _session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionFactory()
+    db.add(
+        DeliveryAgent(
+            agent_id="a1",
+            full_name="a1",
+            password_hash="x",
+            phone_number="a1",
+            vehicle_type=VehicleType.BIKE,
+            base_payout_per_delivery=3.0,
+            total_earnings=0.0,
+            total_deliveries=0,
+        )
+    )
+    for order_id, fee in ((1, 4.5), (2, 6.25)):
+        db.add(
+            Order(
+                order_id=order_id,
+                user_id=1,
+                restaurant_id=1,
+                order_items=[],
+                base_fare=fee,
+                delivery_fee=fee,
+                commission_amount=0.5,
+                order_status="on_the_way",
+                assigned_partner_id="a1",
+            )
+        )
+    db.commit()
+    db.close()
+    return SessionFactory
+
+
+def test_fulfillment_books_one_payout_per_order():
+    SessionFactory = _session_factory()
+    proof = FulfillDeliveryRequest(proof_photo_ref="proof-1")
+
+    db = SessionFactory()
+    try:
+        first = asyncio.run(fulfill_agent_order("a1", 1, proof, db))
+        again = asyncio.run(fulfill_agent_order("a1", 1, proof, db))
+        second = asyncio.run(fulfill_agent_order("a1", 2, proof, db))
+    finally:
+        db.close()
+
+    assert (first.payout_amount, first.total_earnings, first.total_deliveries) == (4.5, 4.5, 1)
+    assert (again.total_earnings, again.total_deliveries) == (4.5, 1)
+    assert (second.total_earnings, second.total_deliveries) == (10.75, 2)
+
+    db = SessionFactory()
+    try:
+        earnings = get_agent_earnings("a1", limit=20, since=None, db=db)
+        assert [entry.order_id for entry in earnings.entries] == [2, 1]
+        assert earnings.total_earnings == 10.75
+        assert agent_ledger_crud.reconcile_totals(db) == []
+    finally:
+        db.close()
+
+
+def test_concurrent_payouts_do_not_lose_updates():
+    SessionFactory = _session_factory()
+    first, second = SessionFactory(), SessionFactory()
+    try:
+        # Both sessions have read the agent before either writes.
+        assert first.get(DeliveryAgent, "a1").total_earnings == 0.0
+        assert second.get(DeliveryAgent, "a1").total_earnings == 0.0
+        agent_ledger_crud.record_delivery_payout(first, "a1", 1, 4.5)
+        first.commit()
+        agent_ledger_crud.record_delivery_payout(second, "a1", 2, 6.25)
+        second.commit()
+
+        # A retried payout for an order already booked is refused by the ledger.
+        with pytest.raises(IntegrityError):
+            agent_ledger_crud.record_delivery_payout(second, "a1", 1, 4.5)
+        second.rollback()
+    finally:
+        first.close()
+        second.close()
+
+    db = SessionFactory()
+    try:
+        agent = db.get(DeliveryAgent, "a1")
+        assert (agent.total_earnings, agent.total_deliveries) == (10.75, 2)
+    finally:
+        db.close()
+
+
+def test_manual_totals_become_adjustments_and_reconcile():
+    SessionFactory = _session_factory()
+    db = SessionFactory()
+    try:
+        agent = delivery_agent_crud.get_by_id(db, "a1")
+        delivery_agent_crud.update(db, agent, DeliveryAgentUpdate(total_earnings=12.0, total_deliveries=3))
+        adjustment = db.query(AgentLedgerEntry).one()
+        assert (adjustment.entry_type, adjustment.amount, adjustment.deliveries) == ("adjustment", 12.0, 3)
+        assert (agent.total_earnings, agent.total_deliveries) == (12.0, 3)
+
+        # Order 1 was paid out before the ledger existed.
+        db.execute(text("UPDATE orders SET agent_payout_status = 'paid', agent_payout_amount = 4.5 WHERE order_id = 1"))
+        db.execute(text("UPDATE delivery_agents SET total_earnings = 16.5, total_deliveries = 4"))
+        db.commit()
+        assert agent_ledger_crud.backfill_paid_orders(db) == 1
+        assert agent_ledger_crud.reconcile_totals(db) == []
+
+        db.execute(text("UPDATE delivery_agents SET total_earnings = 99"))
+        assert agent_ledger_crud.reconcile_totals(db, apply=True) == [("a1", 99.0, 16.5, 4, 4)]
+        db.commit()
+        assert db.get(DeliveryAgent, "a1").total_earnings == 16.5
+    finally:
+        db.close()
+
+
+def test_reconcile_keeps_a_payout_booked_while_it_runs(monkeypatch):
+    SessionFactory = _session_factory()
+    db = SessionFactory()
+    try:
+        db.execute(text("UPDATE delivery_agents SET total_earnings = 99"))
+        db.commit()
+        ledger_totals = agent_ledger_crud.ledger_totals
+
+        def _totals_then_payout(session):
+            totals = ledger_totals(session)
+            # A delivery is paid out after the ledger was summed.
+            other = SessionFactory()
+            agent_ledger_crud.record_delivery_payout(other, "a1", 1, 4.5)
+            other.commit()
+            other.close()
+            return totals
+
+        monkeypatch.setattr(agent_ledger_crud, "ledger_totals", _totals_then_payout)
+        assert agent_ledger_crud.reconcile_totals(db, apply=True) == [("a1", 103.5, 0.0, 1, 0)]
+        db.commit()
+        agent = db.get(DeliveryAgent, "a1")
+        assert (agent.total_earnings, agent.total_deliveries) == (4.5, 1)
+    finally:
+        db.close()
@@ -0,0 +1,200 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.dispatch.agent_locations import (
+    AgentLocation,
+    InMemoryAgentLocationStore,
+    RedisAgentLocationStore,
+    drain_locations,
+    set_agent_location_store,
+)
+from app.models.delivery_agent import DeliveryAgent, VehicleType
+
+T0 = datetime(2026, 10, 19, 18, 0, tzinfo=timezone.utc)
+
+
+def _ping(agent_id: str, latitude: float, longitude: float, seconds: float = 0) -> AgentLocation:
+    return AgentLocation(
+        agent_id=agent_id,
+        latitude=latitude,
+        longitude=longitude,
+        recorded_at=T0 + timedelta(seconds=seconds),
+    )
+
+
+def _store(kind: str):
+    if kind == "memory":
+        return InMemoryAgentLocationStore()
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisAgentLocationStore(fakeredis.aioredis.FakeRedis(decode_responses=True))
+
+
+@pytest.mark.parametrize("kind", ["memory", "redis"])
+def test_location_store_contract(kind):
+    store = _store(kind)
+
+    async def _exercise():
+        accepted = await store.record(
+            [
+                _ping("a1", 38.5449, -121.7405, 0),
+                _ping("a1", 38.5460, -121.7410, 4),
+                _ping("a2", 38.5600, -121.7600, 2),
+            ]
+        )
+        # Only the newest ping of a batch is kept per agent.
+        assert sorted((location.agent_id, location.latitude) for location in accepted) == [
+            ("a1", 38.546),
+            ("a2", 38.56),
+        ]
+        # A late, older ping does not move the agent back.
+        assert await store.record([_ping("a1", 38.0, -121.0, 1)]) == []
+
+        a1 = await store.get("a1")
+        assert a1.latitude == pytest.approx(38.546, abs=1e-5)
+        assert a1.longitude == pytest.approx(-121.741, abs=1e-5)
+        assert a1.recorded_at == T0 + timedelta(seconds=4)
+        assert await store.get("missing") is None
+
+        nearby = await store.nearby(38.5449, -121.7405, 1.0)
+        assert [agent.agent_id for agent in nearby] == ["a1"]
+        assert nearby[0].distance_km == pytest.approx(0.13, abs=0.01)
+
+        dirty = await store.take_dirty(10)
+        assert sorted(location.agent_id for location in dirty) == ["a1", "a2"]
+        assert await store.take_dirty(10) == []
+        await store.mark_dirty(["a2"])
+        assert [location.agent_id for location in await store.take_dirty(10)] == ["a2"]
+
+    asyncio.run(_exercise())
+
+
+def test_redis_store_keeps_the_newest_of_concurrent_pings():
+    store = _store("redis")
+
+    async def _exercise():
+        # Every request checks and writes in one step, whatever order they land in.
+        results = await asyncio.gather(
+            *(store.record([_ping("a1", 38.5 + seconds / 1000, -121.7, seconds)]) for seconds in (3, 9, 1, 7, 5))
+        )
+        assert sum(len(accepted) for accepted in results) >= 1
+        a1 = await store.get("a1")
+        assert a1.recorded_at == T0 + timedelta(seconds=9)
+        assert a1.latitude == pytest.approx(38.509, abs=1e-5)
+        assert await store.record([_ping("a1", 1.0, 1.0, 8)]) == []
+
+    asyncio.run(_exercise())
+
+
+def _session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionFactory()
+    for agent_id in ("a1", "a2"):
+        db.add(
+            DeliveryAgent(
+                agent_id=agent_id,
+                full_name=agent_id,
+                password_hash="x",
+                phone_number=agent_id,
+                vehicle_type=VehicleType.BIKE,
+                base_payout_per_delivery=3.0,
+            )
+        )
+    db.commit()
+    db.close()
+    return SessionFactory
+
+
+def test_flush_writes_latest_positions_in_bulk():
+    SessionFactory = _session_factory()
+    store = InMemoryAgentLocationStore()
+
+    async def _exercise():
+        await store.record([_ping("a1", 38.5449, -121.7405, 10), _ping("a2", 38.56, -121.76, 10)])
+        # Batches of one still drain everything.
+        assert await drain_locations(store, batch_size=1, session_factory=SessionFactory) == 2
+
+        # A flusher holding an older position (another API process) must not win.
+        stale = InMemoryAgentLocationStore()
+        await stale.record([_ping("a1", 1.0, 1.0, 5), _ping("ghost", 1.0, 1.0, 5)])
+        assert await drain_locations(stale, session_factory=SessionFactory) == 2
+
+    asyncio.run(_exercise())
+
+    db = SessionFactory()
+    try:
+        agents = {agent.agent_id: agent for agent in db.query(DeliveryAgent).all()}
+        assert (agents["a1"].current_lat, agents["a1"].current_lng) == (38.5449, -121.7405)
+        assert (agents["a2"].current_lat, agents["a2"].current_lng) == (38.56, -121.76)
+        assert agents["a1"].location_updated_at.replace(tzinfo=timezone.utc) == T0 + timedelta(seconds=10)
+    finally:
+        db.close()
+
+
+def test_failed_flush_leaves_positions_dirty():
+    store = InMemoryAgentLocationStore()
+
+    def _broken_session():
+        raise RuntimeError("database unavailable")
+
+    async def _exercise():
+        await store.record([_ping("a1", 38.5449, -121.7405)])
+        with pytest.raises(RuntimeError):
+            await drain_locations(store, session_factory=_broken_session)
+        assert store.dirty == {"a1"}
+
+    asyncio.run(_exercise())
+
+
+def test_location_endpoints_record_pings():
+    from main import app
+
+    store = InMemoryAgentLocationStore()
+    previous = set_agent_location_store(store)
+    try:
+        client = TestClient(app)
+        response = client.post(
+            "/api/v1/delivery-agents/a1/location",
+            json={"latitude": 38.5449, "longitude": -121.7405},
+        )
+        assert response.status_code == 202
+        assert response.json()["accepted"] is True
+
+        recorded_at = response.json()["recorded_at"]
+        response = client.post(
+            "/api/v1/delivery-agents/locations",
+            json={
+                "pings": [
+                    {"agent_id": "a1", "latitude": 1.0, "longitude": 1.0, "recorded_at": "2020-01-01T00:00:00Z"},
+                    {"agent_id": "a2", "latitude": 38.56, "longitude": -121.76},
+                ]
+            },
+        )
+        assert response.status_code == 202
+        assert response.json() == {"accepted": 1, "stale": 1}
+        assert store.locations["a1"].recorded_at.isoformat().startswith(recorded_at[:19])
+        assert store.dirty == {"a1", "a2"}
+
+        response = client.post(
+            "/api/v1/delivery-agents/a1/location", json={"latitude": 91, "longitude": 0}
+        )
+        assert response.status_code == 422
+        # Beyond what a Redis GEO set can index.
+        response = client.post(
+            "/api/v1/delivery-agents/a1/location", json={"latitude": 85.1, "longitude": 0}
+        )
+        assert response.status_code == 422
+    finally:
+        set_agent_location_store(previous)
@@ -0,0 +1,111 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.delivery_agents import fulfill_agent_order, get_agent_stats
+from app.api.delivery_bids import accept_delivery_bid, place_delivery_bid
+from app.database import Base
+from app.dispatch.state_store import InMemoryStateStore, set_state_store
+from app.models.agent_daily_stats import AgentDailyStats
+from app.models.delivery_agent import AgentType, DeliveryAgent, VehicleType
+from app.models.order import Order
+from app.schemas.delivery_agent import FulfillDeliveryRequest
+from app.schemas.delivery_bid import DeliveryBidCreate
+
+
+def _session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionFactory()
+    for agent_id in ("a1", "a2"):
+        db.add(
+            DeliveryAgent(
+                agent_id=agent_id,
+                full_name=agent_id,
+                password_hash="x",
+                phone_number=agent_id,
+                agent_type=AgentType.STUDENT,
+                vehicle_type=VehicleType.BIKE,
+                base_payout_per_delivery=3.0,
+                total_earnings=0.0,
+                total_deliveries=0,
+            )
+        )
+    now = datetime.now(timezone.utc)
+    for order_id, ready_minutes_ago in ((1, 20), (2, 60)):
+        db.add(
+            Order(
+                order_id=order_id,
+                user_id=1,
+                restaurant_id=1,
+                order_items=[],
+                base_fare=6.0,
+                delivery_fee=6.0,
+                commission_amount=0.6,
+                order_status="ready",
+                ready_at=now - timedelta(minutes=ready_minutes_ago),
+            )
+        )
+    db.commit()
+    db.close()
+    return SessionFactory
+
+
+def test_stats_are_rolled_up_from_bids_awards_and_deliveries():
+    SessionFactory = _session_factory()
+    previous_store = set_state_store(InMemoryStateStore())
+    db = SessionFactory()
+    try:
+        async def _exercise():
+            winner = await place_delivery_bid(DeliveryBidCreate(order_id=1, agent_id="a1", bid_amount=6.5), db)
+            await place_delivery_bid(DeliveryBidCreate(order_id=1, agent_id="a2", bid_amount=7.0), db)
+            await accept_delivery_bid(winner.bid_id, db)
+            solo = await place_delivery_bid(DeliveryBidCreate(order_id=2, agent_id="a1", bid_amount=6.5), db)
+            await accept_delivery_bid(solo.bid_id, db)
+
+            # a1 picked up order 2 while still carrying order 1.
+            now = datetime.now(timezone.utc)
+            db.get(Order, 1).assigned_at = now - timedelta(minutes=30)
+            db.get(Order, 2).assigned_at = now - timedelta(minutes=10)
+            db.commit()
+            proof = FulfillDeliveryRequest(proof_photo_ref="proof")
+            await fulfill_agent_order("a1", 1, proof, db)
+            await fulfill_agent_order("a1", 2, proof, db)
+            # A retried fulfill is not counted again.
+            await fulfill_agent_order("a1", 2, proof, db)
+
+        asyncio.run(_exercise())
+
+        a1 = get_agent_stats("a1", days=7, db=db)
+        assert (a1.bids_placed, a1.bids_won, a1.bids_lost) == (2, 2, 0)
+        assert a1.acceptance_rate == 1.0
+        assert a1.avg_bid_to_base_fare == pytest.approx(6.5 / 6.0, abs=1e-4)
+        assert a1.deliveries == 2
+        # Order 2 was ready an hour ago.
+        assert a1.on_time_rate == 0.5
+        assert a1.earnings == 13.0
+        # The overlapping trip counts once: 30 minutes, not 40.
+        assert a1.active_hours == pytest.approx(0.5, abs=0.01)
+        assert a1.earnings_per_hour == pytest.approx(26.0, abs=0.5)
+        assert len(a1.daily) == 1
+
+        a2 = get_agent_stats("a2", days=7, db=db)
+        assert (a2.bids_placed, a2.bids_won, a2.bids_lost) == (1, 0, 1)
+        assert (a2.acceptance_rate, a2.win_rate) == (0.0, 0.0)
+        assert a2.avg_bid_to_base_fare == pytest.approx(7.0 / 6.0, abs=1e-4)
+        assert a2.on_time_rate is None and a2.earnings_per_hour is None
+
+        # Reading the stats touches one row per agent per day.
+        assert db.query(AgentDailyStats).count() == 2
+    finally:
+        db.close()
+        set_state_store(previous_store)
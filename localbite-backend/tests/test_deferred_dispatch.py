@@ -0,0 +1,128 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.crud import order as order_crud
+from app.crud import restaurant_prep_stats as prep_stats_crud
+from app.database import Base
+from app.dispatch import engine as dispatch_engine
+from app.dispatch.clock import VirtualClock
+from app.dispatch.state_store import InMemoryStateStore
+from app.models.order import Order
+from app.schemas.order import OrderUpdate
+from app.services.prep_time import estimate_prep_time, plan_deferred_dispatch
+
+
+def _session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def _order(db, restaurant_id: int, created_at: datetime) -> Order:
+    order = Order(
+        user_id=1,
+        restaurant_id=restaurant_id,
+        order_items=[],
+        base_fare=6.0,
+        delivery_fee=6.0,
+        commission_amount=0.6,
+        order_status="preparing",
+        created_at=created_at,
+    )
+    db.add(order)
+    db.commit()
+    return order
+
+
+def test_prep_stats_are_updated_when_orders_become_ready():
+    db = _session_factory()()
+    now = datetime.now(timezone.utc)
+    for minutes in (20, 24, 22, 26, 28):
+        order = _order(db, 3, now - timedelta(minutes=minutes))
+        order_crud.update(db, order, OrderUpdate(order_status="ready"))
+    # Marking an order ready again does not count it twice.
+    order_crud.update(db, order, OrderUpdate(order_status="ready"))
+
+    estimate = estimate_prep_time(db, 3)
+    assert estimate.source == "history"
+    assert estimate.samples == 5
+    # EWMA (alpha 0.2) seeded with the first sample: 20 -> 20.8 -> 21.04 -> 22.03 -> 23.23.
+    assert estimate.expected_minutes == 23.23
+    assert estimate.stddev_minutes is not None and 3.0 < estimate.stddev_minutes < 3.3
+    assert estimate_prep_time(db, 4).source == "default"
+    db.close()
+
+
+def test_prep_samples_recorded_from_stale_sessions_all_count():
+    SessionFactory = _session_factory()
+    first, second = SessionFactory(), SessionFactory()
+    try:
+        prep_stats_crud.record_prep_time(first, 3, 20.0)
+        first.commit()
+        # Both requests hold the stats before either records its sample.
+        held = [prep_stats_crud.get_by_restaurant(session, 3) for session in (first, second)]
+        assert [stats.samples for stats in held] == [1, 1]
+        prep_stats_crud.record_prep_time(first, 3, 24.0)
+        first.commit()
+        prep_stats_crud.record_prep_time(second, 3, 22.0)
+        second.commit()
+
+        stats = prep_stats_crud.get_by_restaurant(SessionFactory(), 3)
+        assert stats.samples == 3
+        assert stats.mean_minutes == pytest.approx(22.0)
+        assert stats.m2 == pytest.approx(8.0)
+        assert stats.ewma_minutes == pytest.approx(0.2 * 22 + 0.8 * (0.2 * 24 + 0.8 * 20))
+    finally:
+        first.close()
+        second.close()
+
+
+def test_deferred_dispatch_starts_from_the_schedule():
+    SessionFactory = _session_factory()
+    db = SessionFactory()
+    clock = VirtualClock()
+    order = _order(db, 1, clock.now())
+    order_id = order.order_id
+    db.close()
+
+    estimate = estimate_prep_time(SessionFactory(), 1)
+    plan = plan_deferred_dispatch(
+        ordered_at=clock.now(), estimate=estimate, phase1_wait_seconds=240, now=clock.now()
+    )
+    # 15 min default prep - 4 min student pool - 5 min pickup lead.
+    assert plan.deferred and plan.dispatch_at == clock.now() + timedelta(minutes=6)
+    store = InMemoryStateStore()
+
+    async def _main():
+        with dispatch_engine.dispatch_runtime(
+            clock=clock, rng=random.Random(1), session_factory=SessionFactory, state_store=store
+        ):
+            await dispatch_engine.schedule_dispatch(
+                dispatch_engine.DeferredDispatch(
+                    order_id=order_id,
+                    restaurant_id=1,
+                    delivery_address="1 Shields Ave",
+                    run_at=plan.dispatch_at,
+                    expected_ready_at=plan.expected_ready_at,
+                )
+            )
+            clock.advance(300)
+            assert await dispatch_engine.run_due_dispatches() == []
+            assert store.states[order_id]["status"] == "scheduled"
+            clock.advance(60)
+            assert await dispatch_engine.run_due_dispatches() == [order_id]
+            assert store.scheduled == {}
+            await dispatch_engine.cancel_dispatch(order_id)
+
+    asyncio.run(_main())
+    assert store.states[order_id]["status"] == "cancelled"
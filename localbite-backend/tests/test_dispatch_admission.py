@@ -0,0 +1,138 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.dispatch import engine as dispatch_engine
+from app.dispatch.admission import (
+    AdmissionController,
+    AdmissionLimits,
+    AdmissionRejected,
+    admission_priority,
+)
+from app.dispatch.clock import VirtualClock
+from app.dispatch.state_store import InMemoryStateStore
+from app.models.order import Order
+
+T0 = datetime(2026, 10, 19, 18, 0, tzinfo=timezone.utc)
+
+
+def test_priority_prefers_older_and_more_valuable_orders():
+    older = admission_priority(T0, 5.0, seconds_per_dollar=30)
+    newer = admission_priority(T0 + timedelta(minutes=2), 5.0, seconds_per_dollar=30)
+    # $5 more is worth 150s of waiting, enough to jump an order placed two minutes earlier.
+    newer_pricier = admission_priority(T0 + timedelta(minutes=2), 10.0, seconds_per_dollar=30)
+    assert older < newer
+    assert newer_pricier < older
+
+
+def test_controller_caps_and_queue_order():
+    controller = AdmissionController(
+        AdmissionLimits(max_active=3, max_active_per_restaurant=2, max_waiting=3)
+    )
+    assert controller.try_admit(1, restaurant_id=10, priority=1.0)
+    assert controller.try_admit(2, restaurant_id=10, priority=2.0)
+    # Restaurant 10 is at its cap, restaurant 20 is not.
+    assert not controller.try_admit(3, restaurant_id=10, priority=3.0)
+    assert controller.try_admit(4, restaurant_id=20, priority=4.0)
+    assert not controller.try_admit(5, restaurant_id=20, priority=5.0)
+
+    assert controller.enqueue(3, 10, 3.0, "three") == 1
+    assert controller.enqueue(5, 20, 5.0, "five") == 2
+    assert controller.enqueue(6, 30, 0.5, "six") == 1
+    with pytest.raises(AdmissionRejected):
+        controller.enqueue(7, 30, 0.1, "seven")
+
+    # A slot at restaurant 20 frees up: order 6 (best priority) takes the global slot.
+    controller.release(4)
+    assert controller.pop_admissible() == [(6, "six")]
+    # Restaurant 10 frees up but the global cap is still full.
+    controller.release(1)
+    controller.release(6)
+    assert controller.pop_admissible() == [(3, "three"), (5, "five")]
+    assert controller.waiting_count == 0
+    assert controller.active_count == 3
+    assert controller.active_for_restaurant(10) == 2
+
+
+def test_restaurant_at_cap_does_not_block_others():
+    controller = AdmissionController(
+        AdmissionLimits(max_active=10, max_active_per_restaurant=1, max_waiting=10)
+    )
+    assert controller.try_admit(1, 10, 1.0)
+    controller.enqueue(2, 10, 2.0, "two")
+    # Order 2 waits for restaurant 10 only; order 3 of another restaurant goes straight in.
+    assert controller.try_admit(3, 20, 3.0)
+    controller.remove(2)
+    assert controller.pop_admissible() == []
+
+
+def _session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def test_queued_dispatch_starts_when_capacity_frees_up():
+    SessionFactory = _session_factory()
+    db = SessionFactory()
+    for order_id in (1, 2, 3):
+        db.add(
+            Order(
+                order_id=order_id,
+                user_id=1,
+                restaurant_id=1,
+                order_items=[],
+                base_fare=6.0,
+                delivery_fee=6.0,
+                commission_amount=0.6,
+                order_status="pending",
+            )
+        )
+    db.commit()
+    db.close()
+    store = InMemoryStateStore()
+    clock = VirtualClock()
+    previous = dispatch_engine.set_admission_controller(
+        AdmissionController(AdmissionLimits(max_active=1, max_active_per_restaurant=1, max_waiting=1))
+    )
+
+    async def _main():
+        with dispatch_engine.dispatch_runtime(
+            clock=clock, rng=random.Random(3), session_factory=SessionFactory, state_store=store
+        ):
+            window = {"phase1_wait_seconds_min": 60, "phase1_wait_seconds_max": 60, "phase2_wait_seconds": 60}
+            assert await dispatch_engine.start_dispatch_background(1, 1, "1 Shields Ave", **window)
+            assert await dispatch_engine.start_dispatch_background(2, 1, "2 Shields Ave", **window)
+            assert dispatch_engine.is_dispatch_queued(2)
+            assert store.states[2]["status"] == "queued"
+            with pytest.raises(AdmissionRejected):
+                await dispatch_engine.start_dispatch_background(3, 1, "3 Shields Ave", **window)
+            # Already queued.
+            assert not await dispatch_engine.start_dispatch_background(2, 1, "2 Shields Ave", **window)
+
+            await clock.run_until_complete(clock.sleep(30))
+            assert not dispatch_engine.is_dispatch_running(2)
+            await dispatch_engine.mark_order_assigned(1, "student-1")
+            await clock.run_until_complete(clock.sleep(10))
+            assert not dispatch_engine.is_dispatch_running(1)
+            assert dispatch_engine.is_dispatch_running(2)
+            assert dispatch_engine.dispatch_queue_depth() == 0
+
+            await dispatch_engine.cancel_dispatch(2)
+
+    try:
+        asyncio.run(_main())
+    finally:
+        dispatch_engine.set_admission_controller(previous)
+    assert store.states[1]["status"] == "assigned"
+    assert store.states[2]["status"] == "cancelled"
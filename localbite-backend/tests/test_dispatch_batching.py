@@ -0,0 +1,258 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.dispatch import cancel_order_dispatch
+from app.api.orders import update_order
+from app.crud import dispatch_bundle as bundle_crud
+from app.database import Base
+from app.dispatch import engine as dispatch_engine
+from app.dispatch.clock import VirtualClock
+from app.dispatch.state_store import InMemoryStateStore
+from app.models.delivery_bid import DeliveryBid
+from app.models.order import Order
+from app.models.restaurant import Restaurant
+from app.schemas.order import OrderUpdate
+from app.services.batching import find_batch, quote_bundle
+
+CREATED = datetime(2026, 10, 19, 18, 0, tzinfo=timezone.utc)
+
+
+def _order(order_id: int, lat: float, lng: float, *, restaurant_id: int = 1, minutes_later: int = 0) -> Order:
+    return Order(
+        order_id=order_id,
+        user_id=1,
+        restaurant_id=restaurant_id,
+        order_items=[],
+        base_fare=6.0,
+        delivery_fee=6.0,
+        commission_amount=0.6,
+        order_status="preparing",
+        delivery_lat=lat,
+        delivery_lng=lng,
+        created_at=CREATED + timedelta(minutes=minutes_later),
+    )
+
+
+def _restaurant() -> Restaurant:
+    return Restaurant(
+        id=1,
+        email="shahs@example.com",
+        password_hash="x",
+        name="Shah's Halal",
+        cuisine_type="halal",
+        address="Silo, UC Davis",
+        latitude=38.5382,
+        longitude=-121.7535,
+    )
+
+
+def test_find_batch_and_quote_bundle():
+    lead = _order(1, 38.5449, -121.7405)
+    nearby = _order(2, 38.5461, -121.7380, minutes_later=4)
+    also_nearby = _order(3, 38.5430, -121.7420, minutes_later=-3)
+    too_far = _order(4, 38.5600, -121.6900)
+    too_late = _order(5, 38.5450, -121.7400, minutes_later=25)
+    other_restaurant = _order(6, 38.5450, -121.7400, restaurant_id=2)
+
+    batch = find_batch(
+        lead, [nearby, also_nearby, too_far, too_late, other_restaurant], prep_minutes=15
+    )
+    assert [order.order_id for order in batch] == [1, 3, 2]
+
+    quote = quote_bundle(_restaurant(), batch, request_time=CREATED)
+    assert quote.lead_order_id == 1
+    # Nearest drop-off first from the restaurant.
+    assert quote.order_ids == [3, 1, 2]
+    assert quote.route_distance_km > 0
+    assert quote.base_fare < quote.separate_base_fare_total
+
+
+def test_bundle_award_assigns_every_member_atomically():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionFactory()
+    db.add_all([_order(1, 38.5449, -121.7405), _order(2, 38.5461, -121.7380), _order(3, 38.5430, -121.7420)])
+    db.commit()
+    bundle = bundle_crud.create(
+        db, restaurant_id=1, lead_order_id=1, order_ids=[3, 1, 2], route_distance_km=2.1, base_fare=8.0
+    )
+    bundle_id = bundle.bundle_id
+    assert bundle_crud.effective_base_fare(db, db.get(Order, 1)) == 8.0
+    assert bundle_crud.effective_base_fare(db, db.get(Order, 2)) == 6.0
+    db.add(
+        DeliveryBid(
+            order_id=1,
+            agent_id="student-7",
+            bid_amount=10.0,
+            min_allowed_fare=8.0,
+            max_allowed_fare=12.0,
+            pool_phase="student_pool",
+        )
+    )
+    db.commit()
+    db.close()
+    store = InMemoryStateStore()
+
+    async def _main():
+        with dispatch_engine.dispatch_runtime(session_factory=SessionFactory, state_store=store):
+            await dispatch_engine.bundle_orders(bundle_id, 1, [3, 1, 2])
+            assert store.states[2]["status"] == "bundled"
+            return await dispatch_engine.auto_award_best_bid(1)
+
+    assert asyncio.run(_main()) == (True, "student-7")
+    db = SessionFactory()
+    orders = {order.order_id: order for order in db.query(Order).all()}
+    assert {order.assigned_partner_id for order in orders.values()} == {"student-7"}
+    assert sorted(order.delivery_fee for order in orders.values()) == [3.33, 3.33, 3.34]
+    assert orders[1].delivery_fee == 3.34
+    assert bundle_crud.get_by_id(db, bundle_id).status == "assigned"
+    db.close()
+    assert store.assigned == {1, 2, 3}
+
+
+def _open_bundle_with_lead_bid():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionFactory()
+    db.add_all([_order(1, 38.5449, -121.7405), _order(2, 38.5461, -121.7380), _order(3, 38.5430, -121.7420)])
+    db.commit()
+    bundle_id = bundle_crud.create(
+        db, restaurant_id=1, lead_order_id=1, order_ids=[3, 1, 2], route_distance_km=2.1, base_fare=8.0
+    ).bundle_id
+    # Priced against the bundle's fare.
+    db.add(
+        DeliveryBid(
+            order_id=1,
+            agent_id="student-7",
+            bid_amount=11.0,
+            min_allowed_fare=8.0,
+            max_allowed_fare=12.0,
+            pool_phase="student_pool",
+        )
+    )
+    db.commit()
+    db.close()
+    return SessionFactory, bundle_id
+
+
+def _cancel_in_bundle(order_id: int):
+    SessionFactory, bundle_id = _open_bundle_with_lead_bid()
+    store = InMemoryStateStore()
+    clock = VirtualClock()
+
+    async def _main():
+        with dispatch_engine.dispatch_runtime(
+            clock=clock, rng=random.Random(3), session_factory=SessionFactory, state_store=store
+        ):
+            await dispatch_engine.bundle_orders(bundle_id, 1, [3, 1, 2])
+            assert await dispatch_engine.start_dispatch_background(1, 1, "1 Shields Ave")
+            await clock.run_until_complete(clock.sleep(10))
+            lead_task = dispatch_engine._dispatch_tasks[1]
+
+            db = SessionFactory()
+            try:
+                await cancel_order_dispatch(order_id, None, db=db)
+            finally:
+                db.close()
+            await clock.run_until_complete(clock.sleep(5))
+            running = {member: dispatch_engine.is_dispatch_running(member) for member in (1, 2, 3)}
+            restarted_lead = dispatch_engine._dispatch_tasks.get(1) is not lead_task
+            addresses = {member: store.states[member].get("delivery_address") for member in (1, 2, 3)}
+            for member in (1, 2, 3):
+                await dispatch_engine.cancel_dispatch(member)
+            return running, restarted_lead, addresses
+
+    running, restarted_lead, addresses = asyncio.run(_main())
+    db = SessionFactory()
+    assert bundle_crud.get_by_id(db, bundle_id).status == "dissolved"
+    assert {order.bundle_id for order in db.query(Order).all()} == {None}
+    assert bundle_crud.effective_base_fare(db, db.get(Order, 1)) == 6.0
+    assert [bid.bid_status for bid in db.query(DeliveryBid).all()] == ["rejected"]
+    db.close()
+    return running, restarted_lead, addresses
+
+
+def test_cancelling_the_bundle_lead_dispatches_the_other_orders():
+    running, _, addresses = _cancel_in_bundle(1)
+    assert running == {1: False, 2: True, 3: True}
+    # Parked members broadcast their drop-off point.
+    assert addresses[2] == "38.54610,-121.73800"
+
+
+def test_cancelling_a_bundle_member_restarts_the_lead_on_its_own_fare():
+    running, restarted_lead, addresses = _cancel_in_bundle(2)
+    assert running == {1: True, 2: False, 3: True}
+    assert restarted_lead
+    assert addresses[1] == "1 Shields Ave"
+
+
+def test_bundle_conflict_on_award_dissolves_the_bundle():
+    SessionFactory, bundle_id = _open_bundle_with_lead_bid()
+    db = SessionFactory()
+    db.get(Order, 2).order_status = "cancelled"
+    db.commit()
+    db.close()
+    store = InMemoryStateStore()
+    clock = VirtualClock()
+
+    async def _main():
+        with dispatch_engine.dispatch_runtime(
+            clock=clock, rng=random.Random(3), session_factory=SessionFactory, state_store=store
+        ):
+            await dispatch_engine.bundle_orders(bundle_id, 1, [3, 1, 2])
+            awarded = await dispatch_engine.auto_award_best_bid(1)
+            running = {member: dispatch_engine.is_dispatch_running(member) for member in (1, 2, 3)}
+            for member in (1, 3):
+                await dispatch_engine.cancel_dispatch(member)
+            return awarded, running
+
+    assert asyncio.run(_main()) == ((False, None), {1: True, 2: False, 3: True})
+    db = SessionFactory()
+    assert bundle_crud.get_by_id(db, bundle_id).status == "dissolved"
+    assert db.get(Order, 3).assigned_partner_id is None
+    db.close()
+
+
+def test_cancelling_the_bundle_lead_order_dispatches_the_other_orders():
+    SessionFactory, bundle_id = _open_bundle_with_lead_bid()
+    store = InMemoryStateStore()
+    clock = VirtualClock()
+
+    async def _main():
+        with dispatch_engine.dispatch_runtime(
+            clock=clock, rng=random.Random(3), session_factory=SessionFactory, state_store=store
+        ):
+            await dispatch_engine.bundle_orders(bundle_id, 1, [3, 1, 2])
+            assert await dispatch_engine.start_dispatch_background(1, 1, "1 Shields Ave")
+            await clock.run_until_complete(clock.sleep(10))
+
+            db = SessionFactory()
+            try:
+                await update_order(1, OrderUpdate(order_status="cancelled"), db)
+            finally:
+                db.close()
+            running = {member: dispatch_engine.is_dispatch_running(member) for member in (1, 2, 3)}
+            for member in (2, 3):
+                await dispatch_engine.cancel_dispatch(member)
+            return running
+
+    assert asyncio.run(_main()) == {1: False, 2: True, 3: True}
+    assert store.states[1]["status"] == "cancelled"
+    db = SessionFactory()
+    assert bundle_crud.get_by_id(db, bundle_id).status == "dissolved"
+    db.close()
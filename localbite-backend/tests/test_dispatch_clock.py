@@ -0,0 +1,237 @@
+import asyncio
+import math
+import random
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.orders import update_order
+from app.database import Base
+from app.dispatch import engine as dispatch_engine
+from app.dispatch.clock import SystemClock, VirtualClock
+from app.dispatch.state_store import InMemoryStateStore
+from app.models.delivery_bid import DeliveryBid
+from app.models.order import Order
+from app.schemas.order import OrderUpdate
+
+POLL_SECONDS = 5
+
+
+@pytest.fixture
+def dispatch_env():
+    """Shared in-memory SQLite for the engine's sessions."""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = TestingSessionLocal()
+    order = Order(
+        user_id=1,
+        restaurant_id=1,
+        order_items=[{"item_id": 1, "quantity": 1}],
+        base_fare=6.5,
+        delivery_fee=6.5,
+        commission_amount=0.65,
+        order_status="pending",
+    )
+    db.add(order)
+    db.commit()
+    order_id = order.order_id
+    db.close()
+    yield TestingSessionLocal, order_id
+    engine.dispose()
+
+
+def _phase1_end(seed: int) -> int:
+    """When phase 1 ends for a seeded RNG: the drawn window rounded up to a poll."""
+    window = int(random.Random(seed).uniform(180, 240))
+    return math.ceil(window / POLL_SECONDS) * POLL_SECONDS
+
+
+def test_virtual_clock_wakes_sleepers_in_deadline_order():
+    clock = VirtualClock()
+    woke: list[tuple[str, float]] = []
+
+    async def _sleeper(name: str, seconds: float) -> None:
+        await clock.sleep(seconds)
+        woke.append((name, clock.monotonic()))
+
+    async def _main() -> None:
+        tasks = [asyncio.create_task(_sleeper(n, s)) for n, s in (("c", 30), ("a", 10), ("b", 20))]
+        for task in tasks:
+            clock.track(task)
+        await clock.run_until_complete(asyncio.gather(*tasks))
+
+    asyncio.run(_main())
+    assert woke == [("a", 10.0), ("b", 20.0), ("c", 30.0)]
+
+
+def test_unclaimed_order_needs_fee_increase_in_virtual_time(dispatch_env):
+    SessionFactory, order_id = dispatch_env
+    clock = VirtualClock()
+
+    async def _main():
+        with dispatch_engine.dispatch_runtime(
+            clock=clock,
+            rng=random.Random(30),
+            session_factory=SessionFactory,
+            state_store=InMemoryStateStore(),
+        ):
+            await clock.run_until_complete(
+                dispatch_engine.dispatch_order(order_id, 1, "1 Shields Ave, Davis, CA")
+            )
+            return await dispatch_engine.get_dispatch_state(order_id)
+
+    started = time.perf_counter()
+    state = asyncio.run(_main())
+
+    assert state["status"] == "needs_fee_increase"
+    assert clock.monotonic() == _phase1_end(30) + 180
+    assert time.perf_counter() - started < 5.0
+    # The runtime is restored once the context exits.
+    assert isinstance(dispatch_engine.get_dispatch_clock(), SystemClock)
+
+
+def test_phase2_bid_is_awarded_after_rolling_close(dispatch_env):
+    SessionFactory, order_id = dispatch_env
+    clock = VirtualClock()
+    bid_at = _phase1_end(7) + 12
+
+    async def _agent() -> None:
+        await clock.sleep(bid_at)
+        db = SessionFactory()
+        bid = DeliveryBid(
+            order_id=order_id,
+            agent_id="agent-late",
+            bid_amount=7.25,
+            min_allowed_fare=6.5,
+            max_allowed_fare=9.75,
+            pool_phase="all_agents",
+        )
+        db.add(bid)
+        db.commit()
+        await dispatch_engine.record_bid(order_id, bid.bid_id, bid.bid_amount)
+        db.close()
+
+    async def _main() -> None:
+        with dispatch_engine.dispatch_runtime(
+            clock=clock,
+            rng=random.Random(7),
+            session_factory=SessionFactory,
+            state_store=InMemoryStateStore(),
+        ):
+            clock.track(asyncio.create_task(_agent()))
+            await clock.run_until_complete(
+                dispatch_engine.dispatch_order(
+                    order_id, 1, "1 Shields Ave, Davis, CA", rolling_bid_close_seconds=60
+                )
+            )
+
+    asyncio.run(_main())
+
+    # The bid is first seen on the next poll, then the 60s close window runs out.
+    first_seen = math.ceil(bid_at / POLL_SECONDS) * POLL_SECONDS
+    assert clock.monotonic() == first_seen + 60
+
+    db = SessionFactory()
+    order = db.get(Order, order_id)
+    assert order.assigned_partner_id == "agent-late"
+    assert order.delivery_fee == 7.25
+    db.close()
+
+
+def _place_bid(SessionFactory, order_id: int, agent_id: str) -> DeliveryBid:
+    db = SessionFactory()
+    bid = DeliveryBid(
+        order_id=order_id,
+        agent_id=agent_id,
+        bid_amount=7.25,
+        min_allowed_fare=6.5,
+        max_allowed_fare=9.75,
+        pool_phase="all_agents",
+    )
+    db.add(bid)
+    db.commit()
+    db.refresh(bid)
+    db.close()
+    return bid
+
+
+def test_order_cancelled_under_its_bids_ends_the_dispatch(dispatch_env):
+    SessionFactory, order_id = dispatch_env
+    clock = VirtualClock()
+    store = InMemoryStateStore()
+    bid_at = _phase1_end(7) + 12
+
+    async def _agent_then_customer() -> None:
+        await clock.sleep(bid_at)
+        bid = _place_bid(SessionFactory, order_id, "agent-late")
+        await dispatch_engine.record_bid(order_id, bid.bid_id, bid.bid_amount)
+        # Cancelled by a write that does not go through the orders API.
+        db = SessionFactory()
+        db.get(Order, order_id).order_status = "cancelled"
+        db.commit()
+        db.close()
+
+    async def _main() -> None:
+        with dispatch_engine.dispatch_runtime(
+            clock=clock, rng=random.Random(7), session_factory=SessionFactory, state_store=store
+        ):
+            clock.track(asyncio.create_task(_agent_then_customer()))
+            await clock.run_until_complete(
+                dispatch_engine.dispatch_order(
+                    order_id, 1, "1 Shields Ave, Davis, CA", rolling_bid_close_seconds=60
+                )
+            )
+
+    asyncio.run(_main())
+
+    # The rolling close fails to award once and the loop ends instead of re-arming.
+    assert clock.monotonic() == math.ceil(bid_at / POLL_SECONDS) * POLL_SECONDS + 60
+    assert store.states[order_id]["status"] == "cancelled"
+    assert not store.bids.get(order_id)
+    db = SessionFactory()
+    assert db.get(Order, order_id).assigned_partner_id is None
+    db.close()
+
+
+def test_cancelling_through_the_orders_api_stops_the_dispatch(dispatch_env):
+    SessionFactory, order_id = dispatch_env
+    clock = VirtualClock()
+    store = InMemoryStateStore()
+    bid_at = _phase1_end(7) + 12
+
+    async def _agent_then_customer() -> None:
+        await clock.sleep(bid_at)
+        bid = _place_bid(SessionFactory, order_id, "agent-late")
+        await dispatch_engine.record_bid(order_id, bid.bid_id, bid.bid_amount)
+        await clock.sleep(20)
+        db = SessionFactory()
+        try:
+            await update_order(order_id, OrderUpdate(order_status="cancelled"), db)
+        finally:
+            db.close()
+
+    async def _main() -> None:
+        with dispatch_engine.dispatch_runtime(
+            clock=clock, rng=random.Random(7), session_factory=SessionFactory, state_store=store
+        ):
+            assert await dispatch_engine.start_dispatch_background(
+                order_id, 1, "1 Shields Ave, Davis, CA", rolling_bid_close_seconds=60
+            )
+            await clock.run_until_complete(_agent_then_customer())
+            assert not dispatch_engine.is_dispatch_running(order_id)
+
+    asyncio.run(_main())
+
+    assert clock.monotonic() == bid_at + 20
+    state = store.states[order_id]
+    assert (state["status"], state["note"]) == ("cancelled", "order cancelled")
+    assert not store.bids.get(order_id)
@@ -0,0 +1,126 @@
+import asyncio
+import random
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.dispatch import engine as dispatch_engine
+from app.dispatch.clock import VirtualClock
+from app.dispatch.event_log import (
+    drain_events,
+    flush_events_once,
+    load_events,
+    rebuild_states,
+    write_event_rows,
+)
+from app.dispatch.state_store import InMemoryStateStore, RedisStateStore, event_row
+from app.models.delivery_bid import DeliveryBid
+from app.models.dispatch_state import DispatchEventRecord
+from app.models.order import Order
+
+
+def _session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def _create_order(SessionFactory) -> int:
+    db = SessionFactory()
+    order = Order(
+        user_id=1,
+        restaurant_id=1,
+        order_items=[],
+        base_fare=6.0,
+        delivery_fee=6.0,
+        commission_amount=0.6,
+        order_status="pending",
+    )
+    db.add(order)
+    db.commit()
+    order_id = order.order_id
+    db.close()
+    return order_id
+
+
+def test_replayed_events_rebuild_live_dispatch_state():
+    fakeredis = pytest.importorskip("fakeredis")
+    SessionFactory = _session_factory()
+    order_id = _create_order(SessionFactory)
+    store = RedisStateStore(client=fakeredis.aioredis.FakeRedis(decode_responses=True))
+    clock = VirtualClock()
+
+    async def _bid(agent_id: str, at: float, amount: float) -> None:
+        await clock.sleep(at)
+        db = SessionFactory()
+        bid = DeliveryBid(
+            order_id=order_id,
+            agent_id=agent_id,
+            bid_amount=amount,
+            min_allowed_fare=6.0,
+            max_allowed_fare=9.0,
+            pool_phase="student_pool",
+        )
+        db.add(bid)
+        db.commit()
+        await dispatch_engine.record_bid(order_id, bid.bid_id, bid.bid_amount)
+        db.close()
+
+    async def _main():
+        with dispatch_engine.dispatch_runtime(
+            clock=clock, rng=random.Random(3), session_factory=SessionFactory, state_store=store
+        ):
+            clock.track(asyncio.create_task(_bid("student-1", 20, 7.0)))
+            clock.track(asyncio.create_task(_bid("student-2", 35, 6.5)))
+            await clock.run_until_complete(
+                dispatch_engine.dispatch_order(
+                    order_id, 1, "1 Shields Ave", phase1_wait_seconds_min=60, phase1_wait_seconds_max=60
+                )
+            )
+        # Small batches exercise the consumer-group cursor across several reads.
+        flushed = await drain_events(store, consumer="test", batch_size=3, session_factory=SessionFactory)
+        live = (await store.get_state(order_id), await store.is_assigned(order_id), await store.get_bids(order_id))
+        pending = await store.client.xpending("dispatch:events", "dispatch-events-flush")
+        return flushed, live, pending
+
+    flushed, (live_state, live_assigned, live_bids), pending = asyncio.run(_main())
+
+    db = SessionFactory()
+    events = load_events(db, order_id=order_id)
+    db.close()
+    assert flushed == len(events) > 0
+    assert pending["pending"] == 0
+    assert [event.kind for event in events if event.kind in ("bid", "award")] == ["bid", "bid", "award"]
+
+    rebuilt = rebuild_states(events)[order_id]
+    assert rebuilt.state == live_state
+    assert rebuilt.state["status"] == "assigned"
+    assert rebuilt.assigned is live_assigned is True
+    assert rebuilt.bids == live_bids == {}
+
+
+def test_redelivered_batch_is_written_once():
+    SessionFactory = _session_factory()
+    store = InMemoryStateStore()
+
+    async def _main():
+        await store.append_event({"o": "5", "k": "bid", "t": "2026-10-19T18:00:00+00:00", "d": '{"bid_id":1,"amount":7.0}'})
+        entries = await store.read_event_batch("test", 10)
+        # A flusher that crashed after committing but before acking leaves the batch pending.
+        db = SessionFactory()
+        write_event_rows(db, [event_row(fields, stream_id=entry_id) for entry_id, fields in entries])
+        db.close()
+        return await flush_events_once(store, consumer="test", session_factory=SessionFactory)
+
+    assert asyncio.run(_main()) == 1
+    assert list(store.events) == []
+    db = SessionFactory()
+    assert db.query(DispatchEventRecord).count() == 1
+    db.close()
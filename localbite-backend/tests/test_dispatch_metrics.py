@@ -0,0 +1,122 @@
+import asyncio
+import random
+import threading
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.metrics import Counter, Histogram, render_prometheus
+from app.database import Base
+from app.dispatch import engine as dispatch_engine
+from app.dispatch import metrics as dispatch_metrics
+from app.dispatch.clock import VirtualClock
+from app.dispatch.state_store import InMemoryStateStore
+from app.models.delivery_bid import DeliveryBid
+from app.models.order import Order
+
+
+def test_sharded_counter_and_histogram_render():
+    counter = Counter("test_sharded_total", "Test counter.", labelnames=("kind",))
+    histogram = Histogram("test_latency_seconds", "Test histogram.", buckets=(1, 5))
+
+    def _work():
+        for _ in range(1000):
+            counter.inc(kind="a")
+        histogram.observe(0.5)
+        histogram.observe(3)
+        histogram.observe(9)
+
+    threads = [threading.Thread(target=_work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.value(kind="a") == 4000
+    assert histogram.snapshot() == (12, 4 * 12.5)
+    text = render_prometheus()
+    assert 'test_sharded_total{kind="a"} 4000' in text
+    assert 'test_latency_seconds_bucket{le="1"} 4' in text
+    assert 'test_latency_seconds_bucket{le="5"} 8' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 12' in text
+    assert "test_latency_seconds_count 12" in text
+
+
+def test_dispatch_lifecycle_is_instrumented():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionFactory()
+    order = Order(
+        user_id=1,
+        restaurant_id=1,
+        order_items=[],
+        base_fare=6.0,
+        delivery_fee=6.0,
+        commission_amount=0.6,
+        order_status="pending",
+    )
+    db.add(order)
+    db.commit()
+    order_id = order.order_id
+    db.close()
+
+    clock = VirtualClock()
+    awarded_before = dispatch_metrics.DISPATCH_OUTCOMES.value(outcome="awarded", phase="student_pool")
+    first_bid_before = dispatch_metrics.TIME_TO_FIRST_BID.snapshot()
+    award_before = dispatch_metrics.TIME_TO_AWARD.snapshot(phase="student_pool")
+
+    async def _student() -> None:
+        await clock.sleep(42)
+        session = SessionFactory()
+        bid = DeliveryBid(
+            order_id=order_id,
+            agent_id="student-1",
+            bid_amount=6.5,
+            min_allowed_fare=6.0,
+            max_allowed_fare=9.0,
+            pool_phase="student_pool",
+        )
+        session.add(bid)
+        session.commit()
+        await dispatch_engine.record_bid(order_id, bid.bid_id, bid.bid_amount)
+        session.close()
+
+    async def _main() -> None:
+        with dispatch_engine.dispatch_runtime(
+            clock=clock,
+            rng=random.Random(1),
+            session_factory=SessionFactory,
+            state_store=InMemoryStateStore(),
+        ):
+            clock.track(asyncio.create_task(_student()))
+            await clock.run_until_complete(
+                dispatch_engine.dispatch_order(
+                    order_id, 1, "1 Shields Ave", phase1_wait_seconds_min=60, phase1_wait_seconds_max=60
+                )
+            )
+
+    asyncio.run(_main())
+    engine.dispose()
+
+    assert dispatch_metrics.DISPATCH_OUTCOMES.value(outcome="awarded", phase="student_pool") == awarded_before + 1
+    count, total = dispatch_metrics.TIME_TO_FIRST_BID.snapshot()
+    assert (count - first_bid_before[0], total - first_bid_before[1]) == (1, 42)
+    count, total = dispatch_metrics.TIME_TO_AWARD.snapshot(phase="student_pool")
+    assert (count - award_before[0], total - award_before[1]) == (1, 60)
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    from main import app
+
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE localbite_dispatch_live_tasks gauge" in response.text
+    assert "localbite_dispatch_live_tasks 0" in response.text
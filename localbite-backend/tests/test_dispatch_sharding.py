@@ -0,0 +1,256 @@
+import asyncio
+import random
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.dispatch import engine as dispatch_engine
+from app.dispatch.clock import VirtualClock
+from app.dispatch.sharding import (
+    InMemoryShardLeases,
+    RedisShardLeases,
+    ShardCoordinator,
+    UNLOCATED_SHARD,
+    shard_for,
+)
+from app.dispatch.state_store import InMemoryStateStore
+from app.dispatch.worker import DispatchWorker, ShardedDispatch, set_shard_leases, submit_dispatch
+from app.models.order import Order
+
+
+def test_shard_for_restaurant_location():
+    shard = shard_for(38.5449, -121.7405)
+    assert len(shard) == 5
+    assert shard_for(38.5449, -121.7405, precision=3) == shard[:3]
+    assert shard_for(38.5452, -121.7401) == shard
+    assert shard_for(None, -121.7405) == UNLOCATED_SHARD
+
+
+def _leases(kind: str, now):
+    if kind == "memory":
+        return InMemoryShardLeases(now=now)
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisShardLeases(fakeredis.aioredis.FakeRedis(decode_responses=True), now=now)
+
+
+@pytest.mark.parametrize("kind", ["memory", "redis"])
+def test_lease_contract(kind):
+    leases = _leases(kind, now=lambda: 1000.0)
+
+    async def _exercise():
+        assert await leases.acquire("9qce8", "worker-a", 15)
+        assert not await leases.acquire("9qce8", "worker-b", 15)
+        # Renewal by the holder.
+        assert await leases.acquire("9qce8", "worker-a", 15)
+        await leases.release("9qce8", "worker-b")
+        assert await leases.owner("9qce8") == "worker-a"
+        await leases.release("9qce8", "worker-a")
+        assert await leases.owner("9qce8") is None
+        assert await leases.acquire("9qce8", "worker-b", 15)
+
+        await leases.heartbeat("worker-a", 15)
+        await leases.heartbeat("worker-b", 15)
+        assert await leases.live_workers() == ["worker-a", "worker-b"]
+        await leases.leave("worker-a")
+        assert await leases.live_workers() == ["worker-b"]
+
+        await leases.add_shard("9qce8")
+        await leases.add_shard("9qce9")
+        await leases.add_shard("9qce8")
+        assert await leases.known_shards() == {"9qce8", "9qce9"}
+
+    asyncio.run(_exercise())
+
+
+def test_coordinators_split_shards_and_take_over_on_leave():
+    now = [0.0]
+    leases = InMemoryShardLeases(now=lambda: now[0])
+    a = ShardCoordinator(leases, "worker-a", lease_seconds=15)
+    b = ShardCoordinator(leases, "worker-b", lease_seconds=15)
+
+    async def _exercise():
+        for shard in ("9qce8", "9qce9", "9qced", "9qcef"):
+            await leases.add_shard(shard)
+        assert (await a.rebalance()).owned == {"9qce8", "9qce9", "9qced", "9qcef"}
+
+        # b joins: nothing is free yet, but a sheds its surplus on its next tick.
+        assert (await b.rebalance()).owned == set()
+        shed = await a.rebalance()
+        assert shed.owned == {"9qce8", "9qce9"}
+        assert shed.lost == {"9qced", "9qcef"}
+        assert (await b.rebalance()).gained == {"9qced", "9qcef"}
+
+        # a crashes: its leases and heartbeat expire and b picks everything up.
+        now[0] += 20
+        assert (await b.rebalance()).owned == {"9qce8", "9qce9", "9qced", "9qcef"}
+
+        # A pinned worker only competes for its own shards.
+        pinned = ShardCoordinator(leases, "worker-c", lease_seconds=15, pinned={"9qcez"})
+        assert (await pinned.rebalance()).owned == {"9qcez"}
+
+    asyncio.run(_exercise())
+
+
+def _session_factory_with_order(order_id: int):
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionFactory()
+    db.add(
+        Order(
+            order_id=order_id,
+            user_id=1,
+            restaurant_id=1,
+            order_items=[],
+            base_fare=6.0,
+            delivery_fee=6.0,
+            commission_amount=0.6,
+            order_status="pending",
+        )
+    )
+    db.commit()
+    db.close()
+    return SessionFactory
+
+
+def _sharded_request(order_id: int, shard: str) -> ShardedDispatch:
+    return ShardedDispatch(
+        order_id=order_id,
+        restaurant_id=1,
+        delivery_address="1 Shields Ave",
+        shard=shard,
+        phase1_wait_seconds_min=120,
+        phase1_wait_seconds_max=120,
+    )
+
+
+def test_dispatch_moves_between_workers_with_its_shard():
+    SessionFactory = _session_factory_with_order(41)
+    store = InMemoryStateStore()
+    clock = VirtualClock()
+    leases = InMemoryShardLeases(now=clock.monotonic)
+    previous_leases = set_shard_leases(leases)
+    worker_a = DispatchWorker(ShardCoordinator(leases, "worker-a", lease_seconds=15))
+    worker_b = DispatchWorker(ShardCoordinator(leases, "worker-b", lease_seconds=15))
+
+    async def _main():
+        with dispatch_engine.dispatch_runtime(
+            clock=clock, rng=random.Random(4), session_factory=SessionFactory, state_store=store
+        ):
+            await submit_dispatch(_sharded_request(41, "9qce8"))
+            assert store.states[41]["status"] == "submitted"
+            assert await worker_a.tick() == 1
+            assert dispatch_engine.is_dispatch_running(41)
+            await clock.run_until_complete(clock.sleep(30))
+
+            # worker-a stops; worker-b takes the shard and resumes the checkpointed dispatch.
+            await worker_a.shutdown()
+            assert store.states[41]["status"] == "interrupted"
+            assert not dispatch_engine.is_dispatch_running(41)
+            await worker_b.tick()
+            assert worker_b.owned_shards == {"9qce8"}
+            assert dispatch_engine.is_dispatch_running(41)
+
+            await dispatch_engine.cancel_dispatch(41)
+            await worker_b.shutdown()
+
+    try:
+        asyncio.run(_main())
+    finally:
+        set_shard_leases(previous_leases)
+    assert store.states[41]["status"] == "cancelled"
+    assert store.states[41]["shard"] == "9qce8"
+
+
+def test_shed_shard_is_checkpointed_before_its_lease_is_released():
+    SessionFactory = _session_factory_with_order(42)
+    store = InMemoryStateStore()
+    clock = VirtualClock()
+    leases = InMemoryShardLeases(now=clock.monotonic)
+    previous_leases = set_shard_leases(leases)
+    worker_a = DispatchWorker(ShardCoordinator(leases, "worker-a", lease_seconds=15))
+    worker_b = DispatchWorker(ShardCoordinator(leases, "worker-b", lease_seconds=15))
+
+    status_at_release = {}
+    release = leases.release
+
+    async def _release(shard, worker_id):
+        status_at_release[shard] = store.states[42]["status"]
+        await release(shard, worker_id)
+
+    leases.release = _release
+
+    async def _main():
+        with dispatch_engine.dispatch_runtime(
+            clock=clock, rng=random.Random(4), session_factory=SessionFactory, state_store=store
+        ):
+            await leases.add_shard("9qce8")
+            await submit_dispatch(_sharded_request(42, "9qce9"))
+            assert await worker_a.tick() == 1
+            assert worker_a.owned_shards == {"9qce8", "9qce9"}
+            await clock.run_until_complete(clock.sleep(10))
+
+            # b joins; a sheds 9qce9 on its next tick and b picks it up.
+            await worker_b.tick()
+            await worker_a.tick()
+            assert worker_a.owned_shards == {"9qce8"}
+            assert status_at_release == {"9qce9": "interrupted"}
+            await worker_b.tick()
+            assert worker_b.owned_shards == {"9qce9"}
+            assert dispatch_engine.is_dispatch_running(42)
+
+            await dispatch_engine.cancel_dispatch(42)
+            await worker_a.shutdown()
+            await worker_b.shutdown()
+
+    try:
+        asyncio.run(_main())
+    finally:
+        set_shard_leases(previous_leases)
+
+
+def test_new_owner_rescans_for_dispatches_checkpointed_after_takeover():
+    SessionFactory = _session_factory_with_order(43)
+    store = InMemoryStateStore()
+    clock = VirtualClock()
+    leases = InMemoryShardLeases(now=clock.monotonic)
+    previous_leases = set_shard_leases(leases)
+    worker_a = DispatchWorker(ShardCoordinator(leases, "worker-a", lease_seconds=15))
+    worker_b = DispatchWorker(
+        ShardCoordinator(leases, "worker-b", lease_seconds=15), resume_scan_ticks=2
+    )
+
+    async def _main():
+        with dispatch_engine.dispatch_runtime(
+            clock=clock, rng=random.Random(4), session_factory=SessionFactory, state_store=store
+        ):
+            await submit_dispatch(_sharded_request(43, "9qce8"))
+            assert await worker_a.tick() == 1
+
+            # a stalls past its lease: b takes the shard while a still runs the dispatch.
+            await clock.run_until_complete(clock.sleep(20))
+            await worker_b.tick()
+            assert worker_b.owned_shards == {"9qce8"}
+
+            # a notices the loss and checkpoints; b's rescan resumes the dispatch.
+            await worker_a.tick()
+            assert store.states[43]["status"] == "interrupted"
+            assert not dispatch_engine.is_dispatch_running(43)
+            await worker_b.tick()
+            assert dispatch_engine.is_dispatch_running(43)
+
+            await dispatch_engine.cancel_dispatch(43)
+            await worker_a.shutdown()
+            await worker_b.shutdown()
+
+    try:
+        asyncio.run(_main())
+    finally:
+        set_shard_leases(previous_leases)
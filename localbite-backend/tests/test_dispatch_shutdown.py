@@ -0,0 +1,118 @@
+import asyncio
+import random
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.dispatch import engine as dispatch_engine
+from app.dispatch.clock import VirtualClock
+from app.dispatch.state_store import InMemoryStateStore
+from app.models.delivery_bid import DeliveryBid
+from app.models.order import Order
+
+
+def _session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def _create_order(SessionFactory) -> int:
+    db = SessionFactory()
+    order = Order(
+        user_id=1,
+        restaurant_id=1,
+        order_items=[],
+        base_fare=6.0,
+        delivery_fee=6.0,
+        commission_amount=0.6,
+        order_status="pending",
+    )
+    db.add(order)
+    db.commit()
+    order_id = order.order_id
+    db.close()
+    return order_id
+
+
+def test_drained_dispatch_resumes_with_original_deadline():
+    SessionFactory = _session_factory()
+    order_id = _create_order(SessionFactory)
+    store = InMemoryStateStore()
+    clock = VirtualClock()
+
+    async def _student_bid() -> None:
+        await clock.sleep(50)
+        db = SessionFactory()
+        bid = DeliveryBid(
+            order_id=order_id,
+            agent_id="student-1",
+            bid_amount=6.5,
+            min_allowed_fare=6.0,
+            max_allowed_fare=9.0,
+            pool_phase="student_pool",
+        )
+        db.add(bid)
+        db.commit()
+        await dispatch_engine.record_bid(order_id, bid.bid_id, bid.bid_amount)
+        db.close()
+
+    async def _main():
+        with dispatch_engine.dispatch_runtime(
+            clock=clock, rng=random.Random(5), session_factory=SessionFactory, state_store=store
+        ):
+            await dispatch_engine.start_dispatch_background(
+                order_id, 1, "1 Shields Ave", phase1_wait_seconds_min=180, phase1_wait_seconds_max=180
+            )
+            await clock.run_until_complete(clock.sleep(100))
+
+            assert await dispatch_engine.drain_dispatch_tasks() == 1
+            interrupted = dict(store.states[order_id])
+            assert not dispatch_engine.is_dispatch_running(order_id)
+
+            clock.track(asyncio.create_task(_student_bid()))
+            assert await dispatch_engine.resume_interrupted_dispatches() == [order_id]
+            await clock.run_until_complete(asyncio.gather(dispatch_engine._dispatch_tasks[order_id]))
+            return interrupted
+
+    interrupted = asyncio.run(_main())
+
+    assert interrupted["status"] == "interrupted"
+    checkpoint = dispatch_engine.DispatchCheckpoint.model_validate_json(interrupted["checkpoint"])
+    assert checkpoint.phase == "student_pool"
+    assert checkpoint.phase_deadline == datetime(2026, 1, 1, 0, 3, tzinfo=timezone.utc)
+    # The student pool still closed at t=180 (not 100 + 180) and awarded the bid.
+    assert clock.monotonic() == 180
+    assert store.states[order_id]["status"] == "assigned"
+    assert store.assigned == {order_id}
+
+
+def test_cancel_stops_task_and_withdraws_broadcasts():
+    SessionFactory = _session_factory()
+    order_id = _create_order(SessionFactory)
+    store = InMemoryStateStore()
+    clock = VirtualClock()
+
+    async def _main():
+        with dispatch_engine.dispatch_runtime(
+            clock=clock, rng=random.Random(5), session_factory=SessionFactory, state_store=store
+        ):
+            await dispatch_engine.start_dispatch_background(
+                order_id, 1, "1 Shields Ave", phase1_wait_seconds_min=60, phase1_wait_seconds_max=60
+            )
+            await clock.run_until_complete(clock.sleep(30))
+            assert len(store.queues["dispatch:queue:student"]) == 1
+            return await dispatch_engine.cancel_dispatch(order_id, reason="customer cancelled")
+
+    assert asyncio.run(_main()) is True
+    assert not dispatch_engine.is_dispatch_running(order_id)
+    assert list(store.queues["dispatch:queue:student"]) == []
+    assert store.states[order_id]["status"] == "cancelled"
+    assert store.states[order_id]["note"] == "customer cancelled"
@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.jobs.simulate_dispatch import (
+    HistoricalBid,
+    HistoricalOrder,
+    load_history,
+    parse_config,
+    run_configuration,
+)
+from app.models.delivery_agent import AgentType, DeliveryAgent, VehicleType
+from app.models.delivery_bid import DeliveryBid
+from app.models.order import Order
+
+T0 = datetime(2026, 10, 19, 18, 0, tzinfo=timezone.utc)
+
+
+def _create_test_session():
+    """Create an in-memory SQLite session for testing and create tables."""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return TestingSessionLocal()
+
+
+def _history() -> list[HistoricalOrder]:
+    return [
+        # A student bid inside the student pool: awarded when phase 1 closes.
+        HistoricalOrder(
+            order_id=1,
+            restaurant_id=1,
+            base_fare=6.0,
+            created_at=T0,
+            bids=[HistoricalBid(agent_id="student-1", bid_amount=6.5, offset_seconds=30)],
+        ),
+        # Only a third-party bid, 20s after escalation: awarded after the rolling close.
+        HistoricalOrder(
+            order_id=2,
+            restaurant_id=1,
+            base_fare=6.0,
+            created_at=T0 + timedelta(seconds=10),
+            bids=[
+                HistoricalBid(
+                    agent_id="courier-1", bid_amount=8.0, offset_seconds=20, after_escalation=True
+                )
+            ],
+        ),
+        # Nobody bids.
+        HistoricalOrder(order_id=3, restaurant_id=1, base_fare=6.0, created_at=T0 + timedelta(seconds=20)),
+    ]
+
+
+def test_parse_config():
+    config = parse_config("short:p1min=60,p1max=90,close=30")
+    assert config.name == "short"
+    assert (config.phase1_wait_seconds_min, config.phase1_wait_seconds_max) == (60, 90)
+    assert config.rolling_bid_close_seconds == 30
+    assert config.phase2_wait_seconds == 180
+
+    with pytest.raises(ValueError):
+        parse_config("bad:p3=1")
+
+
+def test_simulation_reports_policy_outcomes():
+    config = parse_config("short:p1min=60,p1max=60,p2=90,close=30")
+    result = run_configuration(config, _history(), seed=3)
+
+    assert result.orders == 3
+    assert result.assigned == 2
+    assert result.needs_fee_increase == 1
+    assert result.student_pool_awards == 1
+    assert result.student_pool_share == 0.5
+    assert result.avg_delivery_fee == 7.25
+    # Order 1 is awarded when phase 1 closes at 60s. Order 2 escalates at 60s, its bid
+    # lands 20s later on a poll boundary, and the 30s rolling close awards it at 110s.
+    assert result.time_to_assign_p50 == pytest.approx(85.0)
+    assert result.time_to_assign_p99 == pytest.approx(109.5)
+
+    # Same seed, same answer.
+    again = run_configuration(config, _history(), seed=3)
+    assert again.model_dump(exclude={"wall_seconds"}) == result.model_dump(exclude={"wall_seconds"})
+
+
+def test_load_history_times_third_party_bids_from_escalation():
+    db = _create_test_session()
+    for agent_id, agent_type in (("student-1", AgentType.STUDENT), ("courier-1", AgentType.THIRD_PARTY)):
+        db.add(
+            DeliveryAgent(
+                agent_id=agent_id,
+                full_name=agent_id,
+                email=f"{agent_id}@example.com",
+                password_hash="x",
+                phone_number=agent_id,
+                agent_type=agent_type,
+                vehicle_type=VehicleType.BIKE,
+                base_payout_per_delivery=3.0,
+            )
+        )
+    db.add(
+        Order(
+            order_id=1,
+            user_id=1,
+            restaurant_id=1,
+            order_items=[],
+            base_fare=6.0,
+            delivery_fee=7.0,
+            commission_amount=0.6,
+            order_status="delivered",
+            created_at=T0,
+        )
+    )
+    for agent_id, seconds in (("student-1", 40), ("courier-1", 250)):
+        db.add(
+            DeliveryBid(
+                order_id=1,
+                agent_id=agent_id,
+                bid_amount=7.0,
+                min_allowed_fare=6.0,
+                max_allowed_fare=9.0,
+                pool_phase="student_pool" if agent_id == "student-1" else "all_agents",
+                created_at=T0 + timedelta(seconds=seconds),
+            )
+        )
+    db.commit()
+
+    (order,) = load_history(db, historical_phase1_seconds=210)
+    bids = {bid.agent_id: bid for bid in order.bids}
+    assert bids["student-1"].offset_seconds == 40
+    assert not bids["student-1"].after_escalation
+    assert bids["courier-1"].offset_seconds == 40
+    assert bids["courier-1"].after_escalation
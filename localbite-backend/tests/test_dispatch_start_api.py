@@ -0,0 +1,151 @@
+import asyncio
+import random
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.dispatch import start_order_dispatch
+from app.database import Base
+from app.dispatch import engine as dispatch_engine
+from app.dispatch import worker as dispatch_worker
+from app.dispatch.admission import AdmissionController, AdmissionLimits
+from app.dispatch.clock import VirtualClock
+from app.dispatch.sharding import InMemoryShardLeases, inbox_key, shard_for
+from app.dispatch.state_store import InMemoryStateStore
+from app.dispatch.worker import ShardedDispatch
+from app.models.order import Order
+from app.models.restaurant import Restaurant
+from app.schemas.dispatch import DispatchStartRequest
+
+T0 = datetime(2026, 10, 19, 18, 0, tzinfo=timezone.utc)
+
+
+def _session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionFactory()
+    db.add(
+        Restaurant(
+            id=1,
+            name="Taqueria",
+            email="t@example.com",
+            password_hash="x",
+            cuisine_type="mexican",
+            address="1 Main St",
+            latitude=38.5449,
+            longitude=-121.7405,
+        )
+    )
+    for order_id in (1, 2, 3, 4):
+        db.add(
+            Order(
+                order_id=order_id,
+                user_id=1,
+                restaurant_id=1,
+                order_items=[],
+                base_fare=6.0 + order_id,
+                delivery_fee=6.0,
+                commission_amount=0.6,
+                order_status="pending",
+                created_at=T0,
+            )
+        )
+    db.commit()
+    db.close()
+    return SessionFactory
+
+
+def _request(**overrides) -> DispatchStartRequest:
+    return DispatchStartRequest(
+        delivery_address="1 Shields Ave",
+        phase1_wait_seconds_min=60,
+        phase1_wait_seconds_max=60,
+        phase2_wait_seconds=60,
+        **overrides,
+    )
+
+
+def test_start_endpoint_admits_queues_rejects_and_defers():
+    SessionFactory = _session_factory()
+    store = InMemoryStateStore()
+    clock = VirtualClock(start=T0)
+    previous = dispatch_engine.set_admission_controller(
+        AdmissionController(AdmissionLimits(max_active=1, max_active_per_restaurant=1, max_waiting=1))
+    )
+
+    async def _main():
+        with dispatch_engine.dispatch_runtime(
+            clock=clock, rng=random.Random(5), session_factory=SessionFactory, state_store=store
+        ):
+            db = SessionFactory()
+            try:
+                started = await start_order_dispatch(1, _request(), db)
+                assert (started.status, started.dispatch_started) == ("accepted", True)
+                queued = await start_order_dispatch(2, _request(), db)
+                assert (queued.status, queued.queue_position) == ("queued", 1)
+                with pytest.raises(HTTPException) as exc_info:
+                    await start_order_dispatch(3, _request(), db)
+                assert exc_info.value.status_code == 503
+
+                deferred = await start_order_dispatch(4, _request(defer_until_ready=True), db)
+                assert deferred.status == "scheduled"
+                assert deferred.scheduled_for > clock.now()
+                assert store.scheduled
+            finally:
+                db.close()
+            for order_id in (1, 2, 4):
+                await dispatch_engine.cancel_dispatch(order_id)
+
+    try:
+        asyncio.run(_main())
+    finally:
+        dispatch_engine.set_admission_controller(previous)
+    assert store.states[2]["status"] == "cancelled"
+
+
+@pytest.mark.parametrize("mode", ["inline", "sharded"])
+def test_start_endpoint_runs_inline_or_submits_to_the_restaurant_shard(mode, monkeypatch):
+    monkeypatch.setattr(dispatch_worker, "DISPATCH_MODE", mode)
+    SessionFactory = _session_factory()
+    store = InMemoryStateStore()
+    clock = VirtualClock(start=T0)
+    leases = InMemoryShardLeases(now=clock.monotonic)
+    previous_leases = dispatch_worker.set_shard_leases(leases)
+    shard = shard_for(38.5449, -121.7405)
+
+    async def _main():
+        with dispatch_engine.dispatch_runtime(
+            clock=clock, rng=random.Random(5), session_factory=SessionFactory, state_store=store
+        ):
+            db = SessionFactory()
+            try:
+                response = await start_order_dispatch(2, _request(), db)
+            finally:
+                db.close()
+            if mode == "inline":
+                assert (response.status, response.shard) == ("accepted", None)
+                assert dispatch_engine.is_dispatch_running(2)
+                assert not store.queues.get(inbox_key(shard))
+            else:
+                assert (response.status, response.shard) == ("submitted", shard)
+                assert not dispatch_engine.is_dispatch_running(2)
+                assert store.states[2]["status"] == "submitted"
+                assert await leases.known_shards() == {shard}
+                [raw] = store.queues[inbox_key(shard)]
+                request = ShardedDispatch.model_validate_json(raw)
+                assert (request.order_id, request.shard, request.order_value) == (2, shard, 8.0)
+            await dispatch_engine.cancel_dispatch(2)
+
+    try:
+        asyncio.run(_main())
+    finally:
+        dispatch_worker.set_shard_leases(previous_leases)
@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.dispatch.state_store import (
+    CircuitBreaker,
+    FailoverStateStore,
+    InMemoryStateStore,
+    PostgresStateStore,
+    RedisStateStore,
+    build_state_store,
+)
+
+
+def _sql_session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def _make_store(kind: str):
+    if kind == "memory":
+        return InMemoryStateStore()
+    if kind == "postgres":
+        return PostgresStateStore(_sql_session_factory())
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisStateStore(client=fakeredis.aioredis.FakeRedis(decode_responses=True))
+
+
+class UnreachableStore(InMemoryStateStore):
+    """Behaves like Redis during an outage until `down` is cleared."""
+
+    name = "unreachable"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.down = True
+        self.calls = 0
+
+    def __getattribute__(self, attr):
+        value = super().__getattribute__(attr)
+        if attr in {"set_state", "get_state", "set_assigned", "is_assigned", "add_bid", "get_bids"}:
+            async def _guarded(*args):
+                self.calls += 1
+                if self.down:
+                    raise RedisConnectionError("connection refused")
+                return await value(*args)
+
+            return _guarded
+        return value
+
+
+@pytest.mark.parametrize("kind", ["memory", "postgres", "redis"])
+def test_state_store_contract(kind):
+    store = _make_store(kind)
+
+    async def _exercise():
+        await store.set_state(7, {"status": "starting", "phase": "student_pool"})
+        await store.set_state(7, {"status": "waiting_for_bids"})
+        assert await store.get_state(7) == {"status": "waiting_for_bids", "phase": "student_pool"}
+        assert await store.get_state(8) == {}
+
+        assert await store.is_assigned(7) is False
+        await store.set_assigned(7)
+        assert await store.is_assigned(7) is True
+        await store.clear_assigned(7)
+        assert await store.is_assigned(7) is False
+
+        await store.push("dispatch:queue:student", '{"order_id": 7}')
+
+        for order_id in (1, 2, 3):
+            await store.push("dispatch:inbox:9q9p1", f'{{"order_id": {order_id}}}')
+        assert await store.pop("dispatch:inbox:9q9p1", 2) == ['{"order_id": 1}', '{"order_id": 2}']
+        assert await store.pop("dispatch:inbox:9q9p1", 2) == ['{"order_id": 3}']
+        assert await store.pop("dispatch:inbox:9q9p1", 2) == []
+
+        assert await store.bid_marker(7) == (0, 0)
+        await store.replace_bids(7, {3: 6.5, 5: 7.0})
+        await store.add_bid(7, 9, 6.75)
+        assert await store.get_bids(7) == {3: 6.5, 5: 7.0, 9: 6.75}
+        assert await store.bid_marker(7) == (3, 9)
+        await store.replace_bids(7, {4: 8.0})
+        assert await store.bid_marker(7) == (1, 4)
+        await store.clear_bids(7)
+        assert await store.bid_marker(7) == (0, 0)
+
+        await store.schedule(7, 100.0, '{"order_id": 7}')
+        await store.schedule(9, 200.0, '{"order_id": 9}')
+        await store.schedule(10, 150.0, '{"order_id": 10}')
+        await store.unschedule(10)
+        assert await store.pop_due(150.0, 10) == ['{"order_id": 7}']
+        assert await store.pop_due(150.0, 10) == []
+        assert await store.pop_due(250.0, 10) == ['{"order_id": 9}']
+
+    asyncio.run(_exercise())
+
+
+def test_failover_uses_fallback_while_primary_is_down():
+    primary = UnreachableStore()
+    fallback = InMemoryStateStore()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout_seconds=0.0)
+    store = FailoverStateStore(primary, fallback, breaker=breaker)
+
+    async def _exercise():
+        await store.set_state(1, {"status": "waiting_for_bids", "updated_at": "2026-10-19T18:00:00"})
+        await store.set_assigned(1)
+        await store.add_bid(1, 11, 7.0)
+        assert breaker.state != "closed"
+        assert fallback.states[1]["status"] == "waiting_for_bids"
+
+        # Primary comes back: the half-open trial succeeds and closes the breaker, and
+        # writes made during the outage are still visible through the fallback.
+        primary.down = False
+        assert await store.is_assigned(1) is True
+        assert breaker.state == "closed"
+        assert await store.get_state(1) == {"status": "waiting_for_bids", "updated_at": "2026-10-19T18:00:00"}
+        assert await store.bid_marker(1) == (1, 11)
+
+        # Newer primary state wins over the outage copy.
+        await store.set_state(1, {"status": "assigned", "updated_at": "2026-10-19T18:05:00"})
+        assert (await store.get_state(1))["status"] == "assigned"
+
+    asyncio.run(_exercise())
+
+
+def test_open_breaker_skips_primary():
+    primary = UnreachableStore()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout_seconds=60.0)
+    store = FailoverStateStore(primary, InMemoryStateStore(), breaker=breaker)
+
+    async def _exercise():
+        for _ in range(5):
+            await store.set_state(2, {"status": "starting"})
+
+    asyncio.run(_exercise())
+    assert breaker.state == "open"
+    assert primary.calls == 1
+
+
+def test_build_state_store_from_config():
+    assert isinstance(build_state_store("memory"), InMemoryStateStore)
+    assert isinstance(build_state_store("postgres"), PostgresStateStore)
+    assert isinstance(build_state_store("redis", "none"), RedisStateStore)
+    failover = build_state_store("redis", "postgres")
+    assert isinstance(failover, FailoverStateStore)
+    assert isinstance(failover.fallback, PostgresStateStore)
+    with pytest.raises(ValueError):
+        build_state_store("etcd")
@@ -0,0 +1,111 @@
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.crud import agent_ledger as agent_ledger_crud
+from app.crud import delivery_agent as delivery_agent_crud
+from app.crud.entity_cache import EntityCache, set_entity_cache
+from app.database import Base
+from app.models.delivery_agent import AgentType, DeliveryAgent, VehicleType
+from app.schemas.delivery_agent import DeliveryAgentUpdate
+
+
+def _session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionFactory()
+    db.add(
+        DeliveryAgent(
+            agent_id="a1",
+            full_name="Ada",
+            password_hash="x",
+            phone_number="a1",
+            agent_type=AgentType.STUDENT,
+            vehicle_type=VehicleType.BIKE,
+            base_payout_per_delivery=3.0,
+            total_earnings=0.0,
+            total_deliveries=0,
+            location_updated_at=datetime(2026, 5, 1, 12, 0, tzinfo=timezone.utc),
+        )
+    )
+    db.commit()
+    db.close()
+    return SessionFactory
+
+
+@pytest.fixture
+def cache():
+    cache = EntityCache(ttl_seconds=60)
+    previous = set_entity_cache(cache)
+    yield cache
+    set_entity_cache(previous)
+
+
+def test_repeat_lookups_are_served_from_memory_and_invalidated_on_writes(cache):
+    SessionFactory = _session_factory()
+
+    first, second = SessionFactory(), SessionFactory()
+    try:
+        assert delivery_agent_crud.get_by_id(first, "a1").full_name == "Ada"
+        agent = delivery_agent_crud.get_by_id(second, "a1")
+        assert cache.stats()["delivery_agents"]["local"] == 1
+        # A cached row is a normal persistent instance of the caller's session.
+        assert agent in second and agent.vehicle_type == VehicleType.BIKE
+        assert agent.location_updated_at.replace(tzinfo=timezone.utc) == datetime(2026, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+        delivery_agent_crud.update(second, agent, DeliveryAgentUpdate(full_name="Ada L."))
+    finally:
+        first.close()
+        second.close()
+
+    db = SessionFactory()
+    try:
+        assert delivery_agent_crud.get_by_id(db, "a1").full_name == "Ada L."
+        agent_ledger_crud.record_delivery_payout(db, "a1", 7, 6.5)
+        db.commit()
+    finally:
+        db.close()
+
+    db = SessionFactory()
+    try:
+        # The ledger's bulk UPDATE of the totals dropped the cached row too.
+        agent = delivery_agent_crud.get_by_id(db, "a1")
+        assert (agent.total_earnings, agent.total_deliveries) == (6.5, 1)
+    finally:
+        db.close()
+
+    stats = cache.stats()["delivery_agents"]
+    assert (stats["local"], stats["miss"]) == (1, 3)
+    assert stats["hit_ratio"] == 0.25
+
+
+def test_redis_tier_is_shared_between_processes():
+    fakeredis = pytest.importorskip("fakeredis")
+    SessionFactory = _session_factory()
+    client = fakeredis.FakeRedis()
+    writer, reader = EntityCache(ttl_seconds=60, redis_client=client), EntityCache(ttl_seconds=60, redis_client=client)
+
+    db = SessionFactory()
+    try:
+        writer.get(db, DeliveryAgent, "a1")
+    finally:
+        db.close()
+
+    db = SessionFactory()
+    try:
+        agent = reader.get(db, DeliveryAgent, "a1")
+        assert (agent.full_name, agent.agent_type) == ("Ada", AgentType.STUDENT)
+        assert reader.stats()["delivery_agents"]["redis"] == 1
+
+        writer.invalidate(DeliveryAgent, "a1")
+        assert client.get("entity:delivery_agents:a1") is None
+    finally:
+        db.close()
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.jobs.calibrate_eta import (
+    GroupAccumulator,
+    accumulate_delivered_orders,
+    build_table,
+    write_table,
+)
+from app.models.order import Order
+from app.models.restaurant import Restaurant
+from app.models.users import User
+from app.schemas.fare import FareRecommendationRequest
+from app.services import base_fare, eta_calibration
+from app.services.hot_reload import HotReloadFile
+
+
+def _create_test_session():
+    """Create an in-memory SQLite session for testing and create tables."""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return TestingSessionLocal()
+
+
+def test_fit_recovers_speed_and_buffer():
+    """A noiseless zone/hour should recover the generating speed and buffer exactly."""
+    accumulator = GroupAccumulator()
+    zone = accumulator.zone_index("9qc7m")
+    distance = np.linspace(0.5, 6.0, 40)
+    minutes = 11.0 + distance * (60.0 / 20.0)  # 20 km/h with an 11 minute buffer
+    accumulator.add(np.full(40, zone), np.full(40, 18), distance, minutes)
+
+    table = build_table(accumulator, min_samples=10, version="test")
+
+    assert table.lookup("9qc7m", 18) == pytest.approx((20.0, 11.0))
+    # Other hours of the zone fall back to the zone-wide fit.
+    assert table.lookup("9qc7m", 3) == pytest.approx((20.0, 11.0))
+    # Unknown zones use the default row.
+    assert table.lookup("zzzzz", 18) == pytest.approx((20.0, 11.0))
+
+
+def test_job_streams_orders_and_fare_uses_calibration(tmp_path, monkeypatch):
+    db = _create_test_session()
+    db.add(User(id=1, email="eta@example.com", password_hash="x", first_name="E", last_name="T"))
+    db.add(
+        Restaurant(
+            id=1,
+            email="r@example.com",
+            password_hash="x",
+            name="Shah's Halal",
+            cuisine_type="Halal",
+            address="123 Main St",
+            latitude=38.5449,
+            longitude=-121.7405,
+        )
+    )
+    start = datetime(2026, 10, 1, 18, 0, tzinfo=timezone.utc)
+    for i in range(30):
+        d_lat = 38.5449 + 0.005 * (i + 1)
+        distance_km = 0.005 * (i + 1) * 111.195
+        created_at = start + timedelta(days=i % 7)
+        db.add(
+            Order(
+                user_id=1,
+                restaurant_id=1,
+                order_items=[],
+                base_fare=5.0,
+                delivery_fee=5.0,
+                commission_amount=0.5,
+                order_status="delivered",
+                delivery_lat=d_lat,
+                delivery_lng=-121.7405,
+                created_at=created_at,
+                delivered_at=created_at + timedelta(minutes=6 + distance_km * 3),
+            )
+        )
+    db.commit()
+
+    table = build_table(accumulate_delivered_orders(db), min_samples=10, version="20261019")
+    path = write_table(table, tmp_path / "eta.json")
+    assert table.default.samples[start.astimezone().hour] == 30
+
+    monkeypatch.setattr(
+        eta_calibration,
+        "_calibration_file",
+        HotReloadFile(path, eta_calibration.EtaCalibrationTable.model_validate_json),
+    )
+    quote = base_fare.get_fare_recommendation(
+        FareRecommendationRequest(
+            user_location={"address": "Home", "latitude": 38.5849, "longitude": -121.7405},
+            restaurant_location={"address": "123 Main St", "latitude": 38.5449, "longitude": -121.7405},
+            request_time=start.astimezone().replace(tzinfo=None),
+        )
+    )
+
+    assert quote.breakdown.pricing_version == "v1+eta.20261019"
+    # 4.45 km at 20 km/h plus a 6 minute buffer.
+    assert quote.eta_estimate_minutes == 20
@@ -0,0 +1,141 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.crud import order as order_crud
+from app.database import Base
+from app.jobs import archive_orders
+from app.models.delivery_bid import DeliveryBid
+from app.models.order import Order
+from app.models.order_line_item import OrderLineItem
+from app.models.payments import Payment, PaymentMethodType, PaymentStatus
+from app.services.archive import read_archive
+
+NOW = datetime.now(timezone.utc).replace(microsecond=0)
+OLD = NOW - timedelta(days=200)
+
+
+def _session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def _order(order_id: int, status: str, created_at: datetime) -> Order:
+    return Order(
+        order_id=order_id,
+        user_id=1,
+        restaurant_id=1,
+        order_items=[{"item_id": 1, "quantity": 1}],
+        base_fare=6.0,
+        delivery_fee=6.0,
+        commission_amount=0.6,
+        order_status=status,
+        created_at=created_at,
+    )
+
+
+def _bid(bid_id: int, order_id: int, status: str, created_at: datetime) -> DeliveryBid:
+    return DeliveryBid(
+        bid_id=bid_id,
+        order_id=order_id,
+        agent_id="a1",
+        bid_amount=6.0,
+        min_allowed_fare=6.0,
+        max_allowed_fare=9.0,
+        bid_status=status,
+        created_at=created_at,
+    )
+
+
+def _payment(status: PaymentStatus, created_at: datetime) -> Payment:
+    return Payment(
+        order_id=uuid.uuid4(),
+        merchant_id=uuid.uuid4(),
+        amount_subtotal=1000,
+        amount_total=1100,
+        payment_method=PaymentMethodType.CARD,
+        status=status,
+        idempotency_key=uuid.uuid4().hex,
+        created_at=created_at.replace(tzinfo=None),
+    )
+
+
+def test_archive_moves_old_finished_rows_to_monthly_files(tmp_path, monkeypatch):
+    SessionFactory = _session_factory()
+    db = SessionFactory()
+    db.add_all(
+        [
+            _order(1, "delivered", OLD),
+            _order(2, "cancelled", OLD - timedelta(days=40)),
+            _order(3, "preparing", OLD),  # never finished: stays
+            _order(4, "delivered", NOW),  # recent: stays
+            _bid(1, 1, "accepted", OLD),
+            _bid(2, 1, "rejected", OLD),
+            _bid(3, 3, "expired", OLD),  # settled bid of an open order
+            _bid(4, 3, "placed", OLD),
+            OrderLineItem(order_id=1, menu_id=1, quantity=1, unit_price=9.5),
+            _payment(PaymentStatus.CAPTURED, OLD),
+            _payment(PaymentStatus.AUTHORIZED, OLD),
+            _payment(PaymentStatus.CAPTURED, NOW),
+        ]
+    )
+    db.commit()
+    db.close()
+
+    monkeypatch.setattr(archive_orders, "SessionLocal", SessionFactory)
+    archive_orders.main(["--days", "180", "--dir", str(tmp_path)])
+    assert not any(tmp_path.iterdir())
+
+    archive_orders.main(["--days", "180", "--dir", str(tmp_path), "--batch-size", "1", "--apply"])
+    db = SessionFactory()
+    try:
+        assert sorted(order.order_id for order in db.query(Order)) == [3, 4]
+        assert sorted(bid.bid_id for bid in db.query(DeliveryBid)) == [4]
+        assert db.query(OrderLineItem).count() == 0
+        assert sorted(payment.status for payment in db.query(Payment)) == [
+            PaymentStatus.AUTHORIZED,
+            PaymentStatus.CAPTURED,
+        ]
+    finally:
+        db.close()
+
+    old_month = f"{OLD:%Y-%m}"
+    orders = list(read_archive(tmp_path, "orders"))
+    # Months are read oldest first.
+    assert [(row["order_id"], row["order_items"]) for row in orders] == [
+        (2, [{"item_id": 1, "quantity": 1}]),
+        (1, [{"item_id": 1, "quantity": 1}]),
+    ]
+    assert [row["order_id"] for row in read_archive(tmp_path, "orders", old_month)] == [1]
+    assert sorted(row["bid_id"] for row in read_archive(tmp_path, "delivery_bids")) == [1, 2, 3]
+    assert [row["order_id"] for row in read_archive(tmp_path, "order_line_items", old_month)] == [1]
+    payments = list(read_archive(tmp_path, "payments"))
+    assert [(row["status"], row["payment_method"]) for row in payments] == [("captured", "card")]
+    assert not list(tmp_path.rglob("*.tmp"))
+
+    # Nothing left to move: a rerun writes no files.
+    files = sorted(tmp_path.rglob("*.jsonl.gz"))
+    archive_orders.main(["--days", "180", "--dir", str(tmp_path), "--apply"])
+    assert sorted(tmp_path.rglob("*.jsonl.gz")) == files
+
+
+def test_dispatch_queries_skip_orders_outside_the_lookback(monkeypatch):
+    SessionFactory = _session_factory()
+    db = SessionFactory()
+    try:
+        db.add_all([_order(1, "pending", NOW - timedelta(hours=30)), _order(2, "pending", NOW - timedelta(hours=1))])
+        db.commit()
+        assert [order.order_id for order in order_crud.list_awaiting_dispatch(db)] == [2]
+
+        monkeypatch.setattr(order_crud, "DISPATCH_LOOKBACK_HOURS", 0)
+        assert [order.order_id for order in order_crud.list_awaiting_dispatch(db)] == [1, 2]
+    finally:
+        db.close()
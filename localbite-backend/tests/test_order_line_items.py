@@ -0,0 +1,151 @@
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.restaurants import get_restaurant_item_sales
+from app.crud import order as order_crud
+from app.crud import order_line_item as line_item_crud
+from app.database import Base
+from app.jobs import backfill_order_line_items
+from app.models.menu import MenuItem
+from app.models.order import Order
+from app.models.order_line_item import OrderLineItem
+from app.models.restaurant import Restaurant
+from app.schemas.order import OrderCreate
+
+
+def _session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionFactory()
+    db.add(
+        Restaurant(
+            id=1,
+            name="Taqueria",
+            email="t@example.com",
+            password_hash="x",
+            cuisine_type="mexican",
+            address="1 Main St",
+        )
+    )
+    db.add_all(
+        [
+            MenuItem(menu_id=10, restaurant_id=1, item_name="Burrito", price=9.5),
+            MenuItem(menu_id=11, restaurant_id=1, item_name="Taco", price=3.0),
+        ]
+    )
+    db.commit()
+    db.close()
+    return SessionFactory
+
+
+def _payload(order_items, **overrides) -> OrderCreate:
+    fields = dict(
+        user_id=1,
+        restaurant_id=1,
+        order_items=order_items,
+        base_fare=6.0,
+        delivery_fee=6.0,
+        commission_amount=0.6,
+    )
+    fields.update(overrides)
+    return OrderCreate(**fields)
+
+
+def test_create_writes_line_items_with_price_snapshot():
+    SessionFactory = _session_factory()
+    db = SessionFactory()
+    try:
+        order = order_crud.create(
+            db,
+            _payload([{"item_id": 10, "quantity": 2}, {"item_id": 11, "quantity": 3, "customizations": {}}]),
+        )
+        assert order.item_count == 2
+        lines = line_item_crud.list_by_order(db, order.order_id)
+        assert [(line.menu_id, line.quantity, line.unit_price) for line in lines] == [(10, 2, 9.5), (11, 3, 3.0)]
+
+        # The snapshot does not follow later menu changes.
+        db.get(MenuItem, 10).price = 12.0
+        db.commit()
+        assert line_item_crud.list_by_order(db, order.order_id)[0].unit_price == 9.5
+
+        order_crud.delete(db, order)
+        assert line_item_crud.list_by_order(db, order.order_id) == []
+    finally:
+        db.close()
+
+
+def test_list_views_do_not_load_the_items_json():
+    SessionFactory = _session_factory()
+    db = SessionFactory()
+    try:
+        order_crud.create(db, _payload([{"item_id": 10, "quantity": 1}]))
+        db.expunge_all()
+        order = order_crud.list_all(db, with_items=False)[0]
+        assert "order_items" not in order.__dict__
+        assert line_item_crud.item_count(order) == 1
+        assert "order_items" not in order.__dict__
+
+        db.expunge_all()
+        assert order_crud.list_all(db)[0].__dict__["order_items"] == [{"item_id": 10, "quantity": 1}]
+    finally:
+        db.close()
+
+
+def test_backfill_converts_legacy_orders_in_batches(monkeypatch):
+    SessionFactory = _session_factory()
+    db = SessionFactory()
+    try:
+        for order_id in range(1, 6):
+            db.add(
+                Order(
+                    order_id=order_id,
+                    user_id=1,
+                    restaurant_id=1,
+                    order_items=[{"item_id": 10, "quantity": order_id}, {"item_id": 99}],
+                    base_fare=6.0,
+                    delivery_fee=6.0,
+                    commission_amount=0.6,
+                    order_status="cancelled" if order_id == 5 else "delivered",
+                )
+            )
+        db.commit()
+        # Orders written before item_count existed: the column is NULL.
+        db.execute(update(Order).values(item_count=None))
+        db.commit()
+        assert line_item_crud.item_count(db.get(Order, 1)) == 2
+    finally:
+        db.close()
+
+    monkeypatch.setattr(backfill_order_line_items, "SessionLocal", SessionFactory)
+    backfill_order_line_items.main(["--batch-size", "2"])
+    db = SessionFactory()
+    try:
+        assert db.query(OrderLineItem).count() == 0
+    finally:
+        db.close()
+
+    backfill_order_line_items.main(["--batch-size", "2", "--apply"])
+    backfill_order_line_items.main(["--batch-size", "2", "--apply"])
+    db = SessionFactory()
+    try:
+        assert db.query(Order).filter(Order.item_count.is_(None)).count() == 0
+        assert db.query(OrderLineItem).count() == 10
+        assert {order.version for order in db.query(Order)} == {1}
+        assert [(line.menu_id, line.quantity, line.unit_price) for line in line_item_crud.list_by_order(db, 3)] == [
+            (10, 3, 9.5),
+            (99, 1, None),
+        ]
+
+        sales = get_restaurant_item_sales(1, since=None, limit=20, db=db)
+        assert [(row.menu_id, row.item_name, row.quantity, row.revenue, row.orders) for row in sales] == [
+            (10, "Burrito", 10, 95.0, 4),
+            (99, None, 4, 0.0, 4),
+        ]
+    finally:
+        db.close()
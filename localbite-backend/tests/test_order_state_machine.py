@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.delivery_agents import fulfill_agent_order
+from app.api.orders import update_order
+from app.crud import order as order_crud
+from app.database import Base
+from app.models.delivery_agent import DeliveryAgent, VehicleType
+from app.models.order import Order
+from app.schemas.delivery_agent import FulfillDeliveryRequest
+from app.schemas.order import OrderUpdate
+from app.services.order_status import IllegalOrderTransition, can_transition
+
+
+def _session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionFactory()
+    db.add(
+        DeliveryAgent(
+            agent_id="a1",
+            full_name="a1",
+            password_hash="x",
+            phone_number="a1",
+            vehicle_type=VehicleType.BIKE,
+            base_payout_per_delivery=3.0,
+        )
+    )
+    db.add(
+        Order(
+            order_id=1,
+            user_id=1,
+            restaurant_id=1,
+            order_items=[],
+            base_fare=6.0,
+            delivery_fee=6.0,
+            commission_amount=0.6,
+            order_status="pending",
+        )
+    )
+    db.commit()
+    db.close()
+    return SessionFactory
+
+
+def test_transition_table():
+    assert can_transition("pending", "preparing")
+    assert can_transition("assigned", "ready")
+    assert can_transition("delivered", "delivered")
+    assert not can_transition("delivered", "pending")
+    assert not can_transition("cancelled", "assigned")
+    assert not can_transition("pending", "teleported")
+    # Rows written before the state machine may hold statuses it does not know.
+    assert can_transition(None, "pending") and can_transition("bidding", "assigned")
+
+    order = Order(order_status="delivered")
+    with pytest.raises(IllegalOrderTransition):
+        order.order_status = "pending"
+
+
+def test_status_updates_follow_the_state_machine_and_bump_the_version():
+    SessionFactory = _session_factory()
+    db = SessionFactory()
+    try:
+        # The version starts at 1 on insert.
+        order = asyncio.run(update_order(1, OrderUpdate(order_status="preparing"), db))
+        assert (order.order_status, order.version) == ("preparing", 2)
+        order = asyncio.run(update_order(1, OrderUpdate(order_status="ready", version=2), db))
+        assert (order.order_status, order.version) == ("ready", 3)
+        assert order.ready_at is not None
+
+        with pytest.raises(HTTPException) as excinfo:
+            asyncio.run(update_order(1, OrderUpdate(order_status="pending"), db))
+        assert excinfo.value.status_code == 409
+
+        # A client that read version 2 cannot overwrite version 3.
+        with pytest.raises(HTTPException) as excinfo:
+            asyncio.run(update_order(1, OrderUpdate(assigned_partner_id="a1", version=2), db))
+        assert excinfo.value.status_code == 409
+        assert db.get(Order, 1).assigned_partner_id is None
+    finally:
+        db.close()
+
+
+def test_concurrent_writer_loses_the_compare_and_set():
+    SessionFactory = _session_factory()
+    first, second = SessionFactory(), SessionFactory()
+    try:
+        mine = order_crud.get_by_id(first, 1)
+        theirs = order_crud.get_by_id(second, 1)
+
+        order_crud.update(first, mine, OrderUpdate(order_status="cancelled"))
+        with pytest.raises(order_crud.VersionConflict):
+            order_crud.update(second, theirs, OrderUpdate(assigned_partner_id="a1", order_status="assigned"))
+
+        check = SessionFactory()
+        row = check.get(Order, 1)
+        assert (row.order_status, row.assigned_partner_id, row.version) == ("cancelled", None, 2)
+        check.close()
+    finally:
+        first.close()
+        second.close()
+
+
+def test_cancelled_order_cannot_be_fulfilled():
+    SessionFactory = _session_factory()
+    db = SessionFactory()
+    try:
+        order = db.get(Order, 1)
+        order.assigned_partner_id = "a1"
+        order.order_status = "cancelled"
+        db.commit()
+
+        with pytest.raises(HTTPException) as excinfo:
+            asyncio.run(fulfill_agent_order("a1", 1, FulfillDeliveryRequest(proof_photo_ref="p"), db))
+        assert excinfo.value.status_code == 409
+        db.expire_all()
+        assert db.get(Order, 1).agent_payout_status != "paid"
+    finally:
+        db.close()
@@ -0,0 +1,92 @@
+import json
+from datetime import datetime
+
+from app.schemas.fare import FareRecommendationRequest
+from app.services import base_fare, pricing
+from app.services.hot_reload import HotReloadFile
+
+
+def _legacy_time_multiplier(hour: int) -> float:
+    if 0 <= hour < 6:
+        return 1.12
+    if 6 <= hour < 11:
+        return 1.00
+    if 11 <= hour < 14:
+        return 1.08
+    if 14 <= hour < 17:
+        return 0.97
+    if 17 <= hour < 22:
+        return 1.12
+    return 1.05
+
+
+def _legacy_peak_multiplier(hour: int) -> float:
+    if 11 <= hour < 14 or 18 <= hour < 22:
+        return 1.12
+    return 1.00
+
+
+def _quote(request_time: datetime):
+    return base_fare.get_fare_recommendation(
+        FareRecommendationRequest(
+            user_location={"address": "Home"},
+            restaurant_location={"address": "123 Main St"},
+            distance_km=3.0,
+            request_time=request_time,
+        )
+    )
+
+
+def test_default_table_matches_legacy_branches():
+    table = pricing.DEFAULT_PRICING_TABLE
+    for day in range(7):
+        for hour in range(24):
+            when = datetime(2026, 10, 19 + day, hour)
+            assert table.time_multiplier(when) == _legacy_time_multiplier(hour)
+            assert table.peak_multiplier(when) == _legacy_peak_multiplier(hour)
+
+
+def test_band_past_midnight_lands_on_the_next_day():
+    config = pricing.DEFAULT_PRICING_CONFIG.model_copy(
+        update={"peak_bands": [pricing.MultiplierBand(start_hour=22, end_hour=2, multiplier=1.5, days=[4])]}
+    )
+    table = pricing.compile_pricing_config(config)
+    # 2026-10-23 is a Friday.
+    assert table.peak_multiplier(datetime(2026, 10, 23, 23)) == 1.5
+    assert table.peak_multiplier(datetime(2026, 10, 24, 1)) == 1.5
+    assert table.peak_multiplier(datetime(2026, 10, 23, 1)) == 1.0
+    # Sunday night wraps into Monday.
+    sunday = pricing.compile_pricing_config(
+        config.model_copy(
+            update={"peak_bands": [pricing.MultiplierBand(start_hour=22, end_hour=2, multiplier=1.5, days=[6])]}
+        )
+    )
+    assert sunday.peak_multiplier(datetime(2026, 10, 26, 1)) == 1.5
+    assert sunday.peak_multiplier(datetime(2026, 10, 25, 1)) == 1.0
+
+
+def test_hot_reloaded_config_applies_to_new_quotes_only(tmp_path, monkeypatch):
+    config = pricing.DEFAULT_PRICING_CONFIG.model_dump()
+    config["version"] = "v2-weekend"
+    # Saturday/Sunday late nights cost more, wrapping midnight.
+    config["peak_bands"].append({"start_hour": 22, "end_hour": 2, "multiplier": 1.3, "days": [5, 6]})
+    path = tmp_path / "pricing.json"
+
+    monkeypatch.setattr(
+        pricing, "_pricing_file", HotReloadFile(path, pricing.load_pricing_table, check_interval_seconds=0)
+    )
+    saturday_late = datetime(2026, 10, 24, 23)
+
+    # No file yet: built-in v1 is active.
+    in_flight = pricing.get_pricing_table()
+    assert _quote(saturday_late).breakdown.pricing_version == "v1"
+
+    path.write_text(json.dumps(config))
+    quote = _quote(saturday_late)
+
+    assert quote.breakdown.pricing_version == "v2-weekend"
+    assert quote.breakdown.peak_multiplier == 1.3
+    assert _quote(datetime(2026, 10, 21, 23)).breakdown.peak_multiplier == 1.0
+    # A table taken before the swap is untouched.
+    assert in_flight.version == "v1"
+    assert in_flight.peak_multiplier(saturday_late) == 1.0
@@ -0,0 +1,183 @@
+import asyncio
+import struct
+import zlib
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base, get_db
+from app.models.delivery_agent import DeliveryAgent, VehicleType
+from app.models.order import Order
+from app.services.object_store import LocalObjectStore, ObjectTooLarge, set_object_store
+from app.services.proof_photos import ThumbnailWorker, set_thumbnail_worker
+
+
+def _png(width: int = 2, height: int = 2) -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    rows = b"".join(b"\x00" + b"\xff\x00\x00" * width for _ in range(height))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+async def _chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+def test_object_store_streams_and_deduplicates(tmp_path):
+    store = LocalObjectStore(tmp_path)
+
+    async def _exercise():
+        first = await store.put_stream(_chunks(b"world"), first_chunk=b"hello ")
+        second = await store.put_stream(_chunks(b"hello ", b"world"))
+        with pytest.raises(ObjectTooLarge):
+            await store.put_stream(_chunks(b"x" * 10, b"x" * 10), max_bytes=15)
+        return first, second
+
+    first, second = asyncio.run(_exercise())
+    assert first.ref == second.ref
+    assert first.ref == "sha256:b94d27b9934d3e08a52e52d7da7dabfac484efe37a5380ee9088f7ace2efcde9"
+    assert store.path_for(first.ref).read_bytes() == b"hello world"
+    # Rejected and duplicate uploads leave no temporary files behind.
+    assert list((tmp_path / "tmp").iterdir()) == []
+
+
+@pytest.fixture
+def client(tmp_path):
+    from main import app
+
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = SessionFactory()
+    db.add(
+        DeliveryAgent(
+            agent_id="a1",
+            full_name="a1",
+            password_hash="x",
+            phone_number="a1",
+            vehicle_type=VehicleType.BIKE,
+            base_payout_per_delivery=3.0,
+            total_earnings=0.0,
+            total_deliveries=0,
+        )
+    )
+    db.add(
+        Order(
+            order_id=7,
+            user_id=1,
+            restaurant_id=1,
+            order_items=[],
+            base_fare=6.0,
+            delivery_fee=6.0,
+            commission_amount=0.6,
+            order_status="on_the_way",
+            assigned_partner_id="a1",
+        )
+    )
+    db.commit()
+    db.close()
+
+    def _get_db():
+        session = SessionFactory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    store = LocalObjectStore(tmp_path)
+    previous_store = set_object_store(store)
+    previous_worker = set_thumbnail_worker(ThumbnailWorker(store=store, session_factory=SessionFactory))
+    app.dependency_overrides[get_db] = _get_db
+    try:
+        yield TestClient(app), SessionFactory, store
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        set_object_store(previous_store)
+        set_thumbnail_worker(previous_worker)
+
+
+def test_proof_upload_fulfills_in_one_request(client):
+    http, SessionFactory, store = client
+    photo = _png()
+
+    response = http.post(
+        "/api/v1/delivery-agents/a1/orders/7/proof?filename=door.png",
+        content=photo,
+        headers={"Content-Type": "image/png"},
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["order_status"] == "delivered"
+    assert body["total_deliveries"] == 1
+    ref = body["proof_photo_ref"]
+    assert ref.startswith("sha256:")
+    assert store.path_for(ref).read_bytes() == photo
+
+    db = SessionFactory()
+    try:
+        order = db.get(Order, 7)
+        assert (order.delivery_proof_ref, order.delivery_proof_filename) == (ref, "door.png")
+    finally:
+        db.close()
+
+    fetched = http.get("/api/v1/delivery-agents/a1/orders/7/proof")
+    assert fetched.status_code == 200
+    assert fetched.headers["content-type"] == "image/png"
+    assert fetched.content == photo
+
+    # Retrying with another photo keeps the proof the order was fulfilled with.
+    retry = http.post("/api/v1/delivery-agents/a1/orders/7/proof", content=_png(3, 3))
+    assert retry.json()["proof_photo_ref"] == ref
+    assert retry.json()["total_deliveries"] == 1
+
+
+def test_proof_upload_rejects_non_images_and_oversized_bodies(client, monkeypatch):
+    http, SessionFactory, _ = client
+
+    response = http.post("/api/v1/delivery-agents/a1/orders/7/proof", content=b"%PDF-1.7 not a photo")
+    assert response.status_code == 415
+
+    import app.api.delivery_agents as delivery_agents_api
+
+    monkeypatch.setattr(delivery_agents_api, "PROOF_MAX_BYTES", 64)
+    response = http.post("/api/v1/delivery-agents/a1/orders/7/proof", content=_png(8, 8))
+    assert response.status_code == 413
+
+    response = http.post("/api/v1/delivery-agents/a2/orders/7/proof", content=_png())
+    assert response.status_code == 404
+
+    db = SessionFactory()
+    try:
+        assert db.get(Order, 7).order_status == "on_the_way"
+    finally:
+        db.close()
+
+
+def test_thumbnail_is_rendered_and_recorded(client):
+    http, SessionFactory, store = client
+
+    response = http.post("/api/v1/delivery-agents/a1/orders/7/proof", content=_png(640, 480))
+    ref = response.json()["proof_photo_ref"]
+    worker = ThumbnailWorker(store=store, session_factory=SessionFactory)
+    thumb_ref = asyncio.run(worker._run(7, ref))
+    assert thumb_ref is not None and store.exists(thumb_ref)
+
+    db = SessionFactory()
+    try:
+        assert db.get(Order, 7).delivery_proof_thumbnail_ref == thumb_ref
+    finally:
+        db.close()
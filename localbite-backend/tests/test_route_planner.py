@@ -0,0 +1,103 @@
+import itertools
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+from app.services.route_planner import RouteStop, distance_matrix, plan_route, sequence_stops
+
+NOW = datetime(2026, 10, 19, 18, 0, tzinfo=timezone.utc)
+START = (38.5449, -121.7405)
+
+
+def _random_stops(seed: int, orders: int, picked_up: int = 0) -> list[RouteStop]:
+    rng = random.Random(seed)
+    stops: list[RouteStop] = []
+    for order_id in range(1, orders + 1):
+        if order_id > picked_up:
+            stops.append(
+                RouteStop(
+                    order_id=order_id,
+                    kind="pickup",
+                    latitude=38.54 + rng.uniform(-0.02, 0.02),
+                    longitude=-121.74 + rng.uniform(-0.02, 0.02),
+                )
+            )
+        stops.append(
+            RouteStop(
+                order_id=order_id,
+                kind="dropoff",
+                latitude=38.54 + rng.uniform(-0.03, 0.03),
+                longitude=-121.74 + rng.uniform(-0.03, 0.03),
+            )
+        )
+    return stops
+
+
+def _feasible(stops: list[RouteStop], order: list[int]) -> bool:
+    seen_pickups = set()
+    for index in order:
+        stop = stops[index]
+        if stop.kind == "pickup":
+            seen_pickups.add(stop.order_id)
+        elif any(s.order_id == stop.order_id and s.kind == "pickup" for s in stops) and (
+            stop.order_id not in seen_pickups
+        ):
+            return False
+    return True
+
+
+def _length(stops: list[RouteStop], order: list[int]) -> float:
+    dist = distance_matrix(START, stops)
+    route = [0] + [index + 1 for index in order]
+    return sum(dist[route[k]][route[k + 1]] for k in range(len(route) - 1))
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_sequence_is_feasible_and_near_optimal(seed):
+    stops = _random_stops(seed, orders=3, picked_up=1)
+    order = sequence_stops(START, stops)
+    assert sorted(order) == list(range(len(stops)))
+    assert _feasible(stops, order)
+
+    best = min(
+        _length(stops, list(candidate))
+        for candidate in itertools.permutations(range(len(stops)))
+        if _feasible(stops, list(candidate))
+    )
+    assert _length(stops, order) <= best * 1.15
+
+
+def test_plan_route_etas_and_totals():
+    stops = [
+        RouteStop(order_id=1, kind="pickup", latitude=38.5382, longitude=-121.7535),
+        RouteStop(order_id=1, kind="dropoff", latitude=38.5300, longitude=-121.7700),
+        RouteStop(order_id=2, kind="dropoff", latitude=38.5449, longitude=-121.7420),
+    ]
+    plan = plan_route(*START, stops, now=NOW, speed_kmph=30.0)
+    # Order 2 is already on board and its drop-off is next to the agent.
+    assert [(stop.order_id, stop.kind) for stop in plan.stops] == [
+        (2, "dropoff"),
+        (1, "pickup"),
+        (1, "dropoff"),
+    ]
+    assert [stop.sequence for stop in plan.stops] == [1, 2, 3]
+    etas = [stop.eta for stop in plan.stops]
+    assert etas == sorted(etas) and etas[0] > NOW
+    assert plan.total_distance_km == pytest.approx(plan.stops[-1].cumulative_distance_km)
+    assert plan.total_minutes == pytest.approx(plan.total_distance_km / 30.0 * 60 + 3 + 2 * 2, abs=0.01)
+
+
+def test_pickup_without_dropoff_is_rejected():
+    with pytest.raises(ValueError):
+        sequence_stops(START, [RouteStop(order_id=1, kind="pickup", latitude=38.5, longitude=-121.7)])
+
+
+def test_twelve_stops_are_all_planned_in_order():
+    # Planning time for this size is tracked in tests/benchmarks/test_route_benchmarks.py.
+    stops = _random_stops(42, orders=6)
+    plan = plan_route(*START, stops, now=NOW, speed_kmph=28.0)
+    order = [(stop.order_id, stop.kind) for stop in plan.stops]
+    assert sorted(order) == sorted((stop.order_id, stop.kind) for stop in stops)
+    for order_id in range(1, 7):
+        assert order.index((order_id, "pickup")) < order.index((order_id, "dropoff"))
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+
+from app.core.singleflight import SingleFlight, SyncSingleFlight
+from app.dispatch import engine as dispatch_engine
+from app.dispatch.state_store import InMemoryStateStore, set_state_store
+
+
+class _CountingStore(InMemoryStateStore):
+    def __init__(self) -> None:
+        super().__init__()
+        self.state_reads = 0
+
+    async def get_state(self, order_id: int) -> dict[str, str]:
+        self.state_reads += 1
+        await asyncio.sleep(0.01)
+        return await super().get_state(order_id)
+
+
+def test_concurrent_loads_share_one_call_and_its_error():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def load(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        if value == "boom":
+            raise RuntimeError("backend down")
+        return value
+
+    async def _exercise():
+        results = await asyncio.gather(*(flight.do("k", lambda: load("v")) for _ in range(50)))
+        assert results == ["v"] * 50
+        assert calls == ["v"]
+
+        outcomes = await asyncio.gather(
+            *(flight.do("k", lambda: load("boom")) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+
+        # A waiter giving up does not cancel the load for the others.
+        leader = asyncio.ensure_future(flight.do("k", lambda: load("late")))
+        waiter = asyncio.ensure_future(flight.do("k", lambda: load("late")))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        assert await leader == "late"
+        assert waiter.cancelled()
+
+        # Nothing is cached after the flight lands.
+        assert len(flight) == 0
+        assert await flight.do("k", lambda: load("again")) == "again"
+
+    asyncio.run(_exercise())
+    assert calls == ["v", "boom", "late", "again"]
+
+
+def test_threads_share_one_blocking_load():
+    flight = SyncSingleFlight("test")
+    calls = []
+    start = threading.Barrier(8)
+    results = []
+
+    def load():
+        calls.append(1)
+        time.sleep(0.05)
+        return {"rows": 1}
+
+    def worker():
+        start.wait()
+        results.append(flight.do("k", load))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 8 and all(result == {"rows": 1} for result in results)
+    assert len(calls) == 1
+
+
+def test_feed_refresh_reads_dispatch_state_once_per_order():
+    store = _CountingStore()
+    previous = set_state_store(store)
+    try:
+        async def _exercise():
+            await store.set_state(7, {"status": "broadcasted", "phase": "all_agents"})
+            states = await asyncio.gather(*(dispatch_engine.get_dispatch_state(7) for _ in range(100)))
+            assert all(state["phase"] == "all_agents" for state in states)
+            # Callers get their own copy of the shared result.
+            states[0]["phase"] = "changed"
+            assert states[1]["phase"] == "all_agents"
+
+        asyncio.run(_exercise())
+        assert store.state_reads == 1
+    finally:
+        set_state_store(previous)
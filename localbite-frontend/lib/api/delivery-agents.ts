@@ -45,6 +45,92 @@ export interface AgentActiveOrdersResponse {
   active_orders: AgentActiveOrder[]
 }
 
+export interface AgentRouteStop {
+  sequence: number
+  order_id: number
+  kind: "pickup" | "dropoff"
+  latitude: number
+  longitude: number
+  address?: string | null
+  leg_distance_km: number
+  cumulative_distance_km: number
+  eta: string
+}
+
+export interface AgentRouteResponse {
+  agent_id: string
+  start_latitude: number
+  start_longitude: number
+  speed_kmph: number
+  total_distance_km: number
+  total_minutes: number
+  stops: AgentRouteStop[]
+  unrouted_order_ids: number[]
+}
+
+export interface AgentLedgerEntry {
+  entry_id: number
+  order_id?: number | null
+  entry_type: "delivery_payout" | "adjustment" | string
+  amount: number
+  deliveries: number
+  note?: string | null
+  created_at: string
+}
+
+export interface AgentEarningsResponse {
+  agent_id: string
+  total_earnings: number
+  total_deliveries: number
+  since?: string | null
+  period_earnings?: number | null
+  period_deliveries?: number | null
+  entries: AgentLedgerEntry[]
+}
+
+export interface AgentDailyStats {
+  day: string
+  bids_placed: number
+  bids_won: number
+  bids_lost: number
+  deliveries: number
+  on_time_deliveries: number
+  earnings: number
+  active_seconds: number
+}
+
+export interface AgentStatsResponse {
+  agent_id: string
+  from_date: string
+  to_date: string
+  bids_placed: number
+  bids_won: number
+  bids_lost: number
+  acceptance_rate?: number | null
+  win_rate?: number | null
+  avg_bid_to_base_fare?: number | null
+  deliveries: number
+  on_time_rate?: number | null
+  earnings: number
+  active_hours: number
+  earnings_per_hour?: number | null
+  daily: AgentDailyStats[]
+}
+
+export interface AgentLocationPing {
+  latitude: number
+  longitude: number
+  recorded_at?: string
+}
+
+export interface AgentLocationResponse {
+  agent_id: string
+  accepted: boolean
+  latitude: number
+  longitude: number
+  recorded_at: string
+}
+
 export interface FulfillDeliveryRequest {
   proof_photo_ref: string
   proof_photo_filename?: string
@@ -92,6 +178,92 @@ export async function getAgentActiveOrders(
   return response.json()
 }
 
+export async function getAgentEarnings(
+  agentId: string,
+  options: { since?: string; limit?: number } = {}
+): Promise<AgentEarningsResponse> {
+  const params = new URLSearchParams()
+  if (options.since) params.set("since", options.since)
+  if (options.limit) params.set("limit", String(options.limit))
+  const query = params.toString() ? `?${params.toString()}` : ""
+  const response = await fetch(`${API_URL}/delivery-agents/${agentId}/earnings${query}`, {
+    credentials: "include",
+    cache: "no-store",
+  })
+
+  if (!response.ok) {
+    throw new Error("Failed to fetch agent earnings")
+  }
+
+  return response.json()
+}
+
+export async function getAgentStats(agentId: string, days = 30): Promise<AgentStatsResponse> {
+  const response = await fetch(`${API_URL}/delivery-agents/${agentId}/stats?days=${days}`, {
+    credentials: "include",
+    cache: "no-store",
+  })
+
+  if (!response.ok) {
+    throw new Error("Failed to fetch agent stats")
+  }
+
+  return response.json()
+}
+
+export async function reportAgentLocation(
+  agentId: string,
+  ping: AgentLocationPing
+): Promise<AgentLocationResponse> {
+  const response = await fetch(`${API_URL}/delivery-agents/${agentId}/location`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    credentials: "include",
+    body: JSON.stringify(ping),
+  })
+
+  if (!response.ok) {
+    let detail = "Failed to report agent location"
+    try {
+      const err = await response.json()
+      detail = err.detail || detail
+    } catch {
+      // ignore parse errors
+    }
+    throw new Error(detail)
+  }
+
+  return response.json()
+}
+
+export async function getAgentRoute(
+  agentId: string,
+  location?: { latitude: number; longitude: number }
+): Promise<AgentRouteResponse> {
+  const query = location
+    ? `?latitude=${location.latitude}&longitude=${location.longitude}`
+    : ""
+  const response = await fetch(`${API_URL}/delivery-agents/${agentId}/route${query}`, {
+    credentials: "include",
+    cache: "no-store",
+  })
+
+  if (!response.ok) {
+    let detail = "Failed to fetch agent route"
+    try {
+      const err = await response.json()
+      detail = err.detail || detail
+    } catch {
+      // ignore parse errors
+    }
+    throw new Error(detail)
+  }
+
+  return response.json()
+}
+
 export async function fulfillAgentOrder(
   agentId: string,
   orderId: number,
@@ -122,3 +294,36 @@ export async function fulfillAgentOrder(
 
   return response.json()
 }
+
+// Streams the photo as the request body and fulfills the order in the same request.
+export async function uploadProofAndFulfill(
+  agentId: string,
+  orderId: number,
+  file: File
+): Promise<FulfillDeliveryResponse> {
+  const params = new URLSearchParams({ filename: file.name })
+  const response = await fetch(
+    `${API_URL}/delivery-agents/${agentId}/orders/${orderId}/proof?${params}`,
+    {
+      method: "POST",
+      headers: {
+        "Content-Type": file.type || "application/octet-stream",
+      },
+      credentials: "include",
+      body: file,
+    }
+  )
+
+  if (!response.ok) {
+    let detail = "Failed to upload proof of delivery"
+    try {
+      const err = await response.json()
+      detail = err.detail || detail
+    } catch {
+      // ignore parse errors
+    }
+    throw new Error(detail)
+  }
+
+  return response.json()
+}
@@ -63,3 +63,47 @@ export async function listOrderBids(orderId: number): Promise<DeliveryBid[]> {
 
   return response.json()
 }
+
+export interface AgentBidSummary {
+  total: number
+  by_status: Record<BidStatus, number>
+  won_amount: number
+}
+
+export interface AgentBidHistory {
+  items: DeliveryBid[]
+  next_cursor?: string | null
+  summary: AgentBidSummary
+}
+
+export interface AgentBidHistoryQuery {
+  limit?: number
+  cursor?: string | null
+  status?: BidStatus
+  since?: string
+  until?: string
+}
+
+// One page of an agent's bids, newest first; pass next_cursor back for the next page.
+export async function getAgentBidHistory(
+  agentId: string,
+  query: AgentBidHistoryQuery = {}
+): Promise<AgentBidHistory> {
+  const params = new URLSearchParams()
+  for (const [key, value] of Object.entries(query)) {
+    if (value !== undefined && value !== null) params.set(key, String(value))
+  }
+  const response = await fetch(
+    `${API_URL}/delivery-bids/agents/${agentId}?${params}`,
+    {
+      credentials: "include",
+      cache: "no-store",
+    }
+  )
+
+  if (!response.ok) {
+    throw new Error("Failed to fetch bid history")
+  }
+
+  return response.json()
+}
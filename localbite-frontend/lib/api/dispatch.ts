@@ -6,6 +6,8 @@ export interface DispatchStartRequest {
   phase1_wait_seconds_max?: number
   phase2_wait_seconds?: number
   poll_interval_seconds?: number
+  defer_until_ready?: boolean
+  batch?: boolean
 }
 
 export interface DispatchStartResponse {
@@ -18,6 +20,20 @@ export interface DispatchStartResponse {
   phase2_wait_seconds: number
   poll_interval_seconds: number
   message: string
+  scheduled_for?: string | null
+  expected_ready_at?: string | null
+  bundle_id?: number | null
+  bundle_order_ids?: number[]
+  bundle_base_fare?: number | null
+  queue_position?: number | null
+  shard?: string | null
+}
+
+export interface DispatchCancelResponse {
+  order_id: number
+  was_running: boolean
+  status: string
+  message: string
 }
 
 export interface DispatchStatusResponse {
@@ -31,6 +47,10 @@ export interface DispatchStatusResponse {
   phase2_wait_seconds?: number | null
   note?: string | null
   updated_at?: string | null
+  scheduled_for?: string | null
+  queue_position?: number | null
+  shard?: string | null
+  queue_depth: number
 }
 
 export interface AgentAvailableDispatchItem {
@@ -51,6 +71,8 @@ export interface AgentAvailableDispatchItem {
   leading_bid_created_at?: string | null
   total_placed_bids: number
   order_created_at?: string | null
+  bundle_id?: number | null
+  bundle_order_ids?: number[]
 }
 
 export interface AgentAvailableDispatchResponse {
@@ -86,6 +108,33 @@ export async function startOrderDispatch(
   return response.json()
 }
 
+export async function cancelOrderDispatch(
+  orderId: number,
+  reason?: string
+): Promise<DispatchCancelResponse> {
+  const response = await fetch(`${API_URL}/dispatch/orders/${orderId}/cancel`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    credentials: "include",
+    body: JSON.stringify({ reason: reason ?? null }),
+  })
+
+  if (!response.ok) {
+    let detail = "Failed to cancel dispatch"
+    try {
+      const err = await response.json()
+      detail = err.detail || detail
+    } catch {
+      // ignore parse errors
+    }
+    throw new Error(detail)
+  }
+
+  return response.json()
+}
+
 export async function getDispatchStatus(
   orderId: number
 ): Promise<DispatchStatusResponse> {
@@ -29,7 +29,7 @@ export interface FareRecommendationResponse {
     time_multiplier: number
     peak_multiplier: number
     incentive_multiplier: number
-    pricing_version: "v1"
+    pricing_version: string
     distance_source: "input_distance" | "haversine"
   }
 }
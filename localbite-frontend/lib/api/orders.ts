@@ -27,6 +27,10 @@ export interface Order {
   commission_amount: number;
   order_status: string;
   created_at: string;
+  ready_at?: string | null;
+  bundle_id?: number | null;
+  version?: number;
+  item_count?: number | null;
   restaurant?: {
     id: number;
     name: string;